@@ -29,11 +29,15 @@ from sqlalchemy import event
 from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
 from werkzeug.local import LocalProxy
 
+from app.celery.task_publisher import BatchedTaskPublisher
 from app.clients import NotificationProviderClients
 from app.clients.cbc_proxy import CBCProxyClient
 from app.clients.document_download import DocumentDownloadClient
 from app.clients.email.aws_ses import AwsSesClient
 from app.clients.email.aws_ses_stub import AwsSesStubClient
+from app.clients.provider_sender import ProviderSender
+from app.clients.send_rate_governor import SendRateGovernor
+from app.clients.service_callback import ServiceCallbackClient
 from app.clients.sms.aws_sns import AwsSnsClient
 
 
@@ -53,6 +57,7 @@ db = SQLAlchemy()
 migrate = Migrate()
 ma = Marshmallow()
 notify_celery = NotifyCelery()
+task_publisher = BatchedTaskPublisher()
 aws_ses_client = AwsSesClient()
 aws_ses_stub_client = AwsSesStubClient()
 aws_sns_client = AwsSnsClient()
@@ -65,6 +70,9 @@ document_download_client = DocumentDownloadClient()
 metrics = GDSMetrics()
 
 notification_provider_clients = NotificationProviderClients()
+provider_sender = ProviderSender()
+send_rate_governor = SendRateGovernor()
+service_callback_client = ServiceCallbackClient()
 
 api_user = LocalProxy(lambda: g.api_user)
 authenticated_service = LocalProxy(lambda: g.authenticated_service)
@@ -108,10 +116,14 @@ def create_app(application):
         sms_clients=[aws_sns_client],
         email_clients=email_clients
     )
+    provider_sender.init_app(application, statsd_client)
+    service_callback_client.init_app(application, statsd_client)
 
     notify_celery.init_app(application)
+    task_publisher.init_app(application, notify_celery, statsd_client)
     encryption.init_app(application)
     redis_store.init_app(application)
+    send_rate_governor.init_app(application, redis_store, statsd_client)
     document_download_client.init_app(application)
 
     cbc_proxy_client.init_app(application)
@@ -325,6 +337,14 @@ def init_app(app):
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
         return response
 
+    @app.teardown_request
+    def release_unused_daily_limit_reservation(exception):
+        if 'daily_limit_reservation' in g:
+            from app.notifications.process_notifications import (
+                release_unused_daily_limit_reservation,
+            )
+            release_unused_daily_limit_reservation(exception)
+
     @app.errorhandler(Exception)
     def exception(error):
         app.logger.exception(error)
@@ -1,7 +1,13 @@
+import hashlib
 import uuid
+from threading import Lock
+from time import time
 
+import cachetools
+import jwt
 from flask import current_app, g, request
 from gds_metrics import Histogram
+from gds_metrics.metrics import Counter
 from notifications_python_client.authentication import (
     decode_jwt_token,
     get_token_issuer,
@@ -25,6 +31,20 @@ AUTH_DB_CONNECTION_DURATION_SECONDS = Histogram(
     'Time taken to get DB connection and fetch service from database',
 )
 
+AUTH_TOKEN_CACHE_LOOKUPS = Counter(
+    'auth_token_cache_lookups',
+    'Service API tokens checked against the cache of recently verified tokens',
+    ['result']
+)
+
+# A token is only accepted within 30 seconds of its `iat`, and integrators tend to reuse one for as long as they can,
+# so for that long we remember which API key each token was signed with and skip verifying it again
+TOKEN_LIFETIME_SECONDS = 30
+verified_tokens = cachetools.TTLCache(maxsize=10000, ttl=2 * TOKEN_LIFETIME_SECONDS)
+verified_tokens_lock = Lock()
+# the API key that last signed a token for each service, which is almost always the one that signed the next
+last_used_api_key_ids = cachetools.LRUCache(maxsize=10000)
+
 
 class AuthError(Exception):
     def __init__(self, message, code, service_id=None, api_key_id=None):
@@ -113,7 +133,10 @@ def requires_auth():
     if not service.active:
         raise AuthError("Invalid token: service is archived", 403, service_id=service.id)
 
-    api_key = _decode_jwt_token(auth_token, service.api_keys, service.id)
+    api_key = _get_api_key_for_verified_token(auth_token, service)
+    if api_key is None:
+        api_key = _decode_jwt_token(auth_token, _api_keys_most_likely_first(auth_token, service), service.id)
+        _remember_verified_token(auth_token, service.id, api_key)
 
     current_app.logger.info('API authorised for service {} with api key {}, using issuer {} for URL: {}'.format(
         service_id,
@@ -157,6 +180,60 @@ def _decode_jwt_token(auth_token, api_keys, service_id=None):
         raise AuthError("Invalid token: API key not found", 403, service_id=service_id)
 
 
+def _token_digest(auth_token):
+    return hashlib.sha256(auth_token.encode()).hexdigest()
+
+
+def _get_api_key_for_verified_token(auth_token, service):
+    with verified_tokens_lock:
+        verified_token = verified_tokens.get(_token_digest(auth_token))
+
+    if verified_token is None:
+        AUTH_TOKEN_CACHE_LOOKUPS.labels('miss').inc()
+        return None
+
+    service_id, api_key_id, valid_until = verified_token
+    if service_id == str(service.id) and time() <= valid_until:
+        for api_key in service.api_keys:
+            # a revoked key is picked up when the service's API keys are invalidated, and the token then goes through
+            # the full check so it fails with the right error
+            if str(api_key.id) == api_key_id and not api_key.expiry_date:
+                AUTH_TOKEN_CACHE_LOOKUPS.labels('hit').inc()
+                return api_key
+
+    AUTH_TOKEN_CACHE_LOOKUPS.labels('stale').inc()
+    return None
+
+
+def _remember_verified_token(auth_token, service_id, api_key):
+    try:
+        issued_at = int(jwt.decode(auth_token, options={'verify_signature': False})['iat'])
+    except Exception:
+        return
+
+    with verified_tokens_lock:
+        verified_tokens[_token_digest(auth_token)] = (
+            str(service_id), str(api_key.id), issued_at + TOKEN_LIFETIME_SECONDS
+        )
+        last_used_api_key_ids[str(service_id)] = str(api_key.id)
+
+
+def _api_keys_most_likely_first(auth_token, service):
+    # try the key named in the token's `kid` header, if it has one, then the key this service used last, so that
+    # usually only one signature is checked however many keys the service has
+    try:
+        key_id_hint = jwt.get_unverified_header(auth_token).get('kid')
+    except Exception:
+        key_id_hint = None
+    with verified_tokens_lock:
+        last_used_api_key_id = last_used_api_key_ids.get(str(service.id))
+
+    return sorted(
+        service.api_keys,
+        key=lambda api_key: (str(api_key.id) != key_id_hint, str(api_key.id) != last_used_api_key_id),
+    )
+
+
 def _get_auth_token(req):
     auth_header = req.headers.get('Authorization', None)
     if not auth_header:
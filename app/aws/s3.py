@@ -1,3 +1,5 @@
+import codecs
+
 import botocore
 from boto3 import client, resource
 from flask import current_app
@@ -47,8 +49,17 @@ def get_contact_list_location(service_id, contact_list_id):
 
 
 def get_job_and_metadata_from_s3(service_id, job_id):
-    obj = get_s3_object(*get_job_location(service_id, job_id))
-    return obj.get()['Body'].read().decode('utf-8'), obj.get()['Metadata']
+    response = get_s3_object(*get_job_location(service_id, job_id)).get()
+    return response['Body'].read().decode('utf-8'), response['Metadata']
+
+
+def get_job_stream_and_metadata_from_s3(service_id, job_id):
+    """
+    Like get_job_and_metadata_from_s3, but the file is returned as a text stream that's downloaded and decoded as
+    it's read, rather than all at once
+    """
+    response = get_s3_object(*get_job_location(service_id, job_id)).get()
+    return codecs.getreader('utf-8')(response['Body']), response['Metadata']
 
 
 def get_job_from_s3(service_id, job_id):
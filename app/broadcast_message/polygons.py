@@ -0,0 +1,88 @@
+"""
+Simplifying the polygons of a broadcast's areas is slow for big areas, and the same areas (flood warning regions, for
+example) are sent again and again. So the result is cached, keyed by a hash of the coordinates it was made from, in
+this process and in redis.
+"""
+import hashlib
+import json
+from time import monotonic
+
+from cachetools import LRUCache
+from flask import current_app
+from gds_metrics import Counter, Histogram
+from notifications_utils.polygons import Polygons
+
+from app import redis_store
+
+# change this if the way polygons are simplified changes, so that results cached in redis are ignored
+SIMPLE_POLYGONS_CACHE_VERSION = 1
+SIMPLE_POLYGONS_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+MAX_POLYGONS_BEFORE_SIMPLIFYING = 12
+MAX_POINTS_BEFORE_SIMPLIFYING = 250
+
+SIMPLE_POLYGONS_CACHE_LOOKUPS = Counter(
+    'broadcast_simple_polygons_cache_lookups',
+    'Simplified broadcast polygons looked up, by where they were found',
+    ['result']
+)
+POLYGON_SIMPLIFICATION_DURATION_SECONDS = Histogram(
+    'broadcast_polygon_simplification_duration_seconds',
+    'Time taken to smooth and simplify the polygons of a broadcast',
+)
+POLYGON_SIMPLIFICATION_POINTS_KEPT_RATIO = Histogram(
+    'broadcast_polygon_simplification_points_kept_ratio',
+    'Points left after simplifying the polygons of a broadcast, as a fraction of the points before',
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
+simple_polygons_cache = LRUCache(maxsize=256)
+
+
+def get_simple_polygons(coordinates):
+    """
+    Takes a list of polygons, each a list of coordinate pairs as `Polygons` expects them, and returns them as
+    `as_coordinate_pairs_lat_long` - smoothed and simplified first if there are too many polygons or points to send
+    as they are.
+    """
+    key = _cache_key(coordinates)
+
+    simple_polygons = simple_polygons_cache.get(key)
+    if simple_polygons is not None:
+        SIMPLE_POLYGONS_CACHE_LOOKUPS.labels('memory').inc()
+        return simple_polygons
+
+    cached = redis_store.get(key)
+    if cached is not None:
+        SIMPLE_POLYGONS_CACHE_LOOKUPS.labels('redis').inc()
+        simple_polygons = json.loads(cached)
+    else:
+        SIMPLE_POLYGONS_CACHE_LOOKUPS.labels('miss').inc()
+        simple_polygons = _simplify(coordinates)
+        redis_store.set(key, json.dumps(simple_polygons), ex=SIMPLE_POLYGONS_CACHE_TTL_SECONDS)
+
+    simple_polygons_cache[key] = simple_polygons
+    return simple_polygons
+
+
+def _simplify(coordinates):
+    polygons = Polygons(coordinates)
+    if len(polygons) <= MAX_POLYGONS_BEFORE_SIMPLIFYING and polygons.point_count <= MAX_POINTS_BEFORE_SIMPLIFYING:
+        return polygons.as_coordinate_pairs_lat_long
+
+    start = monotonic()
+    simple_polygons = polygons.smooth.simplify
+    elapsed_time = monotonic() - start
+
+    POLYGON_SIMPLIFICATION_DURATION_SECONDS.observe(elapsed_time)
+    POLYGON_SIMPLIFICATION_POINTS_KEPT_RATIO.observe(simple_polygons.point_count / polygons.point_count)
+    current_app.logger.info(
+        f'Simplified {len(polygons)} polygons with {polygons.point_count} points to {len(simple_polygons)} polygons '
+        f'with {simple_polygons.point_count} points in {elapsed_time:.3f}s'
+    )
+    return simple_polygons.as_coordinate_pairs_lat_long
+
+
+def _cache_key(coordinates):
+    digest = hashlib.sha256(json.dumps(coordinates, separators=(',', ':')).encode('utf-8')).hexdigest()
+    return f'broadcast-simple-polygons-v{SIMPLE_POLYGONS_CACHE_VERSION}-{digest}'
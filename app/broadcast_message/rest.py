@@ -17,8 +17,13 @@ from app.dao.services_dao import dao_fetch_service_by_id
 from app.dao.templates_dao import dao_get_template_by_id_and_service_id
 from app.dao.users_dao import get_user_by_id
 from app.errors import InvalidRequest, register_errors
-from app.models import BroadcastMessage, BroadcastStatusType
+from app.models import (
+    BroadcastMessage,
+    BroadcastProviderMessageStatus,
+    BroadcastStatusType,
+)
 from app.schema_validation import validate
+from app.utils import get_dt_string_or_none
 
 broadcast_message_blueprint = Blueprint(
     'broadcast_message',
@@ -48,6 +53,62 @@ def get_broadcast_message(service_id, broadcast_message_id):
     return jsonify(dao_get_broadcast_message_by_id_and_service_id(broadcast_message_id, service_id).serialize())
 
 
+@broadcast_message_blueprint.route('/<uuid:broadcast_message_id>/timeline', methods=['GET'])
+def get_broadcast_message_timeline(service_id, broadcast_message_id):
+    """
+    When each event (alert, update, cancel) of a broadcast was created and when each provider acknowledged it, so we
+    can see how long it took to reach every mobile network.
+
+    A provider with no `status` hasn't been sent the event yet.
+    """
+    broadcast_message = dao_get_broadcast_message_by_id_and_service_id(broadcast_message_id, service_id)
+    providers = broadcast_message.service.get_available_broadcast_providers()
+
+    return jsonify(
+        id=str(broadcast_message.id),
+        status=broadcast_message.status,
+        created_at=get_dt_string_or_none(broadcast_message.created_at),
+        approved_at=get_dt_string_or_none(broadcast_message.approved_at),
+        cancelled_at=get_dt_string_or_none(broadcast_message.cancelled_at),
+        events=[
+            _broadcast_event_timeline(event, providers)
+            for event in sorted(broadcast_message.events, key=lambda event: event.sent_at)
+        ],
+    )
+
+
+def _broadcast_event_timeline(broadcast_event, providers):
+    provider_messages = {
+        provider_message.provider: provider_message for provider_message in broadcast_event.provider_messages
+    }
+    timeline = []
+    for provider in sorted(set(providers) | set(provider_messages)):
+        provider_message = provider_messages.get(provider)
+        acked_at = (
+            provider_message.updated_at
+            if provider_message and provider_message.status == BroadcastProviderMessageStatus.ACK else None
+        )
+        timeline.append({
+            'provider': provider,
+            'status': provider_message.status if provider_message else None,
+            'created_at': get_dt_string_or_none(provider_message.created_at) if provider_message else None,
+            'acked_at': get_dt_string_or_none(acked_at),
+            'seconds_to_ack': (acked_at - broadcast_event.sent_at).total_seconds() if acked_at else None,
+        })
+
+    seconds_to_ack = [provider['seconds_to_ack'] for provider in timeline]
+    return {
+        'id': str(broadcast_event.id),
+        'message_type': broadcast_event.message_type,
+        'sent_at': get_dt_string_or_none(broadcast_event.sent_at),
+        'providers': timeline,
+        # how long it took for the last provider to acknowledge the event, once they all have
+        'seconds_to_ack_all_providers': (
+            max(seconds_to_ack) if seconds_to_ack and None not in seconds_to_ack else None
+        ),
+    }
+
+
 @broadcast_message_blueprint.route('', methods=['POST'])
 def create_broadcast_message(service_id):
     data = request.get_json()
@@ -1,29 +1,37 @@
-from bs4 import BeautifulSoup
+from lxml import etree
+
+CAP_NAMESPACES = {'cap': 'urn:oasis:names:tc:emergency:cap:1.2'}
 
 
 def cap_xml_to_dict(cap_xml):
     # This function assumes that it’s being passed valid CAP XML
-    cap = BeautifulSoup(cap_xml, "xml")
+    return cap_alert_to_dict(etree.fromstring(cap_xml))
+
+
+def cap_alert_to_dict(alert):
+    """
+    Takes the <alert> element of a CAP document that has already been parsed (and validated) by lxml, so that the
+    document doesn't have to be parsed again
+    """
+    info = alert.find('cap:info', CAP_NAMESPACES)
     return {
-        "msgType": cap.alert.msgType.text,
-        "reference": cap.alert.identifier.text,
-        "references": (
-            # references to previous events belonging to the same alert
-            cap.alert.references.text if cap.alert.references else None
-        ),
-        "cap_event": cap.alert.info.event.text,
-        "category": cap.alert.info.category.text,
-        "expires": cap.alert.info.expires.text,
-        "content": cap.alert.info.description.text,
+        "msgType": alert.findtext('cap:msgType', namespaces=CAP_NAMESPACES),
+        "reference": alert.findtext('cap:identifier', namespaces=CAP_NAMESPACES),
+        # references to previous events belonging to the same alert
+        "references": alert.findtext('cap:references', namespaces=CAP_NAMESPACES),
+        "cap_event": info.findtext('cap:event', namespaces=CAP_NAMESPACES),
+        "category": info.findtext('cap:category', namespaces=CAP_NAMESPACES),
+        "expires": info.findtext('cap:expires', namespaces=CAP_NAMESPACES),
+        "content": info.findtext('cap:description', namespaces=CAP_NAMESPACES),
         "areas": [
             {
-                "name": area.areaDesc.text,
+                "name": area.findtext('cap:areaDesc', namespaces=CAP_NAMESPACES),
                 "polygons": [
                     cap_xml_polygon_to_list(polygon.text)
-                    for polygon in area.find_all('polygon')
+                    for polygon in area.iterfind('cap:polygon', CAP_NAMESPACES)
                 ]
             }
-            for area in cap.alert.info.find_all('area')
+            for area in info.iterfind('cap:area', CAP_NAMESPACES)
         ]
     }
 
@@ -0,0 +1,122 @@
+"""
+Invalidation for the in-process caches in app.serialised_models.
+
+DAO functions that change a service, template, API keys or callback APIs call `invalidate_after_commit`. Once the
+change has been committed, the matching entries are removed from this process's caches and from redis, and a message
+is published on a redis pub/sub channel so that every other process subscribed to it can remove them too.
+"""
+import json
+import os
+import threading
+from time import sleep
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db, redis_store
+
+INVALIDATION_CHANNEL = 'serialised-model-invalidation'
+PENDING_INVALIDATIONS = 'serialised_model_invalidations'
+
+SERVICE = 'service'
+TEMPLATE = 'template'
+API_KEYS = 'api_keys'
+CALLBACK_APIS = 'callback_apis'
+
+# called with (model, id) for each invalidation, whether it was made in this process or received from another one
+_handlers = []
+
+
+def register_handler(handler):
+    _handlers.append(handler)
+
+
+def invalidate_after_commit(model, id, redis_keys=()):
+    db.session.info.setdefault(PENDING_INVALIDATIONS, []).append({
+        'model': model,
+        'id': str(id),
+        'redis_keys': list(redis_keys),
+    })
+
+
+def invalidate_service(service_id):
+    invalidate_after_commit(SERVICE, service_id, redis_keys=[f'service-{service_id}'])
+
+
+def invalidate_template(service_id, template_id):
+    # only the latest version is looked up without a version number; older versions never change
+    invalidate_after_commit(
+        TEMPLATE, template_id, redis_keys=[f'service-{service_id}-template-{template_id}-version-None']
+    )
+
+
+def invalidate_api_keys(service_id):
+    invalidate_after_commit(API_KEYS, service_id)
+
+
+def invalidate_callback_apis(service_id):
+    invalidate_after_commit(CALLBACK_APIS, service_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_changes(session):
+    # if the change is rolled back instead, the invalidation goes out with the next commit, which does no harm
+    for invalidation in session.info.pop(PENDING_INVALIDATIONS, []):
+        _handle(invalidation['model'], invalidation['id'])
+        if not redis_store.active:
+            continue
+        try:
+            if invalidation['redis_keys']:
+                redis_store.delete(*invalidation['redis_keys'])
+            if current_app.config['SERIALISED_MODEL_CACHE_INVALIDATION_ENABLED']:
+                redis_store.redis_store.publish(INVALIDATION_CHANNEL, json.dumps(invalidation))
+        except Exception:
+            current_app.logger.exception(f"Failed to publish cache invalidation for {invalidation}")
+
+
+def _handle(model, id):
+    for handler in _handlers:
+        handler(model, id)
+
+
+class InvalidationSubscriber:
+    """
+    Listens for invalidations published by other processes, on a daemon thread started by the first call to
+    `ensure_running` in each process.
+
+    If the connection to redis drops we may have missed messages, so `on_reconnect` is called to let the caches
+    throw everything away.
+    """
+
+    def __init__(self, on_reconnect):
+        self.on_reconnect = on_reconnect
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_running(self):
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(
+                target=self._listen, args=(current_app._get_current_object(),), daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _listen(self, app):
+        with app.app_context():
+            while True:
+                try:
+                    pubsub = redis_store.redis_store.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(INVALIDATION_CHANNEL)
+                    self.on_reconnect()
+                    for message in pubsub.listen():
+                        invalidation = json.loads(message['data'])
+                        _handle(invalidation['model'], invalidation['id'])
+                except Exception:
+                    app.logger.exception('Lost connection to cache invalidation channel, resubscribing')
+                    sleep(1)
@@ -1,6 +1,8 @@
 from datetime import datetime
+from time import monotonic
 
 from flask import current_app
+from gds_metrics import Histogram
 
 from app import cbc_proxy_client, notify_celery
 from app.clients.cbc_proxy import CBCProxyRetryableException
@@ -17,6 +19,18 @@ from app.models import (
 )
 from app.utils import format_sequential_number
 
+BROADCAST_PROVIDER_MESSAGE_INVOKE_DURATION_SECONDS = Histogram(
+    'broadcast_provider_message_invoke_duration_seconds',
+    'Time taken to send a broadcast event to a provider through the CBC proxy, including any failover',
+    ['provider', 'message_type']
+)
+
+BROADCAST_PROVIDER_MESSAGE_ACK_DURATION_SECONDS = Histogram(
+    'broadcast_provider_message_ack_duration_seconds',
+    'Time from a broadcast event being created (when the broadcast is approved or cancelled) to the provider ACK',
+    ['provider', 'message_type']
+)
+
 
 class BroadcastIntegrityError(Exception):
     pass
@@ -172,6 +186,7 @@ def send_broadcast_provider_message(self, broadcast_event_id, provider):
 
     cbc_proxy_provider_client = cbc_proxy_client.get_proxy(provider)
 
+    invoke_started_at = monotonic()
     try:
         if broadcast_event.message_type == BroadcastEventMessageType.ALERT:
             cbc_proxy_provider_client.create_and_send_broadcast(
@@ -210,6 +225,9 @@ def send_broadcast_provider_message(self, broadcast_event_id, provider):
                 sent=broadcast_event.sent_at_as_cap_datetime_string,
             )
     except CBCProxyRetryableException as exc:
+        BROADCAST_PROVIDER_MESSAGE_INVOKE_DURATION_SECONDS.labels(
+            provider, broadcast_event.message_type
+        ).observe(monotonic() - invoke_started_at)
         delay = get_retry_delay(self.request.retries)
         current_app.logger.exception(
             f'Retrying send_broadcast_provider_message for broadcast event {broadcast_event_id}, '
@@ -222,8 +240,21 @@ def send_broadcast_provider_message(self, broadcast_event_id, provider):
             queue=QueueNames.BROADCASTS,
         )
 
+    BROADCAST_PROVIDER_MESSAGE_INVOKE_DURATION_SECONDS.labels(
+        provider, broadcast_event.message_type
+    ).observe(monotonic() - invoke_started_at)
+
     update_broadcast_provider_message_status(broadcast_provider_message, status=BroadcastProviderMessageStatus.ACK)
 
+    seconds_to_ack = (datetime.utcnow() - broadcast_event.sent_at).total_seconds()
+    BROADCAST_PROVIDER_MESSAGE_ACK_DURATION_SECONDS.labels(
+        provider, broadcast_event.message_type
+    ).observe(seconds_to_ack)
+    current_app.logger.info(
+        f'Broadcast event {broadcast_event_id} ({broadcast_event.message_type}) acknowledged by {provider} '
+        f'{seconds_to_ack:.3f} seconds after it was created'
+    )
+
 
 @notify_celery.task(name='trigger-link-test')
 def trigger_link_test(provider):
@@ -1,6 +1,7 @@
 from base64 import urlsafe_b64encode
 from datetime import datetime, timedelta
 from hashlib import sha512
+from time import monotonic
 
 from botocore.exceptions import ClientError as BotoClientError
 from flask import current_app
@@ -8,7 +9,7 @@ from notifications_utils.letter_timings import LETTER_PROCESSING_DEADLINE
 from notifications_utils.postal_address import PostalAddress
 from notifications_utils.timezones import convert_utc_to_bst
 
-from app import encryption, notify_celery
+from app import encryption, notify_celery, statsd_client
 from app.aws import s3
 from app.config import QueueNames, TaskNames
 from app.cronitor import cronitor
@@ -32,6 +33,7 @@ from app.letters.utils import (
     get_billable_units_for_letter_page_count,
     get_file_names_from_error_bucket,
     get_folder_name,
+    get_letter_pdf_keys_and_sizes_in_s3,
     get_reference_from_filename,
     move_error_pdf_to_scan_bucket,
     move_failed_pdf,
@@ -242,6 +244,10 @@ def send_letters_volume_email_to_dvla(letters_volumes, date):
 
 def get_key_and_size_of_letters_to_be_sent_to_print(print_run_deadline, postage):
     letters_awaiting_sending = dao_get_letters_to_be_printed(print_run_deadline, postage)
+    if current_app.config['LETTER_PDF_KEY_INDEX_ENABLED']:
+        yield from _get_key_and_size_of_letters_from_folder_listings(letters_awaiting_sending, postage)
+        return
+
     for letter in letters_awaiting_sending:
         try:
             letter_pdf = find_letter_pdf_in_s3(letter)
@@ -256,6 +262,64 @@ def get_key_and_size_of_letters_to_be_sent_to_print(print_run_deadline, postage)
                 f"Error getting letter from bucket for notification: {letter.id} with reference: {letter.reference}", e)
 
 
+def _get_key_and_size_of_letters_from_folder_listings(letters, postage):
+    """
+    Rather than a LIST request per letter, each day folder of the letters PDF bucket is listed once, the first time a
+    letter from it comes up, and the letters are looked up by reference in that listing.
+
+    The time spent collating (fetching the letters, listing folders and looking letters up, but not whatever the
+    caller does with each letter in between) is logged and sent to statsd once all the letters have been collated.
+    """
+    bucket_name = current_app.config['LETTERS_PDF_BUCKET_NAME']
+    folder_listings = {}
+    found = 0
+    not_found = 0
+    listing_time = 0
+    collation_time = 0
+
+    start = monotonic()
+    for letter in letters:
+        folder = get_folder_name(letter.created_at)
+        if folder not in folder_listings:
+            listing_start = monotonic()
+            try:
+                folder_listings[folder] = get_letter_pdf_keys_and_sizes_in_s3(bucket_name, folder)
+            except BotoClientError as e:
+                current_app.logger.exception(f"Error listing letters in bucket {bucket_name} folder {folder}", e)
+                folder_listings[folder] = {}
+            listing_time += monotonic() - listing_start
+
+        key_and_size = folder_listings[folder].get(letter.reference.upper())
+        if not key_and_size:
+            not_found += 1
+            current_app.logger.error(
+                f"Letter not found in bucket {bucket_name} folder {folder} for notification: {letter.id} "
+                f"with reference: {letter.reference}"
+            )
+            continue
+
+        found += 1
+        key, size = key_and_size
+        collation_time += monotonic() - start
+        yield {
+            "Key": key,
+            "Size": size,
+            "ServiceId": str(letter.service_id),
+            "OrganisationId": str(letter.service.organisation_id)
+        }
+        start = monotonic()
+    collation_time += monotonic() - start
+
+    current_app.logger.info(
+        f"Collated {found} {postage} letters in {collation_time:.2f} seconds, {listing_time:.2f} of them spent "
+        f"listing {len(folder_listings)} folders in {bucket_name}. {not_found} letters were not found"
+    )
+    statsd_client.timing(f'letters.collate.{postage}.duration', collation_time)
+    statsd_client.timing(f'letters.collate.{postage}.s3-listing-duration', listing_time)
+    statsd_client.incr(f'letters.collate.{postage}.found', count=found)
+    statsd_client.incr(f'letters.collate.{postage}.not-found', count=not_found)
+
+
 def group_letters(letter_pdfs):
     """
     Group letters in chunks of MAX_LETTER_PDF_ZIP_FILESIZE. Will add files to lists, never going over that size.
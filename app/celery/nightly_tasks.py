@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+import json
+from datetime import datetime, time, timedelta
+from time import monotonic, sleep
 
 import pytz
 from flask import current_app
@@ -9,7 +11,7 @@ from notifications_utils.timezones import convert_utc_to_bst
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 
-from app import notify_celery, statsd_client, zendesk_client
+from app import notify_celery, redis_store, statsd_client, zendesk_client
 from app.aws import s3
 from app.config import QueueNames
 from app.cronitor import cronitor
@@ -19,10 +21,17 @@ from app.dao.jobs_dao import (
     dao_archive_job,
     dao_get_jobs_older_than_data_retention,
 )
+from app.dao.notification_partitions_dao import (
+    dao_archive_notification_partition,
+    dao_create_notification_partitions,
+    dao_get_notification_partition_days,
+)
 from app.dao.notifications_dao import (
     dao_get_notifications_processing_time_stats,
+    dao_get_replica_lag_and_lock_waits,
     dao_timeout_notifications,
     get_service_ids_with_notifications_before,
+    move_notifications_past_retention_batch,
     move_notifications_to_notification_history,
 )
 from app.dao.service_data_retention_dao import (
@@ -63,13 +72,52 @@ def _remove_csv_files(job_types):
         current_app.logger.info("Job ID {} has been removed from s3.".format(job.id))
 
 
+@notify_celery.task(name="create-notification-partitions")
+def create_notification_partitions():
+    # today's partition was made in advance - and on the day of the migration, today's notifications are in the
+    # default partition, so making one for today would fail
+    created = dao_create_notification_partitions(
+        datetime.utcnow().date() + timedelta(days=1),
+        current_app.config['NOTIFICATION_PARTITIONS_DAYS_AHEAD'],
+    )
+    current_app.logger.info(f'create-notification-partitions: created {len(created)} partitions {created}')
+
+
 @notify_celery.task(name="delete-notifications-older-than-retention")
 def delete_notifications_older_than_retention():
+    if current_app.config['NOTIFICATION_PARTITION_RETENTION_ENABLED']:
+        _archive_notification_partitions_older_than_retention()
     delete_email_notifications_older_than_retention.apply_async(queue=QueueNames.REPORTING)
     delete_sms_notifications_older_than_retention.apply_async(queue=QueueNames.REPORTING)
     delete_letter_notifications_older_than_retention.apply_async(queue=QueueNames.REPORTING)
 
 
+def _archive_notification_partitions_older_than_retention():
+    """
+    Moves whole days of notifications past the default 7 day retention to notification_history, before the tasks
+    for each service run. Those still find letters and notifications for services with their own retention
+    period, and anything from before notifications was partitioned.
+    """
+    seven_days_ago = get_london_midnight_in_utc(convert_utc_to_bst(datetime.utcnow()).date() - timedelta(days=7))
+
+    for day in dao_get_notification_partition_days():
+        if datetime.combine(day + timedelta(days=1), time()) > seven_days_ago:
+            break
+
+        start = datetime.utcnow()
+        try:
+            moved, kept = dao_archive_notification_partition(day)
+        except SQLAlchemyError:
+            # the tasks for each service will still delete them, just more slowly
+            current_app.logger.exception(f'Failed to archive the notifications partition for {day}')
+            continue
+
+        current_app.logger.info(
+            f'delete-notifications-older-than-retention: archived partition for {day}: {moved} notifications moved '
+            f'to notification_history, {kept} kept, in {datetime.utcnow() - start}'
+        )
+
+
 @notify_celery.task(name="delete-sms-notifications")
 @cronitor("delete-sms-notifications")
 def delete_sms_notifications_older_than_retention():
@@ -89,6 +137,10 @@ def delete_letter_notifications_older_than_retention():
 
 
 def _delete_notifications_older_than_retention_by_type(notification_type):
+    if current_app.config['RETENTION_SWEEPER_ENABLED']:
+        sweep_notifications_past_retention.apply_async([notification_type], queue=QueueNames.REPORTING)
+        return
+
     flexible_data_retention = fetch_service_data_retention_for_all_services_by_notification_type(notification_type)
 
     for f in flexible_data_retention:
@@ -147,6 +199,83 @@ def delete_notifications_for_service_and_type(service_id, notification_type, dat
         )
 
 
+@notify_celery.task(bind=True, name='sweep-notifications-past-retention')
+def sweep_notifications_past_retention(self, notification_type, checkpoint=None):
+    """
+    Moves every service's notifications of `notification_type` that are past retention to notification_history,
+    in batches taken in (created_at, id) order across all services.
+
+    Where it's got to is kept in redis for the day, so a sweep that was interrupted carries on from there when it's
+    started again. After RETENTION_SWEEP_MAX_TASK_SECONDS the sweep carries on in a new task, passed the checkpoint.
+    """
+    start = monotonic()
+    checkpoint_key = f'retention-sweep-checkpoint-{notification_type}'
+    bst_today = convert_utc_to_bst(datetime.utcnow()).date()
+
+    default_cutoff = get_london_midnight_in_utc(bst_today - timedelta(days=7))
+    service_cutoffs = {
+        retention.service_id: get_london_midnight_in_utc(bst_today - timedelta(days=retention.days_of_retention))
+        for retention in fetch_service_data_retention_for_all_services_by_notification_type(notification_type)
+    }
+
+    if checkpoint is None:
+        saved_checkpoint = redis_store.get(checkpoint_key)
+        checkpoint = json.loads(saved_checkpoint) if saved_checkpoint else None
+    if checkpoint and checkpoint['day'] != str(bst_today):
+        checkpoint = None
+    after = (datetime.fromisoformat(checkpoint['created_at']), checkpoint['id']) if checkpoint else None
+
+    moved = 0
+    while True:
+        if monotonic() - start > current_app.config['RETENTION_SWEEP_MAX_TASK_SECONDS']:
+            self.apply_async([notification_type, checkpoint], queue=QueueNames.REPORTING)
+            break
+
+        if _database_is_busy():
+            statsd_client.incr(f'retention-sweep.{notification_type}.throttled')
+            sleep(current_app.config['RETENTION_SWEEP_THROTTLE_SECONDS'])
+            continue
+
+        batch_start = monotonic()
+        try:
+            count, after = move_notifications_past_retention_batch(
+                notification_type,
+                default_cutoff,
+                service_cutoffs,
+                after=after,
+                batch_size=current_app.config['RETENTION_SWEEP_BATCH_SIZE'],
+            )
+        except SQLAlchemyError:
+            # most likely the lock timeout. Nothing from the batch was moved, so it's safe to try it again
+            current_app.logger.exception(f'sweep-notifications-past-retention: {notification_type} batch failed')
+            statsd_client.incr(f'retention-sweep.{notification_type}.throttled')
+            sleep(current_app.config['RETENTION_SWEEP_THROTTLE_SECONDS'])
+            continue
+        statsd_client.timing(f'retention-sweep.{notification_type}.batch-duration', monotonic() - batch_start)
+
+        if not after:
+            redis_store.delete(checkpoint_key)
+            break
+
+        moved += count
+        statsd_client.incr(f'retention-sweep.{notification_type}.moved', count=count)
+        checkpoint = {'day': str(bst_today), 'created_at': after[0].isoformat(), 'id': str(after[1])}
+        redis_store.set(checkpoint_key, json.dumps(checkpoint), ex=24 * 60 * 60)
+
+    current_app.logger.info(
+        f'sweep-notifications-past-retention: {notification_type}: {moved} notifications moved or deleted in '
+        f'{monotonic() - start:.0f} seconds, checkpoint {checkpoint}'
+    )
+
+
+def _database_is_busy():
+    replica_lag, lock_waits = dao_get_replica_lag_and_lock_waits()
+    return (
+        replica_lag > current_app.config['RETENTION_SWEEP_MAX_REPLICA_LAG_SECONDS']
+        or lock_waits > current_app.config['RETENTION_SWEEP_MAX_LOCK_WAITS']
+    )
+
+
 @notify_celery.task(name='timeout-sending-notifications')
 @cronitor('timeout-sending-notifications')
 def timeout_notifications():
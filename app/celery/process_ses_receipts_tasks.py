@@ -1,25 +1,65 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
+from time import monotonic
 
 import iso8601
 from celery.exceptions import Retry
 from flask import current_app, json
 from sqlalchemy.orm.exc import NoResultFound
 
-from app import notify_celery, statsd_client
+from app import notify_celery, redis_store, statsd_client
 from app.clients.email.aws_ses import get_aws_responses
 from app.config import QueueNames
 from app.dao import notifications_dao
-from app.models import NOTIFICATION_PENDING, NOTIFICATION_SENDING
+from app.models import (
+    NOTIFICATION_PENDING,
+    NOTIFICATION_SENDING,
+    NotificationHistory,
+)
 from app.notifications.notifications_ses_callback import (
     _check_and_queue_complaint_callback_task,
     check_and_queue_callback_task,
     determine_notification_bounce_type,
     handle_complaint,
+    queue_callback_tasks,
 )
 
+SesReceipt = namedtuple('SesReceipt', ['response', 'reference', 'status', 'bounce_message', 'message_time'])
+
+SES_RECEIPTS_KEY = 'ses-receipts'
+
+
+def queue_ses_result(response, queue):
+    """
+    Gives the SES notification to drain-ses-receipts if SES_RECEIPT_BATCHING_ENABLED is on, or otherwise (or if
+    redis is unavailable) a process-ses-result task of its own.
+    """
+    if not _add_to_ses_receipts(response):
+        process_ses_results.apply_async([response], queue=queue)
+
+
+def _add_to_ses_receipts(response):
+    """
+    With SES_RECEIPT_BATCHING_ENABLED, adds the SES notification to a list in redis, for drain-ses-receipts to pass
+    on to process-ses-results-batch with others. Returns whether it was added.
+    """
+    if not current_app.config['SES_RECEIPT_BATCHING_ENABLED'] or not redis_store.active:
+        return False
+    try:
+        redis_store.redis_store.rpush(SES_RECEIPTS_KEY, json.dumps(response))
+        return True
+    except Exception:
+        current_app.logger.exception("Failed to add SES receipt to redis, processing it on its own")
+        return False
+
 
 @notify_celery.task(bind=True, name="process-ses-result", max_retries=5, default_retry_delay=300)
 def process_ses_results(self, response):
+    # SES receipts are queued as process-ses-result tasks by the lambda that receives them from SNS, so with
+    # batching on they're handed over to drain-ses-receipts here
+    if self.request.retries == 0 and _add_to_ses_receipts(response):
+        return True
+
     try:
         ses_message = json.loads(response['Message'])
         notification_type = ses_message['notificationType']
@@ -86,3 +126,121 @@ def process_ses_results(self, response):
     except Exception as e:
         current_app.logger.exception('Error processing SES results: {}'.format(type(e)))
         self.retry(queue=QueueNames.RETRY)
+
+
+@notify_celery.task(bind=True, name="process-ses-results-batch", max_retries=5, default_retry_delay=300)
+def process_ses_results_batch(self, responses):
+    """
+    Does the same as process-ses-result for a list of SES notifications, with a fixed number of queries however many
+    there are: one to look the notifications up in each of notifications and notification_history, one UPDATE per
+    table to change their statuses, and one to find the services' callback APIs.
+
+    Only receipts that haven't been applied are retried, together as a smaller batch: those for notifications we
+    can't find yet, and those that couldn't be read or applied because of an error. Complaints are handled as they're
+    read, so they're never retried once saved.
+    """
+    start = monotonic()
+    receipts = {}
+    unread_responses = []
+    for response in responses:
+        try:
+            receipt = _parse_ses_receipt(response)
+        except Exception:
+            current_app.logger.exception('Error processing SES result')
+            unread_responses.append(response)
+            continue
+        if receipt:
+            receipts[receipt.reference] = receipt
+
+    receipts_to_retry = []
+    try:
+        notifications = notifications_dao.dao_get_notifications_or_history_by_references(receipts.keys())
+
+        statuses_by_reference = {}
+        for reference, receipt in receipts.items():
+            notification = notifications.get(reference)
+            if not notification:
+                if datetime.utcnow() - receipt.message_time < timedelta(minutes=5):
+                    current_app.logger.info(
+                        f"notification not found for reference: {reference} (update to {receipt.status}). "
+                        f"Callback may have arrived before notification was persisted to the DB. "
+                        f"Adding to retry batch"
+                    )
+                    receipts_to_retry.append(receipt.response)
+                else:
+                    current_app.logger.warning(
+                        f"notification not found for reference: {reference} (update to {receipt.status})"
+                    )
+                continue
+
+            if receipt.bounce_message:
+                current_app.logger.info(f"SES bounce for notification ID {notification.id}: {receipt.bounce_message}")
+
+            if notification.status not in [NOTIFICATION_SENDING, NOTIFICATION_PENDING]:
+                notifications_dao._duplicate_update_warning(notification=notification, status=receipt.status)
+                continue
+
+            statuses_by_reference[reference] = receipt.status
+
+        updated_notifications, updated_history = notifications_dao.dao_update_notification_statuses_by_reference(
+            statuses_by_reference,
+            history_references=[
+                reference for reference in statuses_by_reference
+                if isinstance(notifications[reference], NotificationHistory)
+            ],
+        )
+    except Exception as e:
+        # nothing has been updated, so every receipt is tried again
+        current_app.logger.exception('Error processing SES results batch: {}'.format(type(e)))
+        self.retry(
+            args=[unread_responses + [receipt.response for receipt in receipts.values()]], queue=QueueNames.RETRY
+        )
+
+    try:
+        for notification in updated_notifications + updated_history:
+            statsd_client.incr(f'callback.ses.{notification.status}')
+            if notification.sent_at:
+                statsd_client.timing_with_dates(
+                    f'callback.ses.{notification.status}.elapsed-time',
+                    datetime.utcnow(),
+                    notification.sent_at
+                )
+
+        # notification_history doesn't store the recipient, so there's nothing to send a callback with
+        queue_callback_tasks(updated_notifications)
+    except Exception:
+        # the statuses have been updated, and a retry would skip these notifications as already updated
+        current_app.logger.exception('Error queueing callbacks for SES results batch')
+
+    statsd_client.timing('tasks.process-ses-results-batch.duration', monotonic() - start)
+    statsd_client.incr('tasks.process-ses-results-batch.receipts', count=len(responses))
+    current_app.logger.info(
+        f"Processed {len(responses)} SES results in {monotonic() - start:.3f}s: "
+        f"{len(updated_notifications) + len(updated_history)} updated, "
+        f"{len(receipts_to_retry) + len(unread_responses)} to retry"
+    )
+
+    if receipts_to_retry or unread_responses:
+        self.retry(args=[unread_responses + receipts_to_retry], queue=QueueNames.RETRY)
+
+    return True
+
+
+def _parse_ses_receipt(response):
+    ses_message = json.loads(response['Message'])
+    notification_type = ses_message['notificationType']
+    bounce_message = None
+
+    if notification_type == 'Bounce':
+        notification_type, bounce_message = determine_notification_bounce_type(notification_type, ses_message)
+    elif notification_type == 'Complaint':
+        _check_and_queue_complaint_callback_task(*handle_complaint(ses_message))
+        return None
+
+    return SesReceipt(
+        response=response,
+        reference=ses_message['mail']['messageId'],
+        status=get_aws_responses(notification_type)['notification_status'],
+        bounce_message=bounce_message,
+        message_time=iso8601.parse_date(ses_message['mail']['timestamp']).replace(tzinfo=None),
+    )
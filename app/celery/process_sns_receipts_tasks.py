@@ -0,0 +1,126 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from time import monotonic
+
+import iso8601
+from celery.exceptions import Retry
+from flask import current_app, json
+
+from app import notify_celery, statsd_client
+from app.clients.sms.aws_sns import get_sns_delivery_status
+from app.config import QueueNames
+from app.dao import notifications_dao
+from app.models import (
+    NOTIFICATION_PENDING,
+    NOTIFICATION_SENDING,
+    NOTIFICATION_SENT,
+    NotificationHistory,
+)
+from app.notifications.notifications_ses_callback import queue_callback_tasks
+
+# international SMS are marked as sent rather than sending, but SNS still logs their delivery
+SNS_UPDATABLE_STATUSES = (NOTIFICATION_SENDING, NOTIFICATION_PENDING, NOTIFICATION_SENT)
+
+SnsReceipt = namedtuple('SnsReceipt', ['event', 'reference', 'status', 'provider_response', 'message_time'])
+
+
+@notify_celery.task(bind=True, name="process-sns-results-batch", max_retries=5, default_retry_delay=300)
+def process_sns_results_batch(self, events):
+    """
+    Applies a list of SNS SMS delivery status events, each the JSON message SNS writes to CloudWatch Logs. SNS
+    notifications are matched on their reference, which is the MessageId SNS gave us when we sent them.
+
+    Like process-ses-results-batch, this is a fixed number of queries however many events there are, and events for
+    notifications we can't find yet are retried together.
+    """
+    start = monotonic()
+    try:
+        receipts = {}
+        for event in events:
+            receipt = _parse_sns_receipt(event)
+            receipts[receipt.reference] = receipt
+            statsd_client.timing_with_dates('callback.sns.lag', datetime.utcnow(), receipt.message_time)
+
+        notifications = notifications_dao.dao_get_notifications_or_history_by_references(receipts.keys())
+
+        statuses_by_reference = {}
+        events_to_retry = []
+        for reference, receipt in receipts.items():
+            notification = notifications.get(reference)
+            if not notification:
+                if datetime.utcnow() - receipt.message_time < timedelta(minutes=5):
+                    current_app.logger.info(
+                        f"notification not found for reference: {reference} (update to {receipt.status}). "
+                        f"Adding to retry batch"
+                    )
+                    events_to_retry.append(receipt.event)
+                else:
+                    current_app.logger.warning(
+                        f"notification not found for reference: {reference} (update to {receipt.status})"
+                    )
+                continue
+
+            if receipt.status != 'delivered':
+                current_app.logger.info(
+                    f"SNS {receipt.status} for notification ID {notification.id}: {receipt.provider_response}"
+                )
+
+            if notification.status not in SNS_UPDATABLE_STATUSES:
+                notifications_dao._duplicate_update_warning(notification=notification, status=receipt.status)
+                continue
+
+            statuses_by_reference[reference] = receipt.status
+
+        updated_notifications, updated_history = notifications_dao.dao_update_notification_statuses_by_reference(
+            statuses_by_reference,
+            history_references=[
+                reference for reference in statuses_by_reference
+                if isinstance(notifications[reference], NotificationHistory)
+            ],
+            updatable_statuses=SNS_UPDATABLE_STATUSES,
+        )
+
+        for notification in updated_notifications + updated_history:
+            statsd_client.incr(f'callback.sns.{notification.status}')
+            if notification.sent_at:
+                statsd_client.timing_with_dates(
+                    f'callback.sns.{notification.status}.elapsed-time',
+                    datetime.utcnow(),
+                    notification.sent_at
+                )
+
+        # notification_history doesn't store the recipient, so there's nothing to send a callback with
+        queue_callback_tasks(updated_notifications)
+
+        statsd_client.timing('tasks.process-sns-results-batch.duration', monotonic() - start)
+        statsd_client.incr('tasks.process-sns-results-batch.receipts', count=len(events))
+        current_app.logger.info(
+            f"Processed {len(events)} SNS results in {monotonic() - start:.3f}s: "
+            f"{len(updated_notifications) + len(updated_history)} updated, {len(events_to_retry)} to retry"
+        )
+
+        if events_to_retry:
+            self.retry(args=[events_to_retry], queue=QueueNames.RETRY)
+
+        return True
+
+    except Retry:
+        raise
+
+    except Exception as e:
+        current_app.logger.exception('Error processing SNS results batch: {}'.format(type(e)))
+        self.retry(queue=QueueNames.RETRY)
+
+
+def _parse_sns_receipt(event):
+    message = json.loads(event)
+    provider_response = message['delivery'].get('providerResponse')
+
+    return SnsReceipt(
+        event=event,
+        reference=message['notification']['messageId'],
+        status=get_sns_delivery_status(message['status'], provider_response),
+        provider_response=provider_response,
+        # SNS logs timestamps like 2016-06-28 00:40:34.558, in UTC
+        message_time=iso8601.parse_date(message['notification']['timestamp']).replace(tzinfo=None),
+    )
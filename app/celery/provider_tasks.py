@@ -1,9 +1,14 @@
+import random
+from math import ceil
+
 from flask import current_app
 from sqlalchemy.orm.exc import NoResultFound
 
 from app import notify_celery
 from app.clients.email import EmailClientNonRetryableException
 from app.clients.email.aws_ses import AwsSesClientThrottlingSendRateException
+from app.clients.provider_sender import ProviderSenderBusyException
+from app.clients.send_rate_governor import SendRateExceededException
 from app.clients.sms import SmsClientResponseException
 from app.config import QueueNames
 from app.dao import notifications_dao
@@ -12,6 +17,8 @@ from app.delivery import send_to_providers
 from app.exceptions import NotificationTechnicalFailureException
 from app.models import NOTIFICATION_TECHNICAL_FAILURE
 
+SEND_RATE_RETRY_JITTER_SECONDS = 10
+
 
 @notify_celery.task(bind=True, name="deliver_sms", max_retries=48, default_retry_delay=300)
 def deliver_sms(self, notification_id):
@@ -21,6 +28,16 @@ def deliver_sms(self, notification_id):
         if not notification:
             raise NoResultFound()
         send_to_providers.send_sms_to_provider(notification)
+    except SendRateExceededException as e:
+        current_app.logger.warning(
+            f"RETRY: SMS notification {notification_id} was held back to stay under the send rate: {e}"
+        )
+        _retry_later(self, notification_id, e.wait)
+    except ProviderSenderBusyException as e:
+        current_app.logger.warning(
+            f"RETRY: SMS notification {notification_id} was held back as the provider is busy: {e}"
+        )
+        _retry_later(self, notification_id)
     except Exception as e:
         if isinstance(e, SmsClientResponseException):
             current_app.logger.warning(
@@ -57,6 +74,16 @@ def deliver_email(self, notification_id):
             f"Email notification {notification_id} failed: {e}"
         )
         update_notification_status_by_id(notification_id, 'technical-failure')
+    except SendRateExceededException as e:
+        current_app.logger.warning(
+            f"RETRY: Email notification {notification_id} was held back to stay under the SES send rate: {e}"
+        )
+        _retry_later(self, notification_id, e.wait)
+    except ProviderSenderBusyException as e:
+        current_app.logger.warning(
+            f"RETRY: Email notification {notification_id} was held back as the provider is busy: {e}"
+        )
+        _retry_later(self, notification_id)
     except Exception as e:
         try:
             if isinstance(e, AwsSesClientThrottlingSendRateException):
@@ -75,3 +102,58 @@ def deliver_email(self, notification_id):
                       "Notification has been updated to technical-failure".format(notification_id)
             update_notification_status_by_id(notification_id, NOTIFICATION_TECHNICAL_FAILURE)
             raise NotificationTechnicalFailureException(message)
+
+
+@notify_celery.task(name="deliver_sms_batch")
+def deliver_sms_batch(notification_ids):
+    current_app.logger.info("Start sending batch of {} SMS".format(len(notification_ids)))
+    notifications = notifications_dao.get_notifications_by_ids(notification_ids)
+    try:
+        failed_ids, throttled = send_to_providers.send_sms_batch_to_provider(notifications)
+    except Exception:
+        # this is only raised before anything has been sent, so the whole batch can be tried again
+        current_app.logger.exception("Sending batch of {} SMS failed".format(len(notification_ids)))
+        failed_ids, throttled = [notification.id for notification in notifications], []
+    _retry_individually(deliver_sms, notification_ids, notifications, failed_ids, throttled)
+
+
+@notify_celery.task(name="deliver_email_batch")
+def deliver_email_batch(notification_ids):
+    current_app.logger.info("Start sending batch of {} emails".format(len(notification_ids)))
+    notifications = notifications_dao.get_notifications_by_ids(notification_ids)
+    try:
+        failed_ids, throttled = send_to_providers.send_email_batch_to_provider(notifications)
+    except Exception:
+        # this is only raised before anything has been sent, so the whole batch can be tried again
+        current_app.logger.exception("Sending batch of {} emails failed".format(len(notification_ids)))
+        failed_ids, throttled = [notification.id for notification in notifications], []
+    _retry_individually(deliver_email, notification_ids, notifications, failed_ids, throttled)
+
+
+def _retry_individually(deliver_task, notification_ids, notifications, failed_ids, throttled):
+    # anything that failed (or wasn't in the database yet) goes back through the single notification task, which
+    # knows how to retry and when to give up
+    found_ids = {str(notification.id) for notification in notifications}
+    missing_ids = [notification_id for notification_id in notification_ids if str(notification_id) not in found_ids]
+
+    for notification_id in missing_ids + [str(notification_id) for notification_id in failed_ids]:
+        deliver_task.apply_async([notification_id], queue=QueueNames.RETRY)
+
+    for notification_id, wait in throttled:
+        deliver_task.apply_async([str(notification_id)], queue=QueueNames.RETRY, countdown=_retry_countdown(wait))
+
+
+def _retry_later(task, notification_id, wait=0):
+    # nothing was sent and it's nobody's fault (we're pacing ourselves), so try again once the send rate allows or
+    # the provider sender has room, without using up a retry
+    task.apply_async(
+        [notification_id],
+        queue=QueueNames.RETRY,
+        countdown=_retry_countdown(wait),
+        retries=task.request.retries,
+    )
+
+
+def _retry_countdown(wait):
+    # spread the retries out, so that they don't all come back for the same slot
+    return ceil(wait) + random.randint(0, SEND_RATE_RETRY_JITTER_SECONDS)
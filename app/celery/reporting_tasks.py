@@ -1,17 +1,25 @@
 from datetime import datetime, timedelta
+from time import time
 
 from flask import current_app
 from notifications_utils.timezones import convert_utc_to_bst
 
-from app import notify_celery
+from app import notify_celery, redis_store
 from app.config import QueueNames
 from app.cronitor import cronitor
 from app.dao.fact_billing_dao import (
     fetch_billing_data_for_day,
     update_fact_billing,
+    update_fact_billing_for_day,
+)
+from app.dao.fact_notification_status_dao import (
+    update_fact_notification_status,
+    update_fact_notification_status_for_day,
+)
+from app.dao.notifications_dao import (
+    get_service_ids_with_notifications_changed_since,
+    get_service_ids_with_notifications_on_date,
 )
-from app.dao.fact_notification_status_dao import update_fact_notification_status
-from app.dao.notifications_dao import get_service_ids_with_notifications_on_date
 from app.models import EMAIL_TYPE, LETTER_TYPE, SMS_TYPE
 
 
@@ -44,6 +52,15 @@ def create_nightly_billing_for_day(process_day):
         f'create-nightly-billing-for-day task for {process_day}: started'
     )
 
+    if current_app.config['SET_BASED_FACT_AGGREGATION_ENABLED']:
+        _aggregate_facts_for_day(
+            'ft_billing',
+            process_day,
+            [SMS_TYPE, EMAIL_TYPE, LETTER_TYPE],
+            lambda service_ids: update_fact_billing_for_day(process_day, service_ids),
+        )
+        return
+
     start = datetime.utcnow()
     transit_data = fetch_billing_data_for_day(process_day=process_day)
     end = datetime.utcnow()
@@ -89,6 +106,17 @@ def create_nightly_notification_status():
 
     yesterday = convert_utc_to_bst(datetime.utcnow()).date() - timedelta(days=1)
 
+    if current_app.config['SET_BASED_FACT_AGGREGATION_ENABLED']:
+        for i in range(10):
+            create_nightly_notification_status_for_day.apply_async(
+                kwargs={
+                    'process_day': (yesterday - timedelta(days=i)).isoformat(),
+                    'notification_types': [SMS_TYPE, EMAIL_TYPE, LETTER_TYPE] if i < 4 else [LETTER_TYPE],
+                },
+                queue=QueueNames.REPORTING
+            )
+        return
+
     for notification_type in [SMS_TYPE, EMAIL_TYPE, LETTER_TYPE]:
         days = 10 if notification_type == LETTER_TYPE else 4
 
@@ -127,3 +155,45 @@ def create_nightly_notification_status_for_service_and_day(process_day, service_
         f'for {service_id}, {notification_type} for {process_day}: '
         f'updated in {(end - start).seconds} seconds'
     )
+
+
+@notify_celery.task(name="create-nightly-notification-status-for-day")
+def create_nightly_notification_status_for_day(process_day, notification_types):
+    process_day = datetime.strptime(process_day, "%Y-%m-%d").date()
+    _aggregate_facts_for_day(
+        'ft_notification_status',
+        process_day,
+        notification_types,
+        lambda service_ids: update_fact_notification_status_for_day(process_day, notification_types, service_ids),
+    )
+
+
+def _aggregate_facts_for_day(fact_table, process_day, notification_types, update_facts):
+    """
+    Calls `update_facts` with the services to aggregate `fact_table` for on `process_day` - None for all of them.
+
+    With incremental aggregation, when the day has been aggregated before it's only done again for the services
+    whose notifications have changed since. When it was last aggregated is kept in redis, for as long as the nightly
+    tasks keep going back over the day.
+    """
+    start = time()
+    checkpoint_key = f'{fact_table}-aggregated-at-{process_day}'
+    service_ids = None
+    if current_app.config['INCREMENTAL_FACT_AGGREGATION_ENABLED']:
+        last_aggregated_at = redis_store.get(checkpoint_key)
+        if last_aggregated_at:
+            service_ids = get_service_ids_with_notifications_changed_since(
+                process_day, datetime.utcfromtimestamp(float(last_aggregated_at)), notification_types
+            )
+
+    rows = update_facts(service_ids) if service_ids is None or service_ids else 0
+
+    if current_app.config['INCREMENTAL_FACT_AGGREGATION_ENABLED']:
+        # leave some overlap, for updates in transactions that hadn't committed when the aggregation started
+        redis_store.set(checkpoint_key, start - 10 * 60, ex=timedelta(days=11))
+
+    services = 'all services' if service_ids is None else f'{len(service_ids)} services'
+    current_app.logger.info(
+        f'{fact_table} for {process_day} aggregated for {services}: {rows} rows updated in '
+        f'{time() - start:.1f} seconds'
+    )
@@ -8,7 +8,7 @@ from requests import HTTPError, request
 
 from app import notify_celery
 from app.aws.s3 import file_exists
-from app.celery.process_ses_receipts_tasks import process_ses_results
+from app.celery.process_ses_receipts_tasks import queue_ses_result
 from app.config import QueueNames
 from app.models import SMS_TYPE
 
@@ -50,7 +50,7 @@ def send_email_response(reference, to):
     else:
         body = ses_notification_callback(reference)
 
-    process_ses_results.apply_async([body], queue=QueueNames.RESEARCH_MODE)
+    queue_ses_result(body, queue=QueueNames.RESEARCH_MODE)
 
 
 def make_request(notification_type, provider, data, headers):
@@ -1,17 +1,31 @@
 from datetime import datetime, timedelta
+from time import time
 
-from flask import current_app
+from flask import current_app, json
 from notifications_utils.clients.zendesk.zendesk_client import (
     NotifySupportTicket,
 )
 from sqlalchemy import between
 from sqlalchemy.exc import SQLAlchemyError
 
-from app import db, notify_celery, zendesk_client
+from app import (
+    aws_sns_client,
+    db,
+    notify_celery,
+    redis_store,
+    statsd_client,
+    zendesk_client,
+)
 from app.aws import s3
 from app.celery.broadcast_message_tasks import trigger_link_test
 from app.celery.letters_pdf_tasks import get_pdf_for_templated_letter
+from app.celery.process_ses_receipts_tasks import (
+    SES_RECEIPTS_KEY,
+    process_ses_results_batch,
+)
+from app.celery.process_sns_receipts_tasks import process_sns_results_batch
 from app.celery.tasks import (
+    get_job_rows_and_template_and_sender_id,
     get_recipient_csv_and_template_and_sender_id,
     process_incomplete_jobs,
     process_job,
@@ -58,6 +72,7 @@ from app.models import (
     Job,
 )
 from app.notifications.process_notifications import send_notification_to_queue
+from app.utils import chunked
 
 
 @notify_celery.task(name="run-scheduled-jobs")
@@ -279,8 +294,13 @@ def check_if_letters_still_in_created():
 def check_for_missing_rows_in_completed_jobs():
     jobs = find_jobs_with_missing_rows()
     for job in jobs:
-        recipient_csv, template, sender_id = get_recipient_csv_and_template_and_sender_id(job)
-        missing_rows = find_missing_row_for_job(job.id, job.notification_count)
+        if current_app.config['JOB_CSV_STREAMING_ENABLED']:
+            missing_rows = find_missing_row_for_job(job.id, job.notification_count)
+            rows, template, sender_id = get_job_rows_and_template_and_sender_id(job)
+            recipient_csv = _get_rows_by_index(rows, {row.missing_row for row in missing_rows})
+        else:
+            recipient_csv, template, sender_id = get_recipient_csv_and_template_and_sender_id(job)
+            missing_rows = find_missing_row_for_job(job.id, job.notification_count)
         for row_to_process in missing_rows:
             row = recipient_csv[row_to_process.missing_row]
             current_app.logger.info(
@@ -288,6 +308,19 @@ def check_for_missing_rows_in_completed_jobs():
             process_row(row, template, job, job.service, sender_id=sender_id)
 
 
+def _get_rows_by_index(rows, indexes):
+    """
+    Picks the rows with `indexes` out of `rows`, without reading any further than the last of them
+    """
+    rows_by_index = {}
+    for row in rows:
+        if row.index in indexes:
+            rows_by_index[row.index] = row
+            if len(rows_by_index) == len(indexes):
+                break
+    return rows_by_index
+
+
 @notify_celery.task(name='check-for-services-with-high-failure-rates-or-sending-to-tv-numbers')
 def check_for_services_with_high_failure_rates_or_sending_to_tv_numbers():
     start_date = (datetime.utcnow() - timedelta(days=1))
@@ -367,3 +400,59 @@ def remove_yesterdays_planned_tests_on_govuk_alerts():
         name=TaskNames.PUBLISH_GOVUK_ALERTS,
         queue=QueueNames.GOVUK_ALERTS
     )
+
+
+@notify_celery.task(name='process-sns-delivery-status-logs')
+def process_sns_delivery_status_logs():
+    for log_group_name in current_app.config['SNS_DELIVERY_STATUS_LOG_GROUPS']:
+        _process_sns_delivery_status_log_group(log_group_name)
+
+
+def _process_sns_delivery_status_log_group(log_group_name):
+    checkpoint_key = f'sns-delivery-status-logs-checkpoint-{log_group_name}'
+    checkpoint = redis_store.get(checkpoint_key)
+    # the first time a group is read, start a little before now
+    start_time = int(checkpoint) if checkpoint else int((time() - 15 * 60) * 1000)
+
+    events = aws_sns_client.get_delivery_status_events(log_group_name, start_time)
+    for batch in chunked(events, current_app.config['SNS_DELIVERY_STATUS_BATCH_SIZE']):
+        process_sns_results_batch.apply_async(
+            [[event['message'] for event in batch]], queue=QueueNames.SMS_CALLBACKS
+        )
+        # events logged in the same millisecond as the latest one are read again next time, which does no harm
+        latest = max(event['timestamp'] for event in batch)
+        redis_store.set(checkpoint_key, latest)
+
+        statsd_client.incr('sns-delivery-status-logs.events', count=len(batch))
+        statsd_client.timing('sns-delivery-status-logs.lag', time() - latest / 1000)
+
+
+@notify_celery.task(name='drain-ses-receipts')
+def drain_ses_receipts():
+    """
+    Takes the SES receipts queue_ses_result has added to redis off the list, and processes them in batches of
+    SES_RECEIPT_BATCH_SIZE. Each batch is taken off the list in a transaction, and put back if it can't be queued.
+    """
+    if not redis_store.active:
+        return
+
+    batch_size = current_app.config['SES_RECEIPT_BATCH_SIZE']
+    while True:
+        pipeline = redis_store.redis_store.pipeline()
+        pipeline.lrange(SES_RECEIPTS_KEY, 0, batch_size - 1)
+        pipeline.ltrim(SES_RECEIPTS_KEY, batch_size, -1)
+        receipts, _ = pipeline.execute()
+        if not receipts:
+            return
+
+        try:
+            process_ses_results_batch.apply_async(
+                [[json.loads(receipt) for receipt in receipts]], queue=QueueNames.NOTIFY
+            )
+        except Exception:
+            redis_store.redis_store.lpush(SES_RECEIPTS_KEY, *reversed(receipts))
+            raise
+        statsd_client.incr('ses-receipts.drained', count=len(receipts))
+
+        if len(receipts) < batch_size:
+            return
@@ -1,20 +1,63 @@
-import json
+from math import ceil
+from time import time
 
 from flask import current_app
-from requests import HTTPError, RequestException, request
+from requests import HTTPError, RequestException
 
-from app import encryption, notify_celery
+from app import encryption, notify_celery, service_callback_client
+from app.clients.service_callback import CallbackEndpointUnavailableException
 from app.config import QueueNames
+from app.models import COMPLAINT_CALLBACK_TYPE, DELIVERY_STATUS_CALLBACK_TYPE
+from app.serialised_models import SerialisedServiceCallbackApi
 from app.utils import DATETIME_FORMAT
 
+# SQS won't delay a message for longer than 15 minutes
+MAX_PARK_COUNTDOWN_SECONDS = 15 * 60
+
 
 @notify_celery.task(bind=True, name="send-delivery-status", max_retries=5, default_retry_delay=300)
 def send_delivery_status_to_service(
-    self, notification_id, encrypted_status_update
+    self, notification_id, encrypted_status_update, parked_since=None
 ):
     status_update = encryption.decrypt(encrypted_status_update)
+    url, token = _get_callback_url_and_token(status_update, DELIVERY_STATUS_CALLBACK_TYPE)
+    if not url:
+        return
 
-    data = {
+    _send_data_to_service_callback_api(
+        self,
+        _delivery_status_callback_body(notification_id, status_update),
+        url,
+        token,
+        'send_delivery_status_to_service'
+    )
+
+
+@notify_celery.task(bind=True, name="send-delivery-statuses", max_retries=5, default_retry_delay=300)
+def send_delivery_statuses_to_service(self, encrypted_status_updates, parked_since=None):
+    """
+    Sends several status updates for one service in a single POST, as a JSON list. Only used for services with the
+    batched_callbacks permission, as their callback endpoints have to expect a list.
+    """
+    status_updates = [encryption.decrypt(status_update) for status_update in encrypted_status_updates]
+    url, token = _get_callback_url_and_token(status_updates[0], DELIVERY_STATUS_CALLBACK_TYPE)
+    if not url:
+        return
+
+    _send_data_to_service_callback_api(
+        self,
+        [
+            _delivery_status_callback_body(status_update['notification_id'], status_update)
+            for status_update in status_updates
+        ],
+        url,
+        token,
+        'send_delivery_statuses_to_service'
+    )
+
+
+def _delivery_status_callback_body(notification_id, status_update):
+    return {
         "id": str(notification_id),
         "reference": status_update['notification_client_reference'],
         "to": status_update['notification_to'],
@@ -27,18 +70,13 @@ def send_delivery_status_to_service(
         "template_version": status_update['template_version']
     }
 
-    _send_data_to_service_callback_api(
-        self,
-        data,
-        status_update['service_callback_api_url'],
-        status_update['service_callback_api_bearer_token'],
-        'send_delivery_status_to_service'
-    )
-
 
 @notify_celery.task(bind=True, name="send-complaint", max_retries=5, default_retry_delay=300)
-def send_complaint_to_service(self, complaint_data):
+def send_complaint_to_service(self, complaint_data, parked_since=None):
     complaint = encryption.decrypt(complaint_data)
+    url, token = _get_callback_url_and_token(complaint, COMPLAINT_CALLBACK_TYPE)
+    if not url:
+        return
 
     data = {
         "notification_id": complaint['notification_id'],
@@ -51,25 +89,44 @@ def send_complaint_to_service(self, complaint_data):
     _send_data_to_service_callback_api(
         self,
         data,
-        complaint['service_callback_api_url'],
-        complaint['service_callback_api_bearer_token'],
+        url,
+        token,
         'send_complaint_to_service'
     )
 
 
+def _get_callback_url_and_token(callback_data, callback_type):
+    """
+    Callback tasks carry the version of the service's callback API they were created with rather than its URL and
+    bearer token, which are looked up (and cached) here. Tasks queued before that change still carry the URL and
+    token themselves. Returns (None, None) if the service has removed its callback API since the task was queued.
+    """
+    if 'service_callback_api_url' in callback_data:
+        return callback_data['service_callback_api_url'], callback_data['service_callback_api_bearer_token']
+
+    service_callback_api = SerialisedServiceCallbackApi.from_service_id_and_type_at_version(
+        callback_data['service_id'],
+        callback_type,
+        callback_data['service_callback_api_version'],
+    )
+    if not service_callback_api:
+        current_app.logger.info(
+            "{} callback API for service {} no longer exists, not sending callback".format(
+                callback_type,
+                callback_data['service_id']
+            )
+        )
+        return None, None
+    return service_callback_api.url, service_callback_api.bearer_token
+
+
 def _send_data_to_service_callback_api(self, data, service_callback_url, token, function_name):
-    notification_id = (data["notification_id"] if "notification_id" in data else data["id"])
+    if isinstance(data, list):
+        notification_id = "{} notifications".format(len(data))
+    else:
+        notification_id = (data["notification_id"] if "notification_id" in data else data["id"])
     try:
-        response = request(
-            method="POST",
-            url=service_callback_url,
-            data=json.dumps(data),
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': 'Bearer {}'.format(token)
-            },
-            timeout=5
-        )
+        response = service_callback_client.post(service_callback_url, data, token)
         current_app.logger.info('{} sending {} to {}, response {}'.format(
             function_name,
             notification_id,
@@ -77,6 +134,8 @@ def _send_data_to_service_callback_api(self, data, service_callback_url, token,
             response.status_code
         ))
         response.raise_for_status()
+    except CallbackEndpointUnavailableException as e:
+        _park(self, e, function_name, notification_id)
     except RequestException as e:
         current_app.logger.warning(
             "{} request failed for notification_id: {} and url: {}. exception: {}".format(
@@ -108,6 +167,32 @@ def _send_data_to_service_callback_api(self, data, service_callback_url, token,
             )
 
 
+def _park(self, exception, function_name, notification_id):
+    """
+    Puts the task back on the retry queue until the circuit breaker for its host closes, without counting it as a
+    retry. Tasks that have been parked for longer than SERVICE_CALLBACK_MAX_PARKED_SECONDS are dropped.
+    """
+    kwargs = self.request.kwargs or {}
+    parked_since = kwargs.get('parked_since') or time()
+    if time() - parked_since > current_app.config['SERVICE_CALLBACK_MAX_PARKED_SECONDS']:
+        current_app.logger.warning(
+            "{} callback for notification_id: {} has been parked for too long and is not being retried. {}".format(
+                function_name,
+                notification_id,
+                exception
+            )
+        )
+        return
+
+    self.apply_async(
+        args=self.request.args,
+        kwargs={**kwargs, 'parked_since': parked_since},
+        queue=QueueNames.CALLBACKS_RETRY,
+        countdown=min(ceil(exception.retry_after_seconds), MAX_PARK_COUNTDOWN_SECONDS),
+        retries=self.request.retries,
+    )
+
+
 def create_delivery_status_callback_data(notification, service_callback_api):
     data = {
         "notification_id": str(notification.id),
@@ -119,8 +204,8 @@ def create_delivery_status_callback_data(notification, service_callback_api):
             notification.updated_at.strftime(DATETIME_FORMAT) if notification.updated_at else None,
         "notification_sent_at": notification.sent_at.strftime(DATETIME_FORMAT) if notification.sent_at else None,
         "notification_type": notification.notification_type,
-        "service_callback_api_url": service_callback_api.url,
-        "service_callback_api_bearer_token": service_callback_api.bearer_token,
+        "service_id": str(service_callback_api.service_id),
+        "service_callback_api_version": service_callback_api.version,
         "template_id": str(notification.template_id),
         "template_version": notification.template_version,
     }
@@ -134,7 +219,7 @@ def create_complaint_callback_data(complaint, notification, service_callback_api
         "reference": notification.client_reference,
         "to": recipient,
         "complaint_date": complaint.complaint_date.strftime(DATETIME_FORMAT),
-        "service_callback_api_url": service_callback_api.url,
-        "service_callback_api_bearer_token": service_callback_api.bearer_token,
+        "service_id": str(service_callback_api.service_id),
+        "service_callback_api_version": service_callback_api.version,
     }
     return encryption.encrypt(data)
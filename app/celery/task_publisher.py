@@ -0,0 +1,183 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import monotonic, sleep
+
+from celery.signals import task_postrun, worker_process_shutdown
+from kombu.asynchronous.aws.sqs.message import AsyncMessage
+from kombu.utils.json import dumps
+
+# SQS will not accept more than ten messages in a single SendMessageBatch call
+SQS_MAX_BATCH_SIZE = 10
+
+
+class BatchedTaskPublisher:
+    """
+    Buffers celery task messages per queue and publishes them to SQS up to ten at a time with SendMessageBatch,
+    rather than making one SendMessage call per task.
+
+    A queue's buffer is flushed when it holds ten messages, when its oldest message has been waiting for
+    BATCH_TASK_PUBLISHING_MAX_WAIT_SECONDS (checked by a background thread), and at the end of every celery task.
+    If a batch can't be sent, each of its messages is published on its own with `apply_async` instead.
+
+    When BATCH_TASK_PUBLISHING_ENABLED is off, or the broker isn't SQS, `publish` is just `apply_async`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._buffers = defaultdict(list)
+        self._oldest_message_at = {}
+        self._lock = threading.RLock()
+        self._flusher = None
+
+    def init_app(self, app, celery_app, statsd_client):
+        self.enabled = app.config['BATCH_TASK_PUBLISHING_ENABLED']
+        self.max_wait_seconds = app.config['BATCH_TASK_PUBLISHING_MAX_WAIT_SECONDS']
+        self.celery_app = celery_app
+        self.statsd_client = statsd_client
+        self.logger = app.logger
+
+        task_postrun.connect(self._flush_after_task, weak=False)
+        worker_process_shutdown.connect(self._flush_after_task, weak=False)
+
+    def publish(self, task, args, queue):
+        if not self.enabled:
+            task.apply_async(args, queue=queue)
+            return
+
+        with self._lock:
+            buffer = self._buffers[queue]
+            buffer.append((task, args))
+            self._oldest_message_at.setdefault(queue, monotonic())
+            buffered = len(buffer)
+
+        self.statsd_client.gauge(f'batch-publisher.{queue}.buffered', buffered)
+        self._ensure_flusher_running()
+
+        if buffered >= SQS_MAX_BATCH_SIZE:
+            self.flush(queue)
+
+    def flush(self, queue=None):
+        queues = [queue] if queue else list(self._buffers)
+        for queue_name in queues:
+            while True:
+                with self._lock:
+                    messages = self._buffers[queue_name][:SQS_MAX_BATCH_SIZE]
+                    del self._buffers[queue_name][:SQS_MAX_BATCH_SIZE]
+                    if self._buffers[queue_name]:
+                        self._oldest_message_at[queue_name] = monotonic()
+                    else:
+                        self._oldest_message_at.pop(queue_name, None)
+                if not messages:
+                    break
+                self._send(queue_name, messages)
+
+    def buffered_count(self, queue):
+        with self._lock:
+            return len(self._buffers[queue])
+
+    def _send(self, queue, messages):
+        start = monotonic()
+        # the indexes of the messages the broker has taken, which mustn't be sent again if the batch fails part way
+        published = set()
+        try:
+            self._send_batch(queue, messages, published)
+        except Exception:
+            self.logger.exception(f'Batch publish of {len(messages)} messages to {queue} failed, sending one by one')
+            self.statsd_client.incr(f'batch-publisher.{queue}.fallback')
+            for task, args in (message for index, message in enumerate(messages) if index not in published):
+                try:
+                    task.apply_async(args, queue=queue)
+                except Exception:
+                    # the notification stays in created, and will be picked up by replay-created-notifications
+                    self.logger.exception(f'Failed to publish {task.name} {args} to {queue}')
+        finally:
+            self.statsd_client.timing(f'batch-publisher.{queue}.flush-time', monotonic() - start)
+            self.statsd_client.gauge(f'batch-publisher.{queue}.buffered', self.buffered_count(queue))
+
+    def _send_batch(self, queue, messages, published):
+        with self.celery_app.producer_or_acquire() as producer:
+            channel = producer.channel
+            if not hasattr(channel, 'sqs'):
+                for index, (task, args) in enumerate(messages):
+                    task.apply_async(args, queue=queue, producer=producer)
+                    published.add(index)
+                return
+
+            # let celery and kombu build each message exactly as they would for apply_async, but hold on to it
+            # rather than letting the channel send it to SQS
+            collected = []
+            with _collect_sqs_messages(channel, collected):
+                for task, args in messages:
+                    task.apply_async(args, queue=queue, producer=producer)
+
+            # each apply_async puts one message, so `collected` lines up with `messages`
+            messages_by_queue = defaultdict(list)
+            for index, (sqs_queue, message) in enumerate(collected):
+                messages_by_queue[sqs_queue].append((index, message))
+
+            for sqs_queue, queue_messages in messages_by_queue.items():
+                response = channel.sqs(queue=channel.canonical_queue_name(sqs_queue)).send_message_batch(
+                    QueueUrl=channel._new_queue(sqs_queue),
+                    Entries=[
+                        {'Id': str(index), 'MessageBody': _encode_sqs_message_body(channel, message)}
+                        for index, message in queue_messages
+                    ],
+                )
+                failures = {int(failure['Id']): failure for failure in response.get('Failed', [])}
+                published.update(index for index, _ in queue_messages if index not in failures)
+                for index, message in queue_messages:
+                    if index in failures:
+                        self.logger.warning(
+                            f"Message failed batch publish to {sqs_queue}: {failures[index].get('Message')}"
+                        )
+                        channel._put(sqs_queue, message)
+                        published.add(index)
+
+    def _flush_after_task(self, *args, **kwargs):
+        if self.enabled:
+            self.flush()
+
+    def _ensure_flusher_running(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._flush_stale_buffers, daemon=True)
+            self._flusher.start()
+
+    def _flush_stale_buffers(self):
+        while True:
+            sleep(self.max_wait_seconds)
+            now = monotonic()
+            with self._lock:
+                stale_queues = [
+                    queue for queue, oldest in self._oldest_message_at.items()
+                    if now - oldest >= self.max_wait_seconds
+                ]
+            for queue in stale_queues:
+                try:
+                    self.flush(queue)
+                except Exception:
+                    self.logger.exception(f'Background flush of {queue} failed')
+
+
+@contextmanager
+def _collect_sqs_messages(channel, collected):
+    def collect(queue, message, **kwargs):
+        collected.append((queue, message))
+
+    channel._put = collect
+    try:
+        yield
+    finally:
+        del channel._put
+
+
+def _encode_sqs_message_body(channel, message):
+    # this matches how kombu's SQS channel encodes a message in `_put`
+    body = dumps(message)
+    if channel.sqs_base64_encoding:
+        body = AsyncMessage().encode(body)
+    return body
@@ -1,6 +1,10 @@
+import csv
+import io
 import json
 from collections import defaultdict, namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import chain, takewhile
+from time import monotonic
 
 from flask import current_app
 from notifications_utils.insensitive_dict import InsensitiveDict
@@ -10,7 +14,14 @@ from notifications_utils.timezones import convert_utc_to_bst
 from requests import HTTPError, RequestException, request
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from app import create_random_identifier, create_uuid, encryption, notify_celery
+from app import (
+    create_random_identifier,
+    create_uuid,
+    encryption,
+    notify_celery,
+    statsd_client,
+    task_publisher,
+)
 from app.aws import s3
 from app.celery import letters_pdf_tasks, provider_tasks, research_mode_tasks
 from app.config import QueueNames
@@ -18,7 +29,17 @@ from app.dao.daily_sorted_letter_dao import (
     dao_create_or_update_daily_sorted_letter,
 )
 from app.dao.inbound_sms_dao import dao_get_inbound_sms_by_id
-from app.dao.jobs_dao import dao_get_job_by_id, dao_update_job
+from app.dao.jobs_dao import (
+    dao_create_job_shards,
+    dao_finish_job_shard,
+    dao_get_job_by_id,
+    dao_get_job_shard,
+    dao_get_unfinished_job_shards,
+    dao_job_has_shards,
+    dao_start_job_shard,
+    dao_update_job,
+    find_missing_row_for_job,
+)
 from app.dao.notifications_dao import (
     dao_get_last_notification_added_for_job_id,
     dao_get_notification_or_history_by_reference,
@@ -53,11 +74,19 @@ from app.models import (
     SMS_TYPE,
     DailySortedLetter,
 )
-from app.notifications.process_notifications import persist_notification
+from app.notifications.process_notifications import (
+    build_notification,
+    persist_notification,
+    persist_notifications_in_bulk,
+)
 from app.notifications.validators import check_service_over_daily_message_limit
 from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.service.utils import service_allowed_to_send_to
-from app.utils import DATETIME_FORMAT, get_reference_from_personalisation
+from app.utils import (
+    DATETIME_FORMAT,
+    chunked,
+    get_reference_from_personalisation,
+)
 from app.v2.errors import TooManyRequestsError
 
 
@@ -86,16 +115,75 @@ def process_job(job_id, sender_id=None):
     if __sending_limits_for_job_exceeded(service, job, job_id):
         return
 
-    recipient_csv, template, sender_id = get_recipient_csv_and_template_and_sender_id(job)
+    if (
+        current_app.config['JOB_SHARDING_ENABLED']
+        and job.notification_count > current_app.config['JOB_SHARD_SIZE']
+    ):
+        shards = dao_create_job_shards(job, current_app.config['JOB_SHARD_SIZE'])
+        for shard in shards:
+            process_job_shard.apply_async([str(job.id), shard.shard_number], queue=QueueNames.JOBS)
+        current_app.logger.info(
+            "Job {} split into {} shards for {} notifications".format(job_id, len(shards), job.notification_count)
+        )
+        return
+
+    if current_app.config['JOB_CSV_STREAMING_ENABLED']:
+        rows, template, sender_id = get_job_rows_and_template_and_sender_id(job)
+    else:
+        recipient_csv, template, sender_id = get_recipient_csv_and_template_and_sender_id(job)
+        rows = recipient_csv.get_rows()
 
     current_app.logger.info("Starting job {} processing {} notifications".format(job_id, job.notification_count))
 
-    for row in recipient_csv.get_rows():
-        process_row(row, template, job, service, sender_id=sender_id)
+    process_rows(rows, template, job, service, sender_id=sender_id)
 
     job_complete(job, start=start)
 
 
+@notify_celery.task(name="process-job-shard")
+def process_job_shard(job_id, shard_number):
+    """
+    Processes the rows of one shard of a job, and completes the job if it's the last shard to finish. Rows that
+    already have a notification are skipped, so a shard can be run again after it's been interrupted - once it's
+    been in progress for JOB_SHARD_STALE_MINUTES, as until then another task may still be processing it.
+    """
+    shard = dao_get_job_shard(job_id, shard_number)
+    if shard.status == JOB_STATUS_FINISHED:
+        return
+
+    job = shard.job
+    if job.job_status != JOB_STATUS_IN_PROGRESS:
+        current_app.logger.info(
+            "Not processing shard {} of job {} with status: {}".format(shard_number, job_id, job.job_status)
+        )
+        return
+
+    if not dao_start_job_shard(shard, timedelta(minutes=current_app.config['JOB_SHARD_STALE_MINUTES'])):
+        current_app.logger.info("Shard {} of job {} is already being processed".format(shard_number, job_id))
+        return
+
+    missing_row_numbers = {
+        row.missing_row for row in find_missing_row_for_job(
+            job.id, shard.last_row - shard.first_row + 1, first_row=shard.first_row
+        )
+    }
+    rows, template, sender_id = get_job_rows_and_template_and_sender_id(
+        job, first_row=shard.first_row, last_row=shard.last_row
+    )
+    process_rows(
+        (row for row in rows if row.index in missing_row_numbers), template, job, job.service, sender_id=sender_id
+    )
+
+    unfinished_shards = dao_finish_job_shard(shard)
+    current_app.logger.info(
+        "Finished shard {} of job {}, rows {} to {}. {} shards left".format(
+            shard_number, job_id, shard.first_row, shard.last_row, unfinished_shards
+        )
+    )
+    if not unfinished_shards:
+        job_complete(job, start=job.processing_started)
+
+
 def job_complete(job, resumed=False, start=None):
     job.job_status = JOB_STATUS_FINISHED
 
@@ -123,6 +211,78 @@ def get_recipient_csv_and_template_and_sender_id(job):
     return recipient_csv, template, meta_data.get("sender_id")
 
 
+def get_job_rows_and_template_and_sender_id(job, first_row=0, last_row=None):
+    """
+    Like get_recipient_csv_and_template_and_sender_id, but returns an iterator of the job's rows, which streams the
+    file from S3 and parses it JOB_CSV_CHUNK_SIZE rows at a time, so the whole file is never held in memory.
+
+    If `first_row` and `last_row` are given only the rows between them are parsed, and the file is read no further.
+    """
+    db_template = dao_get_template_by_id(job.template_id, job.template_version)
+    template = db_template._as_utils_template()
+
+    csv_stream, meta_data = s3.get_job_stream_and_metadata_from_s3(service_id=str(job.service_id), job_id=str(job.id))
+    rows = chain.from_iterable(
+        get_recipient_csv_rows_in_chunks(
+            csv_stream, template, current_app.config['JOB_CSV_CHUNK_SIZE'], first_row=first_row, last_row=last_row
+        )
+    )
+
+    return rows, template, meta_data.get("sender_id")
+
+
+def get_recipient_csv_rows_in_chunks(csv_stream, template, chunk_size, first_row=0, last_row=None):
+    """
+    Yields lists of up to `chunk_size` rows from a CSV file, parsing each chunk with the file's header row as a
+    RecipientCSV of its own. Rows keep the index they'd have in a RecipientCSV of the whole file, which like
+    RecipientCSV doesn't count blank lines (or lines of empty values). Rows before `first_row` are skipped, and the
+    file isn't read past `last_row`.
+    """
+    records = (
+        record
+        for record in csv.reader(csv_stream, quoting=csv.QUOTE_MINIMAL, skipinitialspace=True)
+        if any(record)
+    )
+    header = next(records, None)
+    if header is None:
+        return
+
+    numbered_records = (
+        (index, record)
+        for index, record in takewhile(lambda item: last_row is None or item[0] <= last_row, enumerate(records))
+        if index >= first_row
+    )
+    for chunk in chunked(numbered_records, chunk_size):
+        chunk_file = io.StringIO()
+        writer = csv.writer(chunk_file)
+        writer.writerow(header)
+        writer.writerows(record for _, record in chunk)
+
+        rows = list(RecipientCSV(chunk_file.getvalue(), template=template).get_rows())
+        if len(rows) != len(chunk):
+            # the rows would be given the wrong job_row_number
+            raise ValueError(
+                "Parsed {} rows from a chunk of {} CSV records starting at row {}".format(
+                    len(rows), len(chunk), chunk[0][0]
+                )
+            )
+        for (index, _), row in zip(chunk, rows):
+            row.index = index
+        yield rows
+
+
+def process_rows(rows, template, job, service, sender_id=None):
+    if (
+        current_app.config['JOB_BATCH_PROCESSING_ENABLED']
+        and template.template_type in {SMS_TYPE, EMAIL_TYPE}
+    ):
+        for batch in chunked(rows, current_app.config['JOB_PROCESSING_BATCH_SIZE']):
+            process_row_batch(batch, template, job, service, sender_id=sender_id)
+    else:
+        for row in rows:
+            process_row(row, template, job, service, sender_id=sender_id)
+
+
 def process_row(row, template, job, service, sender_id=None):
     template_type = template.template_type
     encrypted = encryption.encrypt({
@@ -131,7 +291,10 @@ def process_row(row, template, job, service, sender_id=None):
         'job': str(job.id),
         'to': row.recipient,
         'row_number': row.index,
-        'personalisation': dict(row.personalisation)
+        'personalisation': dict(row.personalisation),
+        # notifications are unique on (id, created_at), so a message that's delivered twice has to save the same
+        # created_at both times to be caught as a duplicate
+        'created_at': datetime.utcnow().strftime(DATETIME_FORMAT),
     })
 
     send_fns = {
@@ -159,6 +322,44 @@ def process_row(row, template, job, service, sender_id=None):
     return notification_id
 
 
+def process_row_batch(rows, template, job, service, sender_id=None):
+    encrypted = encryption.encrypt({
+        'template': str(template.id),
+        'template_version': job.template_version,
+        'job': str(job.id),
+        'created_at': datetime.utcnow().strftime(DATETIME_FORMAT),
+        'notifications': [
+            {
+                'id': create_uuid(),
+                'to': row.recipient,
+                'row_number': row.index,
+                'personalisation': dict(row.personalisation),
+            }
+            for row in rows
+        ],
+    })
+
+    send_fns = {
+        SMS_TYPE: save_sms_batch,
+        EMAIL_TYPE: save_email_batch,
+    }
+
+    send_fn = send_fns[template.template_type]
+
+    task_kwargs = {}
+    if sender_id:
+        task_kwargs['sender_id'] = sender_id
+
+    send_fn.apply_async(
+        (
+            str(service.id),
+            encrypted,
+        ),
+        task_kwargs,
+        queue=QueueNames.DATABASE if not service.research_mode else QueueNames.RESEARCH_MODE
+    )
+
+
 def __sending_limits_for_job_exceeded(service, job, job_id):
     try:
         total_sent = check_service_over_daily_message_limit(KEY_TYPE_NORMAL, service)
@@ -212,14 +413,15 @@ def save_sms(self,
             notification_type=SMS_TYPE,
             api_key_id=None,
             key_type=KEY_TYPE_NORMAL,
-            created_at=datetime.utcnow(),
+            created_at=notification.get('created_at') or datetime.utcnow(),
             job_id=notification.get('job', None),
             job_row_number=notification.get('row_number', None),
             notification_id=notification_id,
             reply_to_text=reply_to_text
         )
 
-        provider_tasks.deliver_sms.apply_async(
+        task_publisher.publish(
+            provider_tasks.deliver_sms,
             [str(saved_notification.id)],
             queue=QueueNames.SEND_SMS if not service.research_mode else QueueNames.RESEARCH_MODE
         )
@@ -269,14 +471,15 @@ def save_email(self,
             notification_type=EMAIL_TYPE,
             api_key_id=None,
             key_type=KEY_TYPE_NORMAL,
-            created_at=datetime.utcnow(),
+            created_at=notification.get('created_at') or datetime.utcnow(),
             job_id=notification.get('job', None),
             job_row_number=notification.get('row_number', None),
             notification_id=notification_id,
             reply_to_text=reply_to_text
         )
 
-        provider_tasks.deliver_email.apply_async(
+        task_publisher.publish(
+            provider_tasks.deliver_email,
             [str(saved_notification.id)],
             queue=QueueNames.SEND_EMAIL if not service.research_mode else QueueNames.RESEARCH_MODE
         )
@@ -286,6 +489,112 @@ def save_email(self,
         handle_exception(self, notification, notification_id, e)
 
 
+@notify_celery.task(bind=True, name="save-sms-batch", max_retries=5, default_retry_delay=300)
+def save_sms_batch(self, service_id, encrypted_batch, sender_id=None):
+    save_notification_batch(self, service_id, encrypted_batch, SMS_TYPE, sender_id=sender_id)
+
+
+@notify_celery.task(bind=True, name="save-email-batch", max_retries=5, default_retry_delay=300)
+def save_email_batch(self, service_id, encrypted_batch, sender_id=None):
+    save_notification_batch(self, service_id, encrypted_batch, EMAIL_TYPE, sender_id=sender_id)
+
+
+def save_notification_batch(task, service_id, encrypted_batch, notification_type, sender_id=None):
+    start = monotonic()
+    batch = encryption.decrypt(encrypted_batch)
+    service = SerialisedService.from_id(service_id)
+    template = SerialisedTemplate.from_id_and_service_id(
+        batch['template'],
+        service_id=service.id,
+        version=batch['template_version'],
+    )
+
+    if notification_type == SMS_TYPE:
+        reply_to_text = (
+            dao_get_service_sms_senders_by_id(service_id, sender_id).sms_sender if sender_id
+            else template.reply_to_text
+        )
+        deliver_task = provider_tasks.deliver_sms
+        deliver_batch_task = provider_tasks.deliver_sms_batch
+        queue = QueueNames.SEND_SMS
+    else:
+        reply_to_text = (
+            dao_get_reply_to_by_id(service_id, sender_id).email_address if sender_id
+            else template.reply_to_text
+        )
+        deliver_task = provider_tasks.deliver_email
+        deliver_batch_task = provider_tasks.deliver_email_batch
+        queue = QueueNames.SEND_EMAIL
+
+    created_at = batch.get('created_at') or datetime.utcnow()
+    notifications = []
+    for row in batch['notifications']:
+        if not service_allowed_to_send_to(row['to'], service, KEY_TYPE_NORMAL):
+            current_app.logger.debug(
+                "{} {} failed as restricted service".format(notification_type, row['id'])
+            )
+            continue
+
+        notifications.append(build_notification(
+            template_id=batch['template'],
+            template_version=batch['template_version'],
+            recipient=row['to'],
+            service=service,
+            personalisation=row.get('personalisation'),
+            notification_type=notification_type,
+            api_key_id=None,
+            key_type=KEY_TYPE_NORMAL,
+            created_at=created_at,
+            job_id=batch['job'],
+            job_row_number=row['row_number'],
+            notification_id=row['id'],
+            reply_to_text=reply_to_text,
+        ))
+
+    try:
+        inserted_ids = persist_notifications_in_bulk(notifications, service.id)
+    except SQLAlchemyError:
+        # the insert skips rows that already exist, so it is safe to retry the whole batch
+        current_app.logger.exception(
+            "Retry save-{}-batch for job {} ({} notifications)".format(
+                notification_type, batch['job'], len(notifications)
+            )
+        )
+        try:
+            task.retry(queue=QueueNames.RETRY)
+        except task.MaxRetriesExceededError:
+            current_app.logger.error(
+                "Max retry failed save-{}-batch for job {}".format(notification_type, batch['job'])
+            )
+        return
+
+    # Notifications that were already in the database came from an earlier attempt at this batch, and were queued
+    # for delivery then. If that attempt died part way through queueing, replay-created-notifications picks them up.
+    queue = queue if not service.research_mode else QueueNames.RESEARCH_MODE
+    ids_to_deliver = [str(notification.id) for notification in notifications if str(notification.id) in inserted_ids]
+    delivery_batch_size = current_app.config['DELIVERY_BATCH_SIZE']
+    if delivery_batch_size > 1:
+        for delivery_batch in chunked(ids_to_deliver, delivery_batch_size):
+            task_publisher.publish(deliver_batch_task, [delivery_batch], queue=queue)
+    else:
+        for notification_id in ids_to_deliver:
+            task_publisher.publish(deliver_task, [notification_id], queue=queue)
+
+    elapsed_time = monotonic() - start
+    statsd_client.timing("tasks.save-{}-batch.duration".format(notification_type), elapsed_time)
+    statsd_client.incr("tasks.save-{}-batch.notifications".format(notification_type), count=len(inserted_ids))
+    current_app.logger.info(
+        "Saved {} of {} {} notifications for job {} in {:.3f}s ({:.0f} per second)".format(
+            len(inserted_ids),
+            len(batch['notifications']),
+            notification_type,
+            batch['job'],
+            elapsed_time,
+            len(inserted_ids) / elapsed_time if elapsed_time else 0,
+        )
+    )
+
+
 @notify_celery.task(bind=True, name="save-api-email", max_retries=5, default_retry_delay=300)
 def save_api_email(self, encrypted_notification):
 
@@ -323,10 +632,7 @@ def save_api_email_or_sms(self, encrypted_notification):
         )
 
         q = q if not service.research_mode else QueueNames.RESEARCH_MODE
-        provider_task.apply_async(
-            [notification['id']],
-            queue=q
-        )
+        task_publisher.publish(provider_task, [notification['id']], queue=q)
         current_app.logger.debug(
             f"{notification['notification_type']} {notification['id']} has been persisted and sent to delivery queue."
         )
@@ -375,7 +681,7 @@ def save_letter(
             notification_type=LETTER_TYPE,
             api_key_id=None,
             key_type=KEY_TYPE_NORMAL,
-            created_at=datetime.utcnow(),
+            created_at=notification.get('created_at') or datetime.utcnow(),
             job_id=notification['job'],
             job_row_number=notification['row_number'],
             notification_id=notification_id,
@@ -630,6 +936,18 @@ def process_incomplete_jobs(job_ids):
 def process_incomplete_job(job_id):
     job = dao_get_job_by_id(job_id)
 
+    if dao_job_has_shards(job_id):
+        # only the shards that didn't finish are run again, and they skip the rows they'd already done
+        unfinished_shards = dao_get_unfinished_job_shards(job_id)
+        current_app.logger.info(
+            "Resuming job {} shards {}".format(job_id, [shard.shard_number for shard in unfinished_shards])
+        )
+        for shard in unfinished_shards:
+            process_job_shard.apply_async([str(job_id), shard.shard_number], queue=QueueNames.JOBS)
+        if not unfinished_shards:
+            job_complete(job, resumed=True)
+        return
+
     last_notification_added = dao_get_last_notification_added_for_job_id(job_id)
 
     if last_notification_added:
@@ -641,9 +959,13 @@ def process_incomplete_job(job_id):
 
     recipient_csv, template, sender_id = get_recipient_csv_and_template_and_sender_id(job)
 
-    for row in recipient_csv.get_rows():
-        if row.index > resume_from_row:
-            process_row(row, template, job, job.service, sender_id=sender_id)
+    process_rows(
+        (row for row in recipient_csv.get_rows() if row.index > resume_from_row),
+        template,
+        job,
+        job.service,
+        sender_id=sender_id,
+    )
 
     job_complete(job, resumed=True)
 
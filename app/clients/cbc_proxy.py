@@ -1,10 +1,15 @@
 import json
 import uuid
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import as_completed
+from time import monotonic
 
 import boto3
 import botocore
 from flask import current_app
+from gds_metrics import Histogram
 from notifications_utils.template import non_gsm_characters
 from sqlalchemy.schema import Sequence
 
@@ -28,6 +33,13 @@ from app.utils import DATETIME_FORMAT, format_sequential_number
 #    the preceeding Alert message in the previous_provider_messages field
 
 
+CBC_PROXY_LAMBDA_INVOKE_DURATION_SECONDS = Histogram(
+    'cbc_proxy_lambda_invoke_duration_seconds',
+    'Time taken to invoke a CBC proxy lambda and get its response',
+    ['lambda_name', 'success']
+)
+
+
 class CBCProxyRetryableException(Exception):
     pass
 
@@ -108,6 +120,10 @@ class CBCProxyClientBase(ABC):
         pass
 
     def _invoke_lambda_with_failover(self, payload):
+        hedging_deadline = current_app.config['CBC_PROXY_HEDGING_DEADLINE_SECONDS']
+        if hedging_deadline:
+            return self._invoke_lambda_with_hedged_failover(payload, hedging_deadline)
+
         result = self._invoke_lambda(self.lambda_name, payload)
 
         if not result:
@@ -119,7 +135,51 @@ class CBCProxyClientBase(ABC):
 
         return result
 
+    def _invoke_lambda_with_hedged_failover(self, payload, hedging_deadline):
+        """
+        Invokes the primary lambda, and if it hasn't succeeded within `hedging_deadline` seconds invokes the failover
+        lambda as well, without waiting for the primary to give up. Whichever succeeds first wins.
+
+        Both lambdas send the same message, with the same identifier, to the same provider, just as they would if the
+        primary had failed.
+        """
+        app = current_app._get_current_object()
+
+        def invoke(lambda_name):
+            with app.app_context():
+                return self._invoke_lambda(lambda_name, payload)
+
+        # a request can't be cancelled once it's in flight, so don't wait for the slower lambda to finish
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cbc-proxy')
+        try:
+            primary = executor.submit(invoke, self.lambda_name)
+            try:
+                if primary.result(timeout=hedging_deadline):
+                    return True
+            except FutureTimeoutError:
+                current_app.logger.info(
+                    f'Lambda {self.lambda_name} took longer than {hedging_deadline} seconds, '
+                    f'also calling {self.failover_lambda_name}'
+                )
+
+            failover = executor.submit(invoke, self.failover_lambda_name)
+            for future in as_completed([primary, failover]):
+                if future.result():
+                    return True
+        finally:
+            executor.shutdown(wait=False)
+
+        raise CBCProxyRetryableException(
+            f'Lambda failed for both {self.lambda_name} and {self.failover_lambda_name}'
+        )
+
     def _invoke_lambda(self, lambda_name, payload):
+        start = monotonic()
+        success = self._invoke_lambda_and_check_result(lambda_name, payload)
+        CBC_PROXY_LAMBDA_INVOKE_DURATION_SECONDS.labels(lambda_name, success).observe(monotonic() - start)
+        return success
+
+    def _invoke_lambda_and_check_result(self, lambda_name, payload):
         payload_bytes = bytes(json.dumps(payload), encoding='utf8')
         try:
             current_app.logger.info(
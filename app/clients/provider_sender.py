@@ -0,0 +1,110 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from app.clients import ClientException
+
+
+class ProviderSenderBusyException(ClientException):
+    '''
+    Raised when a provider already has as many requests in flight as it is allowed, and none finished in time
+    '''
+    pass
+
+
+class ProviderSender:
+    """
+    Runs provider requests (SES send_email, SNS publish, ...) on a thread pool so that a single celery worker
+    process can keep several of them in flight at once, rather than spending most of its time waiting on HTTPS.
+
+    Each provider has its own cap on requests in flight (PROVIDER_MAX_IN_FLIGHT). `submit` blocks the caller while
+    a provider is at its cap, and gives up with ProviderSenderBusyException after PROVIDER_SENDER_QUEUE_TIMEOUT_SECONDS,
+    so a slow provider pushes back on the task feeding it instead of building up an unbounded queue.
+
+    `send` is the blocking version of `submit`. When PROVIDER_SENDER_ENABLED is off it calls the provider directly
+    on the current thread, exactly as before.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._semaphores = {}
+        self._in_flight = {}
+
+    def init_app(self, app, statsd_client):
+        self.app = app
+        self.statsd_client = statsd_client
+        self.enabled = app.config['PROVIDER_SENDER_ENABLED']
+        self.max_in_flight = app.config['PROVIDER_MAX_IN_FLIGHT']
+        self.default_max_in_flight = app.config['PROVIDER_DEFAULT_MAX_IN_FLIGHT']
+        self.queue_timeout_seconds = app.config['PROVIDER_SENDER_QUEUE_TIMEOUT_SECONDS']
+
+    def send(self, provider_name, send_fn, *args, **kwargs):
+        if not self.enabled:
+            return send_fn(*args, **kwargs)
+        return self.submit(provider_name, send_fn, *args, **kwargs).result()
+
+    def submit(self, provider_name, send_fn, *args, **kwargs):
+        queued_at = monotonic()
+        semaphore = self._semaphore(provider_name)
+        if not semaphore.acquire(timeout=self.queue_timeout_seconds):
+            self.statsd_client.incr(f'provider-sender.{provider_name}.busy')
+            raise ProviderSenderBusyException(
+                f'{provider_name} still had {self.max_in_flight_for(provider_name)} requests in flight '
+                f'after {self.queue_timeout_seconds} seconds'
+            )
+
+        self._change_in_flight(provider_name, 1)
+        try:
+            future = self._get_executor().submit(
+                self._run, provider_name, semaphore, queued_at, send_fn, args, kwargs
+            )
+        except Exception:
+            self._finished(provider_name, semaphore)
+            raise
+        return future
+
+    def in_flight(self, provider_name):
+        with self._lock:
+            return self._in_flight.get(provider_name, 0)
+
+    def max_in_flight_for(self, provider_name):
+        return self.max_in_flight.get(provider_name, self.default_max_in_flight)
+
+    def _run(self, provider_name, semaphore, queued_at, send_fn, args, kwargs):
+        self.statsd_client.timing(f'provider-sender.{provider_name}.queue-time', monotonic() - queued_at)
+        try:
+            # provider clients use current_app for config and logging
+            with self.app.app_context():
+                return send_fn(*args, **kwargs)
+        finally:
+            self._finished(provider_name, semaphore)
+
+    def _finished(self, provider_name, semaphore):
+        self._change_in_flight(provider_name, -1)
+        semaphore.release()
+
+    def _change_in_flight(self, provider_name, change):
+        with self._lock:
+            in_flight = self._in_flight.get(provider_name, 0) + change
+            self._in_flight[provider_name] = in_flight
+        self.statsd_client.gauge(f'provider-sender.{provider_name}.in-flight', in_flight)
+
+    def _semaphore(self, provider_name):
+        with self._lock:
+            if provider_name not in self._semaphores:
+                self._semaphores[provider_name] = threading.BoundedSemaphore(self.max_in_flight_for(provider_name))
+            return self._semaphores[provider_name]
+
+    def _get_executor(self):
+        # celery forks its worker processes after the app is created, and threads don't survive a fork, so each
+        # process starts its own pool the first time it sends something
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                max_workers = sum(self.max_in_flight.values()) or self.default_max_in_flight
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provider-sender')
+                self._executor_pid = os.getpid()
+            return self._executor
@@ -0,0 +1,158 @@
+import threading
+from time import sleep, time
+
+from app.clients import ClientException
+
+# Refills the bucket for the time since it was last touched, then takes a token. If the bucket is empty the token is
+# taken anyway (leaving it in debt) and the caller is told how long to wait before sending - unless that wait would
+# be longer than it is prepared to wait, in which case nothing is taken.
+# Returns the tokens left and the wait as strings, as redis would truncate lua numbers to integers.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if wait <= max_wait then
+    tokens = tokens - 1
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+end
+return {tostring(tokens), tostring(wait)}
+"""
+
+# Puts back a token taken by TOKEN_BUCKET_LUA. If the bucket has expired since, it's full anyway.
+RELEASE_TOKEN_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'tokens', 1)
+end
+"""
+
+
+class SendRateExceededException(ClientException):
+    '''
+    Raised when sending now would mean waiting longer than SEND_RATE_MAX_WAIT_SECONDS for the provider's send rate
+    '''
+
+    def __init__(self, bucket, wait):
+        self.bucket = bucket
+        self.wait = wait
+
+    def __str__(self):
+        return "Send rate for {} exceeded, next slot in {:.2f}s".format(self.bucket, self.wait)
+
+
+class SendRateGovernor:
+    """
+    Paces sends to each provider to its account's max send rate, across every worker, with a token bucket in redis.
+
+    Buckets are named after the provider (`ses`, `sns`), and SMS also take a token from a bucket for the number they
+    are sent from (`sns:+15555550100`). Rates come from PROVIDER_MAX_SEND_RATES, where `<provider>:origination-number`
+    is the rate for each of that provider's numbers.
+
+    `acquire` sleeps until the bucket has a token for us, or raises SendRateExceededException if that would take longer
+    than SEND_RATE_MAX_WAIT_SECONDS, so the task can retry later rather than tie up a worker.
+
+    If redis is disabled or erroring, each process falls back to a local bucket with its share of the rate
+    (divided by SEND_RATE_LOCAL_FALLBACK_PROCESSES).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._local_buckets = {}
+        self._lock = threading.Lock()
+        self._scripts = {}
+
+    def init_app(self, app, redis_store, statsd_client):
+        self.enabled = app.config['SEND_RATE_GOVERNOR_ENABLED']
+        self.rates = app.config['PROVIDER_MAX_SEND_RATES']
+        self.max_wait_seconds = app.config['SEND_RATE_MAX_WAIT_SECONDS']
+        self.local_fallback_processes = app.config['SEND_RATE_LOCAL_FALLBACK_PROCESSES']
+        self.redis_store = redis_store
+        self.statsd_client = statsd_client
+        self.logger = app.logger
+
+    def rate_for(self, bucket):
+        if bucket in self.rates:
+            return self.rates[bucket]
+        provider, _, origination_number = bucket.partition(':')
+        if origination_number:
+            return self.rates.get(f'{provider}:origination-number')
+        return None
+
+    def acquire(self, bucket):
+        rate = self.rate_for(bucket)
+        if not self.enabled or not rate:
+            return
+
+        tokens, wait = self._take_token(bucket, rate)
+        self.statsd_client.gauge(f'send-rate.{bucket}.tokens', tokens)
+        if wait > self.max_wait_seconds:
+            self.statsd_client.incr(f'send-rate.{bucket}.exceeded')
+            raise SendRateExceededException(bucket, wait)
+
+        self.statsd_client.timing(f'send-rate.{bucket}.wait-time', wait)
+        if wait > 0:
+            sleep(wait)
+
+    def release(self, bucket):
+        """
+        Gives back a token taken by `acquire`, when nothing was sent with it after all
+        """
+        rate = self.rate_for(bucket)
+        if not self.enabled or not rate:
+            return
+
+        if self.redis_store.active:
+            try:
+                self._run_script(RELEASE_TOKEN_LUA, keys=[f'send-rate-{bucket}'], args=[])
+                return
+            except Exception:
+                self.logger.exception(f'Send rate bucket {bucket} unavailable in redis, using a local bucket')
+        with self._lock:
+            if bucket in self._local_buckets:
+                tokens, updated_at = self._local_buckets[bucket]
+                self._local_buckets[bucket] = (tokens + 1, updated_at)
+
+    def _take_token(self, bucket, rate):
+        if self.redis_store.active:
+            try:
+                return self._take_redis_token(bucket, rate)
+            except Exception:
+                self.logger.exception(f'Send rate bucket {bucket} unavailable in redis, using a local bucket')
+                self.statsd_client.incr(f'send-rate.{bucket}.local-fallback')
+        return self._take_local_token(bucket, rate / self.local_fallback_processes)
+
+    def _take_redis_token(self, bucket, rate):
+        tokens, wait = self._run_script(
+            TOKEN_BUCKET_LUA,
+            keys=[f'send-rate-{bucket}'],
+            args=[rate, max(rate, 1), time(), self.max_wait_seconds],
+        )
+        return float(tokens), float(wait)
+
+    def _run_script(self, lua, keys, args):
+        if lua not in self._scripts:
+            self._scripts[lua] = self.redis_store.redis_store.register_script(lua)
+        return self._scripts[lua](keys=keys, args=args)
+
+    def _take_local_token(self, bucket, rate):
+        capacity = max(rate, 1)
+        now = time()
+        with self._lock:
+            tokens, updated_at = self._local_buckets.get(bucket, (capacity, now))
+            tokens = min(capacity, tokens + max(0, now - updated_at) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0
+            if wait <= self.max_wait_seconds:
+                tokens -= 1
+                self._local_buckets[bucket] = (tokens, now)
+        return tokens, wait
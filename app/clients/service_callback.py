@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from time import monotonic
+from urllib.parse import urlsplit
+
+import requests
+from gds_metrics import Counter, Histogram
+from requests.adapters import HTTPAdapter
+
+from app.clients import ClientException
+
+SERVICE_CALLBACK_REQUEST_DURATION_SECONDS = Histogram(
+    'service_callback_request_duration_seconds',
+    'Time taken to POST a callback to a service, by the host it was sent to and what happened',
+    ['host', 'outcome'],
+)
+SERVICE_CALLBACKS_PARKED = Counter(
+    'service_callbacks_parked',
+    'Callbacks not sent because the circuit breaker for their host was open',
+    ['host'],
+)
+
+
+class CallbackEndpointUnavailableException(ClientException):
+    '''
+    Raised instead of making a request when a host's circuit breaker is open
+    '''
+
+    def __init__(self, host, retry_after_seconds):
+        self.host = host
+        self.retry_after_seconds = retry_after_seconds
+        super().__init__(f'Callbacks to {host} are paused for another {retry_after_seconds:.0f} seconds')
+
+
+class ServiceCallbackClient:
+    """
+    Sends callbacks to services' callback URLs, keeping one pooled requests.Session per host in each process so that
+    connections to the same few hosts are reused instead of paying for a new TCP and TLS handshake each time.
+
+    With SERVICE_CALLBACK_CIRCUIT_BREAKER_ENABLED on, a host that fails SERVICE_CALLBACK_CIRCUIT_BREAKER_FAILURES
+    times in a row (connection errors, timeouts, 429s and 5xx) is left alone for
+    SERVICE_CALLBACK_CIRCUIT_BREAKER_RESET_SECONDS: `post` raises CallbackEndpointUnavailableException for it rather
+    than making a request. After that one request is let through while the others keep waiting, and the breaker
+    closes again if it succeeds or stays open for another SERVICE_CALLBACK_CIRCUIT_BREAKER_RESET_SECONDS if it fails.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._sessions_pid = None
+        self._consecutive_failures = {}
+        self._opened_at = {}
+        self._probing = set()
+
+    def init_app(self, app, statsd_client):
+        self.statsd_client = statsd_client
+        self.logger = app.logger
+        self.pool_size = app.config['SERVICE_CALLBACK_POOL_SIZE']
+        self.timeout = app.config['SERVICE_CALLBACK_TIMEOUT_SECONDS']
+        self.circuit_breaker_enabled = app.config['SERVICE_CALLBACK_CIRCUIT_BREAKER_ENABLED']
+        self.circuit_breaker_failures = app.config['SERVICE_CALLBACK_CIRCUIT_BREAKER_FAILURES']
+        self.circuit_breaker_reset_seconds = app.config['SERVICE_CALLBACK_CIRCUIT_BREAKER_RESET_SECONDS']
+
+    def post(self, url, data, token):
+        host = urlsplit(url).netloc
+        retry_after_seconds = self._seconds_until_request_allowed(host)
+        if retry_after_seconds:
+            SERVICE_CALLBACKS_PARKED.labels(host).inc()
+            raise CallbackEndpointUnavailableException(host, retry_after_seconds)
+
+        start = monotonic()
+        outcome = 'error'
+        try:
+            response = self._session(url).post(
+                url,
+                data=json.dumps(data),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': 'Bearer {}'.format(token)
+                },
+                timeout=self.timeout,
+            )
+            outcome = str(response.status_code)
+            return response
+        finally:
+            elapsed_time = monotonic() - start
+            SERVICE_CALLBACK_REQUEST_DURATION_SECONDS.labels(host, outcome).observe(elapsed_time)
+            self.statsd_client.timing('service-callback.request-time', elapsed_time)
+            self._record_outcome(host, outcome)
+
+    def seconds_until_closed(self, host):
+        """
+        How much longer the circuit breaker for `host` stays open, or 0 if requests can be made to it
+        """
+        opened_at = self._opened_at.get(host)
+        if not self.circuit_breaker_enabled or opened_at is None:
+            return 0
+        return max(0, opened_at + self.circuit_breaker_reset_seconds - monotonic())
+
+    def _seconds_until_request_allowed(self, host):
+        # once the breaker's reset time has passed, only the first caller is let through to probe the host. The breaker
+        # is stamped again so that everyone else keeps waiting until that request has succeeded or failed
+        with self._lock:
+            retry_after_seconds = self.seconds_until_closed(host)
+            if not retry_after_seconds and self.circuit_breaker_enabled and host in self._opened_at:
+                self._opened_at[host] = monotonic()
+                self._probing.add(host)
+            return retry_after_seconds
+
+    def _record_outcome(self, host, outcome):
+        failed = outcome == 'error' or outcome == '429' or outcome.startswith('5')
+        with self._lock:
+            probing = host in self._probing
+            self._probing.discard(host)
+            if not failed:
+                self._consecutive_failures.pop(host, None)
+                self._opened_at.pop(host, None)
+                return
+
+            failures = self._consecutive_failures.get(host, 0) + 1
+            self._consecutive_failures[host] = failures
+            if self.circuit_breaker_enabled and failures >= self.circuit_breaker_failures:
+                if host not in self._opened_at or probing:
+                    self.logger.warning(
+                        f'Pausing callbacks to {host} for {self.circuit_breaker_reset_seconds} seconds '
+                        f'after {failures} failures in a row'
+                    )
+                self._opened_at[host] = monotonic()
+
+    def _session(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            # sessions hold open sockets, so must not be shared with processes forked from this one
+            if self._sessions_pid != os.getpid():
+                self._sessions = {}
+                self._sessions_pid = os.getpid()
+            if key not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(f'{parts.scheme}://', adapter)
+                self._sessions[key] = session
+            return self._sessions[key]
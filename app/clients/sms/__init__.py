@@ -25,4 +25,10 @@ class SmsClient(Client):
         raise NotImplementedError("TODO Need to implement.")
 
     def get_name(self):
-        raise NotImplementedError("TODO Need to implement.")
\ No newline at end of file
+        raise NotImplementedError("TODO Need to implement.")
+
+    def get_origination_number(self, to, sender=None):
+        """
+        The number the provider will send an SMS to `to` from, if it sends from a number of ours. None otherwise.
+        """
+        return None
@@ -7,6 +7,35 @@ import phonenumbers
 
 from app.clients.sms import SmsClient
 
+# SNS logs a providerResponse with each failed delivery. These ones mean sending again won't help
+sns_permanent_failure_responses = {
+    'Blocked as spam by phone carrier',
+    'Destination is on a blocked list',
+    'Invalid phone number',
+    'Phone carrier has blocked this message',
+    'Phone has blocked SMS',
+    'Phone is on a blocked list',
+    'Phone number is opted out',
+}
+# and these ones are our fault rather than the recipient's
+sns_technical_failure_responses = {
+    'Message body is invalid',
+    'This delivery would exceed max price',
+}
+
+
+def get_sns_delivery_status(status, provider_response=None):
+    """
+    Maps the status and providerResponse of an SNS SMS delivery status log event to a notification status
+    """
+    if status == 'SUCCESS':
+        return 'delivered'
+    if provider_response in sns_permanent_failure_responses:
+        return 'permanent-failure'
+    if provider_response in sns_technical_failure_responses:
+        return 'technical-failure'
+    return 'temporary-failure'
+
 
 class AwsSnsClient(SmsClient):
     """
@@ -20,7 +49,8 @@ class AwsSnsClient(SmsClient):
         self.current_app = current_app
         self.statsd_client = statsd_client
         self.long_code_regex = re.compile(r"^\+1\d{10}$")
-        
+        self._logs_clients = {}
+
     @property
     def name(self):
         return 'sns'
@@ -85,5 +115,28 @@ class AwsSnsClient(SmsClient):
             self.current_app.logger.error("No valid numbers found in {}".format(to))
             raise ValueError("No valid numbers found for SMS delivery")
 
+    def get_origination_number(self, to, sender=None):
+        for match in phonenumbers.PhoneNumberMatcher(to, "US"):
+            # this follows the choice of number made in send_sms
+            if phonenumbers.region_code_for_number(match.number) == "US":
+                return self.current_app.config["AWS_US_TOLL_FREE_NUMBER"]
+            if self._send_with_dedicated_phone_number(sender):
+                return sender
+            return None
+        return None
+
     def _send_with_dedicated_phone_number(self, sender):
-        return sender and re.match(self.long_code_regex, sender)
\ No newline at end of file
+        return sender and re.match(self.long_code_regex, sender)
+
+    def get_delivery_status_events(self, log_group_name, start_time):
+        """
+        Yields the SMS delivery status events SNS has logged to a CloudWatch Logs group (named like
+        sns/<region>/<account id>/DirectPublishToPhoneNumber) at or after `start_time`, in milliseconds since the epoch
+        """
+        region = log_group_name.split('/')[1]
+        if region not in self._logs_clients:
+            self._logs_clients[region] = boto3.client("logs", region_name=region)
+
+        paginator = self._logs_clients[region].get_paginator("filter_log_events")
+        for page in paginator.paginate(logGroupName=log_group_name, startTime=start_time):
+            yield from page["events"]
@@ -1,9 +1,11 @@
 import csv
 import functools
 import itertools
+import math
 import os
 import uuid
 from datetime import datetime, timedelta
+from time import monotonic
 
 import click
 import flask
@@ -11,13 +13,18 @@ from click_datetime import Datetime as click_dt
 from flask import current_app, json
 from notifications_utils.recipients import RecipientCSV
 from notifications_utils.statsd_decorators import statsd
-from notifications_utils.template import SMSMessageTemplate
+from notifications_utils.template import (
+    HTMLEmailTemplate,
+    PlainTextEmailTemplate,
+    SMSMessageTemplate,
+)
 from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
 from app import db
 from app.aws import s3
+from app.broadcast_message.translators import cap_alert_to_dict
 from app.celery.letters_pdf_tasks import (
     get_pdf_for_templated_letter,
     resanitise_pdf,
@@ -35,6 +42,16 @@ from app.dao.fact_billing_dao import (
     update_fact_billing,
 )
 from app.dao.jobs_dao import dao_get_job_by_id
+from app.dao.notification_partitions_dao import (
+    dao_archive_notification_partition,
+    dao_create_notification_partitions,
+    dao_get_notification_partition_days,
+    get_partition_name,
+)
+from app.dao.notifications_dao import (
+    dao_get_notifications_by_recipient_or_reference,
+    move_notifications_to_notification_history,
+)
 from app.dao.organisation_dao import (
     dao_add_service_to_organisation,
     dao_get_organisation_by_email_address,
@@ -54,6 +71,7 @@ from app.dao.users_dao import (
     delete_user_verify_codes,
     get_user_by_email,
 )
+from app.delivery import send_to_providers
 from app.models import (
     KEY_TYPE_TEST,
     NOTIFICATION_CREATED,
@@ -63,12 +81,16 @@ from app.models import (
     EmailBranding,
     LetterBranding,
     Notification,
+    NotificationHistory,
     Organisation,
     Permission,
     Service,
     User,
 )
+from app.serialised_models import SerialisedService
+from app.serialised_models import caches as serialised_model_caches
 from app.utils import get_london_midnight_in_utc
+from app.xml_schemas import clear_schema_caches, parse_xml
 
 
 @click.group(name='command', help='Additional commands')
@@ -841,3 +863,239 @@ def local_dev_broadcast_permissions(user_id):
         permission_dao.set_user_service_permission(
             user, service, permission_list, _commit=True, replace=True
         )
+
+
+@notify_command(name='benchmark-email-rendering')
+@click.option('-t', '--template_id', required=True, type=click.UUID, help="The email template to render")
+@click.option('-n', '--number', default=1000, type=int, help="How many emails to render each way")
+def benchmark_email_rendering(template_id, number):
+    """
+    Times how long send_email_to_provider spends getting a template and branding and rendering an email, with the
+    delivery worker caches cleared before every message and with them warm.
+    """
+    template = dao_get_template_by_id(template_id)
+    service = SerialisedService.from_id(template.service_id)
+    version = template.version
+    personalisation = {
+        placeholder: 'Lorem ipsum dolor sit amet'
+        for placeholder in PlainTextEmailTemplate(
+            send_to_providers.get_template(template_id, service.id, version).__dict__
+        ).placeholders
+    }
+
+    def render():
+        template_dict = send_to_providers.get_template(template_id, service.id, version).__dict__
+        str(HTMLEmailTemplate(
+            template_dict, values=personalisation, **send_to_providers.get_html_email_options(service)
+        ))
+        str(PlainTextEmailTemplate(template_dict, values=personalisation))
+
+    def clear_caches():
+        send_to_providers.template_cache.clear()
+        send_to_providers.email_branding_options_cache.clear()
+        for cache in serialised_model_caches.values():
+            cache.clear()
+
+    cold_seconds = warm_seconds = 0
+    for _ in range(number):
+        clear_caches()
+        start = monotonic()
+        render()
+        cold_seconds += monotonic() - start
+
+    for _ in range(number):
+        start = monotonic()
+        render()
+        warm_seconds += monotonic() - start
+
+    print(f'Template {template_id} ({len(template.content)} characters), {number} emails each way')
+    print(f'cold caches: {cold_seconds / number * 1000:.3f}ms per email')
+    print(f'warm caches: {warm_seconds / number * 1000:.3f}ms per email')
+
+
+@notify_command(name='benchmark-cap-ingestion')
+@click.option('-a', '--areas', default=50, type=int, help="How many areas to put in the CAP document")
+@click.option('-p', '--points', default=200, type=int, help="How many points in each area's polygon")
+@click.option('-n', '--number', default=100, type=int, help="How many times to ingest the document each way")
+def benchmark_cap_ingestion(areas, points, number):
+    """
+    Times how long POST /v2/broadcast spends validating a large CAP document against the schema and turning it into
+    a dict, with the compiled schema thrown away before every document and with it cached.
+    """
+    def polygon(area_number):
+        centre_lat, centre_lon = 51 + area_number / 100, -1 + area_number / 100
+        coordinates = [
+            '{:.5f},{:.5f}'.format(
+                centre_lat + 0.01 * math.sin(2 * math.pi * i / points),
+                centre_lon + 0.01 * math.cos(2 * math.pi * i / points),
+            )
+            for i in range(points)
+        ]
+        return ' '.join(coordinates + coordinates[:1])
+
+    areas_xml = ''.join(
+        f'<area><areaDesc>Area {i}</areaDesc><polygon>{polygon(i)}</polygon></area>' for i in range(areas)
+    )
+    cap_xml = f"""
+        <alert xmlns="urn:oasis:names:tc:emergency:cap:1.2">
+            <identifier>{uuid.uuid4()}</identifier>
+            <sender>www.gov.uk/environment-agency</sender>
+            <sent>2020-02-16T23:01:13-00:00</sent>
+            <status>Actual</status>
+            <msgType>Alert</msgType>
+            <scope>Public</scope>
+            <info>
+                <category>Met</category>
+                <event>Benchmark</event>
+                <urgency>Immediate</urgency>
+                <severity>Severe</severity>
+                <certainty>Likely</certainty>
+                <description>Benchmark broadcast</description>
+                {areas_xml}
+            </info>
+        </alert>
+    """.encode('utf-8')
+
+    def ingest():
+        cap_alert = parse_xml(cap_xml, 'CAP-v1.2.xsd')
+        if cap_alert is None:
+            raise ValueError('Benchmark CAP document is not valid')
+        cap_alert_to_dict(cap_alert)
+
+    cold_seconds = warm_seconds = 0
+    for _ in range(number):
+        clear_schema_caches()
+        start = monotonic()
+        ingest()
+        cold_seconds += monotonic() - start
+
+    for _ in range(number):
+        start = monotonic()
+        ingest()
+        warm_seconds += monotonic() - start
+
+    print(f'CAP document with {areas} areas of {points} points ({len(cap_xml) / 1024:.0f}KB), {number} times each way')
+    print(f'schema compiled every time: {cold_seconds / number * 1000:.3f}ms per document')
+    print(f'schema cached: {warm_seconds / number * 1000:.3f}ms per document')
+
+
+@notify_command(name='benchmark-notification-retention')
+@click.option('-t', '--template_id', required=True, type=click.UUID, help="SMS template to create notifications from")
+@click.option('-n', '--number', default=1000000, type=int, help="How many notifications to move each way")
+def benchmark_notification_retention(template_id, number):
+    """
+    Times moving a day of notifications to notification_history the way move_notifications_to_notification_history
+    does, in chunks, and by archiving their partition. Creates `number` delivered SMS notifications from the template
+    on each of two days a year from now. The first way moves all the service's older SMS too, so only run this
+    against a local database.
+    """
+    template = dao_get_template_by_id(template_id)
+    chunked_day = datetime.utcnow().date() + timedelta(days=365)
+    partition_day = chunked_day + timedelta(days=1)
+    dao_create_notification_partitions(chunked_day, 2)
+
+    def create_notifications(day):
+        db.session.execute("""
+            INSERT INTO notifications (
+                id, "to", normalised_to, service_id, template_id, template_version, key_type, billable_units,
+                notification_type, created_at, notification_status, international
+            )
+            SELECT
+                CAST(md5(random()::text || i) AS uuid), '07700900' || lpad((i % 1000)::text, 3, '0'),
+                '447700900' || lpad((i % 1000)::text, 3, '0'), :service_id, :template_id, :template_version,
+                'normal', 1, 'sms', CAST(:day AS timestamp) + (i % 86400) * interval '1 second', 'delivered', false
+            FROM generate_series(1, :number) AS i
+        """, {
+            'service_id': template.service_id,
+            'template_id': template.id,
+            'template_version': template.version,
+            'day': day,
+            'number': number,
+        })
+        db.session.commit()
+
+    create_notifications(chunked_day)
+    start = monotonic()
+    chunked_moved = move_notifications_to_notification_history(
+        SMS_TYPE, template.service_id, datetime.combine(partition_day, datetime.min.time())
+    )
+    chunked_seconds = monotonic() - start
+
+    create_notifications(partition_day)
+    start = monotonic()
+    partition_moved, kept = dao_archive_notification_partition(partition_day)
+    partition_seconds = monotonic() - start
+
+    for table_name in (Notification.__tablename__, NotificationHistory.__tablename__):
+        for day in (chunked_day, partition_day):
+            if day in dao_get_notification_partition_days(table_name):
+                partition_name = get_partition_name(table_name, day)
+                db.session.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition_name}")
+                db.session.execute(f"DROP TABLE {partition_name}")
+    db.session.commit()
+
+    print(f'{number} notifications each way')
+    print(f'in chunks: {chunked_moved} moved in {chunked_seconds:.1f}s')
+    print(f'by partition: {partition_moved} moved, {kept} kept in {partition_seconds:.1f}s')
+
+
+@notify_command(name='benchmark-notification-search')
+@click.option('-t', '--template_id', required=True, type=click.UUID, help="SMS template to create notifications from")
+@click.option('-n', '--number', default=2000000, type=int, help="How many notifications to search through")
+@click.option('-r', '--repeat', default=20, type=int, help="How many times to run each search")
+def benchmark_notification_search(template_id, number, repeat):
+    """
+    Times searching a service's notifications by recipient and reference the way the notifications page does.
+    Creates `number` SMS notifications from the template, to 100,000 different phone numbers over two days a year
+    from now, and removes them again afterwards.
+    """
+    template = dao_get_template_by_id(template_id)
+    first_day = datetime.utcnow().date() + timedelta(days=365)
+    dao_create_notification_partitions(first_day, 2)
+
+    db.session.execute("""
+        INSERT INTO notifications (
+            id, "to", normalised_to, client_reference, service_id, template_id, template_version, key_type,
+            billable_units, notification_type, created_at, notification_status, international
+        )
+        SELECT
+            CAST(md5(random()::text || i) AS uuid), '07700' || lpad((i % 100000)::text, 6, '0'),
+            '447700' || lpad((i % 100000)::text, 6, '0'), 'reference-' || i, :service_id, :template_id,
+            :template_version, 'normal', 1, 'sms', CAST(:day AS timestamp) + (i % 172800) * interval '1 second',
+            'delivered', false
+        FROM generate_series(1, :number) AS i
+    """, {
+        'service_id': template.service_id,
+        'template_id': template.id,
+        'template_version': template.version,
+        'day': first_day,
+        'number': number,
+    })
+    db.session.execute("ANALYZE notifications")
+    db.session.commit()
+
+    searches = [
+        ('part of a phone number', '0900123', False),
+        ('whole phone number', '07700 900123', False),
+        ('whole phone number, exact match', '07700 900123', True),
+        ('part of a reference', 'reference-12345', False),
+    ]
+    exact_match_enabled = current_app.config['NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED']
+    for description, search_term, exact_match in searches:
+        current_app.config['NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED'] = exact_match
+        start = monotonic()
+        for _ in range(repeat):
+            found = len(dao_get_notifications_by_recipient_or_reference(
+                template.service_id, search_term, notification_type=SMS_TYPE, page_size=50
+            ).items)
+        seconds = monotonic() - start
+        print(f'{description} ({search_term!r}): {found} found, {seconds / repeat * 1000:.1f}ms per search')
+    current_app.config['NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED'] = exact_match_enabled
+
+    for table_name in (Notification.__tablename__, NotificationHistory.__tablename__):
+        for day in (first_day, first_day + timedelta(days=1)):
+            if day in dao_get_notification_partition_days(table_name):
+                partition_name = get_partition_name(table_name, day)
+                db.session.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition_name}")
+                db.session.execute(f"DROP TABLE {partition_name}")
+    db.session.commit()
@@ -153,6 +153,13 @@ class Config(object):
     SQLALCHEMY_STATEMENT_TIMEOUT = 1200
     PAGE_SIZE = 50
     API_PAGE_SIZE = 250
+    # when enabled, searching a service's notifications for a whole phone number or email address only finds
+    # notifications sent to exactly that recipient, using an index, rather than any recipient containing it
+    NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED = os.environ.get('NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED') == '1'
+    # when enabled, lists of notifications and inbound sms link to their next page with an opaque `cursor` for where
+    # the page ended, rather than a page number or `older_than`, and pages are found by (created_at, id) rather than
+    # with an OFFSET
+    KEYSET_PAGINATION_ENABLED = os.environ.get('KEYSET_PAGINATION_ENABLED') == '1'
     TEST_MESSAGE_FILENAME = 'Test message'
     ONE_OFF_MESSAGE_FILENAME = 'Report'
     MAX_VERIFY_CODE_COUNT = 5
@@ -160,6 +167,127 @@ class Config(object):
     
     SES_STUB_URL = None # TODO: set to a URL in env and remove this to use a stubbed SES service
 
+    # when enabled, sms and email jobs are saved in chunks of rows by the save-sms-batch/save-email-batch tasks,
+    # rather than one save-sms/save-email task per row. Keep chunks well under the 256kb SQS message size limit.
+    JOB_BATCH_PROCESSING_ENABLED = os.environ.get('JOB_BATCH_PROCESSING_ENABLED') == '1'
+    JOB_PROCESSING_BATCH_SIZE = int(os.environ.get('JOB_PROCESSING_BATCH_SIZE', 500))
+
+    # when enabled, jobs with more than JOB_SHARD_SIZE rows are split into shards of that many rows, each processed by
+    # a process-job-shard task of its own, so that a large job is worked through by several workers at once
+    JOB_SHARDING_ENABLED = os.environ.get('JOB_SHARDING_ENABLED') == '1'
+    JOB_SHARD_SIZE = int(os.environ.get('JOB_SHARD_SIZE', 10000))
+    # a shard that has been in progress for this long is taken to have died, and can be claimed by another task
+    JOB_SHARD_STALE_MINUTES = int(os.environ.get('JOB_SHARD_STALE_MINUTES', 30))
+
+    # when enabled, job files are streamed from S3 and parsed JOB_CSV_CHUNK_SIZE rows at a time, rather than being
+    # downloaded and parsed whole
+    JOB_CSV_STREAMING_ENABLED = os.environ.get('JOB_CSV_STREAMING_ENABLED') == '1'
+    JOB_CSV_CHUNK_SIZE = int(os.environ.get('JOB_CSV_CHUNK_SIZE', 1000))
+
+    # when enabled, collate-letter-pdfs-to-be-sent lists each day folder of the letters PDF bucket once and looks
+    # letters up in that, rather than making a LIST request to S3 for every letter
+    LETTER_PDF_KEY_INDEX_ENABLED = os.environ.get('LETTER_PDF_KEY_INDEX_ENABLED') == '1'
+
+    # when enabled, delivery tasks are buffered per queue and sent to SQS ten at a time with SendMessageBatch
+    BATCH_TASK_PUBLISHING_ENABLED = os.environ.get('BATCH_TASK_PUBLISHING_ENABLED') == '1'
+    BATCH_TASK_PUBLISHING_MAX_WAIT_SECONDS = float(os.environ.get('BATCH_TASK_PUBLISHING_MAX_WAIT_SECONDS', 0.2))
+
+    # most recipients accepted by one POST /v2/notifications/bulk request
+    BULK_API_MAX_NOTIFICATIONS = int(os.environ.get('BULK_API_MAX_NOTIFICATIONS', 1000))
+
+    # batch jobs queue deliver_sms_batch/deliver_email_batch tasks for this many notifications at a time.
+    # 1 means one deliver_sms/deliver_email task per notification
+    DELIVERY_BATCH_SIZE = int(os.environ.get('DELIVERY_BATCH_SIZE', 1))
+
+    # provider requests run on a per-process thread pool, with at most this many in flight per provider. Batch
+    # delivery tasks always use the pool; single deliver_sms/deliver_email tasks only do when it's enabled
+    PROVIDER_SENDER_ENABLED = os.environ.get('PROVIDER_SENDER_ENABLED') == '1'
+    PROVIDER_MAX_IN_FLIGHT = {
+        'ses': int(os.environ.get('SES_MAX_IN_FLIGHT', 10)),
+        'sns': int(os.environ.get('SNS_MAX_IN_FLIGHT', 10)),
+    }
+    PROVIDER_DEFAULT_MAX_IN_FLIGHT = 5
+    PROVIDER_SENDER_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('PROVIDER_SENDER_QUEUE_TIMEOUT_SECONDS', 30))
+
+    # service callbacks reuse up to this many connections to each host in each worker process
+    SERVICE_CALLBACK_POOL_SIZE = int(os.environ.get('SERVICE_CALLBACK_POOL_SIZE', 10))
+    SERVICE_CALLBACK_TIMEOUT_SECONDS = 5
+    # services with the batched_callbacks permission get up to this many status updates in one POST, as a JSON list
+    SERVICE_CALLBACK_BATCH_SIZE = int(os.environ.get('SERVICE_CALLBACK_BATCH_SIZE', 100))
+    # when enabled, callbacks to a host that has failed this many times in a row are parked on the retry queue,
+    # without using up their retries, until the host has been left alone for the reset time. Callbacks that have
+    # been parked for longer than SERVICE_CALLBACK_MAX_PARKED_SECONDS are dropped
+    SERVICE_CALLBACK_CIRCUIT_BREAKER_ENABLED = os.environ.get('SERVICE_CALLBACK_CIRCUIT_BREAKER_ENABLED') == '1'
+    SERVICE_CALLBACK_CIRCUIT_BREAKER_FAILURES = int(os.environ.get('SERVICE_CALLBACK_CIRCUIT_BREAKER_FAILURES', 10))
+    SERVICE_CALLBACK_CIRCUIT_BREAKER_RESET_SECONDS = int(
+        os.environ.get('SERVICE_CALLBACK_CIRCUIT_BREAKER_RESET_SECONDS', 60)
+    )
+    SERVICE_CALLBACK_MAX_PARKED_SECONDS = int(os.environ.get('SERVICE_CALLBACK_MAX_PARKED_SECONDS', 6 * 60 * 60))
+
+    # CloudWatch Logs groups SNS writes SMS delivery status events to, each named like
+    # sns/<region>/<account id>/DirectPublishToPhoneNumber (and .../DirectPublishToPhoneNumber/Failure).
+    # Events are read every minute and applied in batches of SNS_DELIVERY_STATUS_BATCH_SIZE
+    SNS_DELIVERY_STATUS_LOG_GROUPS = json.loads(os.environ.get('SNS_DELIVERY_STATUS_LOG_GROUPS', '[]'))
+    SNS_DELIVERY_STATUS_BATCH_SIZE = int(os.environ.get('SNS_DELIVERY_STATUS_BATCH_SIZE', 250))
+
+    # when enabled, SES receipts are added to a list in redis instead of getting a process-ses-result task each, and
+    # drain-ses-receipts takes them off every few seconds in batches of SES_RECEIPT_BATCH_SIZE for
+    # process-ses-results-batch
+    SES_RECEIPT_BATCHING_ENABLED = os.environ.get('SES_RECEIPT_BATCHING_ENABLED') == '1'
+    SES_RECEIPT_BATCH_SIZE = int(os.environ.get('SES_RECEIPT_BATCH_SIZE', 250))
+
+    # sends per second allowed by each provider account, shared by every worker through a token bucket in redis.
+    # `<provider>:origination-number` is the rate for each individual number SMS are sent from
+    SEND_RATE_GOVERNOR_ENABLED = os.environ.get('SEND_RATE_GOVERNOR_ENABLED') == '1'
+    PROVIDER_MAX_SEND_RATES = {
+        'ses': float(os.environ.get('SES_MAX_SEND_RATE', 14)),
+        'sns': float(os.environ.get('SNS_MAX_SEND_RATE', 20)),
+        'sns:origination-number': float(os.environ.get('SNS_ORIGINATION_NUMBER_MAX_SEND_RATE', 3)),
+    }
+    # sends that would have to wait longer than this for a token are retried later instead
+    SEND_RATE_MAX_WAIT_SECONDS = float(os.environ.get('SEND_RATE_MAX_WAIT_SECONDS', 5))
+    # if redis is unavailable each worker process paces itself to this fraction of the rate
+    SEND_RATE_LOCAL_FALLBACK_PROCESSES = int(os.environ.get('SEND_RATE_LOCAL_FALLBACK_PROCESSES', 8))
+
+    # services, templates and API keys are cached in each process for this long, in front of the redis cache.
+    # With invalidation enabled, changes are broadcast over redis pub/sub so the TTL can safely be much longer
+    SERIALISED_MODEL_CACHE_TTL_SECONDS = int(os.environ.get('SERIALISED_MODEL_CACHE_TTL_SECONDS', 2))
+    SERIALISED_MODEL_CACHE_MAXSIZE = int(os.environ.get('SERIALISED_MODEL_CACHE_MAXSIZE', 1024))
+    SERIALISED_MODEL_CACHE_INVALIDATION_ENABLED = os.environ.get('SERIALISED_MODEL_CACHE_INVALIDATION_ENABLED') == '1'
+
+    # check the API rate limit and reserve against the daily message limit in a single atomic redis call
+    ATOMIC_RATE_LIMITING_ENABLED = os.environ.get('ATOMIC_RATE_LIMITING_ENABLED') == '1'
+
+    # if a broadcast provider's primary CBC proxy lambda hasn't succeeded after this many seconds, call the failover
+    # lambda at the same time rather than waiting for the primary to fail. 0 waits for the primary as before
+    CBC_PROXY_HEDGING_DEADLINE_SECONDS = float(os.environ.get('CBC_PROXY_HEDGING_DEADLINE_SECONDS', 0))
+
+    # notifications and notification_history are partitioned by day on created_at. Partitions are created this many
+    # days ahead. With partition retention enabled, the nightly retention task moves each day's notifications for
+    # services without their own retention period to notification_history a partition at a time, and drops the
+    # partition, instead of deleting them in chunks
+    NOTIFICATION_PARTITIONS_DAYS_AHEAD = int(os.environ.get('NOTIFICATION_PARTITIONS_DAYS_AHEAD', 14))
+    NOTIFICATION_PARTITION_RETENTION_ENABLED = os.environ.get('NOTIFICATION_PARTITION_RETENTION_ENABLED') == '1'
+
+    # when enabled, notifications past retention are moved to notification_history by one sweep-notifications-past-
+    # retention task per notification type, covering every service in batches of RETENTION_SWEEP_BATCH_SIZE, rather
+    # than a delete-notifications-for-service-and-type task per service. The sweep pauses while a replica is further
+    # behind, or more queries are waiting for locks, than the limits below, and hands over to a new task after
+    # RETENTION_SWEEP_MAX_TASK_SECONDS
+    RETENTION_SWEEPER_ENABLED = os.environ.get('RETENTION_SWEEPER_ENABLED') == '1'
+    RETENTION_SWEEP_BATCH_SIZE = int(os.environ.get('RETENTION_SWEEP_BATCH_SIZE', 10000))
+    RETENTION_SWEEP_MAX_REPLICA_LAG_SECONDS = float(os.environ.get('RETENTION_SWEEP_MAX_REPLICA_LAG_SECONDS', 30))
+    RETENTION_SWEEP_MAX_LOCK_WAITS = int(os.environ.get('RETENTION_SWEEP_MAX_LOCK_WAITS', 10))
+    RETENTION_SWEEP_THROTTLE_SECONDS = float(os.environ.get('RETENTION_SWEEP_THROTTLE_SECONDS', 10))
+    RETENTION_SWEEP_MAX_TASK_SECONDS = int(os.environ.get('RETENTION_SWEEP_MAX_TASK_SECONDS', 15 * 60))
+
+    # when enabled, the nightly tasks fill ft_billing and ft_notification_status for all services with one grouped
+    # query per table per day, instead of a query per service and notification type. With incremental aggregation
+    # too, days that have been aggregated before are only aggregated again for services whose notifications have
+    # been created or updated since
+    SET_BASED_FACT_AGGREGATION_ENABLED = os.environ.get('SET_BASED_FACT_AGGREGATION_ENABLED') == '1'
+    INCREMENTAL_FACT_AGGREGATION_ENABLED = os.environ.get('INCREMENTAL_FACT_AGGREGATION_ENABLED') == '1'
+
     # be careful increasing this size without being sure that we won't see slowness in pysftp
     MAX_LETTER_PDF_ZIP_FILESIZE = 40 * 1024 * 1024  # 40mb
     MAX_LETTER_PDF_COUNT_PER_ZIP = 500
@@ -256,6 +384,16 @@ class Config(object):
                 'schedule': crontab(minute='0, 15, 30, 45'),
                 'options': {'queue': QueueNames.PERIODIC}
             },
+            'process-sns-delivery-status-logs': {
+                'task': 'process-sns-delivery-status-logs',
+                'schedule': crontab(),
+                'options': {'queue': QueueNames.PERIODIC}
+            },
+            'drain-ses-receipts': {
+                'task': 'drain-ses-receipts',
+                'schedule': timedelta(seconds=10),
+                'options': {'queue': QueueNames.PERIODIC}
+            },
             # app/celery/nightly_tasks.py
             'timeout-sending-notifications': {
                 'task': 'timeout-sending-notifications',
@@ -277,6 +415,11 @@ class Config(object):
                 'schedule': crontab(hour=3, minute=0),  # after 'create-nightly-notification-status'
                 'options': {'queue': QueueNames.REPORTING}
             },
+            'create-notification-partitions': {
+                'task': 'create-notification-partitions',
+                'schedule': crontab(hour=0, minute=1),
+                'options': {'queue': QueueNames.PERIODIC}
+            },
             'delete-inbound-sms': {
                 'task': 'delete-inbound-sms',
                 'schedule': crontab(hour=1, minute=40),
@@ -2,6 +2,8 @@ import itertools
 from contextlib import contextmanager
 from functools import wraps
 
+from sqlalchemy import asc, desc, literal, tuple_
+
 from app import db
 from app.history_meta import create_history
 
@@ -36,6 +38,29 @@ def transaction():
         raise
 
 
+def keyset_paginate(query, columns, after=None, page_size=50, descending=True):
+    """
+    Gets a page of `page_size` rows of `query`, ordered by `columns`, starting after the row whose values for
+    `columns` are `after`. `columns` must identify a row, eg (created_at, id).
+
+    Unlike an OFFSET, the page is found by comparing `columns` with `after`, so later pages are as quick to get as the
+    first if there's an index on `columns`. One more row than the page is fetched to tell if there's another page.
+
+    Returns the page, and the values for `columns` of its last row to get the next page with, or None if it's the
+    last page.
+    """
+    if after is not None:
+        position = tuple_(*columns)
+        after_position = tuple_(*[literal(value, column.type) for column, value in zip(columns, after)])
+        query = query.filter(position < after_position if descending else position > after_position)
+
+    order = desc if descending else asc
+    rows = query.order_by(*[order(column) for column in columns]).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    return rows[:page_size], tuple(getattr(rows[page_size - 1], column.key) for column in columns)
+
+
 class VersionOptions():
 
     def __init__(self, model_class, history_class=None, must_write_history=True):
@@ -2,11 +2,12 @@ from datetime import date, datetime, timedelta
 
 from flask import current_app
 from notifications_utils.timezones import convert_utc_to_bst
-from sqlalchemy import Date, Integer, and_, desc, func, union
+from sqlalchemy import Date, Integer, and_, desc, func, or_, union
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.sql.expression import case, literal
 
 from app import db
+from app.dao.dao_utils import autocommit
 from app.dao.date_util import (
     get_financial_year_dates,
     get_financial_year_for_datetime,
@@ -652,6 +653,140 @@ def update_fact_billing(data, process_day):
     db.session.commit()
 
 
+@autocommit
+def update_fact_billing_for_day(process_day, service_ids=None):
+    """
+    Aggregates the day's billable notifications of every type into ft_billing for every service with a single
+    grouped query, or only for `service_ids` if they're given, and upserts the result. Rates are looked up in the
+    same query, the same way get_rate does. Returns how many rows were written.
+    """
+    start_date = get_london_midnight_in_utc(process_day)
+    end_date = get_london_midnight_in_utc(process_day + timedelta(days=1))
+
+    is_email = NotificationAllTimeView.notification_type == EMAIL_TYPE
+    is_letter = NotificationAllTimeView.notification_type == LETTER_TYPE
+    provider = case([
+        (is_email, 'ses'),
+        (is_letter, 'dvla'),
+    ], else_=func.coalesce(NotificationAllTimeView.sent_by, 'unknown'))
+    rate_multiplier = case([
+        (is_email, 0),
+    ], else_=func.coalesce(NotificationAllTimeView.rate_multiplier, 1).cast(Integer))
+    international = case([
+        (is_email, False),
+    ], else_=func.coalesce(NotificationAllTimeView.international, False))
+    letter_page_count = case([
+        (is_letter, NotificationAllTimeView.billable_units),
+    ], else_=None)
+    postage = case([
+        (is_letter, func.coalesce(NotificationAllTimeView.postage, 'none')),
+    ], else_='none')
+
+    query = db.session.query(
+        NotificationAllTimeView.template_id,
+        NotificationAllTimeView.service_id,
+        NotificationAllTimeView.notification_type,
+        provider.label('provider'),
+        rate_multiplier.label('rate_multiplier'),
+        international.label('international'),
+        letter_page_count.label('letter_page_count'),
+        postage.label('postage'),
+        func.sum(case([(is_email, 0)], else_=NotificationAllTimeView.billable_units)).label('billable_units'),
+        func.count().label('notifications_sent'),
+    ).filter(
+        or_(
+            and_(is_email, NotificationAllTimeView.status.in_(NOTIFICATION_STATUS_TYPES_SENT_EMAILS)),
+            and_(
+                NotificationAllTimeView.notification_type == SMS_TYPE,
+                NotificationAllTimeView.status.in_(NOTIFICATION_STATUS_TYPES_BILLABLE_SMS),
+            ),
+            and_(is_letter, NotificationAllTimeView.status.in_(NOTIFICATION_STATUS_TYPES_BILLABLE_FOR_LETTERS)),
+        ),
+        NotificationAllTimeView.key_type.in_((KEY_TYPE_NORMAL, KEY_TYPE_TEAM)),
+        NotificationAllTimeView.created_at >= start_date,
+        NotificationAllTimeView.created_at < end_date,
+    ).group_by(
+        NotificationAllTimeView.template_id,
+        NotificationAllTimeView.service_id,
+        NotificationAllTimeView.notification_type,
+        provider,
+        rate_multiplier,
+        international,
+        letter_page_count,
+        postage,
+    )
+    if service_ids is not None:
+        query = query.filter(NotificationAllTimeView.service_id.in_(service_ids))
+    billing_data = query.subquery()
+
+    sms_rate = db.session.query(Rate.rate).filter(
+        Rate.notification_type == SMS_TYPE,
+        Rate.valid_from <= start_date,
+    ).order_by(desc(Rate.valid_from)).limit(1).scalar_subquery()
+    # get_rate treats every service as crown for letters, as the rates are the same for both
+    letter_rate = db.session.query(LetterRate.rate).filter(
+        LetterRate.start_date <= start_date,
+        LetterRate.crown.is_(True),
+        LetterRate.sheet_count == billing_data.c.letter_page_count,
+        LetterRate.post_class == billing_data.c.postage,
+    ).order_by(desc(LetterRate.start_date)).limit(1).scalar_subquery()
+    rate = case([
+        (billing_data.c.notification_type == SMS_TYPE, sms_rate),
+        (and_(billing_data.c.notification_type == LETTER_TYPE, billing_data.c.letter_page_count != 0), letter_rate),
+    ], else_=0)
+    rated_billing_data = db.session.query(billing_data, rate.label('rate')).subquery()
+
+    # letters with different page counts can have the same rate, so add them together rather than have the upsert
+    # below try to write the same ft_billing row twice
+    rows = db.session.query(
+        literal(process_day, Date).label('bst_date'),
+        rated_billing_data.c.template_id,
+        rated_billing_data.c.service_id,
+        rated_billing_data.c.notification_type,
+        rated_billing_data.c.provider,
+        rated_billing_data.c.rate_multiplier,
+        rated_billing_data.c.international,
+        rated_billing_data.c.rate,
+        rated_billing_data.c.postage,
+        func.sum(rated_billing_data.c.billable_units),
+        func.sum(rated_billing_data.c.notifications_sent),
+    ).group_by(
+        rated_billing_data.c.template_id,
+        rated_billing_data.c.service_id,
+        rated_billing_data.c.notification_type,
+        rated_billing_data.c.provider,
+        rated_billing_data.c.rate_multiplier,
+        rated_billing_data.c.international,
+        rated_billing_data.c.rate,
+        rated_billing_data.c.postage,
+    )
+
+    stmt = insert(FactBilling.__table__).from_select(
+        [
+            FactBilling.bst_date,
+            FactBilling.template_id,
+            FactBilling.service_id,
+            FactBilling.notification_type,
+            FactBilling.provider,
+            FactBilling.rate_multiplier,
+            FactBilling.international,
+            FactBilling.rate,
+            FactBilling.postage,
+            FactBilling.billable_units,
+            FactBilling.notifications_sent,
+        ],
+        rows
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="ft_billing_pkey",
+        set_={"notifications_sent": stmt.excluded.notifications_sent,
+              "billable_units": stmt.excluded.billable_units,
+              "updated_at": datetime.utcnow()
+              }
+    )
+    return db.session.connection().execute(stmt).rowcount
+
+
 def create_billing_record(data, rate, process_day):
     billing_record = FactBilling(
         bst_date=process_day,
@@ -86,6 +86,65 @@ def update_fact_notification_status(process_day, notification_type, service_id):
     )
 
 
+@autocommit
+def update_fact_notification_status_for_day(process_day, notification_types, service_ids=None):
+    """
+    Aggregates the day's notifications of `notification_types` into ft_notification_status for every service with a
+    single grouped query, or only for `service_ids` if they're given. Returns how many rows were written.
+    """
+    start_date = get_london_midnight_in_utc(process_day)
+    end_date = get_london_midnight_in_utc(process_day + timedelta(days=1))
+
+    existing_rows = FactNotificationStatus.query.filter(
+        FactNotificationStatus.bst_date == process_day,
+        FactNotificationStatus.notification_type.in_(notification_types),
+    )
+    query = db.session.query(
+        literal(process_day).label("process_day"),
+        NotificationAllTimeView.template_id,
+        NotificationAllTimeView.service_id,
+        func.coalesce(NotificationAllTimeView.job_id, '00000000-0000-0000-0000-000000000000').label('job_id'),
+        NotificationAllTimeView.notification_type,
+        NotificationAllTimeView.key_type,
+        NotificationAllTimeView.status,
+        func.count().label('notification_count')
+    ).filter(
+        NotificationAllTimeView.created_at >= start_date,
+        NotificationAllTimeView.created_at < end_date,
+        NotificationAllTimeView.notification_type.in_(notification_types),
+        NotificationAllTimeView.key_type.in_((KEY_TYPE_NORMAL, KEY_TYPE_TEAM)),
+    ).group_by(
+        NotificationAllTimeView.template_id,
+        NotificationAllTimeView.service_id,
+        'job_id',
+        NotificationAllTimeView.notification_type,
+        NotificationAllTimeView.key_type,
+        NotificationAllTimeView.status
+    )
+    if service_ids is not None:
+        existing_rows = existing_rows.filter(FactNotificationStatus.service_id.in_(service_ids))
+        query = query.filter(NotificationAllTimeView.service_id.in_(service_ids))
+
+    # delete any existing rows in case some no longer exist e.g. if all messages are sent
+    existing_rows.delete(synchronize_session=False)
+
+    return db.session.connection().execute(
+        insert(FactNotificationStatus.__table__).from_select(
+            [
+                FactNotificationStatus.bst_date,
+                FactNotificationStatus.template_id,
+                FactNotificationStatus.service_id,
+                FactNotificationStatus.job_id,
+                FactNotificationStatus.notification_type,
+                FactNotificationStatus.key_type,
+                FactNotificationStatus.notification_status,
+                FactNotificationStatus.notification_count
+            ],
+            query
+        )
+    ).rowcount
+
+
 def fetch_notification_status_for_service_by_month(start_date, end_date, service_id):
     return db.session.query(
         func.date_trunc('month', FactNotificationStatus.bst_date).label('month'),
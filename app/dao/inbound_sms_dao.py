@@ -4,7 +4,7 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import aliased
 
 from app import db
-from app.dao.dao_utils import autocommit
+from app.dao.dao_utils import autocommit, keyset_paginate
 from app.models import (
     SMS_TYPE,
     InboundSms,
@@ -61,6 +61,29 @@ def dao_get_paginated_inbound_sms_for_service_for_public_api(
     ).items
 
 
+def dao_get_inbound_sms_for_service_after(service_id, after=None, older_than=None, page_size=None):
+    """
+    Like dao_get_paginated_inbound_sms_for_service_for_public_api, but gets the page of messages after `after`, a
+    (created_at, id) position, or after the message with id `older_than`.
+
+    Returns the page, and the position of its last message to get the next page with, or None if there isn't another
+    page.
+    """
+    if page_size is None:
+        page_size = current_app.config['PAGE_SIZE']
+
+    if after is None and older_than is not None:
+        after = db.session.query(InboundSms.created_at, InboundSms.id).filter(
+            InboundSms.service_id == service_id,
+            InboundSms.id == older_than,
+        ).first()
+        if after is None:
+            return [], None
+
+    query = InboundSms.query.filter(InboundSms.service_id == service_id)
+    return keyset_paginate(query, [InboundSms.created_at, InboundSms.id], after=after, page_size=page_size)
+
+
 def dao_count_inbound_sms_for_service(service_id, limit_days):
     return InboundSms.query.filter(
         InboundSms.service_id == service_id,
@@ -6,7 +6,7 @@ from notifications_utils.letter_timings import (
     CANCELLABLE_JOB_LETTER_STATUSES,
     letter_can_be_cancelled,
 )
-from sqlalchemy import and_, asc, desc, func
+from sqlalchemy import and_, asc, desc, func, or_
 
 from app import db
 from app.dao.dao_utils import autocommit
@@ -14,6 +14,7 @@ from app.dao.templates_dao import dao_get_template_by_id
 from app.models import (
     JOB_STATUS_CANCELLED,
     JOB_STATUS_FINISHED,
+    JOB_STATUS_IN_PROGRESS,
     JOB_STATUS_PENDING,
     JOB_STATUS_SCHEDULED,
     LETTER_TYPE,
@@ -21,6 +22,7 @@ from app.models import (
     NOTIFICATION_CREATED,
     FactNotificationStatus,
     Job,
+    JobShard,
     Notification,
     ServiceDataRetention,
     Template,
@@ -239,9 +241,13 @@ def find_jobs_with_missing_rows():
     return jobs_with_rows_missing.all()
 
 
-def find_missing_row_for_job(job_id, job_size):
+def find_missing_row_for_job(job_id, job_size, first_row=0):
+    """
+    The rows from `first_row` to `first_row + job_size - 1` that there isn't a notification for. Pass the first row
+    and size of a shard to only look at its rows.
+    """
     expected_row_numbers = db.session.query(
-        func.generate_series(0, job_size - 1).label('row')
+        func.generate_series(first_row, first_row + job_size - 1).label('row')
     ).subquery()
 
     query = db.session.query(
@@ -253,3 +259,80 @@ def find_missing_row_for_job(job_id, job_size):
         Notification.job_row_number == None  # noqa
     )
     return query.all()
+
+
+@autocommit
+def dao_create_job_shards(job, shard_size):
+    """
+    Splits the job's rows into shards of up to `shard_size` rows, and returns them
+    """
+    shards = [
+        JobShard(
+            job_id=job.id,
+            shard_number=shard_number,
+            first_row=first_row,
+            last_row=min(first_row + shard_size, job.notification_count) - 1,
+            status=JOB_STATUS_PENDING,
+        )
+        for shard_number, first_row in enumerate(range(0, job.notification_count, shard_size))
+    ]
+    db.session.add_all(shards)
+    return shards
+
+
+def dao_get_job_shard(job_id, shard_number):
+    return JobShard.query.filter_by(job_id=job_id, shard_number=shard_number).one()
+
+
+def dao_get_unfinished_job_shards(job_id):
+    return JobShard.query.filter(
+        JobShard.job_id == job_id,
+        JobShard.status != JOB_STATUS_FINISHED,
+    ).order_by(
+        JobShard.shard_number
+    ).all()
+
+
+def dao_job_has_shards(job_id):
+    return db.session.query(JobShard.query.filter_by(job_id=job_id).exists()).scalar()
+
+
+@autocommit
+def dao_start_job_shard(shard, stale_after):
+    """
+    Claims the shard, and returns whether it was claimed. Only a pending shard can be claimed, or one that was
+    claimed more than `stale_after` ago, whose task is taken to have died - so when SQS redelivers a shard's task, or
+    process_incomplete_job queues it again, only one copy processes its rows at a time.
+    """
+    now = datetime.utcnow()
+    claimed = JobShard.query.filter(
+        JobShard.job_id == shard.job_id,
+        JobShard.shard_number == shard.shard_number,
+        or_(
+            JobShard.status == JOB_STATUS_PENDING,
+            and_(JobShard.status == JOB_STATUS_IN_PROGRESS, JobShard.processing_started < now - stale_after),
+        )
+    ).update(
+        {'status': JOB_STATUS_IN_PROGRESS, 'processing_started': now},
+        synchronize_session=False
+    )
+    return claimed == 1
+
+
+@autocommit
+def dao_finish_job_shard(shard):
+    """
+    Marks the shard as finished, and returns how many of the job's shards aren't finished yet.
+
+    The job is locked first, so that when the last two shards finish at the same time, the second one to get the
+    lock sees that the first has finished, and knows to complete the job.
+    """
+    Job.query.filter_by(id=shard.job_id).with_for_update().one()
+    shard.status = JOB_STATUS_FINISHED
+    shard.processing_finished = datetime.utcnow()
+    db.session.add(shard)
+    db.session.flush()
+    return JobShard.query.filter(
+        JobShard.job_id == shard.job_id,
+        JobShard.status != JOB_STATUS_FINISHED,
+    ).count()
@@ -0,0 +1,137 @@
+"""
+notifications and notification_history are partitioned by range on created_at, with one partition per UTC day named
+like notifications_20220101, and a default partition holding the rows from before they were partitioned (see
+migration 0375_partition_notifications).
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.dao.dao_utils import autocommit
+from app.dao.notifications_dao import NOTIFICATION_HISTORY_COLUMNS
+from app.models import Notification, NotificationHistory
+
+PARTITIONED_TABLES = [Notification.__tablename__, NotificationHistory.__tablename__]
+
+# don't queue up behind long running queries while holding locks that would block everything else
+PARTITION_LOCK_TIMEOUT = '10s'
+
+HISTORY_COLUMNS = ', '.join(NOTIFICATION_HISTORY_COLUMNS)
+
+# Letters have PDFs in S3 to delete, and services with their own retention period are deleted on their own
+# schedule, so both of these are left for move_notifications_to_notification_history
+KEEP_IN_PARTITION = """
+    notification_type = 'letter' OR EXISTS (
+        SELECT 1 FROM service_data_retention
+        WHERE service_data_retention.service_id = {partition}.service_id
+        AND service_data_retention.notification_type = {partition}.notification_type
+    )
+"""
+
+
+def get_partition_name(table_name, day):
+    return f'{table_name}_{day:%Y%m%d}'
+
+
+def dao_get_notification_partition_days(table_name=Notification.__tablename__):
+    """
+    The days that `table_name` has a partition for, in order. The default partition isn't included.
+    """
+    partition_names = db.session.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST(:table_name AS regclass)
+    """, {'table_name': table_name}).scalars()
+
+    days = []
+    for partition_name in partition_names:
+        try:
+            days.append(datetime.strptime(partition_name, f'{table_name}_%Y%m%d').date())
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+@autocommit
+def dao_create_notification_partitions(start_day, number_of_days):
+    """
+    Creates the notifications and notification_history partitions for `number_of_days` days from `start_day`, if
+    they don't exist yet. Returns the names of the partitions that were created.
+
+    Each partition is created as a table of its own and then attached, which only takes a SHARE UPDATE EXCLUSIVE
+    lock on the partitioned table, so notifications can still be sent while it happens.
+    """
+    created = []
+    db.session.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+    for table_name in PARTITIONED_TABLES:
+        existing_days = set(dao_get_notification_partition_days(table_name))
+        for day in (start_day + timedelta(days=n) for n in range(number_of_days)):
+            if day in existing_days:
+                continue
+            partition_name = get_partition_name(table_name, day)
+            db.session.execute(
+                f"CREATE TABLE {partition_name} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            db.session.execute(
+                f"ALTER TABLE {table_name} ATTACH PARTITION {partition_name} "
+                f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+            )
+            created.append(partition_name)
+    return created
+
+
+@autocommit
+def dao_archive_notification_partition(day):
+    """
+    Moves the notifications created on `day` (a UTC date) to notification_history with a single INSERT ... SELECT,
+    and drops their partition - instead of the chunked DELETEs of insert_notification_history_delete_notifications,
+    and the vacuuming needed after them. Test notifications aren't kept in notification_history, so go with the
+    partition.
+
+    Letters, and notifications for services with their own retention period, are kept. They're copied to a new
+    partition for the day, which replaces the old one. If there's nothing else left in the partition, it's left as
+    it is, or dropped once it's empty.
+
+    Returns how many notifications were moved to notification_history and how many were kept.
+    """
+    partition_name = get_partition_name(Notification.__tablename__, day)
+    kept_partition_name = f'{partition_name}_kept'
+    keep = KEEP_IN_PARTITION.format(partition=partition_name)
+
+    db.session.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+    # stop the notifications being changed while they're copied
+    db.session.execute(f"LOCK TABLE {partition_name} IN SHARE MODE")
+
+    kept = db.session.execute(f"SELECT count(*) FROM {partition_name} WHERE {keep}").scalar()
+    has_notifications_to_move = db.session.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {partition_name} WHERE NOT ({keep}))"
+    ).scalar()
+    if kept and not has_notifications_to_move:
+        return 0, kept
+
+    moved = db.session.execute(f"""
+        INSERT INTO notification_history ({HISTORY_COLUMNS})
+        SELECT {HISTORY_COLUMNS}
+        FROM {partition_name}
+        WHERE NOT ({keep}) AND key_type IN ('normal', 'team')
+        ON CONFLICT ON CONSTRAINT notification_history_pkey DO NOTHING
+    """).rowcount
+
+    if kept:
+        db.session.execute(
+            f"CREATE TABLE {kept_partition_name} "
+            f"(LIKE {Notification.__tablename__} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        db.session.execute(f"INSERT INTO {kept_partition_name} SELECT * FROM {partition_name} WHERE {keep}")
+
+    # the partitioned table is locked from here until the transaction ends, so keep this part short
+    db.session.execute(f"ALTER TABLE {Notification.__tablename__} DETACH PARTITION {partition_name}")
+    db.session.execute(f"DROP TABLE {partition_name}")
+    if kept:
+        db.session.execute(f"ALTER TABLE {kept_partition_name} RENAME TO {partition_name}")
+        db.session.execute(
+            f"ALTER TABLE {Notification.__tablename__} ATTACH PARTITION {partition_name} "
+            f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+        )
+
+    return moved, kept
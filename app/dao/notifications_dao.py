@@ -1,3 +1,4 @@
+import json
 from datetime import datetime, timedelta
 from itertools import groupby
 from operator import attrgetter
@@ -9,11 +10,27 @@ from notifications_utils.international_billing_rates import (
 )
 from notifications_utils.recipients import (
     InvalidEmailError,
+    InvalidPhoneError,
     try_validate_and_format_phone_number,
     validate_and_format_email_address,
+    validate_and_format_phone_number,
 )
 from notifications_utils.timezones import convert_bst_to_utc, convert_utc_to_bst
-from sqlalchemy import and_, asc, desc, func, or_, union
+from sqlalchemy import (
+    Integer,
+    String,
+    Text,
+    and_,
+    asc,
+    cast,
+    column,
+    desc,
+    func,
+    or_,
+    union,
+    values,
+)
+from sqlalchemy.dialects.postgresql import UUID, insert
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import functions
@@ -21,7 +38,7 @@ from sqlalchemy.sql.expression import case
 from werkzeug.datastructures import MultiDict
 
 from app import create_uuid, db, statsd_client
-from app.dao.dao_utils import autocommit
+from app.dao.dao_utils import autocommit, keyset_paginate
 from app.letters.utils import LetterPDFNotFound, find_letter_pdf_in_s3
 from app.models import (
     EMAIL_TYPE,
@@ -49,6 +66,16 @@ from app.utils import (
     midnight_n_days_ago,
 )
 
+RETENTION_SWEEP_LOCK_TIMEOUT = '5s'
+
+# the columns of notification_history, which notifications also has, in the order notification_history has them
+NOTIFICATION_HISTORY_COLUMNS = [
+    'id', 'job_id', 'job_row_number', 'service_id', 'template_id', 'template_version', 'api_key_id', 'key_type',
+    'notification_type', 'created_at', 'sent_at', 'sent_by', 'updated_at', 'reference', 'billable_units',
+    'client_reference', 'international', 'phone_prefix', 'rate_multiplier', 'notification_status', 'created_by_id',
+    'postage', 'document_download_count',
+]
+
 
 def dao_get_last_date_template_was_used(template_id, service_id):
     last_date_from_notifications = db.session.query(
@@ -83,6 +110,36 @@ def dao_create_notification(notification):
     db.session.add(notification)
 
 
+@autocommit
+def dao_bulk_create_notifications(notifications):
+    """
+    Insert many notifications with one multi-row INSERT rather than one INSERT per notification.
+
+    Rows that clash with an existing notification (same id, or same job and row number) are skipped rather than
+    raising, so that an SQS redelivery of a batch is harmless. Returns the ids (as strings) that were actually inserted.
+    """
+    if not notifications:
+        return set()
+
+    rows = [_notification_to_row(notification) for notification in notifications]
+
+    result = db.session.execute(
+        insert(Notification.__table__).values(rows).on_conflict_do_nothing().returning(Notification.__table__.c.id)
+    )
+    return {str(row.id) for row in result}
+
+
+def _notification_to_row(notification):
+    # defaults are normally applied by the ORM on flush, so we have to fill them in ourselves for a core insert
+    row = {}
+    for column in Notification.__table__.columns:
+        value = getattr(notification, column.key)
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        row[column.key] = value
+    return row
+
+
 def country_records_delivery(phone_prefix):
     dlr = INTERNATIONAL_BILLING_RATES[phone_prefix]['attributes']['dlr']
     return dlr and dlr.lower() == 'yes'
@@ -172,6 +229,21 @@ def get_notifications_for_job(service_id, job_id, filter_dict=None, page=1, page
     )
 
 
+def get_notifications_for_job_after(service_id, job_id, after=None, filter_dict=None, page_size=None):
+    """
+    Like get_notifications_for_job, but gets the page of notifications after `after`, a (job_row_number,) position,
+    rather than by page number. Returns the page, and the position of its last notification to get the next page
+    with, or None if there isn't another page.
+    """
+    if page_size is None:
+        page_size = current_app.config['PAGE_SIZE']
+    query = Notification.query.filter_by(service_id=service_id, job_id=job_id)
+    query = _filter_query(query, filter_dict)
+    return keyset_paginate(
+        query, [Notification.job_row_number], after=after, page_size=page_size, descending=False
+    )
+
+
 def dao_get_notification_count_for_job_id(*, job_id):
     return Notification.query.filter_by(job_id=job_id).count()
 
@@ -195,6 +267,55 @@ def get_notification_by_id(notification_id, service_id=None, _raise=False):
     return query.one() if _raise else query.first()
 
 
+def get_notifications_by_ids(notification_ids):
+    return Notification.query.filter(Notification.id.in_(notification_ids)).all()
+
+
+@autocommit
+def dao_update_notifications_to_sending(updates):
+    """
+    Record that a batch of notifications have been sent to a provider, in a single UPDATE ... FROM (VALUES ...).
+
+    `updates` is a list of dicts, each with the notification's `id` and its new `status`, `sent_by`,
+    `billable_units` and (for emails) `reference`. Everything in the batch gets the same `sent_at`.
+    """
+    if not updates:
+        return 0
+
+    now = datetime.utcnow()
+    new_values = values(
+        column('id', UUID(as_uuid=True)),
+        column('status', Text),
+        column('sent_by', String),
+        column('billable_units', Integer),
+        column('reference', String),
+        name='new_values',
+    ).data([
+        (update['id'], update['status'], update['sent_by'], update['billable_units'], update.get('reference'))
+        for update in updates
+    ])
+
+    notifications = Notification.__table__
+    result = db.session.execute(
+        notifications.update().where(
+            # ids are sent as strings, which postgres reads as text in a VALUES list
+            notifications.c.id == cast(new_values.c.id, UUID(as_uuid=True))
+        ).values({
+            # like update_notification_to_sending, don't undo a status set by a delivery receipt that got here first
+            notifications.c.status: case(
+                [(notifications.c.status.in_(NOTIFICATION_STATUS_TYPES_COMPLETED), notifications.c.status)],
+                else_=new_values.c.status
+            ),
+            notifications.c.sent_by: new_values.c.sent_by,
+            notifications.c.billable_units: new_values.c.billable_units,
+            notifications.c.reference: func.coalesce(new_values.c.reference, notifications.c.reference),
+            notifications.c.sent_at: now,
+            notifications.c.updated_at: now,
+        })
+    )
+    return result.rowcount
+
+
 def get_notifications_for_service(
         service_id,
         filter_dict=None,
@@ -214,15 +335,93 @@ def get_notifications_for_service(
     if page_size is None:
         page_size = current_app.config['PAGE_SIZE']
 
-    filters = [Notification.service_id == service_id]
-
-    if limit_days is not None:
-        filters.append(Notification.created_at >= midnight_n_days_ago(limit_days))
+    query = _get_notifications_for_service_query(
+        service_id,
+        filter_dict=filter_dict,
+        limit_days=limit_days,
+        key_type=key_type,
+        personalisation=personalisation,
+        include_jobs=include_jobs,
+        include_from_test_key=include_from_test_key,
+        client_reference=client_reference,
+        include_one_off=include_one_off,
+    )
 
     if older_than is not None:
         older_than_created_at = db.session.query(
             Notification.created_at).filter(Notification.id == older_than).as_scalar()
-        filters.append(Notification.created_at < older_than_created_at)
+        query = query.filter(Notification.created_at < older_than_created_at)
+
+    return query.order_by(desc(Notification.created_at)).paginate(
+        page=page,
+        per_page=page_size,
+        count=count_pages,
+        error_out=error_out,
+    )
+
+
+def get_notifications_for_service_after(
+        service_id,
+        after=None,
+        older_than=None,
+        page_size=None,
+        filter_dict=None,
+        limit_days=None,
+        key_type=None,
+        personalisation=False,
+        include_jobs=False,
+        include_from_test_key=False,
+        client_reference=None,
+        include_one_off=True,
+):
+    """
+    Like get_notifications_for_service, but gets the page of notifications after `after`, a (created_at, id)
+    position, rather than by page number. The position can also be given as `older_than`, the id of the notification
+    to start after. The ix_notifications_service_created_at_id index is there for these queries.
+
+    Returns the page, and the position of its last notification to get the next page with, or None if there isn't
+    another page.
+    """
+    if page_size is None:
+        page_size = current_app.config['PAGE_SIZE']
+
+    if after is None and older_than is not None:
+        after = db.session.query(Notification.created_at, Notification.id).filter(
+            Notification.service_id == service_id,
+            Notification.id == older_than,
+        ).first()
+        if after is None:
+            return [], None
+
+    query = _get_notifications_for_service_query(
+        service_id,
+        filter_dict=filter_dict,
+        limit_days=limit_days,
+        key_type=key_type,
+        personalisation=personalisation,
+        include_jobs=include_jobs,
+        include_from_test_key=include_from_test_key,
+        client_reference=client_reference,
+        include_one_off=include_one_off,
+    )
+    return keyset_paginate(query, [Notification.created_at, Notification.id], after=after, page_size=page_size)
+
+
+def _get_notifications_for_service_query(
+        service_id,
+        filter_dict,
+        limit_days,
+        key_type,
+        personalisation,
+        include_jobs,
+        include_from_test_key,
+        client_reference,
+        include_one_off,
+):
+    filters = [Notification.service_id == service_id]
+
+    if limit_days is not None:
+        filters.append(Notification.created_at >= midnight_n_days_ago(limit_days))
 
     if not include_jobs:
         filters.append(Notification.job_id == None)  # noqa
@@ -244,13 +443,7 @@ def get_notifications_for_service(
         query = query.options(
             joinedload('template')
         )
-
-    return query.order_by(desc(Notification.created_at)).paginate(
-        page=page,
-        per_page=page_size,
-        count=count_pages,
-        error_out=error_out,
-    )
+    return query
 
 
 def _filter_query(query, filter_dict=None):
@@ -398,7 +591,11 @@ def _delete_letters_from_s3(
         # them from it
         Notification.status.in_(NOTIFICATION_STATUS_TYPES_COMPLETED)
     ).limit(query_limit).all()
-    for letter in letters_to_delete_from_s3:
+    _delete_letter_pdfs_from_s3(letters_to_delete_from_s3)
+
+
+def _delete_letter_pdfs_from_s3(letters):
+    for letter in letters:
         try:
             letter_pdf = find_letter_pdf_in_s3(letter)
             letter_pdf.delete()
@@ -410,6 +607,103 @@ def _delete_letters_from_s3(
                 "No S3 object to delete for letter: {}".format(letter.id))
 
 
+@autocommit
+def move_notifications_past_retention_batch(
+    notification_type, default_cutoff, service_cutoffs, after=None, batch_size=10000
+):
+    """
+    Moves the next `batch_size` notifications of a type that are past their service's retention to notification
+    history, for every service at once. Notifications are taken in (created_at, id) order, starting after `after`
+    if it's given, so that notifications which are kept (letters still being sent) aren't looked at again.
+
+    `service_cutoffs` maps services with their own retention period to the time to delete notifications from before,
+    and every other service uses `default_cutoff`. As in move_notifications_to_notification_history, test
+    notifications are deleted without being copied to notification_history.
+
+    Returns how many notifications were moved or deleted, and the (created_at, id) of the last one to carry on
+    from, which is None if there weren't any left.
+    """
+    latest_cutoff = max([default_cutoff, *service_cutoffs.values()])
+    qualified_columns = ', '.join(f'notifications.{column_name}' for column_name in NOTIFICATION_HISTORY_COLUMNS)
+    history_columns = ', '.join(NOTIFICATION_HISTORY_COLUMNS)
+
+    filters = ''
+    if notification_type == LETTER_TYPE:
+        filters += " AND notifications.notification_status NOT IN ('pending-virus-check', 'created', 'sending')"
+    if after:
+        filters += " AND (notifications.created_at, notifications.id) > (:after_created_at, CAST(:after_id AS uuid))"
+
+    # give up on the batch rather than hold up notifications being sent, and try again after a pause
+    db.session.execute(f"SET LOCAL lock_timeout = '{RETENTION_SWEEP_LOCK_TIMEOUT}'")
+    db.session.execute(f"""
+        CREATE TEMP TABLE notification_archive ON COMMIT DROP AS
+        SELECT {qualified_columns}
+        FROM notifications
+        LEFT JOIN json_to_recordset(CAST(:service_cutoffs AS json))
+            AS service_cutoffs(service_id uuid, cutoff timestamp)
+            ON service_cutoffs.service_id = notifications.service_id
+        WHERE notifications.notification_type = :notification_type
+          AND notifications.created_at < :latest_cutoff
+          AND notifications.created_at < coalesce(service_cutoffs.cutoff, :default_cutoff)
+          {filters}
+        ORDER BY notifications.created_at, notifications.id
+        LIMIT :batch_size
+    """, {
+        'service_cutoffs': json.dumps([
+            {'service_id': str(service_id), 'cutoff': cutoff.isoformat()}
+            for service_id, cutoff in service_cutoffs.items()
+        ]),
+        'notification_type': notification_type,
+        'latest_cutoff': latest_cutoff,
+        'default_cutoff': default_cutoff,
+        'after_created_at': after[0] if after else None,
+        'after_id': str(after[1]) if after else None,
+        'batch_size': batch_size,
+    })
+
+    last = db.session.execute(
+        "SELECT created_at, id FROM notification_archive ORDER BY created_at DESC, id DESC LIMIT 1"
+    ).first()
+    if not last:
+        return 0, None
+
+    if notification_type == LETTER_TYPE:
+        archived_ids = db.session.execute("SELECT id FROM notification_archive").scalars().all()
+        _delete_letter_pdfs_from_s3(Notification.query.filter(
+            Notification.id.in_(archived_ids),
+            Notification.status.in_(NOTIFICATION_STATUS_TYPES_COMPLETED),
+        ).all())
+
+    db.session.execute(f"""
+        INSERT INTO notification_history ({history_columns})
+        SELECT {history_columns} FROM notification_archive
+        WHERE key_type IN ('normal', 'team')
+        ON CONFLICT ON CONSTRAINT notification_history_pkey DO NOTHING
+    """)
+    deleted = db.session.execute("""
+        DELETE FROM notifications
+        USING notification_archive
+        WHERE notifications.id = notification_archive.id
+          AND notifications.created_at = notification_archive.created_at
+    """).rowcount
+
+    return deleted, (last.created_at, last.id)
+
+
+def dao_get_replica_lag_and_lock_waits():
+    """
+    How many seconds the most behind replica is behind, as far as this database knows (0 if it knows of none), and
+    how many queries are waiting for a lock.
+    """
+    replica_lag = db.session.execute(
+        "SELECT extract(epoch FROM max(replay_lag)) FROM pg_stat_replication"
+    ).scalar()
+    lock_waits = db.session.execute(
+        "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'"
+    ).scalar()
+    return float(replica_lag or 0), lock_waits
+
+
 @autocommit
 def dao_delete_notifications_by_id(notification_id):
     db.session.query(Notification).filter(
@@ -519,6 +813,61 @@ def dao_update_notifications_by_reference(references, update_dict):
     return updated_count, updated_history_count
 
 
+@autocommit
+def dao_update_notification_statuses_by_reference(
+    statuses_by_reference,
+    history_references=(),
+    updatable_statuses=(NOTIFICATION_SENDING, NOTIFICATION_PENDING),
+):
+    """
+    Apply a batch of delivery receipts in a single UPDATE ... FROM (VALUES ...) per table.
+
+    `statuses_by_reference` maps provider references to their new status. References in `history_references` are
+    updated in notification_history rather than notifications. Only notifications still in one of
+    `updatable_statuses` are changed, so a receipt that has already been applied (by another worker, say) is ignored.
+
+    Returns the updated rows from notifications and from notification_history, with the columns needed to send
+    delivery status callbacks (history rows have no `to`).
+    """
+    history_references = set(history_references)
+    now = datetime.utcnow()
+
+    def update(model, references):
+        if not references:
+            return []
+        new_values = values(
+            column('reference', String),
+            column('status', Text),
+            name='new_values',
+        ).data([(reference, statuses_by_reference[reference]) for reference in references])
+
+        table = model.__table__
+        returned_columns = [
+            'id', 'service_id', 'reference', 'client_reference', 'notification_type', 'template_id',
+            'template_version', 'status', 'created_at', 'sent_at', 'updated_at',
+        ]
+        if model is Notification:
+            returned_columns.append('to')
+
+        return db.session.execute(
+            table.update().where(
+                table.c.reference == new_values.c.reference,
+                table.c.status.in_(updatable_statuses),
+            ).values({
+                table.c.status: new_values.c.status,
+                table.c.updated_at: now,
+            }).returning(
+                # label the columns, as the status column is called notification_status in the database
+                *(table.c[name].label(name) for name in returned_columns)
+            )
+        ).all()
+
+    return (
+        update(Notification, [ref for ref in statuses_by_reference if ref not in history_references]),
+        update(NotificationHistory, [ref for ref in statuses_by_reference if ref in history_references]),
+    )
+
+
 def dao_get_notifications_by_recipient_or_reference(
     service_id,
     search_term,
@@ -528,6 +877,15 @@ def dao_get_notifications_by_recipient_or_reference(
     page_size=None,
     error_out=True,
 ):
+    """
+    Searching for part of a recipient or reference uses the trigram indexes on normalised_to and client_reference,
+    as long as the search term is at least three characters long.
+
+    With NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED on, searching for a whole phone number or email address only finds
+    notifications sent to exactly that recipient, looked up by the md5 of normalised_to, rather than any recipient
+    containing it.
+    """
+    recipient = None
 
     if notification_type == SMS_TYPE:
         normalised = try_validate_and_format_phone_number(search_term)
@@ -537,9 +895,15 @@ def dao_get_notifications_by_recipient_or_reference(
 
         normalised = normalised.lstrip('+0')
 
+        try:
+            recipient = validate_and_format_phone_number(search_term, international=True)
+        except InvalidPhoneError:
+            pass
+
     elif notification_type == EMAIL_TYPE:
         try:
             normalised = validate_and_format_email_address(search_term)
+            recipient = normalised
         except InvalidEmailError:
             normalised = search_term.lower()
 
@@ -557,13 +921,17 @@ def dao_get_notifications_by_recipient_or_reference(
             f'Notification type must be {EMAIL_TYPE}, {SMS_TYPE}, {LETTER_TYPE} or None'
         )
 
-    normalised = escape_special_characters(normalised)
+    if recipient and current_app.config['NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED']:
+        recipient_filter = func.md5(Notification.normalised_to) == func.md5(recipient)
+    else:
+        recipient_filter = Notification.normalised_to.like("%{}%".format(escape_special_characters(normalised)))
+
     search_term = escape_special_characters(search_term)
 
     filters = [
         Notification.service_id == service_id,
         or_(
-            Notification.normalised_to.like("%{}%".format(normalised)),
+            recipient_filter,
             Notification.client_reference.ilike("%{}%".format(search_term)),
         ),
         Notification.key_type != KEY_TYPE_TEST,
@@ -600,6 +968,25 @@ def dao_get_notification_or_history_by_reference(reference):
         ).one()
 
 
+def dao_get_notifications_or_history_by_references(references):
+    """
+    Returns a dict of reference to notification for each of `references` that can be found, looking in
+    notification_history for any that aren't in notifications - one query per table.
+    """
+    references = set(references)
+    notifications = {
+        notification.reference: notification
+        for notification in Notification.query.filter(Notification.reference.in_(references)).all()
+    }
+    missing = references - notifications.keys()
+    if missing:
+        notifications.update({
+            notification.reference: notification
+            for notification in NotificationHistory.query.filter(NotificationHistory.reference.in_(missing)).all()
+        })
+    return notifications
+
+
 def dao_get_notifications_processing_time_stats(start_date, end_date):
     """
     For a given time range, returns the number of notifications sent and the number of
@@ -808,3 +1195,28 @@ def get_service_ids_with_notifications_on_date(notification_type, date):
             notification_table_query, ft_status_table_query
         ).subquery()).distinct()
     }
+
+
+def get_service_ids_with_notifications_changed_since(date, changed_since, notification_types):
+    """
+    The services with notifications of one of `notification_types` created on `date` (in BST) that were created or
+    updated at or after `changed_since`, so need their fact tables for the day aggregating again.
+    """
+    start_date = get_london_midnight_in_utc(date)
+    end_date = get_london_midnight_in_utc(date + timedelta(days=1))
+
+    def _changed_service_ids(table):
+        return db.session.query(
+            table.service_id.label('service_id')
+        ).filter(
+            table.notification_type.in_(notification_types),
+            table.created_at >= start_date,
+            table.created_at < end_date,
+            func.coalesce(table.updated_at, table.created_at) >= changed_since,
+        )
+
+    return {
+        row.service_id for row in db.session.query(union(
+            _changed_service_ids(Notification), _changed_service_ids(NotificationHistory)
+        ).subquery())
+    }
@@ -1,12 +1,9 @@
 from datetime import datetime
 
 from app import create_uuid, db
+from app.cache_invalidation import invalidate_callback_apis
 from app.dao.dao_utils import autocommit, version_class
-from app.models import (
-    COMPLAINT_CALLBACK_TYPE,
-    DELIVERY_STATUS_CALLBACK_TYPE,
-    ServiceCallbackApi,
-)
+from app.models import DELIVERY_STATUS_CALLBACK_TYPE, ServiceCallbackApi
 
 
 @autocommit
@@ -15,6 +12,7 @@ def save_service_callback_api(service_callback_api):
     service_callback_api.id = create_uuid()
     service_callback_api.created_at = datetime.utcnow()
     db.session.add(service_callback_api)
+    invalidate_callback_apis(service_callback_api.service_id)
 
 
 @autocommit
@@ -28,6 +26,7 @@ def reset_service_callback_api(service_callback_api, updated_by_id, url=None, be
     service_callback_api.updated_at = datetime.utcnow()
 
     db.session.add(service_callback_api)
+    invalidate_callback_apis(service_callback_api.service_id)
 
 
 def get_service_callback_api(service_callback_api_id, service_id):
@@ -41,13 +40,14 @@ def get_service_delivery_status_callback_api_for_service(service_id):
     ).first()
 
 
-def get_service_complaint_callback_api_for_service(service_id):
+def get_service_callback_api_for_service_and_type(service_id, callback_type):
     return ServiceCallbackApi.query.filter_by(
         service_id=service_id,
-        callback_type=COMPLAINT_CALLBACK_TYPE
+        callback_type=callback_type
     ).first()
 
 
 @autocommit
 def delete_service_callback_api(service_callback_api):
     db.session.delete(service_callback_api)
+    invalidate_callback_apis(service_callback_api.service_id)
@@ -7,6 +7,7 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.expression import and_, asc, case, func
 
 from app import db
+from app.cache_invalidation import invalidate_api_keys, invalidate_service
 from app.dao.dao_utils import VersionOptions, autocommit, version_class
 from app.dao.date_util import get_current_financial_year
 from app.dao.email_branding_dao import dao_get_email_branding_by_name
@@ -33,6 +34,7 @@ from app.models import (
     InboundNumber,
     InvitedUser,
     Job,
+    JobShard,
     Notification,
     NotificationHistory,
     Organisation,
@@ -261,6 +263,8 @@ def dao_archive_service(service_id):
         joinedload('api_keys'),
     ).filter(Service.id == service_id).one()
 
+    invalidate_service(service.id)
+    invalidate_api_keys(service.id)
     service.active = False
     service.name = get_archived_db_column_value(service.name)
     service.email_from = get_archived_db_column_value(service.email_from)
@@ -343,6 +347,7 @@ def dao_create_service(
 @version_class(Service)
 def dao_update_service(service):
     db.session.add(service)
+    invalidate_service(service.id)
 
 
 def dao_add_user_to_service(service, user, permissions=None, folder_permissions=None):
@@ -398,6 +403,8 @@ def delete_service_and_all_associated_db_objects(service):
     _delete_commit(Permission.query.filter_by(service=service))
     _delete_commit(NotificationHistory.query.filter_by(service=service))
     _delete_commit(Notification.query.filter_by(service=service))
+    job_subq = db.session.query(Job.id).filter_by(service=service).subquery()
+    _delete_commit(JobShard.query.filter(JobShard.job_id.in_(job_subq)))
     _delete_commit(Job.query.filter_by(service=service))
     _delete_commit(Template.query.filter_by(service=service))
     _delete_commit(TemplateHistory.query.filter_by(service_id=service.id))
@@ -501,6 +508,8 @@ def dao_suspend_service(service_id):
             api_key.expiry_date = datetime.utcnow()
 
     service.active = False
+    invalidate_service(service.id)
+    invalidate_api_keys(service.id)
 
 
 @autocommit
@@ -508,6 +517,7 @@ def dao_suspend_service(service_id):
 def dao_resume_service(service_id):
     service = Service.query.get(service_id)
     service.active = True
+    invalidate_service(service.id)
 
 
 def dao_fetch_active_users_for_service(service_id):
@@ -5,6 +5,7 @@ from flask import current_app
 from sqlalchemy import asc, desc
 
 from app import db
+from app.cache_invalidation import invalidate_template
 from app.dao.dao_utils import VersionOptions, autocommit, version_class
 from app.dao.users_dao import get_user_by_id
 from app.models import (
@@ -44,6 +45,7 @@ def dao_create_template(template):
 )
 def dao_update_template(template):
     db.session.add(template)
+    invalidate_template(template.service_id, template.id)
 
 
 @autocommit
@@ -75,6 +77,7 @@ def dao_update_template_reply_to(template_id, reply_to):
                                   "broadcast_data": template.broadcast_data,
                               })
     db.session.add(history)
+    invalidate_template(template.service_id, template.id)
     return template
 
 
@@ -2,7 +2,7 @@ import random
 from datetime import datetime, timedelta
 from urllib import parse
 
-from cachetools import TTLCache, cached
+from cachetools import LRUCache, TTLCache, cached
 from flask import current_app
 from notifications_utils.template import (
     HTMLEmailTemplate,
@@ -10,13 +10,26 @@ from notifications_utils.template import (
     SMSMessageTemplate,
 )
 
-from app import create_uuid, db, notification_provider_clients, statsd_client
+from app import (
+    create_uuid,
+    db,
+    notification_provider_clients,
+    provider_sender,
+    send_rate_governor,
+    statsd_client,
+)
 from app.celery.research_mode_tasks import (
     send_email_response,
     send_sms_response,
 )
+from app.clients.provider_sender import ProviderSenderBusyException
+from app.clients.send_rate_governor import SendRateExceededException
+from app.clients.sms import SmsClient
 from app.dao.email_branding_dao import dao_get_email_branding_by_id
-from app.dao.notifications_dao import dao_update_notification
+from app.dao.notifications_dao import (
+    dao_update_notification,
+    dao_update_notifications_to_sending,
+)
 from app.dao.provider_details_dao import (
     dao_reduce_sms_provider_priority,
     get_provider_details_by_notification_type,
@@ -27,6 +40,7 @@ from app.models import (
     BRANDING_ORG_BANNER,
     EMAIL_TYPE,
     KEY_TYPE_TEST,
+    NOTIFICATION_CREATED,
     NOTIFICATION_SENDING,
     NOTIFICATION_SENT,
     NOTIFICATION_STATUS_TYPES_COMPLETED,
@@ -49,9 +63,7 @@ def send_sms_to_provider(notification):
             technical_failure(notification=notification)
             return
 
-        template_model = SerialisedTemplate.from_id_and_service_id(
-            template_id=notification.template_id, service_id=service.id, version=notification.template_version
-        )
+        template_model = get_template(notification.template_id, service.id, notification.template_version)
 
         template = SMSMessageTemplate(
             template_model.__dict__,
@@ -81,7 +93,15 @@ def send_sms_to_provider(notification):
                     'international': notification.international,
                 }
                 db.session.close()  # no commit needed as no changes to objects have been made above
-                provider.send_sms(**send_sms_kwargs)
+                _wait_for_send_rate(provider, to=send_sms_kwargs['to'], sender=send_sms_kwargs['sender'])
+                reference = provider_sender.send(provider.name, provider.send_sms, **send_sms_kwargs)
+            except SendRateExceededException:
+                # nothing was sent, so this isn't the provider's fault
+                raise
+            except ProviderSenderBusyException:
+                # nor is this, and the send rate taken for it wasn't used
+                _release_send_rate(provider, to=send_sms_kwargs['to'], sender=send_sms_kwargs['sender'])
+                raise
             except Exception as e:
                 notification.billable_units = template.fragment_count
                 dao_update_notification(notification)
@@ -89,6 +109,8 @@ def send_sms_to_provider(notification):
                 raise e
             else:
                 notification.billable_units = template.fragment_count
+                # the provider's id for the message, which its delivery receipts are matched on
+                notification.reference = reference
                 update_notification_to_sending(notification, provider)
 
         delta_seconds = (datetime.utcnow() - created_at).total_seconds()
@@ -113,9 +135,7 @@ def send_email_to_provider(notification):
     if notification.status == 'created':
         provider = provider_to_use(EMAIL_TYPE)
 
-        template_dict = SerialisedTemplate.from_id_and_service_id(
-            template_id=notification.template_id, service_id=service.id, version=notification.template_version
-        ).__dict__
+        template_dict = get_template(notification.template_id, service.id, notification.template_version).__dict__
 
         html_email = HTMLEmailTemplate(
             template_dict,
@@ -137,14 +157,21 @@ def send_email_to_provider(notification):
             from_address = '"{}" <{}@{}>'.format(service.name, service.email_from,
                                                  current_app.config['NOTIFY_EMAIL_DOMAIN'])
 
-            reference = provider.send_email(
-                from_address,
-                notification.normalised_to,
-                plain_text_email.subject,
-                body=str(plain_text_email),
-                html_body=str(html_email),
-                reply_to_address=notification.reply_to_text
-            )
+            _wait_for_send_rate(provider)
+            try:
+                reference = provider_sender.send(
+                    provider.name,
+                    provider.send_email,
+                    from_address,
+                    notification.normalised_to,
+                    plain_text_email.subject,
+                    body=str(plain_text_email),
+                    html_body=str(html_email),
+                    reply_to_address=notification.reply_to_text
+                )
+            except ProviderSenderBusyException:
+                _release_send_rate(provider)
+                raise
             notification.reference = reference
             update_notification_to_sending(notification, provider)
         delta_seconds = (datetime.utcnow() - created_at).total_seconds()
@@ -159,6 +186,283 @@ def send_email_to_provider(notification):
                 statsd_client.timing("email.live-key.not-high-volume.total-time", delta_seconds)
 
 
+def send_sms_batch_to_provider(notifications):
+    """
+    Send a batch of SMS notifications, with up to PROVIDER_MAX_IN_FLIGHT provider calls at once, then mark
+    the ones that were sent as sending with a single UPDATE.
+
+    Anything raised comes from before any provider was called. Once messages have been sent this doesn't raise, so
+    that the caller never sends them again.
+
+    Returns the ids of notifications that could not be sent, so the caller can retry them individually, and a list
+    of (id, seconds to wait) for those held back by the send rate governor, to be retried once the rate allows.
+    """
+    providers = {}
+    to_send = {}
+    updates = []
+    responses = []
+    inactive = []
+    no_provider = []
+
+    for notification in notifications:
+        if notification.status != NOTIFICATION_CREATED:
+            continue
+        service = SerialisedService.from_id(notification.service_id)
+        if not service.active:
+            inactive.append(notification)
+            continue
+
+        if notification.international not in providers:
+            providers[notification.international] = provider_to_use(SMS_TYPE, notification.international)
+        provider = providers[notification.international]
+        if not provider:
+            no_provider.append(notification)
+            continue
+
+        template_model = get_template(notification.template_id, service.id, notification.template_version)
+        template = SMSMessageTemplate(
+            template_model.__dict__,
+            values=notification.personalisation,
+            prefix=service.name,
+            show_prefix=service.prefix_sms,
+        )
+
+        update = {
+            'id': notification.id,
+            'status': NOTIFICATION_SENT if notification.international else NOTIFICATION_SENDING,
+            'sent_by': provider.name,
+            'billable_units': template.fragment_count,
+        }
+        if service.research_mode or notification.key_type == KEY_TYPE_TEST:
+            updates.append(update)
+            responses.append((send_sms_response, [provider.name, str(notification.id), notification.to]))
+        else:
+            to_send.setdefault(provider, []).append((update, {
+                'to': notification.normalised_to,
+                'content': str(template),
+                'reference': str(notification.id),
+                'sender': notification.reply_to_text,
+                'international': notification.international,
+            }))
+
+    _technical_failure_for_inactive_services(inactive)
+    _technical_failure_for_no_provider(no_provider)
+    created_at = {notification.id: notification.created_at for notification in notifications}
+
+    # don't hold a DB connection open while we wait on the provider
+    db.session.close()
+    failed, throttled = [], []
+    for provider, provider_to_send in to_send.items():
+        provider_sent, provider_failed, provider_throttled = _send_concurrently(
+            provider, provider.send_sms, provider_to_send
+        )
+        if provider_failed:
+            dao_reduce_sms_provider_priority(provider.name, time_threshold=timedelta(minutes=1))
+        for update, reference in provider_sent:
+            update['reference'] = reference
+            updates.append(update)
+        failed += provider_failed
+        throttled += provider_throttled
+
+    _record_sent(updates, responses, created_at, 'sms')
+    return [update['id'] for update in failed], [(update['id'], wait) for update, wait in throttled]
+
+
+def send_email_batch_to_provider(notifications):
+    """
+    Send a batch of email notifications, with up to PROVIDER_MAX_IN_FLIGHT provider calls at once, then mark
+    the ones that were sent as sending with a single UPDATE.
+
+    Anything raised comes from before any provider was called. Once messages have been sent this doesn't raise, so
+    that the caller never sends them again.
+
+    Returns the ids of notifications that could not be sent, so the caller can retry them individually, and a list
+    of (id, seconds to wait) for those held back by the send rate governor, to be retried once the rate allows.
+    """
+    provider = provider_to_use(EMAIL_TYPE)
+    html_email_options = {}
+    to_send = []
+    updates = []
+    responses = []
+    inactive = []
+
+    for notification in notifications:
+        if notification.status != NOTIFICATION_CREATED:
+            continue
+        service = SerialisedService.from_id(notification.service_id)
+        if not service.active:
+            inactive.append(notification)
+            continue
+
+        template_dict = get_template(notification.template_id, service.id, notification.template_version).__dict__
+        if service.id not in html_email_options:
+            html_email_options[service.id] = get_html_email_options(service)
+
+        html_email = HTMLEmailTemplate(
+            template_dict,
+            values=notification.personalisation,
+            **html_email_options[service.id]
+        )
+        plain_text_email = PlainTextEmailTemplate(
+            template_dict,
+            values=notification.personalisation
+        )
+
+        update = {
+            'id': notification.id,
+            'status': NOTIFICATION_SENT if notification.international else NOTIFICATION_SENDING,
+            'sent_by': provider.name,
+            'billable_units': notification.billable_units,
+        }
+        if service.research_mode or notification.key_type == KEY_TYPE_TEST:
+            update['reference'] = str(create_uuid())
+            updates.append(update)
+            responses.append((send_email_response, [update['reference'], notification.to]))
+        else:
+            from_address = '"{}" <{}@{}>'.format(service.name, service.email_from,
+                                                 current_app.config['NOTIFY_EMAIL_DOMAIN'])
+            to_send.append((update, {
+                'source': from_address,
+                'to_addresses': notification.normalised_to,
+                'subject': plain_text_email.subject,
+                'body': str(plain_text_email),
+                'html_body': str(html_email),
+                'reply_to_address': notification.reply_to_text,
+            }))
+
+    _technical_failure_for_inactive_services(inactive)
+    created_at = {notification.id: notification.created_at for notification in notifications}
+
+    # don't hold a DB connection open while we wait on the provider
+    db.session.close()
+    sent, failed, throttled = _send_concurrently(provider, provider.send_email, to_send)
+    for update, reference in sent:
+        update['reference'] = reference
+        updates.append(update)
+
+    _record_sent(updates, responses, created_at, 'email')
+    return [update['id'] for update in failed], [(update['id'], wait) for update, wait in throttled]
+
+
+def _record_sent(updates, responses, created_at, notification_type):
+    """
+    Marks the notifications in `updates` as sending, then sends the research mode and test key responses. The
+    responses come after the UPDATE has been committed, so that the statuses they set aren't overwritten by it.
+
+    These notifications have already been sent, so if the single UPDATE fails each one is updated on its own, and
+    any that can't be are left for the delivery receipt to update - nothing is raised for them to be sent again.
+    """
+    try:
+        dao_update_notifications_to_sending(updates)
+    except Exception:
+        current_app.logger.exception(
+            "Marking batch of {} {} notifications as sending failed, updating them one at a time".format(
+                len(updates), notification_type
+            )
+        )
+        for update in updates:
+            try:
+                dao_update_notifications_to_sending([update])
+            except Exception:
+                current_app.logger.exception(
+                    "Marking {} notification {} as sending failed".format(notification_type, update['id'])
+                )
+
+    for send_response, args in responses:
+        try:
+            send_response(*args)
+        except Exception:
+            current_app.logger.exception("Sending {} research mode response failed".format(notification_type))
+
+    for update in updates:
+        statsd_client.timing(
+            "{}.total-time".format(notification_type),
+            (datetime.utcnow() - created_at[update['id']]).total_seconds()
+        )
+
+
+def _send_concurrently(provider, send_fn, to_send):
+    """
+    Call `send_fn` for each (update, kwargs) pair in `to_send` on the provider sender's thread pool.
+
+    Returns a list of (update, provider response) for calls that succeeded, a list of updates for calls that failed,
+    and a list of (update, seconds to wait) for those that weren't made because of the send rate or because the
+    provider sender was busy - which aren't the provider's fault, so are kept out of the failures.
+    """
+    futures = []
+    sent, failed, throttled = [], [], []
+    for update, kwargs in to_send:
+        try:
+            _wait_for_send_rate(provider, to=kwargs.get('to'), sender=kwargs.get('sender'))
+            futures.append((update, provider_sender.submit(provider.name, send_fn, **kwargs)))
+        except SendRateExceededException as e:
+            current_app.logger.warning("Notification {} held back by the send rate: {}".format(update['id'], e))
+            throttled.append((update, e.wait))
+        except ProviderSenderBusyException as e:
+            current_app.logger.warning("Notification {} held back as the provider is busy: {}".format(update['id'], e))
+            _release_send_rate(provider, to=kwargs.get('to'), sender=kwargs.get('sender'))
+            throttled.append((update, 0))
+        except Exception:
+            current_app.logger.exception("Sending notification {} to provider failed".format(update['id']))
+            failed.append(update)
+
+    for update, future in futures:
+        try:
+            sent.append((update, future.result()))
+        except Exception:
+            current_app.logger.exception("Sending notification {} to provider failed".format(update['id']))
+            failed.append(update)
+    return sent, failed, throttled
+
+
+def _wait_for_send_rate(provider, to=None, sender=None):
+    if not send_rate_governor.enabled:
+        return
+    send_rate_governor.acquire(provider.name)
+    if to is not None and isinstance(provider, SmsClient):
+        origination_number = provider.get_origination_number(to, sender)
+        if origination_number:
+            try:
+                send_rate_governor.acquire('{}:{}'.format(provider.name, origination_number))
+            except SendRateExceededException:
+                # nothing will be sent, so don't use up the provider's send rate
+                send_rate_governor.release(provider.name)
+                raise
+
+
+def _release_send_rate(provider, to=None, sender=None):
+    # gives back what _wait_for_send_rate took, when nothing was sent after all
+    if not send_rate_governor.enabled:
+        return
+    send_rate_governor.release(provider.name)
+    if to is not None and isinstance(provider, SmsClient):
+        origination_number = provider.get_origination_number(to, sender)
+        if origination_number:
+            send_rate_governor.release('{}:{}'.format(provider.name, origination_number))
+
+
+def _technical_failure_for_inactive_services(notifications):
+    for notification in notifications:
+        current_app.logger.warning(
+            "Send {} for notification id {} to provider is not allowed: service {} is inactive".format(
+                notification.notification_type, notification.id, notification.service_id
+            )
+        )
+        notification.status = NOTIFICATION_TECHNICAL_FAILURE
+        dao_update_notification(notification)
+
+
+def _technical_failure_for_no_provider(notifications):
+    for notification in notifications:
+        current_app.logger.warning(
+            "Send {} for notification id {} to provider is not possible: no provider can send it".format(
+                notification.notification_type, notification.id
+            )
+        )
+        notification.status = NOTIFICATION_TECHNICAL_FAILURE
+        dao_update_notification(notification)
+
+
 def update_notification_to_sending(notification, provider):
     notification.sent_at = datetime.utcnow()
     notification.sent_by = provider.name
@@ -214,6 +518,36 @@ def get_logo_url(base_url, logo_file):
     return parse.urlunparse(logo_url)
 
 
+# A template version never changes, so these can be kept until they're pushed out by newer ones
+template_cache = LRUCache(maxsize=1024)
+# Branding can be edited, so don't keep it for long
+email_branding_options_cache = TTLCache(maxsize=256, ttl=60)
+
+
+def get_template(template_id, service_id, version):
+    if version is None:
+        return SerialisedTemplate.from_id_and_service_id(template_id=template_id, service_id=service_id)
+    return _get_or_load(
+        template_cache,
+        'template-cache',
+        (str(template_id), str(service_id), version),
+        lambda: SerialisedTemplate.from_id_and_service_id(
+            template_id=template_id, service_id=service_id, version=version
+        ),
+    )
+
+
+def _get_or_load(cache, cache_name, key, load):
+    try:
+        value = cache[key]
+    except KeyError:
+        statsd_client.incr(f'{cache_name}.miss')
+        value = cache[key] = load()
+    else:
+        statsd_client.incr(f'{cache_name}.hit')
+    return value
+
+
 def get_html_email_options(service):
     if service.email_branding is None:
         return {
@@ -221,10 +555,16 @@ def get_html_email_options(service):
             'brand_banner': False,
         }
     if isinstance(service, SerialisedService):
-        branding = dao_get_email_branding_by_id(service.email_branding)
-    else:
-        branding = service.email_branding
+        return _get_or_load(
+            email_branding_options_cache,
+            'email-branding-cache',
+            str(service.email_branding),
+            lambda: _get_email_branding_options(dao_get_email_branding_by_id(service.email_branding)),
+        )
+    return _get_email_branding_options(service.email_branding)
+
 
+def _get_email_branding_options(branding):
     logo_url = get_logo_url(
         current_app.config['ADMIN_BASE_URL'],
         branding.logo
@@ -1,6 +1,6 @@
 import dateutil
 import pytz
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, current_app, jsonify, request, url_for
 
 from app.aws.s3 import get_job_metadata_from_s3
 from app.celery.tasks import process_job
@@ -22,6 +22,7 @@ from app.dao.jobs_dao import (
 from app.dao.notifications_dao import (
     dao_get_notification_count_for_job_id,
     get_notifications_for_job,
+    get_notifications_for_job_after,
 )
 from app.dao.services_dao import dao_fetch_service_by_id
 from app.dao.templates_dao import dao_get_template_by_id
@@ -38,7 +39,12 @@ from app.schemas import (
     notifications_filter_schema,
     unarchived_template_schema,
 )
-from app.utils import midnight_n_days_ago, pagination_links
+from app.utils import (
+    decode_pagination_cursor,
+    encode_pagination_cursor,
+    midnight_n_days_ago,
+    pagination_links,
+)
 
 job_blueprint = Blueprint('job', __name__, url_prefix='/service/<uuid:service_id>/job')
 
@@ -80,6 +86,9 @@ def cancel_letter_job(service_id, job_id):
 @job_blueprint.route('/<job_id>/notifications', methods=['GET'])
 def get_all_notifications_for_service_job(service_id, job_id):
     data = notifications_filter_schema.load(request.args)
+    if 'cursor' in data or (current_app.config['KEYSET_PAGINATION_ENABLED'] and 'page' not in data):
+        return _get_notifications_for_job_after(service_id, job_id, data)
+
     page = data['page'] if 'page' in data else 1
     page_size = data['page_size'] if 'page_size' in data else current_app.config.get('PAGE_SIZE')
     paginated_notifications = get_notifications_for_job(
@@ -111,6 +120,48 @@ def get_all_notifications_for_service_job(service_id, job_id):
     ), 200
 
 
+def _get_notifications_for_job_after(service_id, job_id, data):
+    """
+    Gets a page of the job's notifications, in row order, starting from the `cursor` given for the page before
+    instead of by page number. Unlike pages got by number the total isn't counted, and there are no links to the
+    previous or last page.
+    """
+    after = None
+    if 'cursor' in data:
+        try:
+            after = decode_pagination_cursor(data['cursor'], int)
+        except ValueError:
+            raise InvalidRequest('cursor is not valid', status_code=400)
+
+    page_size = data['page_size'] if 'page_size' in data else current_app.config.get('PAGE_SIZE')
+    notifications, next_page_after = get_notifications_for_job_after(
+        service_id,
+        job_id,
+        after=after,
+        filter_dict=data,
+        page_size=page_size
+    )
+
+    if data.get('format_for_csv'):
+        notifications = [notification.serialize_for_csv() for notification in notifications]
+    else:
+        notifications = notification_with_template_schema.dump(notifications, many=True)
+
+    links = {}
+    if next_page_after:
+        kwargs = request.args.to_dict()
+        kwargs['service_id'] = service_id
+        kwargs['job_id'] = job_id
+        kwargs['cursor'] = encode_pagination_cursor(next_page_after)
+        links['next'] = url_for('.get_all_notifications_for_service_job', **kwargs)
+
+    return jsonify(
+        notifications=notifications,
+        page_size=page_size,
+        links=links
+    ), 200
+
+
 @job_blueprint.route('/<job_id>/notification_count', methods=['GET'])
 def get_notification_count_for_job_id(service_id, job_id):
     dao_get_job_by_service_id_and_job_id(service_id, job_id)
@@ -53,6 +53,23 @@ def find_letter_pdf_in_s3(notification):
     return item
 
 
+def get_letter_pdf_keys_and_sizes_in_s3(bucket_name, folder):
+    """
+    Lists `folder` of `bucket_name` once, a page of up to 1000 keys at a time, and returns a dict of
+    {reference: (key, size)} for the letter PDFs in it. If a reference has more than one PDF the first key is used,
+    as find_letter_pdf_in_s3 would.
+    """
+    paginator = boto3.client('s3').get_paginator('list_objects_v2')
+    key_prefix = PRECOMPILED_BUCKET_PREFIX.format(folder=folder, reference='').upper()
+
+    keys_and_sizes = {}
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=key_prefix):
+        for item in page.get('Contents', []):
+            reference = get_reference_from_filename(item['Key']).upper()
+            keys_and_sizes.setdefault(reference, (item['Key'], item['Size']))
+    return keys_and_sizes
+
+
 def generate_letter_pdf_filename(reference, created_at, ignore_folder=False, postage=SECOND_CLASS):
     upload_file_name = LETTERS_PDF_FILE_LOCATION_STRUCTURE.format(
         folder='' if ignore_folder else get_folder_name(created_at),
@@ -321,6 +321,7 @@ UPLOAD_DOCUMENT = 'upload_document'
 EDIT_FOLDER_PERMISSIONS = 'edit_folder_permissions'
 UPLOAD_LETTERS = 'upload_letters'
 INTERNATIONAL_LETTERS = 'international_letters'
+BATCHED_CALLBACKS = 'batched_callbacks'
 
 SERVICE_PERMISSION_TYPES = [
     EMAIL_TYPE,
@@ -336,6 +337,7 @@ SERVICE_PERMISSION_TYPES = [
     EDIT_FOLDER_PERMISSIONS,
     UPLOAD_LETTERS,
     INTERNATIONAL_LETTERS,
+    BATCHED_CALLBACKS,
 ]
 
 
@@ -1258,6 +1260,23 @@ class Job(db.Model):
     contact_list_id = db.Column(UUID(as_uuid=True), db.ForeignKey('service_contact_list.id'), nullable=True)
 
 
+class JobShard(db.Model):
+    """
+    A range of a large job's rows, processed by a process-job-shard task of its own. The job is finished once all of
+    its shards are. Shards use the pending, in progress and finished job statuses.
+    """
+    __tablename__ = 'job_shards'
+
+    job_id = db.Column(UUID(as_uuid=True), db.ForeignKey('jobs.id'), primary_key=True)
+    job = db.relationship('Job', backref=db.backref('shards', lazy='dynamic'))
+    shard_number = db.Column(db.Integer, primary_key=True)
+    first_row = db.Column(db.Integer, nullable=False)
+    last_row = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(255), nullable=False, default=JOB_STATUS_PENDING)
+    processing_started = db.Column(db.DateTime, nullable=True)
+    processing_finished = db.Column(db.DateTime, nullable=True)
+
+
 VERIFY_CODE_TYPES = [EMAIL_TYPE, SMS_TYPE]
 
 
@@ -1511,21 +1530,39 @@ class Notification(db.Model):
             ['template_id', 'template_version'],
             ['templates_history.id', 'templates_history.version'],
         ),
-        UniqueConstraint('job_id', 'job_row_number', name='uq_notifications_job_row_number'),
+        # partitioned by created_at, so unique constraints have to include it. The primary key is (id, created_at)
+        # in the database, but notifications are still looked up by id alone
+        UniqueConstraint('job_id', 'job_row_number', 'created_at', name='uq_notifications_job_row_number'),
         Index(
             'ix_notifications_notification_type_composite',
             'notification_type',
             'status',
             'created_at'
         ),
-        Index('ix_notifications_service_created_at', 'service_id', 'created_at'),
+        # for keyset pagination of a service's notifications, see get_notifications_for_service_after
+        Index('ix_notifications_service_created_at_id', 'service_id', 'created_at', 'id'),
+        # for searching by recipient and reference, see dao_get_notifications_by_recipient_or_reference
+        Index(
+            'ix_notifications_normalised_to_trgm',
+            'normalised_to',
+            postgresql_using='gin',
+            postgresql_ops={'normalised_to': 'gin_trgm_ops'}
+        ),
+        Index(
+            'ix_notifications_client_reference_trgm',
+            'client_reference',
+            postgresql_using='gin',
+            postgresql_ops={'client_reference': 'gin_trgm_ops'}
+        ),
+        Index('ix_notifications_service_normalised_to_md5', 'service_id', func.md5(normalised_to)),
         Index(
             "ix_notifications_service_id_composite",
             'service_id',
             'notification_type',
             'status',
             'created_at'
-        )
+        ),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
     @property
@@ -1793,7 +1830,8 @@ class NotificationHistory(db.Model, HistoryModel):
             'key_type',
             'notification_type',
             'created_at'
-        )
+        ),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
     @classmethod
@@ -1971,6 +2009,9 @@ class Rate(db.Model):
 
 class InboundSms(db.Model):
     __tablename__ = 'inbound_sms'
+    __table_args__ = (
+        Index('ix_inbound_sms_service_id_created_at_id', 'service_id', 'created_at', 'id'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
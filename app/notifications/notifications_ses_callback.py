@@ -1,21 +1,31 @@
+from collections import defaultdict
+
 from flask import current_app
 
+from app import task_publisher
 from app.celery.service_callback_tasks import (
     create_complaint_callback_data,
     create_delivery_status_callback_data,
     send_complaint_to_service,
     send_delivery_status_to_service,
+    send_delivery_statuses_to_service,
 )
 from app.config import QueueNames
 from app.dao.complaint_dao import save_complaint
 from app.dao.notifications_dao import (
     dao_get_notification_or_history_by_reference,
 )
-from app.dao.service_callback_api_dao import (
-    get_service_complaint_callback_api_for_service,
-    get_service_delivery_status_callback_api_for_service,
+from app.models import (
+    BATCHED_CALLBACKS,
+    COMPLAINT_CALLBACK_TYPE,
+    DELIVERY_STATUS_CALLBACK_TYPE,
+    Complaint,
+)
+from app.serialised_models import (
+    SerialisedService,
+    SerialisedServiceCallbackApi,
 )
-from app.models import Complaint
+from app.utils import chunked
 
 
 def determine_notification_bounce_type(notification_type, ses_message):
@@ -70,16 +80,49 @@ def remove_emails_from_complaint(complaint_dict):
 
 def check_and_queue_callback_task(notification):
     # queue callback task only if the service_callback_api exists
-    service_callback_api = get_service_delivery_status_callback_api_for_service(service_id=notification.service_id)
+    service_callback_api = SerialisedServiceCallbackApi.from_service_id_and_type(
+        notification.service_id, DELIVERY_STATUS_CALLBACK_TYPE
+    )
     if service_callback_api:
         notification_data = create_delivery_status_callback_data(notification, service_callback_api)
         send_delivery_status_to_service.apply_async([str(notification.id), notification_data],
                                                     queue=QueueNames.CALLBACKS)
 
 
+def queue_callback_tasks(notifications):
+    """
+    Like check_and_queue_callback_task for many notifications. Takes anything with the notification attributes the
+    callback needs, such as rows returned by an UPDATE.
+
+    Services with the batched_callbacks permission get their status updates in batches of SERVICE_CALLBACK_BATCH_SIZE.
+    """
+    batches = defaultdict(list)
+    for notification in notifications:
+        service_callback_api = SerialisedServiceCallbackApi.from_service_id_and_type(
+            notification.service_id, DELIVERY_STATUS_CALLBACK_TYPE
+        )
+        if not service_callback_api:
+            continue
+        notification_data = create_delivery_status_callback_data(notification, service_callback_api)
+        if BATCHED_CALLBACKS in SerialisedService.from_id(notification.service_id).permissions:
+            batches[notification.service_id].append(notification_data)
+        else:
+            task_publisher.publish(
+                send_delivery_status_to_service,
+                [str(notification.id), notification_data],
+                queue=QueueNames.CALLBACKS,
+            )
+
+    for service_data in batches.values():
+        for batch in chunked(service_data, current_app.config['SERVICE_CALLBACK_BATCH_SIZE']):
+            task_publisher.publish(send_delivery_statuses_to_service, [batch], queue=QueueNames.CALLBACKS)
+
+
 def _check_and_queue_complaint_callback_task(complaint, notification, recipient):
     # queue callback task only if the service_callback_api exists
-    service_callback_api = get_service_complaint_callback_api_for_service(service_id=notification.service_id)
+    service_callback_api = SerialisedServiceCallbackApi.from_service_id_and_type(
+        notification.service_id, COMPLAINT_CALLBACK_TYPE
+    )
     if service_callback_api:
         complaint_data = create_complaint_callback_data(complaint, notification, service_callback_api, recipient)
         send_complaint_to_service.apply_async([complaint_data], queue=QueueNames.CALLBACKS)
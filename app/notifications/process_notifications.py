@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 
-from flask import current_app
+from flask import current_app, g, has_request_context
 from gds_metrics import Histogram
 from notifications_utils.clients import redis
 from notifications_utils.recipients import (
@@ -15,11 +15,12 @@ from notifications_utils.template import (
     SMSMessageTemplate,
 )
 
-from app import redis_store
+from app import redis_store, task_publisher
 from app.celery import provider_tasks
 from app.celery.letters_pdf_tasks import get_pdf_for_templated_letter
 from app.config import QueueNames
 from app.dao.notifications_dao import (
+    dao_bulk_create_notifications,
     dao_create_notification,
     dao_delete_notifications_by_id,
 )
@@ -80,7 +81,7 @@ def check_placeholders(template_object):
         raise BadRequestError(fields=[{'template': message}], message=message)
 
 
-def persist_notification(
+def build_notification(
     *,
     template_id,
     template_version,
@@ -96,7 +97,6 @@ def persist_notification(
     reference=None,
     client_reference=None,
     notification_id=None,
-    simulated=False,
     created_by_id=None,
     status=NOTIFICATION_CREATED,
     reply_to_text=None,
@@ -105,14 +105,10 @@ def persist_notification(
     document_download_count=None,
     updated_at=None
 ):
-    current_app.logger.info('Presisting notification')
-    
     notification_created_at = created_at or datetime.utcnow()
     if not notification_id:
         notification_id = uuid.uuid4()
-    
-    current_app.logger.info('Presisting notification with id {}'.format(notification_id))
-    
+
     notification = Notification(
         id=notification_id,
         template_id=template_id,
@@ -135,8 +131,6 @@ def persist_notification(
         document_download_count=document_download_count,
         updated_at=updated_at
     )
-    
-    current_app.logger.info('Presisting notification with to address: {}'.format(notification.to))
 
     if notification_type == SMS_TYPE:
         formatted_recipient = validate_and_format_phone_number(recipient, international=True)
@@ -146,40 +140,153 @@ def persist_notification(
         notification.phone_prefix = recipient_info.country_prefix
         notification.rate_multiplier = recipient_info.billable_units
     elif notification_type == EMAIL_TYPE:
-        current_app.logger.info('Presisting notification with type: {}'.format(EMAIL_TYPE))
         notification.normalised_to = format_email_address(notification.to)
-        current_app.logger.info('Presisting notification to formatted email: {}'.format(notification.normalised_to))
     elif notification_type == LETTER_TYPE:
         notification.postage = postage
         notification.international = postage in INTERNATIONAL_POSTAGE_TYPES
         notification.normalised_to = ''.join(notification.to.split()).lower()
 
+    return notification
+
+
+def persist_notification(
+    *,
+    template_id,
+    template_version,
+    recipient,
+    service,
+    personalisation,
+    notification_type,
+    api_key_id,
+    key_type,
+    created_at=None,
+    job_id=None,
+    job_row_number=None,
+    reference=None,
+    client_reference=None,
+    notification_id=None,
+    simulated=False,
+    created_by_id=None,
+    status=NOTIFICATION_CREATED,
+    reply_to_text=None,
+    billable_units=None,
+    postage=None,
+    document_download_count=None,
+    updated_at=None
+):
+    notification = build_notification(
+        template_id=template_id,
+        template_version=template_version,
+        recipient=recipient,
+        service=service,
+        personalisation=personalisation,
+        notification_type=notification_type,
+        api_key_id=api_key_id,
+        key_type=key_type,
+        created_at=created_at,
+        job_id=job_id,
+        job_row_number=job_row_number,
+        reference=reference,
+        client_reference=client_reference,
+        notification_id=notification_id,
+        created_by_id=created_by_id,
+        status=status,
+        reply_to_text=reply_to_text,
+        billable_units=billable_units,
+        postage=postage,
+        document_download_count=document_download_count,
+        updated_at=updated_at,
+    )
+
     # if simulated create a Notification model to return but do not persist the Notification to the dB
     if not simulated:
-        current_app.logger.info('Firing dao_create_notification')
         dao_create_notification(notification)
-        if key_type != KEY_TYPE_TEST and current_app.config['REDIS_ENABLED']:
-            current_app.logger.info('Redis enabled, querying cache key for service id: {}'.format(service.id))
-            cache_key = redis.daily_limit_cache_key(service.id)
-            current_app.logger.info('Redis daily limit cache key: {}'.format(cache_key))
-            if redis_store.get(cache_key) is None:
-                current_app.logger.info('Redis daily limit cache key does not exist')
-                # if cache does not exist set the cache to 1 with an expiry of 24 hours,
-                # The cache should be set by the time we create the notification
-                # but in case it is this will make sure the expiry is set to 24 hours,
-                # where if we let the incr method create the cache it will be set a ttl.
-                redis_store.set(cache_key, 1, ex=86400)
-                current_app.logger.info('Set redis daily limit cache key to 1')
-            else:
-                current_app.logger.info('Redis daily limit cache key does exist')
-                redis_store.incr(cache_key)
-                current_app.logger.info('Redis daily limit cache key has been incremented')
+        if key_type != KEY_TYPE_TEST and not consume_daily_limit_reservation(service.id):
+            increment_daily_limit_cache(service.id)
         current_app.logger.info(
-            "{} {} created at {}".format(notification_type, notification_id, notification_created_at)
+            "{} {} created at {}".format(notification_type, notification.id, notification.created_at)
         )
     return notification
 
 
+def persist_notifications_in_bulk(notifications, service_id):
+    """
+    Insert a batch of notifications built with `build_notification` in a single multi-row INSERT.
+
+    Returns the ids (as strings) that were inserted. Notifications that already exist (for example because SQS delivered
+    the same batch twice) are skipped and are not counted against the daily limit again.
+    """
+    inserted_ids = dao_bulk_create_notifications(notifications)
+
+    billable_count = sum(
+        1 for notification in notifications
+        if str(notification.id) in inserted_ids and notification.key_type != KEY_TYPE_TEST
+    )
+    if billable_count and not consume_daily_limit_reservation(service_id, count=billable_count):
+        increment_daily_limit_cache(service_id, count=billable_count)
+
+    return inserted_ids
+
+
+def increment_daily_limit_cache(service_id, count=1):
+    if not current_app.config['REDIS_ENABLED']:
+        return
+
+    cache_key = redis.daily_limit_cache_key(service_id)
+    if redis_store.get(cache_key) is None:
+        # if cache does not exist set the cache to the count with an expiry of 24 hours,
+        # The cache should be set by the time we create the notification
+        # but in case it is this will make sure the expiry is set to 24 hours,
+        # where if we let the incr method create the cache it will be set a ttl.
+        redis_store.set(cache_key, count, ex=86400)
+    elif count == 1:
+        redis_store.incr(cache_key)
+    else:
+        # the RedisClient has no incrby, so handle errors the way its incr would rather than fail the whole batch
+        try:
+            redis_store.redis_store.incrby(cache_key, count)
+        except Exception:
+            current_app.logger.exception("Failed to increment daily limit cache for service {}".format(service_id))
+
+
+def record_daily_limit_reservation(service_id, count=1):
+    # check_rate_limiting has already counted the notifications this request is about to create
+    g.daily_limit_reservation = str(service_id)
+    g.daily_limit_reservation_count = count
+
+
+def consume_daily_limit_reservation(service_id, count=1):
+    if not has_request_context() or g.get('daily_limit_reservation') != str(service_id):
+        return False
+    reserved = g.get('daily_limit_reservation_count', 1)
+    if count > reserved:
+        return False
+    if count == reserved:
+        g.pop('daily_limit_reservation')
+        g.pop('daily_limit_reservation_count', None)
+    else:
+        g.daily_limit_reservation_count = reserved - count
+    return True
+
+
+def release_unused_daily_limit_reservation(exception=None):
+    """
+    Registered as a teardown_request function, so that a request that reserved messages against the daily limit
+    but failed before creating the notifications (or created fewer than it reserved) gives the rest back.
+    """
+    service_id = g.pop('daily_limit_reservation', None)
+    count = g.pop('daily_limit_reservation_count', 1)
+    if service_id is None or not current_app.config['REDIS_ENABLED']:
+        return
+    try:
+        if count == 1:
+            redis_store.redis_store.decr(redis.daily_limit_cache_key(service_id))
+        else:
+            redis_store.redis_store.decrby(redis.daily_limit_cache_key(service_id), count)
+    except Exception:
+        current_app.logger.exception("Failed to release daily limit reservation for service {}".format(service_id))
+
+
 def send_notification_to_queue_detached(
     key_type, notification_type, notification_id, research_mode, queue=None
 ):
@@ -200,7 +307,12 @@ def send_notification_to_queue_detached(
         deliver_task = get_pdf_for_templated_letter
 
     try:
-        deliver_task.apply_async([str(notification_id)], queue=queue)
+        if has_request_context():
+            # the API doesn't say the notification was created until it's on the queue, so that if it can't be
+            # published the notification is deleted and the request fails. The task publisher only buffers it
+            deliver_task.apply_async([str(notification_id)], queue=queue)
+        else:
+            task_publisher.publish(deliver_task, [str(notification_id)], queue=queue)
     except Exception:
         dao_delete_notifications_by_id(notification_id)
         raise
@@ -1,3 +1,7 @@
+from collections import defaultdict, deque
+from threading import Lock
+from time import time
+
 from flask import current_app
 from gds_metrics.metrics import Histogram
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
@@ -29,6 +33,7 @@ from app.models import (
 )
 from app.notifications.process_notifications import (
     create_content_for_notification,
+    record_daily_limit_reservation,
 )
 from app.serialised_models import SerialisedTemplate
 from app.service.utils import service_allowed_to_send_to
@@ -46,18 +51,39 @@ REDIS_EXCEEDED_RATE_LIMIT_DURATION_SECONDS = Histogram(
 )
 
 
-def check_service_over_api_rate_limit(service, api_key):
+def check_service_over_api_rate_limit(service, api_key, notification_count=1):
     if current_app.config['API_RATE_LIMIT_ENABLED'] and current_app.config['REDIS_ENABLED']:
         cache_key = rate_limit_cache_key(service.id, api_key.key_type)
         rate_limit = service.rate_limit
         interval = 60
         with REDIS_EXCEEDED_RATE_LIMIT_DURATION_SECONDS.time():
-            if redis_store.exceeded_rate_limit(cache_key, rate_limit, interval):
+            if notification_count == 1:
+                exceeded = redis_store.exceeded_rate_limit(cache_key, rate_limit, interval)
+            else:
+                exceeded = _exceeded_rate_limit_for_messages(cache_key, rate_limit, interval, notification_count)
+            if exceeded:
                 current_app.logger.info("service {} has been rate limited for throughput".format(service.id))
                 raise RateLimitError(rate_limit, interval, api_key.key_type)
 
 
-def check_service_over_daily_message_limit(key_type, service):
+def _exceeded_rate_limit_for_messages(cache_key, rate_limit, interval, notification_count):
+    # like RedisClient.exceeded_rate_limit, but each of a bulk request's messages counts towards the limit
+    if not redis_store.active:
+        return False
+    try:
+        now = time()
+        pipeline = redis_store.redis_store.pipeline()
+        pipeline.zadd(cache_key, {'{!r}-{}'.format(now, i): now for i in range(notification_count)})
+        pipeline.zremrangebyscore(cache_key, '-inf', now - interval)
+        pipeline.expire(cache_key, interval)
+        pipeline.zcard(cache_key)
+        return pipeline.execute()[3] > rate_limit
+    except Exception:
+        current_app.logger.exception("Rate limit check for {} failed".format(cache_key))
+        return False
+
+
+def check_service_over_daily_message_limit(key_type, service, notification_count=1):
     if key_type == KEY_TYPE_TEST or not current_app.config['REDIS_ENABLED']:
         return 0
 
@@ -67,8 +93,7 @@ def check_service_over_daily_message_limit(key_type, service):
         # first message of the day, set the cache to 0 and the expiry to 24 hours
         service_stats = 0
         redis_store.set(cache_key, service_stats, ex=86400)
-        return service_stats
-    if int(service_stats) >= service.message_limit:
+    if int(service_stats) + notification_count > service.message_limit:
         current_app.logger.info(
             "service {} has been rate limited for daily use sent {} limit {}".format(
                 service.id, int(service_stats), service.message_limit)
@@ -77,9 +102,118 @@ def check_service_over_daily_message_limit(key_type, service):
     return int(service_stats)
 
 
-def check_rate_limiting(service, api_key):
-    check_service_over_api_rate_limit(service, api_key)
-    check_service_over_daily_message_limit(api_key.key_type, service)
+def check_rate_limiting(service, api_key, notification_count=1):
+    if current_app.config['REDIS_ENABLED'] and current_app.config['ATOMIC_RATE_LIMITING_ENABLED']:
+        check_and_reserve_rate_limits(service, api_key, notification_count=notification_count)
+        return
+    check_service_over_api_rate_limit(service, api_key, notification_count=notification_count)
+    check_service_over_daily_message_limit(api_key.key_type, service, notification_count=notification_count)
+
+
+# Checks the per-minute rate limit, then checks the daily limit and, if there is room, takes the messages from it.
+# Returns {outcome, count} where outcome is 0 if the messages are allowed, 1 if over the rate limit (count is the
+# number of messages in the interval) or 2 if over the daily limit (count is the number sent today).
+RATE_AND_DAILY_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local rate_limit = tonumber(ARGV[3])
+local daily_limit = tonumber(ARGV[4])
+local count = tonumber(ARGV[5])
+
+if rate_limit > 0 then
+    for i = 1, count do
+        local member = ARGV[1]
+        if i > 1 then
+            member = member .. '-' .. i
+        end
+        redis.call('ZADD', KEYS[1], now, member)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - interval)
+    redis.call('EXPIRE', KEYS[1], interval)
+    local requests = redis.call('ZCARD', KEYS[1])
+    if requests > rate_limit then
+        return {1, requests}
+    end
+end
+
+if daily_limit > 0 then
+    local sent = tonumber(redis.call('GET', KEYS[2]))
+    if sent == nil then
+        sent = 0
+        redis.call('SET', KEYS[2], 0, 'EX', 86400)
+    end
+    if sent + count > daily_limit then
+        return {2, sent}
+    end
+    redis.call('INCRBY', KEYS[2], count)
+    return {0, sent}
+end
+return {0, 0}
+"""
+RATE_LIMIT_INTERVAL_SECONDS = 60
+
+rate_and_daily_limit_script = None
+local_rate_limits = defaultdict(deque)
+local_rate_limits_lock = Lock()
+
+
+def check_and_reserve_rate_limits(service, api_key, notification_count=1):
+    """
+    Does the same checks as check_service_over_api_rate_limit and check_service_over_daily_message_limit in one
+    round trip to redis, and reserves the messages against the daily limit at the same time, so two requests can't
+    both take the last message of the day. persist_notification uses the reservation rather than counting the
+    notification again.
+
+    Each of the `notification_count` messages counts towards the per-minute rate limit, so a bulk request can't send
+    more than a service's rate limit allows.
+
+    If redis is unavailable the rate limit is applied per process and the daily limit isn't checked. Nothing is
+    reserved then, so persist_notification counts the notifications as usual.
+    """
+    global rate_and_daily_limit_script
+
+    rate_limit = service.rate_limit if current_app.config['API_RATE_LIMIT_ENABLED'] else 0
+    daily_limit = service.message_limit if api_key.key_type != KEY_TYPE_TEST else 0
+    now = time()
+
+    reserved = False
+    try:
+        if rate_and_daily_limit_script is None:
+            rate_and_daily_limit_script = redis_store.redis_store.register_script(RATE_AND_DAILY_LIMIT_LUA)
+        with REDIS_EXCEEDED_RATE_LIMIT_DURATION_SECONDS.time():
+            outcome, count = rate_and_daily_limit_script(
+                keys=[rate_limit_cache_key(service.id, api_key.key_type), daily_limit_cache_key(service.id)],
+                args=[repr(now), RATE_LIMIT_INTERVAL_SECONDS, rate_limit, daily_limit, notification_count],
+            )
+        reserved = bool(daily_limit)
+    except Exception:
+        current_app.logger.exception("Rate limit check for service {} failed, checking locally".format(service.id))
+        if rate_limit and _exceeded_local_rate_limit(
+            service.id, api_key.key_type, rate_limit, now, notification_count
+        ):
+            outcome, count = 1, rate_limit
+        else:
+            outcome, count = 0, 0
+
+    if outcome == 1:
+        current_app.logger.info("service {} has been rate limited for throughput".format(service.id))
+        raise RateLimitError(rate_limit, RATE_LIMIT_INTERVAL_SECONDS, api_key.key_type)
+    if outcome == 2:
+        current_app.logger.info(
+            "service {} has been rate limited for daily use sent {} limit {}".format(service.id, count, daily_limit)
+        )
+        raise TooManyRequestsError(daily_limit)
+    if reserved:
+        record_daily_limit_reservation(service.id, notification_count)
+
+
+def _exceeded_local_rate_limit(service_id, key_type, rate_limit, now, notification_count=1):
+    with local_rate_limits_lock:
+        requests = local_rate_limits[(str(service_id), key_type)]
+        while requests and requests[0] <= now - RATE_LIMIT_INTERVAL_SECONDS:
+            requests.popleft()
+        requests.extend([now] * notification_count)
+        return len(requests) > rate_limit
 
 
 def check_template_is_for_notification_type(notification_type, template_type):
@@ -182,7 +316,7 @@ def check_notification_content_is_not_empty(template_with_content):
         raise BadRequestError(message=message)
 
 
-def validate_template(template_id, personalisation, service, notification_type, check_char_count=True):
+def get_active_template(template_id, service, notification_type=None):
     try:
         template = SerialisedTemplate.from_id_and_service_id(template_id, service.id)
     except NoResultFound:
@@ -190,8 +324,14 @@ def validate_template(template_id, personalisation, service, notification_type,
         raise BadRequestError(message=message,
                               fields=[{'template': message}])
 
-    check_template_is_for_notification_type(notification_type, template.template_type)
+    if notification_type:
+        check_template_is_for_notification_type(notification_type, template.template_type)
     check_template_is_active(template)
+    return template
+
+
+def validate_template(template_id, personalisation, service, notification_type, check_char_count=True):
+    template = get_active_template(template_id, service, notification_type)
 
     template_with_content = create_content_for_notification(template, personalisation)
 
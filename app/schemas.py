@@ -698,6 +698,7 @@ class NotificationsFilterSchema(ma.Schema):
     include_jobs = fields.Boolean(required=False)
     include_from_test_key = fields.Boolean(required=False)
     older_than = fields.UUID(required=False)
+    cursor = fields.String(required=False)
     format_for_csv = fields.String()
     to = fields.String()
     include_one_off = fields.Boolean(required=False)
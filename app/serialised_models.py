@@ -1,9 +1,10 @@
 from collections import defaultdict
-from functools import partial
+from functools import wraps
 from threading import RLock
 
 import cachetools
 from flask import current_app
+from gds_metrics.metrics import Counter
 from notifications_utils.clients.redis import RequestCache
 from notifications_utils.serialised_model import (
     SerialisedModel,
@@ -11,23 +12,87 @@ from notifications_utils.serialised_model import (
 )
 from werkzeug.utils import cached_property
 
-from app import db, redis_store
+from app import cache_invalidation, db, redis_store
+from app.cache_invalidation import InvalidationSubscriber
 from app.dao.api_key_dao import get_model_api_keys
+from app.dao.service_callback_api_dao import (
+    get_service_callback_api_for_service_and_type,
+)
 from app.dao.services_dao import dao_fetch_service_by_id
 
-caches = defaultdict(partial(cachetools.TTLCache, maxsize=1024, ttl=2))
+caches = {}
 locks = defaultdict(RLock)
 redis_cache = RequestCache(redis_store)
 
+SERIALISED_MODEL_CACHE_HITS = Counter(
+    'serialised_model_cache_hits',
+    'Serialised model lookups answered from the in-process cache',
+    ['cache']
+)
+SERIALISED_MODEL_CACHE_MISSES = Counter(
+    'serialised_model_cache_misses',
+    'Serialised model lookups that had to go to redis or the database',
+    ['cache']
+)
+SERIALISED_MODEL_CACHE_EVICTIONS = Counter(
+    'serialised_model_cache_evictions',
+    'Serialised models removed from the in-process cache, by reason',
+    ['cache', 'reason']
+)
+
+
+class MeteredTTLCache(cachetools.TTLCache):
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+        super().__init__(*args, **kwargs)
+
+    def popitem(self):
+        # only called by cachetools when the cache is full
+        SERIALISED_MODEL_CACHE_EVICTIONS.labels(self.name, 'full').inc()
+        return super().popitem()
+
+    def expire(self, *args, **kwargs):
+        expired = super().expire(*args, **kwargs)
+        if expired:
+            SERIALISED_MODEL_CACHE_EVICTIONS.labels(self.name, 'expired').inc(len(expired))
+        return expired
+
+
+def get_cache(name):
+    with locks[name]:
+        if name not in caches:
+            caches[name] = MeteredTTLCache(
+                name,
+                maxsize=current_app.config['SERIALISED_MODEL_CACHE_MAXSIZE'],
+                ttl=current_app.config['SERIALISED_MODEL_CACHE_TTL_SECONDS'],
+            )
+        return caches[name]
+
 
 def memory_cache(func):
-    @cachetools.cached(
-        cache=caches[func.__qualname__],
-        lock=locks[func.__qualname__],
-        key=ignore_first_argument_cache_key,
-    )
+    name = func.__qualname__
+
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
+        if current_app.config['SERIALISED_MODEL_CACHE_INVALIDATION_ENABLED']:
+            invalidation_subscriber.ensure_running()
+
+        cache = get_cache(name)
+        key = ignore_first_argument_cache_key(*args, **kwargs)
+        with locks[name]:
+            try:
+                value = cache[key]
+            except KeyError:
+                pass
+            else:
+                SERIALISED_MODEL_CACHE_HITS.labels(name).inc()
+                return value
+
+        SERIALISED_MODEL_CACHE_MISSES.labels(name).inc()
+        value = func(*args, **kwargs)
+        with locks[name]:
+            cache[key] = value
+        return value
 
     return wrapper
 
@@ -36,6 +101,33 @@ def ignore_first_argument_cache_key(cls, *args, **kwargs):
     return cachetools.keys.hashkey(*args, **kwargs)
 
 
+def evict(name, id):
+    """
+    Remove every entry from the named cache that was looked up with `id` as one of its arguments
+    """
+    with locks[name]:
+        cache = caches.get(name)
+        if cache is None:
+            return
+        for key in [key for key in cache.keys() if id in map(str, key)]:
+            cache.pop(key, None)
+            SERIALISED_MODEL_CACHE_EVICTIONS.labels(name, 'invalidated').inc()
+
+
+def clear_all_caches():
+    for name in list(caches):
+        with locks[name]:
+            caches[name].clear()
+
+
+def _invalidate(model, id):
+    for name in INVALIDATED_CACHES[model]:
+        evict(name, id)
+
+
+invalidation_subscriber = InvalidationSubscriber(on_reconnect=clear_all_caches)
+
+
 class SerialisedTemplate(SerialisedModel):
     ALLOWED_PROPERTIES = {
         'archived',
@@ -133,3 +225,52 @@ class SerialisedAPIKeyCollection(SerialisedModelCollection):
         ]
         db.session.commit()
         return cls(keys)
+
+
+class SerialisedServiceCallbackApi(SerialisedModel):
+    ALLOWED_PROPERTIES = {
+        'id',
+        'service_id',
+        'callback_type',
+        'url',
+        'bearer_token',
+        'version',
+    }
+
+    @classmethod
+    @memory_cache
+    def from_service_id_and_type(cls, service_id, callback_type):
+        """
+        Returns None if the service doesn't have a callback API of this type, so that's cached too. These are only
+        cached in memory, not in redis, so that bearer tokens are never stored outside the database unencrypted.
+        """
+        callback_api = get_service_callback_api_for_service_and_type(service_id, callback_type)
+        if not callback_api:
+            db.session.commit()
+            return None
+        callback_api_dict = {k: getattr(callback_api, k) for k in cls.ALLOWED_PROPERTIES}
+        db.session.commit()
+        return cls(callback_api_dict)
+
+    @classmethod
+    def from_service_id_and_type_at_version(cls, service_id, callback_type, version):
+        """
+        Like from_service_id_and_type, but reloads the callback API if the cached one is older than `version` - so
+        a task queued after the callback API was changed never uses the old one, even if this process hasn't heard
+        about the change yet.
+        """
+        callback_api = cls.from_service_id_and_type(service_id, callback_type)
+        if callback_api is None or callback_api.version < version:
+            evict('SerialisedServiceCallbackApi.from_service_id_and_type', str(service_id))
+            callback_api = cls.from_service_id_and_type(service_id, callback_type)
+        return callback_api
+
+
+INVALIDATED_CACHES = {
+    cache_invalidation.SERVICE: ['SerialisedService.from_id'],
+    cache_invalidation.TEMPLATE: ['SerialisedTemplate.from_id_and_service_id'],
+    # a cached service holds on to its API keys too
+    cache_invalidation.API_KEYS: ['SerialisedAPIKeyCollection.from_service_id', 'SerialisedService.from_id'],
+    cache_invalidation.CALLBACK_APIS: ['SerialisedServiceCallbackApi.from_service_id_and_type'],
+}
+cache_invalidation.register_handler(_invalidate)
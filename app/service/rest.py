@@ -1,7 +1,8 @@
 import itertools
+import uuid
 from datetime import datetime
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, current_app, jsonify, request, url_for
 from notifications_utils.letter_timings import (
     letter_can_be_cancelled,
     too_late_to_cancel_letter,
@@ -149,6 +150,8 @@ from app.user.users_schema import post_set_permissions_schema
 from app.utils import (
     DATE_FORMAT,
     DATETIME_FORMAT_NO_TIMEZONE,
+    decode_pagination_cursor,
+    encode_pagination_cursor,
     get_prev_next_pagination_links,
     midnight_n_days_ago,
 )
@@ -420,6 +423,9 @@ def get_all_notifications_for_service(service_id):
                                                    search_term=data['to'],
                                                    statuses=data.get('status'),
                                                    notification_type=notification_type)
+    if 'cursor' in data or (current_app.config['KEYSET_PAGINATION_ENABLED'] and 'page' not in data):
+        return _get_notifications_for_service_after(service_id, data)
+
     page = data['page'] if 'page' in data else 1
     page_size = data['page_size'] if 'page_size' in data else current_app.config.get('PAGE_SIZE')
     limit_days = data.get('limit_days')
@@ -482,6 +488,49 @@ def get_all_notifications_for_service(service_id):
     ), 200
 
 
+def _get_notifications_for_service_after(service_id, data):
+    """
+    Gets a page of notifications in one query, starting from the `cursor` given for the page before, instead of by
+    page number. The response links to the next page if there is one, but not to the page before.
+    """
+    after = None
+    if 'cursor' in data:
+        try:
+            after = decode_pagination_cursor(data['cursor'], datetime.fromisoformat, uuid.UUID)
+        except ValueError:
+            raise InvalidRequest('cursor is not valid', status_code=400)
+
+    page_size = data['page_size'] if 'page_size' in data else current_app.config.get('PAGE_SIZE')
+    notifications, next_page_after = notifications_dao.get_notifications_for_service_after(
+        service_id,
+        after=after,
+        page_size=page_size,
+        filter_dict=data,
+        limit_days=data.get('limit_days'),
+        include_jobs=data.get('include_jobs', True),
+        include_from_test_key=data.get('include_from_test_key', False),
+        include_one_off=data.get('include_one_off', True),
+    )
+
+    if data.get('format_for_csv'):
+        notifications = [notification.serialize_for_csv() for notification in notifications]
+    else:
+        notifications = notification_with_template_schema.dump(notifications, many=True)
+
+    links = {}
+    if next_page_after and data.get('count_pages', True):
+        kwargs = request.args.to_dict()
+        kwargs['service_id'] = service_id
+        kwargs['cursor'] = encode_pagination_cursor(next_page_after)
+        links['next'] = url_for('.get_all_notifications_for_service', **kwargs)
+
+    return jsonify(
+        notifications=notifications,
+        page_size=page_size,
+        links=links
+    ), 200
+
+
 @service_blueprint.route('/<uuid:service_id>/notifications/<uuid:notification_id>', methods=['GET'])
 def get_notification_for_service(service_id, notification_id):
 
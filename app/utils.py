@@ -1,4 +1,7 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
+from itertools import islice
 
 import pytz
 from flask import url_for
@@ -40,6 +43,27 @@ def get_prev_next_pagination_links(current_page, next_page_exists, endpoint, **k
     return links
 
 
+def encode_pagination_cursor(values):
+    """
+    An opaque string for where a page ended, as returned by keyset_paginate, for the next page to start from
+    """
+    return urlsafe_b64encode(json.dumps([str(value) for value in values]).encode()).decode()
+
+
+def decode_pagination_cursor(cursor, *types):
+    """
+    The values encoded in `cursor`, each converted by the matching one of `types`, eg
+    decode_pagination_cursor(cursor, datetime.fromisoformat, uuid.UUID). Raises ValueError if it's not a valid cursor.
+    """
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise ValueError(f'{cursor} is not a valid cursor')
+    if not isinstance(values, list) or len(values) != len(types) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f'{cursor} is not a valid cursor')
+    return tuple(type_(value) for type_, value in zip(types, values))
+
+
 def url_with_token(data, url, config, base_url=None):
     from notifications_utils.url_safe_token import generate_token
     token = generate_token(data, config['SECRET_KEY'], config['DANGEROUS_SALT'])
@@ -151,3 +175,12 @@ def get_reference_from_personalisation(personalisation):
     if personalisation:
         return personalisation.get("reference")
     return None
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of up to `size` items from `iterable`, without reading it all into memory first.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
@@ -1,13 +1,13 @@
 from itertools import chain
 
 from flask import current_app, jsonify, request
-from notifications_utils.polygons import Polygons
 from notifications_utils.template import BroadcastMessageTemplate
 from sqlalchemy.orm.exc import MultipleResultsFound
 
 from app import api_user, authenticated_service, redis_store
 from app.broadcast_message import utils as broadcast_utils
-from app.broadcast_message.translators import cap_xml_to_dict
+from app.broadcast_message.polygons import get_simple_polygons
+from app.broadcast_message.translators import cap_alert_to_dict
 from app.dao.broadcast_message_dao import (
     dao_get_broadcast_message_by_references_and_service_id,
 )
@@ -18,7 +18,7 @@ from app.schema_validation import validate
 from app.v2.broadcast import v2_broadcast_blueprint
 from app.v2.broadcast.broadcast_schemas import post_broadcast_schema
 from app.v2.errors import BadRequestError, ValidationError
-from app.xml_schemas import validate_xml
+from app.xml_schemas import parse_xml
 
 
 @v2_broadcast_blueprint.route("", methods=['POST'])
@@ -37,12 +37,13 @@ def create_broadcast():
 
     cap_xml = request.get_data()
 
-    if not validate_xml(cap_xml, 'CAP-v1.2.xsd'):
+    cap_alert = parse_xml(cap_xml, 'CAP-v1.2.xsd')
+    if cap_alert is None:
         raise BadRequestError(
             message='Request data is not valid CAP XML',
             status_code=400,
         )
-    broadcast_json = cap_xml_to_dict(cap_xml)
+    broadcast_json = cap_alert_to_dict(cap_alert)
 
     validate(broadcast_json, post_broadcast_schema)
 
@@ -61,18 +62,13 @@ def create_broadcast():
     else:
         _validate_template(broadcast_json)
 
-        polygons = Polygons(list(chain.from_iterable((
+        simple_polygons = get_simple_polygons(list(chain.from_iterable((
             [
                 [[y, x] for x, y in polygon]
                 for polygon in area['polygons']
             ] for area in broadcast_json['areas']
         ))))
 
-        if len(polygons) > 12 or polygons.point_count > 250:
-            simple_polygons = polygons.smooth.simplify
-        else:
-            simple_polygons = polygons
-
         broadcast_message = BroadcastMessage(
             service_id=authenticated_service.id,
             content=broadcast_json['content'],
@@ -82,7 +78,7 @@ def create_broadcast():
                 'names': [
                     area['name'] for area in broadcast_json['areas']
                 ],
-                'simple_polygons': simple_polygons.as_coordinate_pairs_lat_long,
+                'simple_polygons': simple_polygons,
             },
             status=BroadcastStatusType.PENDING_APPROVAL,
             created_by_api_key_id=api_user.id,
@@ -1,8 +1,13 @@
+import uuid
+from datetime import datetime
+
 from flask import current_app, jsonify, request, url_for
 
 from app import authenticated_service
 from app.dao import inbound_sms_dao
 from app.schema_validation import validate
+from app.utils import decode_pagination_cursor, encode_pagination_cursor
+from app.v2.errors import BadRequestError
 from app.v2.inbound_sms import v2_inbound_sms_blueprint
 from app.v2.inbound_sms.inbound_sms_schemas import get_inbound_sms_request
 
@@ -11,6 +16,9 @@ from app.v2.inbound_sms.inbound_sms_schemas import get_inbound_sms_request
 def get_inbound_sms():
     data = validate(request.args.to_dict(), get_inbound_sms_request)
 
+    if current_app.config['KEYSET_PAGINATION_ENABLED'] or 'cursor' in data:
+        return _get_inbound_sms_after(data)
+
     paginated_inbound_sms = inbound_sms_dao.dao_get_paginated_inbound_sms_for_service_for_public_api(
         authenticated_service.id,
         older_than=data.get('older_than', None),
@@ -39,3 +47,34 @@ def _build_links(inbound_sms_list):
         )
 
     return _links
+
+
+def _get_inbound_sms_after(data):
+    after = None
+    if 'cursor' in data:
+        try:
+            after = decode_pagination_cursor(data['cursor'], datetime.fromisoformat, uuid.UUID)
+        except ValueError:
+            raise BadRequestError(message="cursor is not valid")
+
+    inbound_sms, next_page_after = inbound_sms_dao.dao_get_inbound_sms_for_service_after(
+        authenticated_service.id,
+        after=after,
+        older_than=data.get('older_than'),
+        page_size=current_app.config.get('API_PAGE_SIZE')
+    )
+
+    links = {
+        'current': url_for("v2_inbound_sms.get_inbound_sms", _external=True),
+    }
+    if next_page_after:
+        links['next'] = url_for(
+            "v2_inbound_sms.get_inbound_sms",
+            cursor=encode_pagination_cursor(next_page_after),
+            _external=True,
+        )
+
+    return jsonify(
+        received_text_messages=[i.serialize() for i in inbound_sms],
+        links=links
+    ), 200
@@ -6,6 +6,7 @@ get_inbound_sms_request = {
     "type": "object",
     "properties": {
         "older_than": uuid,
+        "cursor": {"type": "string"},
     },
     "additionalProperties": False,
 }
@@ -1,3 +1,5 @@
+import uuid
+from datetime import datetime
 from io import BytesIO
 
 from flask import current_app, jsonify, request, send_file, url_for
@@ -12,6 +14,7 @@ from app.models import (
     NOTIFICATION_VIRUS_SCAN_FAILED,
 )
 from app.schema_validation import validate
+from app.utils import decode_pagination_cursor, encode_pagination_cursor
 from app.v2.errors import BadRequestError, PDFNotReadyError
 from app.v2.notifications import v2_notification_blueprint
 from app.v2.notifications.notification_schemas import (
@@ -73,8 +76,14 @@ def get_notifications():
     if 'include_jobs' in _data:
         _data['include_jobs'] = _data['include_jobs'][0]
 
+    if 'cursor' in _data:
+        _data['cursor'] = _data['cursor'][0]
+
     data = validate(_data, get_notifications_request)
 
+    if current_app.config['KEYSET_PAGINATION_ENABLED'] or 'cursor' in data:
+        return _get_notifications_after(data)
+
     paginated_notifications = notifications_dao.get_notifications_for_service(
         str(authenticated_service.id),
         filter_dict=data,
@@ -102,3 +111,37 @@ def get_notifications():
         notifications=[notification.serialize() for notification in paginated_notifications.items],
         links=_build_links(paginated_notifications.items)
     ), 200
+
+
+def _get_notifications_after(data):
+    after = None
+    if 'cursor' in data:
+        try:
+            after = decode_pagination_cursor(data['cursor'], datetime.fromisoformat, uuid.UUID)
+        except ValueError:
+            raise BadRequestError(message="cursor is not valid")
+
+    notifications, next_page_after = notifications_dao.get_notifications_for_service_after(
+        str(authenticated_service.id),
+        after=after,
+        older_than=data.get('older_than'),
+        filter_dict=data,
+        key_type=api_user.key_type,
+        personalisation=True,
+        client_reference=data.get('reference'),
+        page_size=current_app.config.get('API_PAGE_SIZE'),
+        include_jobs=data.get('include_jobs'),
+    )
+
+    links = {
+        'current': url_for(".get_notifications", _external=True, **data),
+    }
+    if next_page_after:
+        next_query_params = {key: value for key, value in data.items() if key != 'older_than'}
+        next_query_params['cursor'] = encode_pagination_cursor(next_page_after)
+        links['next'] = url_for(".get_notifications", _external=True, **next_query_params)
+
+    return jsonify(
+        notifications=[notification.serialize() for notification in notifications],
+        links=links
+    ), 200
@@ -86,7 +86,8 @@ get_notifications_request = {
             }
         },
         "include_jobs": {"enum": ["true", "True"]},
-        "older_than": uuid
+        "older_than": uuid,
+        "cursor": {"type": "string"}
     },
     "additionalProperties": False,
 }
@@ -273,3 +274,48 @@ post_letter_response = {
     },
     "required": ["id", "content", "uri", "template"]
 }
+
+post_bulk_request = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "description": "POST bulk notifications schema",
+    "type": "object",
+    "title": "POST v2/notifications/bulk",
+    "properties": {
+        "template_id": uuid,
+        "sms_sender_id": uuid,
+        "email_reply_to_id": uuid,
+        # each recipient is validated on its own, against post_bulk_sms_recipient or post_bulk_email_recipient,
+        # so that one bad recipient doesn't fail the whole request
+        "recipients": {"type": "array", "minItems": 1, "items": {"type": "object"}}
+    },
+    "required": ["template_id", "recipients"],
+    "additionalProperties": False
+}
+
+post_bulk_sms_recipient = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "description": "POST bulk notifications sms recipient schema",
+    "type": "object",
+    "title": "POST v2/notifications/bulk recipient",
+    "properties": {
+        "reference": {"type": "string"},
+        "phone_number": {"type": "string", "format": "phone_number"},
+        "personalisation": personalisation
+    },
+    "required": ["phone_number"],
+    "additionalProperties": False
+}
+
+post_bulk_email_recipient = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+    "description": "POST bulk notifications email recipient schema",
+    "type": "object",
+    "title": "POST v2/notifications/bulk recipient",
+    "properties": {
+        "reference": {"type": "string"},
+        "email_address": {"type": "string", "format": "email_address"},
+        "personalisation": personalisation
+    },
+    "required": ["email_address"],
+    "additionalProperties": False
+}
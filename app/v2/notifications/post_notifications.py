@@ -1,12 +1,19 @@
 import base64
 import functools
+import json
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
+from operator import itemgetter
 
 import botocore
 from flask import abort, current_app, jsonify, request
 from gds_metrics import Histogram
-from notifications_utils.recipients import try_validate_and_format_phone_number
+from jsonschema import ValidationError as JsonSchemaValidationError
+from notifications_utils.recipients import (
+    InvalidEmailError,
+    try_validate_and_format_phone_number,
+)
 
 from app import (
     api_user,
@@ -25,6 +32,7 @@ from app.clients.document_download import DocumentDownloadError
 from app.config import QueueNames, TaskNames
 from app.dao.dao_utils import transaction
 from app.dao.templates_dao import get_precompiled_letter_template
+from app.errors import InvalidRequest
 from app.letters.utils import upload_letter_pdf
 from app.models import (
     EMAIL_TYPE,
@@ -44,17 +52,22 @@ from app.notifications.process_letter_notifications import (
     create_letter_notification,
 )
 from app.notifications.process_notifications import (
+    build_notification,
+    create_content_for_notification,
     persist_notification,
+    persist_notifications_in_bulk,
     send_notification_to_queue_detached,
     simulated_recipient,
 )
 from app.notifications.validators import (
     check_if_service_can_send_files_by_email,
     check_is_message_too_long,
+    check_notification_content_is_not_empty,
     check_rate_limiting,
     check_service_email_reply_to_id,
     check_service_has_permission,
     check_service_sms_sender_id,
+    get_active_template,
     validate_address,
     validate_and_format_recipient,
     validate_template,
@@ -69,6 +82,9 @@ from app.v2.notifications.create_response import (
     create_post_sms_response_from_notification,
 )
 from app.v2.notifications.notification_schemas import (
+    post_bulk_email_recipient,
+    post_bulk_request,
+    post_bulk_sms_recipient,
     post_email_request,
     post_letter_request,
     post_precompiled_letter_request,
@@ -167,6 +183,179 @@ def post_notification(notification_type):
     return jsonify(notification), 201
 
 
+@v2_notification_blueprint.route('/bulk', methods=['POST'])
+def post_bulk_notifications():
+    """
+    Sends one sms or email template to up to BULK_API_MAX_NOTIFICATIONS recipients, each with their own
+    personalisation and reference.
+
+    Recipients are validated one at a time, and any that fail are returned in `errors` with their index in the
+    request rather than failing the whole request. The rest are saved with a single multi-row insert and returned in
+    `notifications`, also with their index. Every recipient that passes validation counts towards the daily limit
+    and the rate limit, and if either would be exceeded nothing is sent. Notifications that can't be queued for sending
+    are deleted and returned in `errors`, and the rest are still sent.
+    """
+    with POST_NOTIFICATION_JSON_PARSE_DURATION_SECONDS.time():
+        form = validate(get_valid_json(), post_bulk_request)
+
+    max_notifications = current_app.config['BULK_API_MAX_NOTIFICATIONS']
+    if len(form['recipients']) > max_notifications:
+        raise BadRequestError(
+            message='Cannot send more than {} notifications in one request'.format(max_notifications)
+        )
+
+    template = get_active_template(form['template_id'], authenticated_service)
+    notification_type = template.template_type
+    if notification_type not in [SMS_TYPE, EMAIL_TYPE]:
+        message = '{} template is not suitable for bulk notifications'.format(notification_type)
+        raise BadRequestError(fields=[{'template': message}], message=message)
+
+    check_service_has_permission(notification_type, authenticated_service.permissions)
+
+    reply_to = get_reply_to_text(notification_type, form, template)
+    recipient_schema = post_bulk_sms_recipient if notification_type == SMS_TYPE else post_bulk_email_recipient
+
+    recipients, errors = [], []
+    for index, recipient in enumerate(form['recipients']):
+        with bulk_recipient_errors(index, errors):
+            recipients.append(validate_bulk_recipient(index, recipient, recipient_schema, notification_type, template))
+
+    if recipients:
+        check_rate_limiting(authenticated_service, api_user, notification_count=len(recipients))
+
+    responses = process_bulk_sms_or_email_notifications(
+        recipients=recipients,
+        notification_type=notification_type,
+        template=template,
+        reply_to_text=reply_to,
+        errors=errors,
+    )
+
+    return jsonify(
+        notifications=responses,
+        errors=sorted(errors, key=itemgetter('index')),
+    ), 201 if responses else 400
+
+
+@contextmanager
+def bulk_recipient_errors(index, errors):
+    """
+    Records an error for the recipient at `index` in `errors`, rather than letting it fail the whole request
+    """
+    try:
+        yield
+    except JsonSchemaValidationError as e:
+        errors.append({'index': index, 'errors': json.loads(e.message)['errors']})
+    except InvalidRequest as e:
+        errors.append({'index': index, 'errors': e.to_dict_v2()['errors']})
+    except InvalidEmailError as e:
+        # raised for invalid phone numbers too
+        errors.append({'index': index, 'errors': [{'error': e.__class__.__name__, 'message': str(e)}]})
+
+
+def validate_bulk_recipient(index, recipient, recipient_schema, notification_type, template):
+    validate(recipient, recipient_schema)
+
+    form_send_to = recipient['email_address'] if notification_type == EMAIL_TYPE else recipient['phone_number']
+    send_to = validate_and_format_recipient(send_to=form_send_to,
+                                            key_type=api_user.key_type,
+                                            service=authenticated_service,
+                                            notification_type=notification_type)
+
+    template_with_content = create_content_for_notification(template, recipient.get('personalisation', {}))
+    check_notification_content_is_not_empty(template_with_content)
+
+    return {
+        'index': index,
+        'to': form_send_to,
+        'simulated': simulated_recipient(send_to, notification_type),
+        'personalisation': recipient.get('personalisation'),
+        'reference': recipient.get('reference'),
+        'template_with_content': template_with_content,
+    }
+
+
+def process_bulk_sms_or_email_notifications(*, recipients, notification_type, template, reply_to_text, errors):
+    created_at = datetime.utcnow()
+    notifications = []
+    responses = []
+    for recipient in recipients:
+        with bulk_recipient_errors(recipient['index'], errors):
+            template_with_content = recipient['template_with_content']
+            personalisation, document_download_count = process_document_uploads(
+                recipient['personalisation'],
+                authenticated_service,
+                simulated=recipient['simulated']
+            )
+            if document_download_count:
+                # We changed personalisation which means we need to update the content
+                template_with_content.values = personalisation
+
+            # validate content length after url is replaced in personalisation.
+            check_is_message_too_long(template_with_content)
+
+            notification = build_notification(
+                template_id=template.id,
+                template_version=template.version,
+                recipient=recipient['to'],
+                service=authenticated_service,
+                personalisation=personalisation,
+                notification_type=notification_type,
+                api_key_id=api_user.id,
+                key_type=api_user.key_type,
+                created_at=created_at,
+                client_reference=recipient['reference'],
+                reply_to_text=reply_to_text,
+                document_download_count=document_download_count,
+            )
+            if not recipient['simulated']:
+                notifications.append(notification)
+
+            response = create_response_for_post_notification(
+                notification_id=notification.id,
+                client_reference=recipient['reference'],
+                template_id=template.id,
+                template_version=template.version,
+                service_id=authenticated_service.id,
+                notification_type=notification_type,
+                reply_to=reply_to_text,
+                template_with_content=template_with_content
+            )
+            responses.append(dict(response, index=recipient['index']))
+
+    persist_notifications_in_bulk(notifications, authenticated_service.id)
+
+    queue_name = QueueNames.PRIORITY if template.process_type == PRIORITY else None
+    unqueued_ids = set()
+    for notification in notifications:
+        try:
+            send_notification_to_queue_detached(
+                key_type=api_user.key_type,
+                notification_type=notification_type,
+                notification_id=notification.id,
+                research_mode=authenticated_service.research_mode,  # research_mode is deprecated
+                queue=queue_name
+            )
+        except Exception:
+            # the notification has been deleted, so tell the client to try it again. The others are still sent
+            current_app.logger.exception("Failed to queue bulk notification {}".format(notification.id))
+            unqueued_ids.add(notification.id)
+
+    if unqueued_ids:
+        for response in responses:
+            if response['id'] in unqueued_ids:
+                errors.append({'index': response['index'], 'errors': [{
+                    'error': 'QueueError',
+                    'message': 'Notification could not be queued for sending, try again',
+                }]})
+        responses = [response for response in responses if response['id'] not in unqueued_ids]
+
+    current_app.logger.info("{} {} notifications created in bulk for service {}, {} simulated".format(
+        len(notifications), notification_type, authenticated_service.id, len(responses) - len(notifications)
+    ))
+    return responses
+
+
 def process_sms_or_email_notification(
     *,
     form,
@@ -1,20 +1,44 @@
+import threading
+from functools import lru_cache
 from pathlib import Path
 
 from lxml import etree
 
+# lxml parsers must not be shared between threads, so each thread gets its own parser for each schema. The compiled
+# schemas themselves are shared.
+_parsers = threading.local()
 
-def validate_xml(document, schema_file_name):
 
+@lru_cache(maxsize=None)
+def get_schema(schema_file_name):
     path = Path(__file__).resolve().parent / schema_file_name
     contents = path.read_text()
 
     schema_root = etree.XML(contents.encode('utf-8'))
-    schema = etree.XMLSchema(schema_root)
-    parser = etree.XMLParser(schema=schema)
+    return etree.XMLSchema(schema_root)
+
+
+def get_validating_parser(schema_file_name):
+    parsers = _parsers.__dict__
+    if schema_file_name not in parsers:
+        parsers[schema_file_name] = etree.XMLParser(schema=get_schema(schema_file_name))
+    return parsers[schema_file_name]
+
 
+def parse_xml(document, schema_file_name):
+    """
+    Parses and validates the document in one pass, returning its root element, or None if it isn't valid
+    """
     try:
-        etree.fromstring(document, parser)
+        return etree.fromstring(document, get_validating_parser(schema_file_name))
     except etree.XMLSyntaxError:
-        return False
+        return None
 
-    return True
+
+def clear_schema_caches():
+    get_schema.cache_clear()
+    _parsers.__dict__.clear()
+
+
+def validate_xml(document, schema_file_name):
+    return parse_xml(document, schema_file_name) is not None
@@ -0,0 +1,21 @@
+"""
+
+Revision ID: 0374_batched_callbacks_perm
+Revises: 0373_add_notifications_view
+Create Date: 2026-10-18 10:12:41.104528
+
+"""
+from alembic import op
+
+
+revision = '0374_batched_callbacks_perm'
+down_revision = '0373_add_notifications_view'
+
+
+def upgrade():
+    op.execute("INSERT INTO service_permission_types VALUES ('batched_callbacks')")
+
+
+def downgrade():
+    op.execute("DELETE FROM service_permissions WHERE permission = 'batched_callbacks'")
+    op.execute("DELETE FROM service_permission_types WHERE name = 'batched_callbacks'")
@@ -0,0 +1,207 @@
+"""
+
+Revision ID: 0375_partition_notifications
+Revises: 0374_batched_callbacks_perm
+Create Date: 2026-10-18 14:02:11.318207
+
+Turns notifications and notification_history into tables partitioned by range on created_at, with one partition
+per (UTC) day.
+
+The existing tables become the DEFAULT partition of each, rather than having their rows copied. They get a CHECK
+constraint saying they only hold rows created before tomorrow, so that postgres knows it doesn't have to scan them
+when a partition is added for a later day. Partitions are created here for the next DAYS_AHEAD days, and after that
+by the create-notification-partitions task.
+
+Unique constraints on a partitioned table have to include created_at, so the primary keys become (id, created_at),
+and uq_notifications_job_row_number becomes (job_id, job_row_number, created_at). Building these takes a while on
+the existing tables, and the tables are locked until the migration finishes, so this needs a maintenance window.
+"""
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0375_partition_notifications'
+down_revision = '0374_batched_callbacks_perm'
+
+# keep in step with NOTIFICATION_PARTITIONS_DAYS_AHEAD in app/config.py
+DAYS_AHEAD = 14
+
+PARTITIONED_TABLES = ['notifications', 'notification_history']
+
+UNIQUE_CONSTRAINTS = {
+    'notifications': {
+        'notifications_pkey': 'PRIMARY KEY (id, created_at)',
+        'uq_notifications_job_row_number': 'UNIQUE (job_id, job_row_number, created_at)',
+    },
+    'notification_history': {
+        'notification_history_pkey': 'PRIMARY KEY (id, created_at)',
+    },
+}
+ORIGINAL_UNIQUE_CONSTRAINTS = {
+    'notifications': {
+        'notifications_pkey': 'PRIMARY KEY (id)',
+        'uq_notifications_job_row_number': 'UNIQUE (job_id, job_row_number)',
+    },
+    'notification_history': {
+        'notification_history_pkey': 'PRIMARY KEY (id)',
+    },
+}
+
+NOTIFICATIONS_ALL_TIME_VIEW = """
+    CREATE VIEW notifications_all_time_view AS
+    (
+        SELECT
+            id,
+            job_id,
+            job_row_number,
+            service_id,
+            template_id,
+            template_version,
+            api_key_id,
+            key_type,
+            billable_units,
+            notification_type,
+            created_at,
+            sent_at,
+            sent_by,
+            updated_at,
+            notification_status,
+            reference,
+            client_reference,
+            international,
+            phone_prefix,
+            rate_multiplier,
+            created_by_id,
+            postage,
+            document_download_count
+        FROM notifications
+    ) UNION
+    (
+        SELECT
+            id,
+            job_id,
+            job_row_number,
+            service_id,
+            template_id,
+            template_version,
+            api_key_id,
+            key_type,
+            billable_units,
+            notification_type,
+            created_at,
+            sent_at,
+            sent_by,
+            updated_at,
+            notification_status,
+            reference,
+            client_reference,
+            international,
+            phone_prefix,
+            rate_multiplier,
+            created_by_id,
+            postage,
+            document_download_count
+        FROM notification_history
+    )
+"""
+
+
+def upgrade():
+    conn = op.get_bind()
+    first_day = datetime.utcnow().date() + timedelta(days=1)
+
+    # the view would otherwise follow the tables when they're renamed
+    op.execute("DROP VIEW notifications_all_time_view")
+
+    for table in PARTITIONED_TABLES:
+        default = f'{table}_default'
+        indexes = conn.execute(sa.text("""
+            SELECT index_class.relname AS name, pg_get_indexdef(index_class.oid) AS definition
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = CAST(:table AS regclass) AND NOT pg_index.indisunique
+        """), {'table': table}).fetchall()
+        foreign_keys = conn.execute(sa.text("""
+            SELECT conname AS name, pg_get_constraintdef(oid) AS definition
+            FROM pg_constraint
+            WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+        """), {'table': table}).fetchall()
+
+        for name in UNIQUE_CONSTRAINTS[table]:
+            op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        op.execute(f"ALTER TABLE {table} RENAME TO {default}")
+        for index in indexes:
+            op.execute(f"ALTER INDEX {index.name} RENAME TO {index.name}_default")
+
+        op.execute(f"""
+            CREATE TABLE {table} (LIKE {default} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+        """)
+        op.execute(
+            f"ALTER TABLE {default} ADD CONSTRAINT {default}_created_at_check CHECK (created_at < '{first_day}')"
+        )
+        op.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+
+        for name, definition in UNIQUE_CONSTRAINTS[table].items():
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        # the definitions name the table, which is now the partitioned one. Postgres attaches the matching index on
+        # the default partition rather than building another one
+        for index in indexes:
+            op.execute(index.definition)
+        for foreign_key in foreign_keys:
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {foreign_key.name} {foreign_key.definition}")
+
+        for day in (first_day + timedelta(days=n) for n in range(DAYS_AHEAD)):
+            op.execute(f"""
+                CREATE TABLE {table}_{day:%Y%m%d} PARTITION OF {table}
+                FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')
+            """)
+
+    op.execute(NOTIFICATIONS_ALL_TIME_VIEW)
+
+
+def downgrade():
+    conn = op.get_bind()
+
+    op.execute("DROP VIEW notifications_all_time_view")
+
+    for table in PARTITIONED_TABLES:
+        default = f'{table}_default'
+        partitions = conn.execute(sa.text("""
+            SELECT child.relname AS name
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = CAST(:table AS regclass) AND child.relname != :default
+        """), {'table': table, 'default': default}).fetchall()
+
+        op.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+        op.execute(f"ALTER TABLE {default} DROP CONSTRAINT {default}_created_at_check")
+        for partition in partitions:
+            op.execute(f"INSERT INTO {default} SELECT * FROM {partition.name}")
+        op.execute(f"DROP TABLE {table}")
+
+        # constraints cloned from the partitioned table were named after the partition by postgres
+        cloned_constraints = conn.execute(sa.text("""
+            SELECT conname AS name
+            FROM pg_constraint
+            WHERE conrelid = CAST(:default AS regclass) AND contype IN ('p', 'u')
+        """), {'default': default}).fetchall()
+        for constraint in cloned_constraints:
+            op.execute(f"ALTER TABLE {default} DROP CONSTRAINT {constraint.name}")
+
+        indexes = conn.execute(sa.text("""
+            SELECT index_class.relname AS name
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = CAST(:default AS regclass)
+        """), {'default': default}).fetchall()
+
+        op.execute(f"ALTER TABLE {default} RENAME TO {table}")
+        for index in indexes:
+            if index.name.endswith('_default'):
+                op.execute(f"ALTER INDEX {index.name} RENAME TO {index.name[:-len('_default')]}")
+        for name, definition in ORIGINAL_UNIQUE_CONSTRAINTS[table].items():
+            op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+    op.execute(NOTIFICATIONS_ALL_TIME_VIEW)
@@ -0,0 +1,32 @@
+"""
+
+Revision ID: 0376_job_shards
+Revises: 0375_partition_notifications
+Create Date: 2026-10-18 16:40:27.551093
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = '0376_job_shards'
+down_revision = '0375_partition_notifications'
+
+
+def upgrade():
+    op.create_table(
+        'job_shards',
+        sa.Column('job_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('shard_number', sa.Integer(), nullable=False),
+        sa.Column('first_row', sa.Integer(), nullable=False),
+        sa.Column('last_row', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=255), nullable=False),
+        sa.Column('processing_started', sa.DateTime(), nullable=True),
+        sa.Column('processing_finished', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ),
+        sa.PrimaryKeyConstraint('job_id', 'shard_number')
+    )
+
+
+def downgrade():
+    op.drop_table('job_shards')
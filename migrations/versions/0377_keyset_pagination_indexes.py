@@ -0,0 +1,58 @@
+"""
+
+Revision ID: 0377_keyset_pagination_indexes
+Revises: 0376_job_shards
+Create Date: 2026-10-18 18:12:40.207351
+
+Indexes for paging through a service's notifications and inbound sms by (created_at, id), which replace the
+(service_id, created_at) index on notifications.
+
+notifications is partitioned, and an index can't be built concurrently on a partitioned table. Instead the index is
+created on the partitioned table alone, where it's invalid until there's a matching index on every partition, then
+built concurrently on each partition and attached. Partitions attached later get the index built when they're
+attached.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0377_keyset_pagination_indexes'
+down_revision = '0376_job_shards'
+
+
+def upgrade():
+    conn = op.get_bind()
+    partitions = conn.execute(sa.text("""
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST('notifications' AS regclass)
+    """)).fetchall()
+
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_notifications_service_created_at_id
+        ON ONLY notifications (service_id, created_at, id)
+    """)
+    op.execute('COMMIT')
+    for partition in partitions:
+        op.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{partition.name}_service_created_at_id
+            ON {partition.name} (service_id, created_at, id)
+        """)
+        op.execute(f"""
+            ALTER INDEX ix_notifications_service_created_at_id
+            ATTACH PARTITION ix_{partition.name}_service_created_at_id
+        """)
+    op.execute('DROP INDEX IF EXISTS ix_notifications_service_created_at')
+
+    op.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_inbound_sms_service_id_created_at_id
+        ON inbound_sms (service_id, created_at, id)
+    """)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_inbound_sms_service_id_created_at_id')
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_notifications_service_created_at ON notifications (service_id, created_at)'
+    )
+    op.execute('DROP INDEX IF EXISTS ix_notifications_service_created_at_id')
@@ -0,0 +1,55 @@
+"""
+
+Revision ID: 0378_notification_search_indexes
+Revises: 0377_keyset_pagination_indexes
+Create Date: 2026-10-18 19:26:53.604118
+
+Indexes for searching a service's notifications by recipient or reference (see
+dao_get_notifications_by_recipient_or_reference):
+
+- trigram indexes on normalised_to and client_reference, which LIKE and ILIKE '%term%' can use for terms of three
+  characters or more
+- an index on the md5 of normalised_to, for looking up a whole phone number or email address. An md5 is indexed
+  rather than normalised_to itself because letter addresses can be too long for a btree index
+
+As in 0377_keyset_pagination_indexes, each index is created on the partitioned notifications table alone, then built
+concurrently on each partition and attached.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0378_notification_search_indexes'
+down_revision = '0377_keyset_pagination_indexes'
+
+INDEXES = {
+    'normalised_to_trgm': 'USING gin (normalised_to gin_trgm_ops)',
+    'client_reference_trgm': 'USING gin (client_reference gin_trgm_ops)',
+    'service_normalised_to_md5': '(service_id, md5(normalised_to))',
+}
+
+
+def upgrade():
+    conn = op.get_bind()
+    partitions = conn.execute(sa.text("""
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST('notifications' AS regclass)
+    """)).fetchall()
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in INDEXES.items():
+        op.execute(f'CREATE INDEX IF NOT EXISTS ix_notifications_{name} ON ONLY notifications {definition}')
+    op.execute('COMMIT')
+
+    for name, definition in INDEXES.items():
+        for partition in partitions:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{partition.name}_{name} ON {partition.name} {definition}'
+            )
+            op.execute(f'ALTER INDEX ix_notifications_{name} ATTACH PARTITION ix_{partition.name}_{name}')
+
+
+def downgrade():
+    for name in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS ix_notifications_{name}')
@@ -5,11 +5,14 @@ import jwt
 import pytest
 from flask import current_app, g, request
 from notifications_python_client.authentication import create_jwt_token
+from notifications_python_client.errors import TokenExpiredError
 
 from app import db
+from app.authentication import auth
 from app.authentication.auth import (
     GENERAL_TOKEN_ERROR_MESSAGE,
     AuthError,
+    _api_keys_most_likely_first,
     _decode_jwt_token,
     _get_auth_token,
     _get_token_issuer,
@@ -22,11 +25,13 @@ from app.dao.api_key_dao import (
     get_unsigned_secrets,
 )
 from app.dao.services_dao import dao_fetch_service_by_id
+from app.serialised_models import SerialisedService
 from tests import (
     create_admin_authorization_header,
     create_internal_authorization_header,
     create_service_authorization_header,
 )
+from tests.app.db import create_api_key
 from tests.conftest import set_config_values
 
 
@@ -342,6 +347,75 @@ def test_requires_auth_should_cache_service_and_api_key_lookups(
     mock_get_service.assert_called_once()
 
 
+def test_requires_auth_only_verifies_a_token_once(
+    mocker,
+    client,
+    service_jwt_token
+):
+    mock_decode = mocker.patch(
+        'app.authentication.auth.decode_jwt_token',
+        wraps=auth.decode_jwt_token,
+    )
+
+    request.headers = {'Authorization': f'Bearer {service_jwt_token}'}
+    requires_auth()
+    requires_auth()  # second request
+
+    mock_decode.assert_called_once()
+
+
+def test_requires_auth_verifies_a_cached_token_again_once_it_has_expired(
+    mocker,
+    client,
+    service_jwt_token
+):
+    request.headers = {'Authorization': f'Bearer {service_jwt_token}'}
+    requires_auth()
+
+    mocker.patch('app.authentication.auth.time', return_value=time.time() + 31)
+    mocker.patch('app.authentication.auth.decode_jwt_token', side_effect=TokenExpiredError('expired', {}))
+
+    with pytest.raises(AuthError) as exc:
+        requires_auth()
+    assert exc.value.short_message == 'Error: Your system clock must be accurate to within 30 seconds'
+
+
+def test_requires_auth_rejects_a_cached_token_once_its_api_key_is_revoked(
+    client,
+    sample_api_key,
+    service_jwt_token
+):
+    request.headers = {'Authorization': f'Bearer {service_jwt_token}'}
+    requires_auth()
+
+    expire_api_key(sample_api_key.service_id, sample_api_key.id)
+
+    with pytest.raises(AuthError) as exc:
+        requires_auth()
+    assert exc.value.short_message == 'Invalid token: API key revoked'
+
+
+def test_api_keys_most_likely_first_tries_the_key_id_hint_then_the_last_used_key(
+    client,
+    sample_api_key,
+    sample_test_api_key,
+):
+    third_key = create_api_key(sample_api_key.service, key_type='team')
+    service = SerialisedService.from_id(sample_api_key.service_id)
+    auth.last_used_api_key_ids[str(service.id)] = str(third_key.id)
+
+    hinted_token = create_custom_jwt_token(
+        headers={'typ': 'JWT', 'alg': 'HS256', 'kid': str(sample_test_api_key.id)},
+        payload={'iss': str(service.id), 'iat': int(time.time())},
+    )
+    unhinted_token = create_jwt_token(secret='secret', client_id=str(service.id))
+
+    assert [str(key.id) for key in _api_keys_most_likely_first(hinted_token, service)][:2] == [
+        str(sample_test_api_key.id), str(third_key.id)
+    ]
+    assert str(_api_keys_most_likely_first(unhinted_token, service)[0].id) == str(third_key.id)
+
+
 def test_requires_internal_auth_checks_proxy_key(
     client,
     mocker,
@@ -1,10 +1,16 @@
+import io
 from datetime import datetime, timedelta
 
 import pytest
 import pytz
 from freezegun import freeze_time
 
-from app.aws.s3 import get_list_of_files_by_suffix, get_s3_file
+from app.aws.s3 import (
+    get_job_and_metadata_from_s3,
+    get_job_stream_and_metadata_from_s3,
+    get_list_of_files_by_suffix,
+    get_s3_file,
+)
 from tests.app.conftest import datetime_in_past
 
 
@@ -73,3 +79,32 @@ def test_get_list_of_files_by_suffix_empty_contents_return_with_no_error(notify_
     key = get_list_of_files_by_suffix('foo-bucket', subfolder='bar', suffix='.pdf')
 
     assert sum(1 for x in key) == 0
+
+
+def test_get_job_and_metadata_from_s3_only_gets_the_file_once(notify_api, mocker):
+    get_s3_mock = mocker.patch('app.aws.s3.get_s3_object')
+    get_s3_mock.return_value.get.return_value = {
+        'Body': io.BytesIO(b'phone number\n+447700900986'),
+        'Metadata': {'sender_id': 'abc'},
+    }
+
+    assert get_job_and_metadata_from_s3('service-id', 'job-id') == ('phone number\n+447700900986', {'sender_id': 'abc'})
+
+    get_s3_mock.assert_called_once_with(
+        notify_api.config['CSV_UPLOAD_BUCKET_NAME'], 'service-service-id-notify/job-id.csv'
+    )
+    get_s3_mock.return_value.get.assert_called_once_with()
+
+
+def test_get_job_stream_and_metadata_from_s3_decodes_the_file_as_it_is_read(notify_api, mocker):
+    get_s3_mock = mocker.patch('app.aws.s3.get_s3_object')
+    get_s3_mock.return_value.get.return_value = {
+        'Body': io.BytesIO('name\nZoë\nJosé\n'.encode('utf-8')),
+        'Metadata': {},
+    }
+
+    stream, metadata = get_job_stream_and_metadata_from_s3('service-id', 'job-id')
+
+    assert list(stream) == ['name\n', 'Zoë\n', 'José\n']
+    assert metadata == {}
+    get_s3_mock.return_value.get.assert_called_once_with()
@@ -0,0 +1,70 @@
+import json
+import math
+
+import pytest
+
+from app.broadcast_message import polygons
+from app.broadcast_message.polygons import (
+    get_simple_polygons,
+    simple_polygons_cache,
+)
+
+SMALL_AREA = [[[-1.2, 51.12], [1.2, 51.12], [1.2, 51.74], [-1.2, 51.74], [-1.2, 51.12]]]
+
+
+@pytest.fixture(autouse=True)
+def clear_simple_polygons_cache():
+    simple_polygons_cache.clear()
+    yield
+    simple_polygons_cache.clear()
+
+
+@pytest.fixture
+def mock_polygons(mocker):
+    return mocker.patch('app.broadcast_message.polygons.Polygons', wraps=polygons.Polygons)
+
+
+def test_get_simple_polygons_returns_small_areas_as_they_are(notify_api, mock_polygons):
+    assert get_simple_polygons(SMALL_AREA) == [
+        [[51.12, -1.2], [51.12, 1.2], [51.74, 1.2], [51.74, -1.2], [51.12, -1.2]]
+    ]
+
+
+def test_get_simple_polygons_simplifies_large_areas(notify_api):
+    circle = [[
+        [-1.0 + 0.1 * math.cos(2 * math.pi * i / 300), 51.0 + 0.1 * math.sin(2 * math.pi * i / 300)]
+        for i in range(301)
+    ]]
+
+    simple_polygons = get_simple_polygons(circle)
+
+    assert 0 < sum(len(polygon) for polygon in simple_polygons) < 301
+
+
+def test_get_simple_polygons_only_simplifies_the_same_area_once(notify_api, mock_polygons):
+    first = get_simple_polygons(SMALL_AREA)
+    second = get_simple_polygons([[list(pair) for pair in polygon] for polygon in SMALL_AREA])
+
+    assert first == second
+    mock_polygons.assert_called_once_with(SMALL_AREA)
+
+
+def test_get_simple_polygons_uses_polygons_cached_in_redis(notify_api, mock_polygons, mocker):
+    mock_get = mocker.patch('app.broadcast_message.polygons.redis_store.get', return_value=b'[[[1.0, 2.0]]]')
+
+    assert get_simple_polygons(SMALL_AREA) == [[[1.0, 2.0]]]
+
+    assert mock_get.call_args[0][0].startswith('broadcast-simple-polygons-v1-')
+    assert not mock_polygons.called
+
+
+def test_get_simple_polygons_stores_new_polygons_in_redis(notify_api, mocker):
+    mocker.patch('app.broadcast_message.polygons.redis_store.get', return_value=None)
+    mock_set = mocker.patch('app.broadcast_message.polygons.redis_store.set')
+
+    simple_polygons = get_simple_polygons(SMALL_AREA)
+
+    key, value = mock_set.call_args[0]
+    assert key.startswith('broadcast-simple-polygons-v1-')
+    assert json.loads(value) == simple_polygons
+    assert mock_set.call_args[1] == {'ex': 604800}
@@ -1,8 +1,10 @@
 import uuid
+from datetime import datetime
 
 import pytest
 from freezegun import freeze_time
 
+from app import db
 from app.dao.broadcast_message_dao import (
     dao_get_broadcast_message_by_id_and_service_id,
 )
@@ -12,11 +14,14 @@ from app.models import (
     BroadcastStatusType,
 )
 from tests.app.db import (
+    create_broadcast_event,
     create_broadcast_message,
+    create_broadcast_provider_message,
     create_service,
     create_template,
     create_user,
 )
+from tests.conftest import set_config
 
 
 def test_get_broadcast_message(
@@ -383,6 +388,45 @@ def test_create_broadcast_message_400s_if_no_content_or_template(
     )
 
 
+def test_get_broadcast_message_timeline(admin_request, notify_api, sample_broadcast_service):
+    t = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    bm = create_broadcast_message(t, status=BroadcastStatusType.BROADCASTING)
+    alert = create_broadcast_event(bm, sent_at=datetime(2021, 1, 1, 12, 0, 0))
+    cancel = create_broadcast_event(bm, sent_at=datetime(2021, 1, 1, 13, 0, 0), message_type='cancel')
+    for event in [alert, cancel]:
+        create_broadcast_provider_message(event, 'ee', status='returned-ack').updated_at = event.sent_at.replace(
+            second=2
+        )
+    create_broadcast_provider_message(alert, 'o2', status='returned-ack').updated_at = datetime(2021, 1, 1, 12, 0, 5)
+    create_broadcast_provider_message(cancel, 'o2')
+    db.session.commit()
+
+    with set_config(notify_api, 'ENABLED_CBCS', {'ee', 'o2'}):
+        response = admin_request.get(
+            'broadcast_message.get_broadcast_message_timeline',
+            service_id=t.service_id,
+            broadcast_message_id=bm.id,
+            _expected_status=200
+        )
+
+    assert response['id'] == str(bm.id)
+    assert [event['id'] for event in response['events']] == [str(alert.id), str(cancel.id)]
+    assert response['events'][0]['seconds_to_ack_all_providers'] == 5
+    assert [
+        (provider['provider'], provider['status'], provider['acked_at'], provider['seconds_to_ack'])
+        for provider in response['events'][0]['providers']
+    ] == [
+        ('ee', 'returned-ack', '2021-01-01T12:00:02.000000Z', 2),
+        ('o2', 'returned-ack', '2021-01-01T12:00:05.000000Z', 5),
+    ]
+    assert all(provider['created_at'] for provider in response['events'][0]['providers'])
+    assert response['events'][1]['seconds_to_ack_all_providers'] is None
+    assert [
+        (provider['provider'], provider['status'], provider['seconds_to_ack'])
+        for provider in response['events'][1]['providers']
+    ] == [('ee', 'returned-ack', 2), ('o2', 'sending', None)]
+
+
 @pytest.mark.parametrize('status', [
     BroadcastStatusType.DRAFT,
     BroadcastStatusType.PENDING_APPROVAL,
@@ -0,0 +1,44 @@
+import pytest
+
+from app.broadcast_message.translators import cap_xml_to_dict
+from tests.app.v2.broadcast.sample_cap_xml_documents import (
+    WAINFLEET,
+    WAINFLEET_CANCEL_WITH_EMPTY_REFERENCES,
+    WAINFLEET_CANCEL_WITH_MISSING_REFERENCES,
+    WAINFLEET_CANCEL_WITH_REFERENCES,
+    WINDEMERE,
+)
+
+
+def test_cap_xml_to_dict():
+    broadcast = cap_xml_to_dict(WAINFLEET)
+
+    assert broadcast['msgType'] == 'Alert'
+    assert broadcast['reference'] == '50385fcb0ab7aa447bbd46d848ce8466E'
+    assert broadcast['references'] is None
+    assert broadcast['cap_event'] == '053/055 Issue Severe Flood Warning EA'
+    assert broadcast['category'] == 'Met'
+    assert broadcast['expires'] == '2020-02-26T23:01:14-00:00'
+    assert broadcast['content'].startswith('A severe flood warning has been issued.')
+    assert [area['name'] for area in broadcast['areas']] == ['River Steeping in Wainfleet All Saints']
+    assert len(broadcast['areas'][0]['polygons']) == 1
+    assert broadcast['areas'][0]['polygons'][0][:2] == [[53.10569, 0.24453], [53.10593, 0.2443]]
+
+
+def test_cap_xml_to_dict_accepts_bytes():
+    assert cap_xml_to_dict(WINDEMERE.encode('utf-8')) == cap_xml_to_dict(WINDEMERE)
+
+
+@pytest.mark.parametrize('cap_xml, expected_references', [
+    (WAINFLEET_CANCEL_WITH_REFERENCES,
+     'www.gov.uk/environment-agency,50385fcb0ab7aa447bbd46d848ce8466E,2020-02-16T23:01:13-00:00'),
+    (WAINFLEET_CANCEL_WITH_EMPTY_REFERENCES, ''),
+    (WAINFLEET_CANCEL_WITH_MISSING_REFERENCES, None),
+])
+def test_cap_xml_to_dict_references(cap_xml, expected_references):
+    broadcast = cap_xml_to_dict(cap_xml)
+
+    assert broadcast['msgType'] == 'Cancel'
+    assert broadcast['references'] == expected_references
+    assert broadcast['cap_event'] == 'Remove Severe Flood Warning - Cell Broadcast'
+    assert broadcast['content'] == ''
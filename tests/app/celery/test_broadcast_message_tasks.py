@@ -175,6 +175,23 @@ def test_send_broadcast_provider_message_sends_data_correctly(
     )
 
 
+def test_send_broadcast_provider_message_records_time_to_ack(mocker, sample_broadcast_service):
+    template = create_template(sample_broadcast_service, BROADCAST_TYPE)
+    broadcast_message = create_broadcast_message(template, status=BroadcastStatusType.BROADCASTING)
+    with freeze_time('2020-08-01 12:00:00'):
+        event = create_broadcast_event(broadcast_message)
+    mocker.patch('app.clients.cbc_proxy.CBCProxyEE.create_and_send_broadcast')
+    mock_ack_duration = mocker.patch(
+        'app.celery.broadcast_message_tasks.BROADCAST_PROVIDER_MESSAGE_ACK_DURATION_SECONDS'
+    )
+
+    with freeze_time('2020-08-01 12:00:03'):
+        send_broadcast_provider_message(provider='ee', broadcast_event_id=str(event.id))
+
+    mock_ack_duration.labels.assert_called_once_with('ee', 'alert')
+    mock_ack_duration.labels.return_value.observe.assert_called_once_with(3)
+
+
 @freeze_time('2020-08-01 12:00')
 @pytest.mark.parametrize('provider,provider_capitalised', [
     ['ee', 'EE'],
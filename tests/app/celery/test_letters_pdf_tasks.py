@@ -0,0 +1,103 @@
+from datetime import datetime
+from unittest.mock import call
+
+import pytest
+from botocore.exceptions import ClientError as BotoClientError
+
+from app.celery.letters_pdf_tasks import (
+    get_key_and_size_of_letters_to_be_sent_to_print,
+)
+from tests.app.db import create_notification
+from tests.conftest import set_config
+
+
+@pytest.fixture
+def letters_in_two_folders(sample_letter_template):
+    # after the letter processing deadline the letter goes in the next day's folder
+    return [
+        create_notification(template=sample_letter_template, reference=reference, created_at=created_at)
+        for reference, created_at in [
+            ('ref-one', datetime(2020, 2, 17, 9)),
+            ('ref-two', datetime(2020, 2, 17, 18)),
+            ('ref-three', datetime(2020, 2, 17, 10)),
+        ]
+    ]
+
+
+def test_get_key_and_size_of_letters_to_be_sent_to_print_lists_each_folder_once(
+    notify_api, mocker, letters_in_two_folders
+):
+    mocker.patch('app.celery.letters_pdf_tasks.dao_get_letters_to_be_printed', return_value=letters_in_two_folders)
+    mock_list = mocker.patch('app.celery.letters_pdf_tasks.get_letter_pdf_keys_and_sizes_in_s3', side_effect=[
+        {'REF-ONE': ('2020-02-17/NOTIFY.REF-ONE.D.2.C.20200217090000.PDF', 1)},
+        {'REF-TWO': ('2020-02-18/NOTIFY.REF-TWO.D.2.C.20200217180000.PDF', 2)},
+    ])
+    mock_statsd = mocker.patch('app.celery.letters_pdf_tasks.statsd_client')
+    mock_find = mocker.patch('app.celery.letters_pdf_tasks.find_letter_pdf_in_s3')
+
+    with set_config(notify_api, 'LETTER_PDF_KEY_INDEX_ENABLED', True):
+        results = list(get_key_and_size_of_letters_to_be_sent_to_print(datetime(2020, 2, 18, 17, 30), 'second'))
+
+    service = letters_in_two_folders[0].service
+    assert results == [
+        {
+            'Key': '2020-02-17/NOTIFY.REF-ONE.D.2.C.20200217090000.PDF',
+            'Size': 1,
+            'ServiceId': str(service.id),
+            'OrganisationId': str(service.organisation_id),
+        },
+        {
+            'Key': '2020-02-18/NOTIFY.REF-TWO.D.2.C.20200217180000.PDF',
+            'Size': 2,
+            'ServiceId': str(service.id),
+            'OrganisationId': str(service.organisation_id),
+        },
+    ]
+    bucket_name = notify_api.config['LETTERS_PDF_BUCKET_NAME']
+    assert mock_list.call_args_list == [call(bucket_name, '2020-02-17/'), call(bucket_name, '2020-02-18/')]
+    assert not mock_find.called
+    mock_statsd.incr.assert_has_calls([
+        call('letters.collate.second.found', count=2),
+        call('letters.collate.second.not-found', count=1),
+    ])
+    assert [args[0] for args, _ in mock_statsd.timing.call_args_list] == [
+        'letters.collate.second.duration',
+        'letters.collate.second.s3-listing-duration',
+    ]
+
+
+def test_get_key_and_size_of_letters_to_be_sent_to_print_skips_letters_in_a_folder_that_cannot_be_listed(
+    notify_api, mocker, letters_in_two_folders
+):
+    mocker.patch('app.celery.letters_pdf_tasks.dao_get_letters_to_be_printed', return_value=letters_in_two_folders)
+    mock_list = mocker.patch('app.celery.letters_pdf_tasks.get_letter_pdf_keys_and_sizes_in_s3', side_effect=[
+        BotoClientError({'Error': {'Code': '403', 'Message': 'Forbidden'}}, 'ListObjectsV2'),
+        {'REF-TWO': ('2020-02-18/NOTIFY.REF-TWO.D.2.C.20200217180000.PDF', 2)},
+    ])
+    mock_statsd = mocker.patch('app.celery.letters_pdf_tasks.statsd_client')
+
+    with set_config(notify_api, 'LETTER_PDF_KEY_INDEX_ENABLED', True):
+        results = list(get_key_and_size_of_letters_to_be_sent_to_print(datetime(2020, 2, 18, 17, 30), 'second'))
+
+    assert [result['Key'] for result in results] == ['2020-02-18/NOTIFY.REF-TWO.D.2.C.20200217180000.PDF']
+    # the folder that failed isn't listed again for the next letter in it
+    assert mock_list.call_count == 2
+    mock_statsd.incr.assert_has_calls([
+        call('letters.collate.second.found', count=1),
+        call('letters.collate.second.not-found', count=2),
+    ])
+
+
+def test_get_key_and_size_of_letters_to_be_sent_to_print_finds_each_letter_when_key_index_disabled(
+    notify_api, mocker, letters_in_two_folders
+):
+    mocker.patch('app.celery.letters_pdf_tasks.dao_get_letters_to_be_printed', return_value=letters_in_two_folders)
+    mock_list = mocker.patch('app.celery.letters_pdf_tasks.get_letter_pdf_keys_and_sizes_in_s3')
+    mock_find = mocker.patch('app.celery.letters_pdf_tasks.find_letter_pdf_in_s3')
+
+    with set_config(notify_api, 'LETTER_PDF_KEY_INDEX_ENABLED', False):
+        results = list(get_key_and_size_of_letters_to_be_sent_to_print(datetime(2020, 2, 18, 17, 30), 'second'))
+
+    assert len(results) == 3
+    assert mock_find.call_args_list == [call(letter) for letter in letters_in_two_folders]
+    assert not mock_list.called
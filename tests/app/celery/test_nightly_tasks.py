@@ -8,13 +8,16 @@ from freezegun import freeze_time
 from notifications_utils.clients.zendesk.zendesk_client import (
     NotifySupportTicket,
 )
+from sqlalchemy.exc import SQLAlchemyError
 
 from app.celery import nightly_tasks
 from app.celery.nightly_tasks import (
     _delete_notifications_older_than_retention_by_type,
+    create_notification_partitions,
     delete_email_notifications_older_than_retention,
     delete_inbound_sms,
     delete_letter_notifications_older_than_retention,
+    delete_notifications_older_than_retention,
     delete_sms_notifications_older_than_retention,
     get_letter_notifications_still_sending_when_they_shouldnt_be,
     letter_raise_alert_if_no_ack_file_for_zip,
@@ -23,6 +26,7 @@ from app.celery.nightly_tasks import (
     remove_sms_email_csv_files,
     s3,
     save_daily_notification_processing_time,
+    sweep_notifications_past_retention,
     timeout_notifications,
 )
 from app.models import EMAIL_TYPE, LETTER_TYPE, SMS_TYPE, FactProcessingTime
@@ -33,6 +37,7 @@ from tests.app.db import (
     create_service_data_retention,
     create_template,
 )
+from tests.conftest import set_config
 
 
 def mock_s3_get_list_match(bucket_name, subfolder='', suffix='', last_modified=None):
@@ -162,6 +167,62 @@ def test_delete_letter_notifications_older_than_retention_calls_child_task(notif
     mocked.assert_called_once_with('letter')
 
 
+@freeze_time('2021-06-05 00:01')
+def test_create_notification_partitions_creates_partitions_from_tomorrow(notify_api, mocker):
+    mock_create = mocker.patch('app.celery.nightly_tasks.dao_create_notification_partitions', return_value=[])
+
+    with set_config(notify_api, 'NOTIFICATION_PARTITIONS_DAYS_AHEAD', 14):
+        create_notification_partitions()
+
+    mock_create.assert_called_once_with(date(2021, 6, 6), 14)
+
+
+@freeze_time('2021-06-10 03:00')
+@pytest.mark.parametrize('enabled, expected_days', [
+    (False, []),
+    # seven days of retention, its morn of 10th, so we want to keep everything from 3rd (BST) onwards - which
+    # starts at 11pm UTC on the 2nd
+    (True, [date(2021, 6, 1)]),
+])
+def test_delete_notifications_older_than_retention_archives_partitions_past_retention(
+    notify_api, mocker, enabled, expected_days
+):
+    mocker.patch('app.celery.nightly_tasks.delete_email_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.delete_sms_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.delete_letter_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.dao_get_notification_partition_days', return_value=[
+        date(2021, 6, 1), date(2021, 6, 2), date(2021, 6, 3), date(2021, 6, 4),
+    ])
+    mock_archive = mocker.patch('app.celery.nightly_tasks.dao_archive_notification_partition', return_value=(1, 0))
+
+    with set_config(notify_api, 'NOTIFICATION_PARTITION_RETENTION_ENABLED', enabled):
+        delete_notifications_older_than_retention()
+
+    assert mock_archive.call_args_list == [call(day) for day in expected_days]
+    nightly_tasks.delete_sms_notifications_older_than_retention.apply_async.assert_called_once_with(
+        queue='reporting-tasks'
+    )
+
+
+def test_delete_notifications_older_than_retention_carries_on_if_a_partition_cannot_be_archived(notify_api, mocker):
+    mocker.patch('app.celery.nightly_tasks.delete_email_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.delete_sms_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.delete_letter_notifications_older_than_retention')
+    mocker.patch('app.celery.nightly_tasks.dao_get_notification_partition_days', return_value=[
+        date(2021, 5, 31), date(2021, 6, 1),
+    ])
+    mock_archive = mocker.patch(
+        'app.celery.nightly_tasks.dao_archive_notification_partition',
+        side_effect=[SQLAlchemyError(), (1, 0)]
+    )
+
+    with set_config(notify_api, 'NOTIFICATION_PARTITION_RETENTION_ENABLED', True), freeze_time('2021-06-10 03:00'):
+        delete_notifications_older_than_retention()
+
+    assert mock_archive.call_count == 2
+    assert nightly_tasks.delete_letter_notifications_older_than_retention.apply_async.called
+
+
 def test_should_not_update_status_of_letter_notifications(client, sample_letter_template):
     created_at = datetime.utcnow() - timedelta(days=5)
     not1 = create_notification(template=sample_letter_template, status='sending', created_at=created_at)
@@ -533,3 +594,103 @@ def test_delete_notifications_task_calls_task_for_services_that_have_sent_notifi
             'datetime_to_delete_before': datetime(2021, 3, 27, 0, 0)
         }),
     ])
+
+
+def test_delete_notifications_older_than_retention_by_type_starts_the_sweep_when_it_is_enabled(notify_api, mocker):
+    mock_sweep = mocker.patch('app.celery.nightly_tasks.sweep_notifications_past_retention.apply_async')
+    mock_subtask = mocker.patch('app.celery.nightly_tasks.delete_notifications_for_service_and_type')
+
+    with set_config(notify_api, 'RETENTION_SWEEPER_ENABLED', True):
+        _delete_notifications_older_than_retention_by_type('sms')
+
+    mock_sweep.assert_called_once_with(['sms'], queue='reporting-tasks')
+    assert not mock_subtask.apply_async.called
+
+
+@freeze_time('2021-04-03 23:30')
+def test_sweep_notifications_past_retention_moves_batches_until_there_are_none_left(notify_db_session, mocker):
+    service = create_service()
+    create_service_data_retention(service, notification_type='sms', days_of_retention=3)
+    mocker.patch('app.celery.nightly_tasks.dao_get_replica_lag_and_lock_waits', return_value=(0, 0))
+    mocker.patch('app.celery.nightly_tasks.redis_store.get', return_value=None)
+    mock_redis_set = mocker.patch('app.celery.nightly_tasks.redis_store.set')
+    mock_redis_delete = mocker.patch('app.celery.nightly_tasks.redis_store.delete')
+    last = (datetime(2021, 3, 26, 12), 'aab5f3a2-1b47-4d7b-9c4c-5fc1c8b0e1b4')
+    mock_move = mocker.patch(
+        'app.celery.nightly_tasks.move_notifications_past_retention_batch',
+        side_effect=[(10, last), (0, None)],
+    )
+
+    sweep_notifications_past_retention('sms')
+
+    # it's already the 4th in BST, so the cutoffs are midnight BST 7 and 3 days before that
+    default_cutoff = datetime(2021, 3, 27, 23, 0)
+    service_cutoffs = {service.id: datetime(2021, 3, 31, 23, 0)}
+    mock_move.assert_has_calls([
+        call('sms', default_cutoff, service_cutoffs, after=None, batch_size=ANY),
+        call('sms', default_cutoff, service_cutoffs, after=last, batch_size=ANY),
+    ])
+    mock_redis_set.assert_called_once_with(
+        'retention-sweep-checkpoint-sms',
+        '{"day": "2021-04-04", "created_at": "2021-03-26T12:00:00", "id": "aab5f3a2-1b47-4d7b-9c4c-5fc1c8b0e1b4"}',
+        ex=24 * 60 * 60,
+    )
+    mock_redis_delete.assert_called_once_with('retention-sweep-checkpoint-sms')
+
+
+@freeze_time('2021-04-03 12:00')
+@pytest.mark.parametrize('checkpoint_day, expected_after', [
+    ('2021-04-03', (datetime(2021, 3, 26, 12), 'aab5f3a2-1b47-4d7b-9c4c-5fc1c8b0e1b4')),
+    ('2021-04-02', None),
+])
+def test_sweep_notifications_past_retention_carries_on_from_todays_checkpoint(
+    notify_db_session, mocker, checkpoint_day, expected_after
+):
+    mocker.patch('app.celery.nightly_tasks.dao_get_replica_lag_and_lock_waits', return_value=(0, 0))
+    mocker.patch('app.celery.nightly_tasks.redis_store.get', return_value=(
+        f'{{"day": "{checkpoint_day}", "created_at": "2021-03-26T12:00:00", '
+        f'"id": "aab5f3a2-1b47-4d7b-9c4c-5fc1c8b0e1b4"}}'
+    ))
+    mocker.patch('app.celery.nightly_tasks.redis_store.delete')
+    mock_move = mocker.patch(
+        'app.celery.nightly_tasks.move_notifications_past_retention_batch', return_value=(0, None)
+    )
+
+    sweep_notifications_past_retention('email')
+
+    assert mock_move.call_args.kwargs['after'] == expected_after
+
+
+def test_sweep_notifications_past_retention_waits_while_the_database_is_busy(notify_db_session, mocker):
+    mocker.patch(
+        'app.celery.nightly_tasks.dao_get_replica_lag_and_lock_waits',
+        side_effect=[(120, 0), (0, 50), (0, 0)],
+    )
+    mocker.patch('app.celery.nightly_tasks.redis_store.get', return_value=None)
+    mocker.patch('app.celery.nightly_tasks.redis_store.delete')
+    mock_sleep = mocker.patch('app.celery.nightly_tasks.sleep')
+    mock_statsd = mocker.patch('app.celery.nightly_tasks.statsd_client.incr')
+    mock_move = mocker.patch(
+        'app.celery.nightly_tasks.move_notifications_past_retention_batch', return_value=(0, None)
+    )
+
+    sweep_notifications_past_retention('sms')
+
+    assert mock_sleep.call_count == 2
+    assert mock_statsd.call_args_list == [call('retention-sweep.sms.throttled')] * 2
+    mock_move.assert_called_once()
+
+
+def test_sweep_notifications_past_retention_hands_over_to_a_new_task_when_out_of_time(
+    notify_api, notify_db_session, mocker
+):
+    mocker.patch('app.celery.nightly_tasks.dao_get_replica_lag_and_lock_waits', return_value=(0, 0))
+    mocker.patch('app.celery.nightly_tasks.redis_store.get', return_value=None)
+    mock_move = mocker.patch('app.celery.nightly_tasks.move_notifications_past_retention_batch')
+    mock_apply_async = mocker.patch('app.celery.nightly_tasks.sweep_notifications_past_retention.apply_async')
+
+    with set_config(notify_api, 'RETENTION_SWEEP_MAX_TASK_SECONDS', -1), freeze_time('2021-04-03 12:00'):
+        sweep_notifications_past_retention('sms')
+
+    mock_apply_async.assert_called_once_with(['sms', None], queue='reporting-tasks')
+    assert not mock_move.called
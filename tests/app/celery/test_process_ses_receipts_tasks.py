@@ -1,16 +1,24 @@
 import json
 from datetime import datetime
 
+import pytest
+from celery.exceptions import Retry
 from freezegun import freeze_time
 
 from app import encryption, statsd_client
-from app.celery.process_ses_receipts_tasks import process_ses_results
+from app.celery.process_ses_receipts_tasks import (
+    process_ses_results,
+    process_ses_results_batch,
+)
 from app.celery.research_mode_tasks import (
     ses_hard_bounce_callback,
     ses_notification_callback,
     ses_soft_bounce_callback,
 )
 from app.dao.notifications_dao import get_notification_by_id
+from app.dao.service_callback_api_dao import (
+    get_service_callback_api_for_service_and_type,
+)
 from app.models import Complaint, Notification
 from app.notifications.notifications_ses_callback import (
     remove_emails_from_bounce,
@@ -18,9 +26,11 @@ from app.notifications.notifications_ses_callback import (
 )
 from tests.app.db import (
     create_notification,
+    create_notification_history,
     create_service_callback_api,
     ses_complaint_callback,
 )
+from tests.conftest import set_config
 
 
 def test_process_ses_results(sample_email_template):
@@ -223,7 +233,134 @@ def test_ses_callback_should_send_on_complaint_to_user_callback_api(sample_email
         'complaint_id': str(Complaint.query.one().id),
         'notification_id': str(notification.id),
         'reference': None,
-        'service_callback_api_bearer_token': 'some_super_secret',
-        'service_callback_api_url': 'https://original_url.com',
+        'service_id': str(sample_email_template.service_id),
+        'service_callback_api_version': 1,
         'to': 'recipient1@example.com'
     }
+
+
+def test_process_ses_results_batch_updates_each_notification(sample_email_template, mocker):
+    mocker.patch('app.statsd_client.incr')
+    mocker.patch('app.statsd_client.timing')
+    sent_at = datetime.utcnow()
+    delivered = create_notification(sample_email_template, reference='ref1', sent_at=sent_at, status='sending')
+    bounced = create_notification(sample_email_template, reference='ref2', sent_at=sent_at, status='sending')
+    history = create_notification_history(sample_email_template, reference='ref3', status='sending')
+
+    assert process_ses_results_batch([
+        ses_notification_callback(reference='ref1'),
+        ses_hard_bounce_callback(reference='ref2'),
+        ses_notification_callback(reference='ref3'),
+    ])
+
+    assert get_notification_by_id(delivered.id).status == 'delivered'
+    assert get_notification_by_id(bounced.id).status == 'permanent-failure'
+    assert history.status == 'delivered'
+    statsd_client.incr.assert_any_call('callback.ses.delivered')
+    statsd_client.incr.assert_any_call('callback.ses.permanent-failure')
+    statsd_client.incr.assert_any_call('tasks.process-ses-results-batch.receipts', count=3)
+    assert statsd_client.timing.call_args[0][0] == 'tasks.process-ses-results-batch.duration'
+
+
+def test_process_ses_results_batch_queues_callbacks_with_one_lookup(sample_email_template, mocker):
+    send_mock = mocker.patch('app.notifications.notifications_ses_callback.send_delivery_status_to_service.apply_async')
+    get_callback_api = mocker.patch(
+        'app.serialised_models.get_service_callback_api_for_service_and_type',
+        wraps=get_service_callback_api_for_service_and_type,
+    )
+    create_service_callback_api(service=sample_email_template.service, url="https://original_url.com")
+    notifications = [
+        create_notification(sample_email_template, reference=f'ref{i}', status='sending') for i in range(3)
+    ]
+
+    assert process_ses_results_batch([ses_notification_callback(reference=f'ref{i}') for i in range(3)])
+
+    assert get_callback_api.call_count == 1
+    assert sorted(call[0][0][0] for call in send_mock.call_args_list) == sorted(
+        str(notification.id) for notification in notifications
+    )
+    data = encryption.decrypt(send_mock.call_args[0][0][1])
+    assert data['notification_status'] == 'delivered'
+    assert data['service_callback_api_version'] == 1
+
+
+def test_process_ses_results_batch_skips_notifications_already_updated(sample_email_template, mocker):
+    mock_dup = mocker.patch('app.celery.process_ses_receipts_tasks.notifications_dao._duplicate_update_warning')
+    notification = create_notification(sample_email_template, reference='ref1', status='delivered')
+
+    assert process_ses_results_batch([ses_soft_bounce_callback(reference='ref1')])
+
+    assert get_notification_by_id(notification.id).status == 'delivered'
+    mock_dup.assert_called_once_with(notification=notification, status='temporary-failure')
+
+
+def test_process_ses_results_batch_retries_only_receipts_for_new_notifications(sample_email_template, mocker):
+    mock_retry = mocker.patch('app.celery.process_ses_receipts_tasks.process_ses_results_batch.retry')
+    notification = create_notification(sample_email_template, reference='ref1', status='sending')
+    missing = ses_notification_callback(reference='ref2')
+
+    with freeze_time('2017-11-17T12:14:03.646Z'):
+        process_ses_results_batch([ses_notification_callback(reference='ref1'), missing])
+
+    assert get_notification_by_id(notification.id).status == 'delivered'
+    mock_retry.assert_called_once_with(args=[[missing]], queue='retry-tasks')
+
+
+def test_process_ses_results_batch_does_not_retry_receipts_for_old_notifications(client, notify_db_session, mocker):
+    mock_retry = mocker.patch('app.celery.process_ses_receipts_tasks.process_ses_results_batch.retry')
+    mock_logger = mocker.patch('app.celery.process_ses_receipts_tasks.current_app.logger.warning')
+
+    with freeze_time('2017-11-17T12:34:03.646Z'):
+        assert process_ses_results_batch([ses_notification_callback(reference='ref')])
+
+    assert mock_retry.call_count == 0
+    mock_logger.assert_called_once_with('notification not found for reference: ref (update to delivered)')
+
+
+def test_process_ses_results_hands_receipts_over_to_be_batched(notify_api, sample_email_template, mocker):
+    mock_redis = mocker.patch('app.celery.process_ses_receipts_tasks.redis_store')
+    notification = create_notification(sample_email_template, reference='ref1', status='sending')
+    response = ses_notification_callback(reference='ref1')
+
+    with set_config(notify_api, 'SES_RECEIPT_BATCHING_ENABLED', True):
+        assert process_ses_results(response)
+
+    mock_redis.redis_store.rpush.assert_called_once_with('ses-receipts', json.dumps(response))
+    assert get_notification_by_id(notification.id).status == 'sending'
+
+
+def test_process_ses_results_batch_retries_every_receipt_but_not_complaints_if_the_update_fails(
+    sample_email_template, mocker
+):
+    mocker.patch(
+        'app.celery.process_ses_receipts_tasks.notifications_dao.dao_update_notification_statuses_by_reference',
+        side_effect=Exception('db error')
+    )
+    mock_handle_complaint = mocker.patch(
+        'app.celery.process_ses_receipts_tasks.handle_complaint', return_value=(None, None, None)
+    )
+    mocker.patch('app.celery.process_ses_receipts_tasks._check_and_queue_complaint_callback_task')
+    mock_retry = mocker.patch(
+        'app.celery.process_ses_receipts_tasks.process_ses_results_batch.retry', side_effect=Retry
+    )
+    create_notification(sample_email_template, reference='ref1', status='sending')
+    receipt = ses_notification_callback(reference='ref1')
+
+    with pytest.raises(Retry):
+        process_ses_results_batch([ses_complaint_callback(), receipt])
+
+    assert mock_handle_complaint.call_count == 1
+    mock_retry.assert_called_once_with(args=[[receipt]], queue='retry-tasks')
+
+
+def test_process_ses_results_batch_does_not_retry_receipts_it_has_applied(sample_email_template, mocker):
+    mocker.patch(
+        'app.celery.process_ses_receipts_tasks.queue_callback_tasks', side_effect=Exception('sqs is down')
+    )
+    mock_retry = mocker.patch('app.celery.process_ses_receipts_tasks.process_ses_results_batch.retry')
+    notification = create_notification(sample_email_template, reference='ref1', status='sending')
+
+    assert process_ses_results_batch([ses_notification_callback(reference='ref1')])
+
+    assert get_notification_by_id(notification.id).status == 'delivered'
+    assert not mock_retry.called
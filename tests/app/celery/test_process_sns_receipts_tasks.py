@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from freezegun import freeze_time
+
+from app import encryption, statsd_client
+from app.celery.process_sns_receipts_tasks import process_sns_results_batch
+from app.dao.notifications_dao import get_notification_by_id
+from tests.app.db import (
+    create_notification,
+    create_notification_history,
+    create_service_callback_api,
+    sns_delivery_status_event,
+)
+
+
+@freeze_time('2017-11-17T12:14:03.646Z')
+def test_process_sns_results_batch_updates_each_notification(sample_template, mocker):
+    mocker.patch('app.statsd_client.incr')
+    mocker.patch('app.statsd_client.timing')
+    mocker.patch('app.statsd_client.timing_with_dates')
+    delivered = create_notification(sample_template, reference='ref1', sent_at=datetime.utcnow(), status='sending')
+    failed = create_notification(sample_template, reference='ref2', sent_at=datetime.utcnow(), status='sending')
+    international = create_notification(sample_template, reference='ref3', status='sent')
+    history = create_notification_history(sample_template, reference='ref4', status='sending')
+
+    assert process_sns_results_batch([
+        sns_delivery_status_event('ref1'),
+        sns_delivery_status_event('ref2', status='FAILURE', provider_response='Invalid phone number'),
+        sns_delivery_status_event('ref3'),
+        sns_delivery_status_event('ref4', status='FAILURE', provider_response='Phone is currently unreachable'),
+    ])
+
+    assert get_notification_by_id(delivered.id).status == 'delivered'
+    assert get_notification_by_id(failed.id).status == 'permanent-failure'
+    assert get_notification_by_id(international.id).status == 'delivered'
+    assert history.status == 'temporary-failure'
+    statsd_client.incr.assert_any_call('callback.sns.delivered')
+    statsd_client.incr.assert_any_call('callback.sns.permanent-failure')
+    statsd_client.incr.assert_any_call('tasks.process-sns-results-batch.receipts', count=4)
+    statsd_client.timing_with_dates.assert_any_call(
+        'callback.sns.lag', datetime.utcnow(), datetime(2017, 11, 17, 12, 13, 3, 646000)
+    )
+    assert statsd_client.timing.call_args[0][0] == 'tasks.process-sns-results-batch.duration'
+
+
+def test_process_sns_results_batch_queues_callbacks(sample_template, mocker):
+    send_mock = mocker.patch('app.notifications.notifications_ses_callback.send_delivery_status_to_service.apply_async')
+    create_service_callback_api(service=sample_template.service, url="https://original_url.com")
+    notification = create_notification(sample_template, reference='ref1', status='sending')
+
+    assert process_sns_results_batch([sns_delivery_status_event('ref1')])
+
+    assert send_mock.call_args[0][0][0] == str(notification.id)
+    data = encryption.decrypt(send_mock.call_args[0][0][1])
+    assert data['notification_status'] == 'delivered'
+    assert data['notification_to'] == notification.to
+
+
+def test_process_sns_results_batch_does_not_change_finished_notifications(sample_template, mocker):
+    mock_dup = mocker.patch('app.celery.process_sns_receipts_tasks.notifications_dao._duplicate_update_warning')
+    notification = create_notification(sample_template, reference='ref1', status='delivered')
+
+    assert process_sns_results_batch([sns_delivery_status_event('ref1', status='FAILURE')])
+
+    assert get_notification_by_id(notification.id).status == 'delivered'
+    mock_dup.assert_called_once_with(notification=notification, status='temporary-failure')
+
+
+def test_process_sns_results_batch_retries_only_events_for_new_notifications(sample_template, mocker):
+    mock_retry = mocker.patch('app.celery.process_sns_receipts_tasks.process_sns_results_batch.retry')
+    create_notification(sample_template, reference='ref1', status='sending')
+    missing = sns_delivery_status_event('ref2')
+
+    with freeze_time('2017-11-17T12:14:03.646Z'):
+        process_sns_results_batch([sns_delivery_status_event('ref1'), missing])
+
+    mock_retry.assert_called_once_with(args=[[missing]], queue='retry-tasks')
+
+
+def test_process_sns_results_batch_does_not_retry_events_for_old_notifications(notify_db_session, mocker):
+    mock_retry = mocker.patch('app.celery.process_sns_receipts_tasks.process_sns_results_batch.retry')
+    mock_logger = mocker.patch('app.celery.process_sns_receipts_tasks.current_app.logger.warning')
+
+    with freeze_time('2017-11-17T12:34:03.646Z'):
+        assert process_sns_results_batch([sns_delivery_status_event('ref')])
+
+    assert mock_retry.call_count == 0
+    mock_logger.assert_called_once_with('notification not found for reference: ref (update to delivered)')
@@ -1,22 +1,34 @@
+from unittest.mock import call
+
 import pytest
 from botocore.exceptions import ClientError
 from celery.exceptions import MaxRetriesExceededError
 
 import app
 from app.celery import provider_tasks
-from app.celery.provider_tasks import deliver_email, deliver_sms
+from app.celery.provider_tasks import (
+    deliver_email,
+    deliver_email_batch,
+    deliver_sms,
+    deliver_sms_batch,
+)
 from app.clients.email import EmailClientNonRetryableException
 from app.clients.email.aws_ses import (
     AwsSesClientException,
     AwsSesClientThrottlingSendRateException,
 )
+from app.clients.provider_sender import ProviderSenderBusyException
+from app.clients.send_rate_governor import SendRateExceededException
 from app.clients.sms import SmsClientResponseException
 from app.exceptions import NotificationTechnicalFailureException
+from tests.app.db import create_notification
 
 
 def test_should_have_decorated_tasks_functions():
     assert deliver_sms.__wrapped__.__name__ == 'deliver_sms'
     assert deliver_email.__wrapped__.__name__ == 'deliver_email'
+    assert deliver_sms_batch.__wrapped__.__name__ == 'deliver_sms_batch'
+    assert deliver_email_batch.__wrapped__.__name__ == 'deliver_email_batch'
 
 
 def test_should_call_send_sms_to_provider_from_deliver_sms_task(
@@ -205,3 +217,83 @@ def test_if_ses_send_rate_throttle_then_should_retry_and_log_warning(sample_noti
     assert sample_notification.status == 'created'
     assert not mock_logger_exception.called
     assert mock_logger_warning.called
+
+
+def test_deliver_sms_batch_sends_all_notifications_and_retries_failures_individually(
+    sample_template,
+    mocker
+):
+    sent = create_notification(template=sample_template)
+    failed = create_notification(template=sample_template)
+    missing_id = str(app.create_uuid())
+    mock_send = mocker.patch(
+        'app.delivery.send_to_providers.send_sms_batch_to_provider', return_value=([failed.id], [])
+    )
+    mock_deliver_sms = mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+
+    deliver_sms_batch([str(sent.id), str(failed.id), missing_id])
+
+    assert {notification.id for notification in mock_send.call_args[0][0]} == {sent.id, failed.id}
+    assert mock_deliver_sms.call_args_list == [
+        call([missing_id], queue='retry-tasks'),
+        call([str(failed.id)], queue='retry-tasks'),
+    ]
+
+
+def test_deliver_email_batch_retries_every_notification_if_the_batch_send_raises(
+    sample_email_template,
+    mocker
+):
+    notifications = [create_notification(template=sample_email_template) for _ in range(2)]
+    mocker.patch('app.delivery.send_to_providers.send_email_batch_to_provider', side_effect=Exception('boom'))
+    mock_deliver_email = mocker.patch('app.celery.provider_tasks.deliver_email.apply_async')
+
+    deliver_email_batch([str(notification.id) for notification in notifications])
+
+    assert {args[0][0][0] for args in mock_deliver_email.call_args_list} == {
+        str(notification.id) for notification in notifications
+    }
+    assert all(args[1] == {'queue': 'retry-tasks'} for args in mock_deliver_email.call_args_list)
+
+
+def test_deliver_sms_batch_retries_throttled_notifications_once_the_send_rate_allows(sample_template, mocker):
+    throttled = create_notification(template=sample_template)
+    mocker.patch(
+        'app.delivery.send_to_providers.send_sms_batch_to_provider', return_value=([], [(throttled.id, 2.5)])
+    )
+    mocker.patch('app.celery.provider_tasks.random.randint', return_value=4)
+    mock_deliver_sms = mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+
+    deliver_sms_batch([str(throttled.id)])
+
+    mock_deliver_sms.assert_called_once_with([str(throttled.id)], queue='retry-tasks', countdown=7)
+
+
+@pytest.mark.parametrize('deliver_task, send_function', [
+    (deliver_sms, 'send_sms_to_provider'),
+    (deliver_email, 'send_email_to_provider'),
+])
+@pytest.mark.parametrize('exception, expected_countdown', [
+    (SendRateExceededException('sns', 2.5), 7),
+    (ProviderSenderBusyException('busy'), 4),
+])
+def test_deliver_requeues_without_using_a_retry_if_we_are_holding_sends_back(
+    sample_notification,
+    mocker,
+    deliver_task,
+    send_function,
+    exception,
+    expected_countdown,
+):
+    mocker.patch(f'app.delivery.send_to_providers.{send_function}', side_effect=exception)
+    mocker.patch('app.celery.provider_tasks.random.randint', return_value=4)
+    mock_retry = mocker.patch.object(deliver_task, 'retry')
+    mock_apply_async = mocker.patch.object(deliver_task, 'apply_async')
+
+    deliver_task(sample_notification.id)
+
+    assert not mock_retry.called
+    mock_apply_async.assert_called_once_with(
+        [sample_notification.id], queue='retry-tasks', countdown=expected_countdown, retries=0
+    )
+    assert sample_notification.status == 'created'
@@ -1,4 +1,4 @@
-from datetime import date, datetime, time, timedelta
+from datetime import date, datetime, time, timedelta, timezone
 from decimal import Decimal
 from uuid import UUID
 
@@ -9,10 +9,11 @@ from app.celery.reporting_tasks import (
     create_nightly_billing,
     create_nightly_billing_for_day,
     create_nightly_notification_status,
+    create_nightly_notification_status_for_day,
     create_nightly_notification_status_for_service_and_day,
 )
 from app.config import QueueNames
-from app.dao.fact_billing_dao import get_rate
+from app.dao.fact_billing_dao import get_rate, update_fact_billing_for_day
 from app.models import (
     EMAIL_TYPE,
     KEY_TYPE_NORMAL,
@@ -33,6 +34,7 @@ from tests.app.db import (
     create_service,
     create_template,
 )
+from tests.conftest import set_config
 
 
 def mocker_get_rate(
@@ -686,3 +688,134 @@ def test_create_nightly_notification_status_for_service_and_day_respects_bst(sam
 
     assert noti_status[0].bst_date == date(2019, 4, 1)
     assert noti_status[0].notification_status == 'created'
+
+
+def _billing_rows():
+    return sorted(
+        (
+            row.template_id, row.notification_type, row.provider, row.rate_multiplier, row.international, row.rate,
+            row.postage, row.billable_units, row.notifications_sent,
+        )
+        for row in FactBilling.query.all()
+    )
+
+
+@freeze_time('2022-01-15T03:30:00')
+def test_update_fact_billing_for_day_matches_the_per_service_aggregation(notify_db_session):
+    create_rate(start_date=datetime(2021, 4, 1), value=0.0158, notification_type=SMS_TYPE)
+    create_rate(start_date=datetime(2021, 12, 1), value=0.0162, notification_type=SMS_TYPE)
+    create_letter_rate(sheet_count=1, rate=0.3, post_class='second')
+    create_letter_rate(sheet_count=2, rate=0.35, post_class='second')
+    create_letter_rate(sheet_count=1, rate=0.6, post_class='first')
+
+    first_service = create_service(service_name='first')
+    second_service = create_service(service_name='second')
+    sms_template = create_template(first_service)
+    email_template = create_template(first_service, template_type=EMAIL_TYPE)
+    letter_template = create_template(second_service, template_type=LETTER_TYPE)
+    created_at = datetime(2022, 1, 14, 12, 0)
+
+    create_notification(sms_template, status='delivered', created_at=created_at, sent_by='sns', billable_units=1)
+    create_notification(sms_template, status='delivered', created_at=created_at, sent_by='sns', billable_units=2)
+    create_notification(sms_template, status='sending', created_at=created_at, sent_by=None, rate_multiplier=2)
+    create_notification(sms_template, status='delivered', created_at=created_at, key_type=KEY_TYPE_TEST)
+    create_notification_history(email_template, status='delivered', created_at=created_at)
+    create_notification(email_template, status='permanent-failure', created_at=created_at)
+    create_notification(letter_template, status='delivered', created_at=created_at, billable_units=1, postage='second')
+    create_notification(letter_template, status='delivered', created_at=created_at, billable_units=2, postage='second')
+    create_notification(letter_template, status='delivered', created_at=created_at, billable_units=1, postage='first')
+    create_notification(letter_template, status='created', created_at=created_at, billable_units=1, postage='second')
+
+    create_nightly_billing_for_day('2022-01-14')
+    per_service_rows = _billing_rows()
+    FactBilling.query.delete()
+
+    assert update_fact_billing_for_day(date(2022, 1, 14)) == len(per_service_rows)
+    assert _billing_rows() == per_service_rows
+
+    # running it again updates the same rows
+    update_fact_billing_for_day(date(2022, 1, 14))
+    assert _billing_rows() == per_service_rows
+
+
+def test_update_fact_billing_for_day_only_aggregates_the_services_given(notify_db_session):
+    create_rate(start_date=datetime(2021, 4, 1), value=0.0158, notification_type=SMS_TYPE)
+    first_template = create_template(create_service(service_name='first'))
+    second_template = create_template(create_service(service_name='second'))
+    create_notification(first_template, status='delivered', created_at=datetime(2022, 1, 14, 12, 0))
+    create_notification(second_template, status='delivered', created_at=datetime(2022, 1, 14, 12, 0))
+
+    update_fact_billing_for_day(date(2022, 1, 14), service_ids=[first_template.service_id])
+
+    assert [row.service_id for row in FactBilling.query.all()] == [first_template.service_id]
+
+
+@freeze_time('2019-08-01T00:30')
+def test_create_nightly_notification_status_triggers_a_task_per_day_when_set_based(notify_api, mocker):
+    mock_celery = mocker.patch('app.celery.reporting_tasks.create_nightly_notification_status_for_day').apply_async
+
+    with set_config(notify_api, 'SET_BASED_FACT_AGGREGATION_ENABLED', True):
+        create_nightly_notification_status()
+
+    assert mock_celery.call_count == 10
+    assert mock_celery.call_args_list[0].kwargs == {
+        'kwargs': {'process_day': '2019-07-31', 'notification_types': [SMS_TYPE, EMAIL_TYPE, LETTER_TYPE]},
+        'queue': QueueNames.REPORTING,
+    }
+    assert mock_celery.call_args_list[4].kwargs['kwargs'] == {
+        'process_day': '2019-07-27', 'notification_types': [LETTER_TYPE]
+    }
+
+
+def test_create_nightly_notification_status_for_day_aggregates_every_service(notify_db_session):
+    first_template = create_template(create_service(service_name='first'))
+    second_template = create_template(create_service(service_name='second'), template_type=EMAIL_TYPE)
+    letter_template = create_template(second_template.service, template_type=LETTER_TYPE)
+    created_at = datetime(2022, 1, 14, 12, 0)
+    create_notification(first_template, status='delivered', created_at=created_at)
+    create_notification(first_template, status='delivered', created_at=created_at)
+    create_notification_history(second_template, status='temporary-failure', created_at=created_at)
+    create_notification(letter_template, status='delivered', created_at=created_at)
+
+    create_nightly_notification_status_for_day('2022-01-14', [SMS_TYPE, EMAIL_TYPE])
+
+    rows = FactNotificationStatus.query.order_by(FactNotificationStatus.notification_type).all()
+    assert [
+        (row.service_id, row.notification_type, row.notification_status, row.notification_count) for row in rows
+    ] == [
+        (second_template.service_id, EMAIL_TYPE, 'temporary-failure', 1),
+        (first_template.service_id, SMS_TYPE, 'delivered', 2),
+    ]
+
+
+@freeze_time('2022-01-15T03:30:00')
+@pytest.mark.parametrize('changed_service_ids, expected_update_calls', [
+    ({'service-id'}, 1),
+    (set(), 0),
+])
+def test_create_nightly_billing_for_day_only_aggregates_changed_services_when_incremental(
+    notify_api, mocker, changed_service_ids, expected_update_calls
+):
+    mocker.patch('app.celery.reporting_tasks.redis_store.get', return_value=b'1642118400.0')
+    mock_redis_set = mocker.patch('app.celery.reporting_tasks.redis_store.set')
+    mock_changed = mocker.patch(
+        'app.celery.reporting_tasks.get_service_ids_with_notifications_changed_since',
+        return_value=changed_service_ids,
+    )
+    mock_update = mocker.patch('app.celery.reporting_tasks.update_fact_billing_for_day', return_value=1)
+
+    with set_config(notify_api, 'SET_BASED_FACT_AGGREGATION_ENABLED', True), \
+            set_config(notify_api, 'INCREMENTAL_FACT_AGGREGATION_ENABLED', True):
+        create_nightly_billing_for_day('2022-01-14')
+
+    mock_changed.assert_called_once_with(
+        date(2022, 1, 14), datetime(2022, 1, 14, 0, 0), [SMS_TYPE, EMAIL_TYPE, LETTER_TYPE]
+    )
+    assert mock_update.call_count == expected_update_calls
+    if expected_update_calls:
+        mock_update.assert_called_once_with(date(2022, 1, 14), {'service-id'})
+    mock_redis_set.assert_called_once_with(
+        'ft_billing-aggregated-at-2022-01-14',
+        datetime(2022, 1, 15, 3, 20, tzinfo=timezone.utc).timestamp(),
+        ex=timedelta(days=11),
+    )
@@ -1,3 +1,4 @@
+import io
 from collections import namedtuple
 from datetime import datetime, timedelta
 from unittest import mock
@@ -10,6 +11,8 @@ from notifications_utils.clients.zendesk.zendesk_client import (
 )
 
 from app.celery import scheduled_tasks
+from app.celery.process_ses_receipts_tasks import process_ses_results_batch
+from app.celery.research_mode_tasks import send_email_response
 from app.celery.scheduled_tasks import (
     auto_expire_broadcast_messages,
     check_for_missing_rows_in_completed_jobs,
@@ -19,6 +22,8 @@ from app.celery.scheduled_tasks import (
     check_job_status,
     delete_invitations,
     delete_verify_codes,
+    drain_ses_receipts,
+    process_sns_delivery_status_logs,
     remove_yesterdays_planned_tests_on_govuk_alerts,
     replay_created_notifications,
     run_scheduled_jobs,
@@ -36,6 +41,7 @@ from app.models import (
     NOTIFICATION_DELIVERED,
     NOTIFICATION_PENDING_VIRUS_CHECK,
     BroadcastStatusType,
+    Notification,
 )
 from tests.app import load_example_csv
 from tests.app.db import (
@@ -44,7 +50,7 @@ from tests.app.db import (
     create_notification,
     create_template,
 )
-from tests.conftest import set_config
+from tests.conftest import set_config, set_config_values
 
 
 def _create_slow_delivery_notification(template, provider='mmg'):
@@ -564,6 +570,31 @@ def test_check_for_missing_rows_in_completed_jobs(mocker, sample_email_template)
     )
 
 
+def test_check_for_missing_rows_in_completed_jobs_streaming_the_file_from_s3(
+    notify_api, mocker, sample_email_template
+):
+    mocker.patch(
+        'app.celery.tasks.s3.get_job_stream_and_metadata_from_s3',
+        return_value=(io.StringIO(load_example_csv('multiple_email')), {"sender_id": None}),
+    )
+    process_row = mocker.patch('app.celery.scheduled_tasks.process_row')
+
+    job = create_job(template=sample_email_template,
+                     notification_count=5,
+                     job_status=JOB_STATUS_FINISHED,
+                     processing_finished=datetime.utcnow() - timedelta(minutes=20))
+    for i in [0, 1, 3]:
+        create_notification(job=job, job_row_number=i)
+
+    with set_config(notify_api, 'JOB_CSV_STREAMING_ENABLED', True):
+        check_for_missing_rows_in_completed_jobs()
+
+    assert [
+        (process_row_call.args[0].index, process_row_call.args[0].recipient)
+        for process_row_call in process_row.call_args_list
+    ] == [(2, 'test3@test.com'), (4, 'test5@test.com')]
+
+
 def test_check_for_missing_rows_in_completed_jobs_calls_save_email(mocker, sample_email_template):
     mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3',
                  return_value=(load_example_csv('multiple_email'), {'sender_id': None}))
@@ -750,3 +781,86 @@ def test_remove_yesterdays_planned_tests_on_govuk_alerts(
         name=TaskNames.PUBLISH_GOVUK_ALERTS,
         queue=QueueNames.GOVUK_ALERTS
     )
+
+
+@freeze_time('2021-07-19 15:50')
+def test_process_sns_delivery_status_logs_queues_events_in_batches_from_the_checkpoint(notify_api, mocker):
+    log_group = 'sns/us-west-2/123456789012/DirectPublishToPhoneNumber'
+    mock_redis = mocker.patch('app.celery.scheduled_tasks.redis_store')
+    mock_redis.get.return_value = b'1626709500000'
+    get_events = mocker.patch(
+        'app.celery.scheduled_tasks.aws_sns_client.get_delivery_status_events',
+        return_value=iter([{'message': f'event {i}', 'timestamp': 1626709500000 + i} for i in range(3)])
+    )
+    mock_task = mocker.patch('app.celery.scheduled_tasks.process_sns_results_batch.apply_async')
+
+    with set_config(notify_api, 'SNS_DELIVERY_STATUS_LOG_GROUPS', [log_group]), \
+            set_config(notify_api, 'SNS_DELIVERY_STATUS_BATCH_SIZE', 2):
+        process_sns_delivery_status_logs()
+
+    get_events.assert_called_once_with(log_group, 1626709500000)
+    assert mock_task.call_args_list == [
+        call([['event 0', 'event 1']], queue=QueueNames.SMS_CALLBACKS),
+        call([['event 2']], queue=QueueNames.SMS_CALLBACKS),
+    ]
+    mock_redis.set.assert_called_with(f'sns-delivery-status-logs-checkpoint-{log_group}', 1626709500002)
+
+
+@freeze_time('2021-07-19 15:50')
+def test_process_sns_delivery_status_logs_starts_fifteen_minutes_ago_without_a_checkpoint(notify_api, mocker):
+    mocker.patch('app.celery.scheduled_tasks.redis_store.get', return_value=None)
+    get_events = mocker.patch(
+        'app.celery.scheduled_tasks.aws_sns_client.get_delivery_status_events', return_value=iter([])
+    )
+
+    with set_config(notify_api, 'SNS_DELIVERY_STATUS_LOG_GROUPS', ['sns/us-west-2/123456789012/Failure']):
+        process_sns_delivery_status_logs()
+
+    get_events.assert_called_once_with('sns/us-west-2/123456789012/Failure', 1626708900000)
+
+
+def test_ses_receipts_are_drained_from_redis_and_processed_in_batches(notify_api, sample_email_template, mocker):
+    buffered = []
+    mock_redis = mocker.Mock(active=True)
+    mock_redis.redis_store.rpush.side_effect = lambda key, receipt: buffered.append(receipt)
+    # lrange and ltrim the first two receipts
+    mock_redis.redis_store.pipeline.return_value.execute.side_effect = lambda: [
+        buffered[:2], buffered.__delitem__(slice(0, 2))
+    ]
+    mocker.patch('app.celery.process_ses_receipts_tasks.redis_store', mock_redis)
+    mocker.patch('app.celery.scheduled_tasks.redis_store', mock_redis)
+    mock_single_task = mocker.patch('app.celery.process_ses_receipts_tasks.process_ses_results.apply_async')
+    mock_batch_task = mocker.patch(
+        'app.celery.scheduled_tasks.process_ses_results_batch.apply_async',
+        side_effect=lambda args, queue: process_ses_results_batch(*args),
+    )
+    notifications = [
+        create_notification(sample_email_template, reference=f'ref{i}', status='sending') for i in range(3)
+    ]
+
+    with set_config_values(notify_api, {'SES_RECEIPT_BATCHING_ENABLED': True, 'SES_RECEIPT_BATCH_SIZE': 2}):
+        for notification in notifications:
+            send_email_response(notification.reference, notification.to)
+        drain_ses_receipts()
+
+    assert not mock_single_task.called
+    assert [len(batch_call.args[0][0]) for batch_call in mock_batch_task.call_args_list] == [2, 1]
+    assert buffered == []
+    assert {
+        status for status, in Notification.query.with_entities(Notification.status).filter(
+            Notification.id.in_([notification.id for notification in notifications])
+        )
+    } == {NOTIFICATION_DELIVERED}
+
+
+def test_drain_ses_receipts_puts_a_batch_back_if_it_cannot_be_queued(notify_api, mocker):
+    mock_redis = mocker.patch('app.celery.scheduled_tasks.redis_store')
+    mock_redis.redis_store.pipeline.return_value.execute.return_value = [[b'"first"', b'"second"'], True]
+    mocker.patch(
+        'app.celery.scheduled_tasks.process_ses_results_batch.apply_async', side_effect=Exception('sqs is down')
+    )
+
+    with pytest.raises(Exception):
+        drain_ses_receipts()
+
+    mock_redis.redis_store.lpush.assert_called_once_with('ses-receipts', b'"second"', b'"first"')
@@ -9,7 +9,10 @@ from app import encryption
 from app.celery.service_callback_tasks import (
     send_complaint_to_service,
     send_delivery_status_to_service,
+    send_delivery_statuses_to_service,
 )
+from app.clients.service_callback import CallbackEndpointUnavailableException
+from app.dao.service_callback_api_dao import delete_service_callback_api
 from app.utils import DATETIME_FORMAT
 from tests.app.db import (
     create_complaint,
@@ -18,6 +21,7 @@ from tests.app.db import (
     create_service_callback_api,
     create_template,
 )
+from tests.conftest import set_config
 
 
 @pytest.mark.parametrize("notification_type", ["email", "sms"])
@@ -61,6 +65,35 @@ def test_send_delivery_status_to_service_post_https_request_to_service_with_encr
     assert request_mock.request_history[0].headers["Authorization"] == "Bearer {}".format(callback_api.bearer_token)
 
 
+def test_send_delivery_status_to_service_uses_the_url_and_token_of_tasks_queued_with_them(notify_db_session):
+    callback_api, template = _set_up_test_data('email', "delivery_status")
+    notification = create_notification(template=template, status='delivered')
+    status_update = encryption.decrypt(_set_up_data_for_status_update(callback_api, notification))
+    del status_update['service_id']
+    del status_update['service_callback_api_version']
+    status_update['service_callback_api_url'] = 'https://old.service.gov.uk/'
+    status_update['service_callback_api_bearer_token'] = 'old_token'
+
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post('https://old.service.gov.uk/', json={}, status_code=200)
+        send_delivery_status_to_service(notification.id, encrypted_status_update=encryption.encrypt(status_update))
+
+    assert request_mock.call_count == 1
+    assert request_mock.request_history[0].headers["Authorization"] == "Bearer old_token"
+
+
+def test_send_delivery_status_to_service_does_nothing_if_the_callback_api_has_been_deleted(notify_db_session):
+    callback_api, template = _set_up_test_data('email', "delivery_status")
+    notification = create_notification(template=template, status='delivered')
+    encrypted_status_update = _set_up_data_for_status_update(callback_api, notification)
+    delete_service_callback_api(callback_api)
+
+    with requests_mock.Mocker() as request_mock:
+        send_delivery_status_to_service(notification.id, encrypted_status_update=encrypted_status_update)
+
+    assert request_mock.call_count == 0
+
+
 def test_send_complaint_to_service_posts_https_request_to_service_with_encrypted_data(notify_db_session):
     with freeze_time('2001-01-01T12:00:00'):
         callback_api, template = _set_up_test_data('email', "complaint")
@@ -167,6 +200,69 @@ def test_send_delivery_status_to_service_succeeds_if_sent_at_is_none(
     assert mocked.call_count == 0
 
 
+def test_send_delivery_statuses_to_service_posts_a_list_of_status_updates(notify_db_session):
+    callback_api, template = _set_up_test_data('sms', "delivery_status")
+    notifications = [create_notification(template=template, status='delivered') for _ in range(2)]
+    encrypted_status_updates = [
+        _set_up_data_for_status_update(callback_api, notification) for notification in notifications
+    ]
+
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post(callback_api.url, json={}, status_code=200)
+        send_delivery_statuses_to_service(encrypted_status_updates)
+
+    assert request_mock.call_count == 1
+    assert [item['id'] for item in request_mock.request_history[0].json()] == [
+        str(notification.id) for notification in notifications
+    ]
+    assert request_mock.request_history[0].headers["Authorization"] == "Bearer {}".format(callback_api.bearer_token)
+
+
+@freeze_time('2022-01-01 12:00:00')
+def test_send_delivery_status_to_service_parks_the_task_when_the_circuit_breaker_is_open(
+    notify_db_session, mocker
+):
+    callback_api, template = _set_up_test_data('sms', "delivery_status")
+    notification = create_notification(template=template, status='delivered')
+    encrypted_data = _set_up_data_for_status_update(callback_api, notification)
+    mocker.patch(
+        'app.celery.service_callback_tasks.service_callback_client.post',
+        side_effect=CallbackEndpointUnavailableException('some.service.gov.uk', 30.5)
+    )
+    mock_retry = mocker.patch('app.celery.service_callback_tasks.send_delivery_status_to_service.retry')
+    mock_apply_async = mocker.patch('app.celery.service_callback_tasks.send_delivery_status_to_service.apply_async')
+
+    send_delivery_status_to_service(notification.id, encrypted_status_update=encrypted_data)
+
+    assert mock_retry.call_count == 0
+    mock_apply_async.assert_called_once_with(
+        args=(notification.id,),
+        kwargs={'encrypted_status_update': encrypted_data, 'parked_since': 1641038400.0},
+        queue='service-callbacks-retry',
+        countdown=31,
+        retries=0,
+    )
+
+
+@freeze_time('2022-01-01 12:00:00')
+def test_send_delivery_status_to_service_drops_tasks_parked_for_too_long(notify_api, notify_db_session, mocker):
+    callback_api, template = _set_up_test_data('sms', "delivery_status")
+    notification = create_notification(template=template, status='delivered')
+    encrypted_data = _set_up_data_for_status_update(callback_api, notification)
+    mocker.patch(
+        'app.celery.service_callback_tasks.service_callback_client.post',
+        side_effect=CallbackEndpointUnavailableException('some.service.gov.uk', 30)
+    )
+    mock_apply_async = mocker.patch('app.celery.service_callback_tasks.send_delivery_status_to_service.apply_async')
+
+    with set_config(notify_api, 'SERVICE_CALLBACK_MAX_PARKED_SECONDS', 60):
+        send_delivery_status_to_service(
+            notification.id, encrypted_status_update=encrypted_data, parked_since=1641038400.0 - 61
+        )
+
+    assert mock_apply_async.call_count == 0
+
+
 def _set_up_test_data(notification_type, callback_type):
     service = create_service(restricted=True)
     template = create_template(service=service, template_type=notification_type, subject='Hello')
@@ -186,8 +282,8 @@ def _set_up_data_for_status_update(callback_api, notification):
             DATETIME_FORMAT) if notification.updated_at else None,
         "notification_sent_at": notification.sent_at.strftime(DATETIME_FORMAT) if notification.sent_at else None,
         "notification_type": notification.notification_type,
-        "service_callback_api_url": callback_api.url,
-        "service_callback_api_bearer_token": callback_api.bearer_token,
+        "service_id": str(callback_api.service_id),
+        "service_callback_api_version": callback_api.version,
         "template_id": str(notification.template_id),
         "template_version": notification.template_version,
     }
@@ -202,8 +298,8 @@ def _set_up_data_for_complaint(callback_api, complaint, notification):
         "reference": notification.client_reference,
         "to": notification.to,
         "complaint_date": complaint.complaint_date.strftime(DATETIME_FORMAT),
-        "service_callback_api_url": callback_api.url,
-        "service_callback_api_bearer_token": callback_api.bearer_token,
+        "service_id": str(callback_api.service_id),
+        "service_callback_api_version": callback_api.version,
     }
     obscured_status_update = encryption.encrypt(data)
     return obscured_status_update
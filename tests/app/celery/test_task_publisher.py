@@ -0,0 +1,175 @@
+import base64
+import json
+from contextlib import contextmanager
+from unittest.mock import Mock, call
+
+import pytest
+
+from app.celery.task_publisher import BatchedTaskPublisher
+
+
+@pytest.fixture
+def publisher(mocker):
+    publisher = BatchedTaskPublisher()
+    publisher.enabled = True
+    publisher.max_wait_seconds = 0.2
+    publisher.celery_app = Mock()
+    publisher.statsd_client = Mock()
+    publisher.logger = Mock()
+    mocker.patch.object(publisher, '_ensure_flusher_running')
+    return publisher
+
+
+def _producer_with_channel(celery_app, channel):
+    producer = Mock(channel=channel)
+
+    @contextmanager
+    def producer_or_acquire():
+        yield producer
+
+    celery_app.producer_or_acquire = producer_or_acquire
+    return producer
+
+
+class FakeSQSChannel:
+    sqs_base64_encoding = True
+
+    def __init__(self):
+        self.client = Mock()
+        self.client.send_message_batch.return_value = {'Successful': [], 'Failed': []}
+        self.sent_individually = []
+
+    def sqs(self, queue=None):
+        return self.client
+
+    def canonical_queue_name(self, queue):
+        return 'prefix-' + queue
+
+    def _new_queue(self, queue):
+        return 'https://sqs/prefix-' + queue
+
+    def _put(self, queue, message, **kwargs):
+        self.sent_individually.append((queue, message))
+
+
+def _fake_task(channel):
+    task = Mock()
+
+    def apply_async(args, queue, producer=None):
+        channel._put(queue, {'body': args[0], 'properties': {}})
+
+    task.apply_async.side_effect = apply_async
+    return task
+
+
+def test_publish_calls_apply_async_straight_away_when_disabled(publisher):
+    publisher.enabled = False
+    task = Mock()
+
+    publisher.publish(task, ['id'], queue='send-sms-tasks')
+
+    task.apply_async.assert_called_once_with(['id'], queue='send-sms-tasks')
+    assert publisher.buffered_count('send-sms-tasks') == 0
+
+
+def test_publish_buffers_messages_until_there_are_ten(publisher):
+    channel = FakeSQSChannel()
+    _producer_with_channel(publisher.celery_app, channel)
+    task = _fake_task(channel)
+
+    for i in range(9):
+        publisher.publish(task, [str(i)], queue='send-sms-tasks')
+
+    assert publisher.buffered_count('send-sms-tasks') == 9
+    assert not channel.client.send_message_batch.called
+
+    publisher.publish(task, ['9'], queue='send-sms-tasks')
+
+    assert publisher.buffered_count('send-sms-tasks') == 0
+    channel.client.send_message_batch.assert_called_once()
+    kwargs = channel.client.send_message_batch.call_args[1]
+    assert kwargs['QueueUrl'] == 'https://sqs/prefix-send-sms-tasks'
+    assert [entry['Id'] for entry in kwargs['Entries']] == [str(i) for i in range(10)]
+    assert [
+        json.loads(base64.b64decode(entry['MessageBody']))['body'] for entry in kwargs['Entries']
+    ] == [str(i) for i in range(10)]
+    assert channel.sent_individually == []
+
+
+def test_flush_sends_each_queue_separately(publisher):
+    channel = FakeSQSChannel()
+    _producer_with_channel(publisher.celery_app, channel)
+    task = _fake_task(channel)
+
+    publisher.publish(task, ['sms-1'], queue='send-sms-tasks')
+    publisher.publish(task, ['email-1'], queue='send-email-tasks')
+    publisher.publish(task, ['sms-2'], queue='send-sms-tasks')
+    publisher.flush()
+
+    assert [
+        args[1]['QueueUrl'] for args in channel.client.send_message_batch.call_args_list
+    ] == ['https://sqs/prefix-send-sms-tasks', 'https://sqs/prefix-send-email-tasks']
+    assert publisher.buffered_count('send-sms-tasks') == 0
+    assert publisher.buffered_count('send-email-tasks') == 0
+
+
+def test_flush_resends_messages_that_sqs_rejected(publisher):
+    channel = FakeSQSChannel()
+    channel.client.send_message_batch.return_value = {'Failed': [{'Id': '1', 'Message': 'oops'}]}
+    _producer_with_channel(publisher.celery_app, channel)
+    task = _fake_task(channel)
+
+    publisher.publish(task, ['0'], queue='send-sms-tasks')
+    publisher.publish(task, ['1'], queue='send-sms-tasks')
+    publisher.flush()
+
+    assert channel.sent_individually == [('send-sms-tasks', {'body': '1', 'properties': {}})]
+
+
+def test_flush_uses_the_shared_producer_if_broker_is_not_sqs(publisher):
+    producer = _producer_with_channel(publisher.celery_app, Mock(spec=[]))
+    task = Mock()
+
+    publisher.publish(task, ['1'], queue='send-sms-tasks')
+    publisher.publish(task, ['2'], queue='send-sms-tasks')
+    publisher.flush()
+
+    assert task.apply_async.call_args_list == [
+        call(['1'], queue='send-sms-tasks', producer=producer),
+        call(['2'], queue='send-sms-tasks', producer=producer),
+    ]
+
+
+def test_flush_falls_back_to_apply_async_if_batch_send_fails(publisher):
+    channel = FakeSQSChannel()
+    channel.client.send_message_batch.side_effect = Exception('SQS is down')
+    _producer_with_channel(publisher.celery_app, channel)
+    task = _fake_task(channel)
+
+    publisher.publish(task, ['1'], queue='send-sms-tasks')
+    publisher.flush()
+
+    assert task.apply_async.call_args_list[-1] == call(['1'], queue='send-sms-tasks')
+    assert channel.sent_individually == [('send-sms-tasks', {'body': '1', 'properties': {}})]
+    publisher.statsd_client.incr.assert_called_once_with('batch-publisher.send-sms-tasks.fallback')
+
+
+def test_flush_only_falls_back_for_messages_sqs_has_not_taken(publisher):
+    class UnavailableSQSChannel(FakeSQSChannel):
+        def _put(self, queue, message, **kwargs):
+            raise Exception('SQS is down')
+
+    channel = UnavailableSQSChannel()
+    channel.client.send_message_batch.return_value = {'Failed': [{'Id': '1', 'Message': 'oops'}]}
+    _producer_with_channel(publisher.celery_app, channel)
+    task = _fake_task(channel)
+
+    publisher.publish(task, ['0'], queue='send-sms-tasks')
+    publisher.publish(task, ['1'], queue='send-sms-tasks')
+    publisher.flush()
+
+    # the first message was accepted in the batch, so only the second is published again
+    assert task.apply_async.call_args_list[-1] == call(['1'], queue='send-sms-tasks')
+    assert [args for args in task.apply_async.call_args_list if 'producer' not in args[1]] == [
+        call(['1'], queue='send-sms-tasks')
+    ]
@@ -1,3 +1,4 @@
+import io
 import json
 import uuid
 from datetime import datetime, timedelta
@@ -7,7 +8,7 @@ import pytest
 import requests_mock
 from celery.exceptions import Retry
 from freezegun import freeze_time
-from notifications_utils.recipients import Row
+from notifications_utils.recipients import RecipientCSV, Row
 from notifications_utils.template import (
     LetterPrintTemplate,
     PlainTextEmailTemplate,
@@ -20,21 +21,30 @@ from app import encryption
 from app.celery import provider_tasks, tasks
 from app.celery.tasks import (
     get_recipient_csv_and_template_and_sender_id,
+    get_recipient_csv_rows_in_chunks,
     process_incomplete_job,
     process_incomplete_jobs,
     process_job,
+    process_job_shard,
     process_returned_letters_list,
     process_row,
     s3,
     save_api_email,
     save_api_sms,
     save_email,
+    save_email_batch,
     save_letter,
     save_sms,
+    save_sms_batch,
     send_inbound_sms_to_service,
 )
 from app.config import QueueNames
 from app.dao import jobs_dao, service_email_reply_to_dao, service_sms_sender_dao
+from app.dao.jobs_dao import (
+    dao_create_job_shards,
+    dao_finish_job_shard,
+    dao_get_job_shard,
+)
 from app.models import (
     EMAIL_TYPE,
     JOB_STATUS_ERROR,
@@ -67,7 +77,7 @@ from tests.app.db import (
     create_template,
     create_user,
 )
-from tests.conftest import set_config_values
+from tests.conftest import set_config, set_config_values
 
 
 class AnyStringWith(str):
@@ -133,6 +143,160 @@ def test_should_process_sms_job(sample_job, mocker):
     assert job.job_status == 'finished'
 
 
+def test_should_process_sms_job_streaming_the_file_from_s3(notify_api, sample_job, mocker):
+    mocker.patch(
+        'app.celery.tasks.s3.get_job_stream_and_metadata_from_s3',
+        return_value=(io.StringIO(load_example_csv('sms')), {'sender_id': None}),
+    )
+    mocker.patch('app.celery.tasks.save_sms.apply_async')
+    mocker.patch('app.encryption.encrypt', return_value="something_encrypted")
+    mocker.patch('app.celery.tasks.create_uuid', return_value="uuid")
+
+    with set_config(notify_api, 'JOB_CSV_STREAMING_ENABLED', True):
+        process_job(sample_job.id)
+
+    assert encryption.encrypt.call_args[0][0]['to'] == '+441234123123'
+    assert encryption.encrypt.call_args[0][0]['row_number'] == 0
+    tasks.save_sms.apply_async.assert_called_once()
+    assert jobs_dao.dao_get_job_by_id(sample_job.id).job_status == 'finished'
+
+
+def test_get_recipient_csv_rows_in_chunks_gives_the_same_rows_as_the_whole_file(
+    sample_email_template_with_placeholders,
+):
+    template = sample_email_template_with_placeholders._as_utils_template()
+    contents = (
+        '\n'
+        'email address,name\n'
+        'one@example.com,"Firstname\nLastname"\n'
+        'two@example.com, Two\n'
+        '\n'
+        ',,\n'
+        'not an email address,Three\n'
+        'four@example.com,Four\n'
+        '\n'
+    )
+
+    chunks = list(get_recipient_csv_rows_in_chunks(io.StringIO(contents), template, 3))
+
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    assert [
+        (row.index, row.recipient, dict(row.personalisation), row.has_error) for chunk in chunks for row in chunk
+    ] == [
+        (row.index, row.recipient, dict(row.personalisation), row.has_error)
+        for row in RecipientCSV(contents, template=template).get_rows()
+    ]
+
+
+def test_get_recipient_csv_rows_in_chunks_numbers_rows_after_blank_lines_like_the_whole_file(sample_email_template):
+    template = sample_email_template._as_utils_template()
+    contents = 'email address\none@example.com\n\n,\ntwo@example.com\nthree@example.com\n'
+
+    rows = [
+        row for chunk in get_recipient_csv_rows_in_chunks(io.StringIO(contents), template, 1, first_row=1, last_row=1)
+        for row in chunk
+    ]
+
+    assert [(row.index, row.recipient) for row in rows] == [
+        (row.index, row.recipient) for row in RecipientCSV(contents, template=template).get_rows() if row.index == 1
+    ] == [(1, 'two@example.com')]
+
+
+def test_get_recipient_csv_rows_in_chunks_copes_with_an_empty_file(sample_email_template):
+    assert list(get_recipient_csv_rows_in_chunks(io.StringIO(''), sample_email_template._as_utils_template(), 1)) == []
+
+
+def test_process_job_splits_large_jobs_into_shards(notify_api, sample_template, mocker):
+    job = create_job(template=sample_template, notification_count=10)
+    mock_process_job_shard = mocker.patch('app.celery.tasks.process_job_shard.apply_async')
+    mock_get_s3 = mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3')
+
+    with set_config_values(notify_api, {'JOB_SHARDING_ENABLED': True, 'JOB_SHARD_SIZE': 4}):
+        process_job(job.id)
+
+    assert mock_process_job_shard.call_args_list == [
+        call([str(job.id), shard_number], queue=QueueNames.JOBS) for shard_number in range(3)
+    ]
+    assert not mock_get_s3.called
+    assert [(shard.first_row, shard.last_row) for shard in job.shards.order_by('shard_number')] == [
+        (0, 3), (4, 7), (8, 9)
+    ]
+    assert job.job_status == JOB_STATUS_IN_PROGRESS
+
+
+def test_process_job_shard_only_processes_its_own_rows_that_have_not_been_done(sample_template, mocker):
+    mocker.patch(
+        'app.celery.tasks.s3.get_job_stream_and_metadata_from_s3',
+        return_value=(io.StringIO(load_example_csv('multiple_sms')), {'sender_id': None}),
+    )
+    mock_process_row = mocker.patch('app.celery.tasks.process_row')
+    job = create_job(template=sample_template, notification_count=10, job_status=JOB_STATUS_IN_PROGRESS)
+    dao_create_job_shards(job, 4)
+    # this row was done before the shard was interrupted
+    create_notification(job=job, job_row_number=5)
+
+    process_job_shard(str(job.id), 1)
+
+    assert [
+        (process_row_call.args[0].index, process_row_call.args[0].recipient)
+        for process_row_call in mock_process_row.call_args_list
+    ] == [(4, '+441234123125'), (6, '+441234123127'), (7, '+441234123128')]
+    assert dao_get_job_shard(job.id, 1).status == JOB_STATUS_FINISHED
+    assert job.job_status == JOB_STATUS_IN_PROGRESS
+
+
+def test_process_job_shard_completes_the_job_when_it_is_the_last_to_finish(sample_template, mocker):
+    mocker.patch(
+        'app.celery.tasks.s3.get_job_stream_and_metadata_from_s3',
+        return_value=(io.StringIO(load_example_csv('multiple_sms')), {'sender_id': None}),
+    )
+    mocker.patch('app.celery.tasks.process_row')
+    job = create_job(template=sample_template, notification_count=10, job_status=JOB_STATUS_IN_PROGRESS)
+    first_shard, _ = dao_create_job_shards(job, 5)
+    dao_finish_job_shard(first_shard)
+
+    process_job_shard(str(job.id), 1)
+
+    assert job.job_status == JOB_STATUS_FINISHED
+    assert job.processing_finished
+
+
+@pytest.mark.parametrize('job_status, shard_status', [
+    (JOB_STATUS_ERROR, 'pending'),
+    (JOB_STATUS_IN_PROGRESS, JOB_STATUS_FINISHED),
+])
+def test_process_job_shard_does_nothing_if_the_job_or_shard_is_not_in_progress(
+    sample_template, mocker, job_status, shard_status
+):
+    mock_get_s3 = mocker.patch('app.celery.tasks.s3.get_job_stream_and_metadata_from_s3')
+    job = create_job(template=sample_template, notification_count=10, job_status=job_status)
+    shard, _ = dao_create_job_shards(job, 5)
+    shard.status = shard_status
+
+    process_job_shard(str(job.id), 0)
+
+    assert not mock_get_s3.called
+
+
+@pytest.mark.parametrize('started_minutes_ago, expect_processed', [(29, False), (31, True)])
+def test_process_job_shard_only_takes_over_a_shard_in_progress_once_it_has_gone_stale(
+    sample_template, mocker, started_minutes_ago, expect_processed
+):
+    mocker.patch(
+        'app.celery.tasks.s3.get_job_stream_and_metadata_from_s3',
+        return_value=(io.StringIO(load_example_csv('multiple_sms')), {'sender_id': None}),
+    )
+    mock_process_row = mocker.patch('app.celery.tasks.process_row')
+    job = create_job(template=sample_template, notification_count=10, job_status=JOB_STATUS_IN_PROGRESS)
+    shard, _ = dao_create_job_shards(job, 5)
+    shard.status = JOB_STATUS_IN_PROGRESS
+    shard.processing_started = datetime.utcnow() - timedelta(minutes=started_minutes_ago)
+
+    process_job_shard(str(job.id), 0)
+
+    assert mock_process_row.called is expect_processed
+
+
 def test_should_process_sms_job_with_sender_id(sample_job, mocker, fake_uuid):
     mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3',
                  return_value=(load_example_csv('sms'), {'sender_id': fake_uuid}))
@@ -360,6 +524,145 @@ def test_should_process_all_sms_job(sample_job_with_placeholdered_template,
     assert job.job_status == 'finished'
 
 
+def test_should_process_sms_job_in_batches(notify_api, sample_job_with_placeholdered_template, mocker):
+    job = sample_job_with_placeholdered_template
+    mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3',
+                 return_value=(load_example_csv('multiple_sms'), {"sender_id": None}))
+    mocker.patch('app.celery.tasks.save_sms.apply_async')
+    mocker.patch('app.celery.tasks.save_sms_batch.apply_async')
+    mocker.patch('app.encryption.encrypt', return_value="something_encrypted")
+
+    with set_config_values(notify_api, {
+        'JOB_BATCH_PROCESSING_ENABLED': True,
+        'JOB_PROCESSING_BATCH_SIZE': 4,
+    }):
+        process_job(job.id)
+
+    assert not tasks.save_sms.apply_async.called
+    assert tasks.save_sms_batch.apply_async.call_args_list == [
+        call((str(job.service_id), "something_encrypted"), {}, queue="database-tasks"),
+    ] * 3
+    batches = [args[0][0] for args in encryption.encrypt.call_args_list]
+    assert [len(batch['notifications']) for batch in batches] == [4, 4, 2]
+    assert batches[0]['template'] == str(job.template.id)
+    assert batches[0]['template_version'] == job.template.version
+    assert batches[0]['job'] == str(job.id)
+    assert batches[0]['notifications'][0]['to'] == '+441234123121'
+    assert batches[0]['notifications'][0]['row_number'] == 0
+    assert batches[0]['notifications'][0]['personalisation'] == {'phonenumber': '+441234123121', 'name': 'chris'}
+    assert [row['row_number'] for batch in batches for row in batch['notifications']] == list(range(10))
+    assert jobs_dao.dao_get_job_by_id(job.id).job_status == 'finished'
+
+
+def test_should_process_email_job_in_batches_with_sender_id(
+    notify_api, email_job_with_placeholders, mocker, fake_uuid
+):
+    mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3',
+                 return_value=(load_example_csv('email'), {"sender_id": fake_uuid}))
+    mocker.patch('app.celery.tasks.save_email_batch.apply_async')
+    mocker.patch('app.encryption.encrypt', return_value="something_encrypted")
+
+    with set_config(notify_api, 'JOB_BATCH_PROCESSING_ENABLED', True):
+        process_job(email_job_with_placeholders.id)
+
+    tasks.save_email_batch.apply_async.assert_called_once_with(
+        (str(email_job_with_placeholders.service_id), "something_encrypted"),
+        {'sender_id': fake_uuid},
+        queue="database-tasks"
+    )
+
+
+def _notification_batch_json(template, rows, job_id):
+    return {
+        "template": str(template.id),
+        "template_version": template.version,
+        "job": str(job_id),
+        "notifications": [
+            {"id": str(uuid.uuid4()), "to": to, "row_number": row_number, "personalisation": {}}
+            for row_number, to in enumerate(rows)
+        ],
+    }
+
+
+def test_save_sms_batch_persists_all_notifications_and_queues_delivery(sample_job, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    batch = _notification_batch_json(sample_job.template, ['+447234123123', '+447234123124'], sample_job.id)
+
+    save_sms_batch(sample_job.service_id, encryption.encrypt(batch))
+
+    notifications = Notification.query.order_by(Notification.job_row_number).all()
+    assert [str(n.id) for n in notifications] == [row['id'] for row in batch['notifications']]
+    assert [n.normalised_to for n in notifications] == ['+447234123123', '+447234123124']
+    assert all(n.job_id == sample_job.id for n in notifications)
+    assert all(n.status == NOTIFICATION_CREATED for n in notifications)
+    assert all(n.key_type == KEY_TYPE_NORMAL for n in notifications)
+    assert all(n.billable_units == 0 for n in notifications)
+    assert provider_tasks.deliver_sms.apply_async.call_args_list == [
+        call([row['id']], queue="send-sms-tasks") for row in batch['notifications']
+    ]
+
+
+def test_save_email_batch_persists_all_notifications_and_queues_delivery(sample_email_template, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_email.apply_async')
+    job = create_job(template=sample_email_template)
+    batch = _notification_batch_json(sample_email_template, ['one@example.com', 'TWO@example.com'], job.id)
+
+    save_email_batch(job.service_id, encryption.encrypt(batch))
+
+    notifications = Notification.query.order_by(Notification.job_row_number).all()
+    assert [n.normalised_to for n in notifications] == ['one@example.com', 'two@example.com']
+    assert provider_tasks.deliver_email.apply_async.call_count == 2
+
+
+def test_save_sms_batch_queues_batch_delivery_tasks_when_delivery_batch_size_is_set(
+    notify_api, sample_job, mocker
+):
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    mocker.patch('app.celery.provider_tasks.deliver_sms_batch.apply_async')
+    batch = _notification_batch_json(
+        sample_job.template, ['+447234123123', '+447234123124', '+447234123125'], sample_job.id
+    )
+
+    with set_config(notify_api, 'DELIVERY_BATCH_SIZE', 2):
+        save_sms_batch(sample_job.service_id, encryption.encrypt(batch))
+
+    ids = [row['id'] for row in batch['notifications']]
+    assert provider_tasks.deliver_sms_batch.apply_async.call_args_list == [
+        call([ids[:2]], queue="send-sms-tasks"),
+        call([ids[2:]], queue="send-sms-tasks"),
+    ]
+    assert not provider_tasks.deliver_sms.apply_async.called
+
+
+def test_save_sms_batch_skips_notifications_that_already_exist(sample_job, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    batch = _notification_batch_json(sample_job.template, ['+447234123123', '+447234123124'], sample_job.id)
+    create_notification(job=sample_job, job_row_number=0)
+
+    save_sms_batch(sample_job.service_id, encryption.encrypt(batch))
+
+    assert Notification.query.count() == 2
+    provider_tasks.deliver_sms.apply_async.assert_called_once_with(
+        [batch['notifications'][1]['id']], queue="send-sms-tasks"
+    )
+
+
+def test_save_sms_batch_should_go_to_retry_queue_if_database_errors(sample_job, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    mocker.patch(
+        'app.notifications.process_notifications.dao_bulk_create_notifications',
+        side_effect=SQLAlchemyError()
+    )
+    mocker.patch('app.celery.tasks.save_sms_batch.retry', side_effect=Retry)
+    batch = _notification_batch_json(sample_job.template, ['+447234123123'], sample_job.id)
+
+    with pytest.raises(Retry):
+        save_sms_batch(sample_job.service_id, encryption.encrypt(batch))
+
+    tasks.save_sms_batch.retry.assert_called_with(queue="retry-tasks")
+    assert not provider_tasks.deliver_sms.apply_async.called
+
+
 # -------------- process_row tests -------------- #
 
 
@@ -371,6 +674,7 @@ def test_should_process_all_sms_job(sample_job_with_placeholdered_template,
     (LETTER_TYPE, False, 'save_letter', 'database-tasks'),
     (LETTER_TYPE, True, 'save_letter', 'research-mode-tasks'),
 ])
+@freeze_time('2021-06-05 12:00:00')
 def test_process_row_sends_letter_task(template_type, research_mode, expected_function, expected_queue, mocker):
     mocker.patch('app.celery.tasks.create_uuid', return_value='noti_uuid')
     task_mock = mocker.patch('app.celery.tasks.{}.apply_async'.format(expected_function))
@@ -400,7 +704,8 @@ def test_process_row_sends_letter_task(template_type, research_mode, expected_fu
         'job': 'job_id',
         'to': 'recip',
         'row_number': 'row_num',
-        'personalisation': {'foo': 'bar'}
+        'personalisation': {'foo': 'bar'},
+        'created_at': '2021-06-05T12:00:00.000000Z',
     })
     task_mock.assert_called_once_with(
         (
@@ -538,6 +843,16 @@ def test_should_save_sms_if_restricted_service_and_valid_number(notify_db_sessio
     )
 
 
+def test_save_sms_uses_the_created_at_time_from_when_the_row_was_processed(sample_template, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    notification = _notification_json(sample_template, "+447700900890")
+    notification['created_at'] = '2021-06-05T12:00:00.000000Z'
+
+    save_sms(sample_template.service_id, uuid.uuid4(), encryption.encrypt(notification))
+
+    assert Notification.query.one().created_at == datetime(2021, 6, 5, 12, 0)
+
+
 def test_save_email_should_save_default_email_reply_to_text_on_notification(notify_db_session, mocker):
     service = create_service()
     create_reply_to_email(service=service, email_address='reply_to@digital.gov.uk', is_default=True)
@@ -1574,6 +1889,33 @@ def test_process_incomplete_job_sms(mocker, sample_template):
     assert save_sms.call_count == 8  # There are 10 in the file and we've added two already
 
 
+def test_process_incomplete_job_runs_unfinished_shards_again(mocker, sample_template):
+    mock_process_job_shard = mocker.patch('app.celery.tasks.process_job_shard.apply_async')
+    job = create_job(template=sample_template, notification_count=10, job_status=JOB_STATUS_IN_PROGRESS)
+    first_shard, _, _ = dao_create_job_shards(job, 4)
+    dao_finish_job_shard(first_shard)
+
+    process_incomplete_job(str(job.id))
+
+    assert mock_process_job_shard.call_args_list == [
+        call([str(job.id), 1], queue=QueueNames.JOBS),
+        call([str(job.id), 2], queue=QueueNames.JOBS),
+    ]
+    assert job.job_status == JOB_STATUS_IN_PROGRESS
+
+
+def test_process_incomplete_job_completes_the_job_if_all_its_shards_finished(mocker, sample_template):
+    mock_process_job_shard = mocker.patch('app.celery.tasks.process_job_shard.apply_async')
+    job = create_job(template=sample_template, notification_count=10, job_status=JOB_STATUS_IN_PROGRESS)
+    for shard in dao_create_job_shards(job, 5):
+        dao_finish_job_shard(shard)
+
+    process_incomplete_job(str(job.id))
+
+    assert not mock_process_job_shard.called
+    assert job.job_status == JOB_STATUS_FINISHED
+
+
 def test_process_incomplete_job_with_notifications_all_sent(mocker, sample_template):
 
     mocker.patch('app.celery.tasks.s3.get_job_and_metadata_from_s3',
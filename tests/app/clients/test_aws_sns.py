@@ -1,6 +1,7 @@
 import pytest
 
 from app import aws_sns_client
+from app.clients.sms.aws_sns import get_sns_delivery_status
 
 
 def test_send_sms_successful_returns_aws_sns_response(notify_api, mocker):
@@ -24,4 +25,47 @@ def test_send_sms_returns_raises_error_if_there_is_no_valid_number_is_found(noti
     content = reference = 'foo'
     with pytest.raises(ValueError) as excinfo:
         aws_sns_client.send_sms(to, content, reference)
-    assert 'No valid numbers found for SMS delivery' in str(excinfo.value)
\ No newline at end of file
+    assert 'No valid numbers found for SMS delivery' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('to, sender, expected', [
+    ('+12025550100', None, '+18885550100'),
+    ('+12025550100', '+12025550199', '+18885550100'),
+    ('+447700900100', '+12025550199', '+12025550199'),
+    ('+447700900100', 'Notify', None),
+    ('', None, None),
+])
+def test_get_origination_number(notify_api, mocker, to, sender, expected):
+    mocker.patch.dict(notify_api.config, {'AWS_US_TOLL_FREE_NUMBER': '+18885550100'})
+    mocker.patch.object(aws_sns_client, 'current_app', notify_api, create=True)
+
+    assert aws_sns_client.get_origination_number(to, sender) == expected
+
+
+@pytest.mark.parametrize('status, provider_response, expected', [
+    ('SUCCESS', 'Message has been accepted by phone carrier', 'delivered'),
+    ('FAILURE', 'Invalid phone number', 'permanent-failure'),
+    ('FAILURE', 'Phone number is opted out', 'permanent-failure'),
+    ('FAILURE', 'This delivery would exceed max price', 'technical-failure'),
+    ('FAILURE', 'Phone is currently unreachable/unavailable', 'temporary-failure'),
+    ('FAILURE', None, 'temporary-failure'),
+])
+def test_get_sns_delivery_status(status, provider_response, expected):
+    assert get_sns_delivery_status(status, provider_response) == expected
+
+
+def test_get_delivery_status_events_reads_every_page_from_the_log_groups_region(notify_api, mocker):
+    boto_client = mocker.patch('app.clients.sms.aws_sns.boto3.client')
+    boto_client.return_value.get_paginator.return_value.paginate.return_value = [
+        {'events': [{'message': 'one'}, {'message': 'two'}]},
+        {'events': [{'message': 'three'}]},
+    ]
+    mocker.patch.object(aws_sns_client, '_logs_clients', {})
+
+    events = list(aws_sns_client.get_delivery_status_events('sns/us-west-2/123456789012/DirectPublishToPhoneNumber', 5))
+
+    assert [event['message'] for event in events] == ['one', 'two', 'three']
+    boto_client.assert_called_once_with('logs', region_name='us-west-2')
+    boto_client.return_value.get_paginator.return_value.paginate.assert_called_once_with(
+        logGroupName='sns/us-west-2/123456789012/DirectPublishToPhoneNumber', startTime=5
+    )
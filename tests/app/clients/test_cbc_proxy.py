@@ -1,4 +1,5 @@
 import json
+import threading
 import uuid
 from collections import namedtuple
 from datetime import datetime
@@ -18,6 +19,7 @@ from app.clients.cbc_proxy import (
     CBCProxyVodafone,
 )
 from app.utils import DATETIME_FORMAT
+from tests.conftest import set_config
 
 EXAMPLE_AREAS = [{
     'description': 'london',
@@ -426,6 +428,61 @@ def test_cbc_proxy_will_failover_to_second_lambda_if_function_error(
     ]
 
 
+def _create_and_send_broadcast(cbc_proxy):
+    cbc_proxy.create_and_send_broadcast(
+        identifier='my-identifier',
+        message_number='0000007b',
+        headline='my-headline',
+        description='test-description',
+        areas=EXAMPLE_AREAS,
+        sent='a-passed-through-sent-value',
+        expires='a-passed-through-expires-value',
+        channel="severe",
+    )
+
+
+def test_cbc_proxy_hedging_calls_failover_lambda_if_primary_is_slow(mocker, notify_api, cbc_proxy_ee):
+    ld_client_mock = mocker.patch.object(cbc_proxy_ee, '_lambda_client', create=True)
+    primary_can_finish = threading.Event()
+
+    def invoke(FunctionName, **kwargs):
+        if FunctionName == 'ee-1-proxy':
+            primary_can_finish.wait(timeout=5)
+        return {'StatusCode': 200}
+
+    ld_client_mock.invoke.side_effect = invoke
+
+    with set_config(notify_api, 'CBC_PROXY_HEDGING_DEADLINE_SECONDS', 0.01):
+        _create_and_send_broadcast(cbc_proxy_ee)
+    primary_can_finish.set()
+
+    assert [c[1]['FunctionName'] for c in ld_client_mock.invoke.call_args_list] == ['ee-1-proxy', 'ee-2-proxy']
+
+
+def test_cbc_proxy_hedging_does_not_call_failover_lambda_if_primary_succeeds_in_time(
+    mocker, notify_api, cbc_proxy_ee
+):
+    ld_client_mock = mocker.patch.object(cbc_proxy_ee, '_lambda_client', create=True)
+    ld_client_mock.invoke.return_value = {'StatusCode': 200}
+
+    with set_config(notify_api, 'CBC_PROXY_HEDGING_DEADLINE_SECONDS', 5):
+        _create_and_send_broadcast(cbc_proxy_ee)
+
+    assert [c[1]['FunctionName'] for c in ld_client_mock.invoke.call_args_list] == ['ee-1-proxy']
+
+
+def test_cbc_proxy_hedging_raises_if_both_lambdas_fail(mocker, notify_api, cbc_proxy_ee):
+    ld_client_mock = mocker.patch.object(cbc_proxy_ee, '_lambda_client', create=True)
+    ld_client_mock.invoke.side_effect = BotoClientError({}, 'error')
+
+    with set_config(notify_api, 'CBC_PROXY_HEDGING_DEADLINE_SECONDS', 5):
+        with pytest.raises(CBCProxyRetryableException) as e:
+            _create_and_send_broadcast(cbc_proxy_ee)
+
+    assert e.match('Lambda failed for both ee-1-proxy and ee-2-proxy')
+    assert ld_client_mock.invoke.call_count == 2
+
+
 @pytest.mark.parametrize('cbc', ['ee', 'vodafone', 'three', 'o2'])
 def test_cbc_proxy_will_failover_to_second_lambda_if_invoke_error(
     mocker,
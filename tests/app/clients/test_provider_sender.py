@@ -0,0 +1,68 @@
+import threading
+from unittest.mock import Mock
+
+import pytest
+from flask import current_app
+
+from app.clients.provider_sender import (
+    ProviderSender,
+    ProviderSenderBusyException,
+)
+
+
+@pytest.fixture
+def sender(notify_api):
+    sender = ProviderSender()
+    sender.init_app(notify_api, Mock())
+    sender.enabled = True
+    sender.max_in_flight = {'sns': 2}
+    sender.queue_timeout_seconds = 0.1
+    return sender
+
+
+def test_send_calls_provider_directly_when_disabled(sender):
+    sender.enabled = False
+    send_fn = Mock(return_value='reference')
+
+    assert sender.send('sns', send_fn, 'to', content='hello') == 'reference'
+
+    send_fn.assert_called_once_with('to', content='hello')
+    assert not sender.statsd_client.timing.called
+
+
+def test_send_runs_on_the_pool_with_an_app_context(sender):
+    assert sender.send('sns', lambda: (current_app.name, threading.current_thread().name)) == (
+        sender.app.name, 'provider-sender_0'
+    )
+    sender.statsd_client.timing.assert_called_once()
+    assert sender.statsd_client.timing.call_args[0][0] == 'provider-sender.sns.queue-time'
+    assert sender.in_flight('sns') == 0
+
+
+def test_submit_lets_several_requests_run_at_once(sender):
+    both_running = threading.Barrier(2, timeout=1)
+
+    futures = [sender.submit('sns', both_running.wait) for _ in range(2)]
+
+    assert sorted(future.result() for future in futures) == [0, 1]
+
+
+def test_submit_raises_if_provider_stays_at_its_limit(sender):
+    release = threading.Event()
+    futures = [sender.submit('sns', release.wait) for _ in range(2)]
+
+    with pytest.raises(ProviderSenderBusyException):
+        sender.submit('sns', Mock())
+
+    sender.statsd_client.incr.assert_called_once_with('provider-sender.sns.busy')
+    release.set()
+    for future in futures:
+        future.result()
+
+
+def test_exceptions_are_raised_from_the_future_and_free_the_slot(sender):
+    with pytest.raises(ValueError):
+        sender.send('sns', Mock(side_effect=ValueError()))
+
+    assert sender.in_flight('sns') == 0
+    sender.statsd_client.gauge.assert_called_with('provider-sender.sns.in-flight', 0)
@@ -0,0 +1,120 @@
+from unittest.mock import Mock
+
+import pytest
+from freezegun import freeze_time
+
+from app.clients.send_rate_governor import (
+    SendRateExceededException,
+    SendRateGovernor,
+)
+
+
+@pytest.fixture
+def mock_sleep(mocker):
+    return mocker.patch('app.clients.send_rate_governor.sleep')
+
+
+@pytest.fixture
+def governor(notify_api, mock_sleep):
+    governor = SendRateGovernor()
+    governor.init_app(notify_api, Mock(active=False), Mock())
+    governor.enabled = True
+    governor.rates = {'ses': 2, 'sns': 10, 'sns:origination-number': 1}
+    governor.max_wait_seconds = 1
+    governor.local_fallback_processes = 1
+    governor.logger = Mock()
+    return governor
+
+
+@pytest.mark.parametrize('bucket, expected_rate', [
+    ('ses', 2),
+    ('sns', 10),
+    ('sns:+15555550100', 1),
+    ('unknown', None),
+])
+def test_rate_for(governor, bucket, expected_rate):
+    assert governor.rate_for(bucket) == expected_rate
+
+
+def test_acquire_does_nothing_when_disabled(governor):
+    governor.enabled = False
+
+    governor.acquire('ses')
+
+    assert not governor.statsd_client.gauge.called
+
+
+@freeze_time('2021-01-01 12:00:00')
+def test_acquire_waits_once_the_local_bucket_is_empty(governor, mock_sleep):
+    governor.acquire('ses')
+    governor.acquire('ses')
+    assert not mock_sleep.called
+
+    governor.acquire('ses')
+    mock_sleep.assert_called_once_with(0.5)
+    governor.statsd_client.timing.assert_called_with('send-rate.ses.wait-time', 0.5)
+    governor.statsd_client.gauge.assert_called_with('send-rate.ses.tokens', -1)
+
+
+@freeze_time('2021-01-01 12:00:00')
+def test_acquire_raises_rather_than_wait_too_long(governor):
+    for _ in range(4):
+        governor.acquire('ses')
+
+    with pytest.raises(SendRateExceededException) as e:
+        governor.acquire('ses')
+
+    assert e.value.wait == 1.5
+    governor.statsd_client.incr.assert_called_once_with('send-rate.ses.exceeded')
+
+
+def test_local_bucket_refills_over_time(governor):
+    with freeze_time('2021-01-01 12:00:00') as frozen_time:
+        for _ in range(3):
+            governor.acquire('ses')
+        frozen_time.tick(1)
+        governor.acquire('ses')
+
+    assert governor._local_buckets['ses'][0] == 0
+
+
+def test_acquire_takes_tokens_from_redis(governor, mock_sleep):
+    governor.redis_store.active = True
+    script = governor.redis_store.redis_store.register_script.return_value
+    script.return_value = [b'0.5', b'0.25']
+
+    governor.acquire('sns:+15555550100')
+
+    assert script.call_args[1]['keys'] == ['send-rate-sns:+15555550100']
+    assert script.call_args[1]['args'][:2] == [1, 1]
+    mock_sleep.assert_called_once_with(0.25)
+    governor.statsd_client.gauge.assert_called_once_with('send-rate.sns:+15555550100.tokens', 0.5)
+
+
+def test_acquire_falls_back_to_a_local_bucket_if_redis_errors(governor):
+    governor.redis_store.active = True
+    governor.redis_store.redis_store.register_script.return_value.side_effect = Exception('redis is down')
+    governor.local_fallback_processes = 2
+
+    governor.acquire('sns')
+
+    governor.statsd_client.incr.assert_called_once_with('send-rate.sns.local-fallback')
+    assert governor._local_buckets['sns'][0] == 4
+
+
+@freeze_time('2021-01-01 12:00:00')
+def test_release_gives_a_token_back_to_the_local_bucket(governor):
+    governor.acquire('ses')
+
+    governor.release('ses')
+
+    assert governor._local_buckets['ses'][0] == 2
+
+
+def test_release_gives_a_token_back_in_redis(governor):
+    governor.redis_store.active = True
+    script = governor.redis_store.redis_store.register_script.return_value
+
+    governor.release('sns')
+
+    assert script.call_args[1]['keys'] == ['send-rate-sns']
@@ -0,0 +1,110 @@
+from unittest.mock import Mock
+
+import pytest
+import requests_mock
+from freezegun import freeze_time
+from requests import ConnectionError
+
+from app.clients.service_callback import (
+    CallbackEndpointUnavailableException,
+    ServiceCallbackClient,
+)
+
+
+@pytest.fixture
+def client(notify_api):
+    client = ServiceCallbackClient()
+    client.init_app(notify_api, Mock())
+    client.circuit_breaker_enabled = True
+    client.circuit_breaker_failures = 2
+    client.circuit_breaker_reset_seconds = 60
+    return client
+
+
+def test_post_sends_json_with_the_bearer_token(client):
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post('https://example.com/callback', status_code=200)
+        response = client.post('https://example.com/callback', {'id': '1'}, 'my-token')
+
+    assert response.status_code == 200
+    assert request_mock.request_history[0].json() == {'id': '1'}
+    assert request_mock.request_history[0].headers['Authorization'] == 'Bearer my-token'
+    client.statsd_client.timing.assert_called_once()
+
+
+def test_post_reuses_one_session_per_host(client):
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post(requests_mock.ANY, status_code=200)
+        client.post('https://example.com/one', {}, 'token')
+        client.post('https://example.com/two', {}, 'token')
+        client.post('https://other.example.com/one', {}, 'token')
+
+    assert len(client._sessions) == 2
+    assert client._session('https://example.com/three') is client._session('https://example.com/one')
+
+
+def test_post_opens_the_circuit_breaker_after_failures_in_a_row(client):
+    with freeze_time('2022-01-01 12:00:00') as frozen_time, requests_mock.Mocker() as request_mock:
+        request_mock.post('https://example.com/callback', status_code=500)
+        client.post('https://example.com/callback', {}, 'token')
+        request_mock.post('https://example.com/callback', exc=ConnectionError)
+        with pytest.raises(ConnectionError):
+            client.post('https://example.com/callback', {}, 'token')
+
+        with pytest.raises(CallbackEndpointUnavailableException) as e:
+            client.post('https://example.com/callback', {}, 'token')
+        assert e.value.retry_after_seconds == 60
+        assert request_mock.call_count == 2
+
+        # other hosts aren't affected
+        request_mock.post('https://other.example.com/callback', status_code=200)
+        client.post('https://other.example.com/callback', {}, 'token')
+
+        frozen_time.tick(61)
+        request_mock.post('https://example.com/callback', status_code=200)
+        client.post('https://example.com/callback', {}, 'token')
+        assert client.seconds_until_closed('example.com') == 0
+
+
+def test_post_lets_one_request_through_once_the_circuit_breaker_has_reset(client):
+    with freeze_time('2022-01-01 12:00:00') as frozen_time, requests_mock.Mocker() as request_mock:
+        request_mock.post('https://example.com/callback', status_code=500)
+        client.post('https://example.com/callback', {}, 'token')
+        client.post('https://example.com/callback', {}, 'token')
+
+        frozen_time.tick(61)
+        # the probe request counts as the one let through even though it doesn't come back in time for the next post
+        client._seconds_until_request_allowed('example.com')
+        with pytest.raises(CallbackEndpointUnavailableException) as e:
+            client.post('https://example.com/callback', {}, 'token')
+        assert e.value.retry_after_seconds == 60
+        client._record_outcome('example.com', '500')
+
+        with pytest.raises(CallbackEndpointUnavailableException):
+            client.post('https://example.com/callback', {}, 'token')
+
+        frozen_time.tick(61)
+        client.post('https://example.com/callback', {}, 'token')
+        with pytest.raises(CallbackEndpointUnavailableException):
+            client.post('https://example.com/callback', {}, 'token')
+
+    assert request_mock.call_count == 3
+
+
+def test_post_does_not_count_client_errors_as_failures(client):
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post('https://example.com/callback', status_code=400)
+        for _ in range(3):
+            client.post('https://example.com/callback', {}, 'token')
+
+    assert client.seconds_until_closed('example.com') == 0
+
+
+def test_post_never_opens_the_circuit_breaker_when_it_is_disabled(client):
+    client.circuit_breaker_enabled = False
+    with requests_mock.Mocker() as request_mock:
+        request_mock.post('https://example.com/callback', status_code=503)
+        for _ in range(3):
+            client.post('https://example.com/callback', {}, 'token')
+
+    assert request_mock.call_count == 3
@@ -8,6 +8,7 @@ from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 
 from app.dao.notifications_dao import (
+    dao_bulk_create_notifications,
     dao_create_notification,
     dao_delete_notifications_by_id,
     dao_get_last_notification_added_for_job_id,
@@ -17,13 +18,19 @@ from app.dao.notifications_dao import (
     dao_get_notification_count_for_job_id,
     dao_get_notification_or_history_by_reference,
     dao_get_notifications_by_recipient_or_reference,
+    dao_get_notifications_or_history_by_references,
     dao_timeout_notifications,
     dao_update_notification,
+    dao_update_notification_statuses_by_reference,
     dao_update_notifications_by_reference,
+    dao_update_notifications_to_sending,
     get_notification_by_id,
     get_notification_with_personalisation,
+    get_notifications_by_ids,
     get_notifications_for_job,
     get_notifications_for_service,
+    get_notifications_for_service_after,
+    get_service_ids_with_notifications_changed_since,
     get_service_ids_with_notifications_on_date,
     is_delivery_slow_for_providers,
     notifications_not_yet_sent,
@@ -55,6 +62,7 @@ from tests.app.db import (
     create_service,
     create_template,
 )
+from tests.conftest import set_config
 
 
 @pytest.mark.skip(reason="Needs updating for TTS: Failing for unknown reason")
@@ -315,6 +323,38 @@ def test_save_notification_creates_sms(sample_template, sample_job):
     assert notification_from_db.status == 'created'
 
 
+def test_dao_bulk_create_notifications_inserts_all_notifications(sample_template, sample_job):
+    notifications = [
+        Notification(**_notification_json(sample_template, job_id=sample_job.id, id=uuid.uuid4()))
+        for _ in range(3)
+    ]
+
+    inserted_ids = dao_bulk_create_notifications(notifications)
+
+    assert inserted_ids == {str(notification.id) for notification in notifications}
+    assert Notification.query.count() == 3
+    for notification_from_db in Notification.query.all():
+        assert notification_from_db.status == 'created'
+        assert notification_from_db.international is False
+        assert notification_from_db.job_id == sample_job.id
+
+
+def test_dao_bulk_create_notifications_skips_existing_notifications(sample_template):
+    existing = create_notification(sample_template, status='sending')
+    new = Notification(**_notification_json(sample_template, id=uuid.uuid4()))
+    duplicate = Notification(**_notification_json(sample_template, id=existing.id))
+
+    inserted_ids = dao_bulk_create_notifications([duplicate, new])
+
+    assert inserted_ids == {str(new.id)}
+    assert Notification.query.count() == 2
+    assert Notification.query.get(existing.id).status == 'sending'
+
+
+def test_dao_bulk_create_notifications_with_no_notifications(notify_db_session):
+    assert dao_bulk_create_notifications([]) == set()
+
+
 def test_save_notification_and_create_email(sample_email_template, sample_job):
     assert Notification.query.count() == 0
 
@@ -749,6 +789,34 @@ def test_should_not_count_pages_when_given_a_flag(sample_user, sample_template):
     assert pagination.items[0].id == notification.id
 
 
+def test_get_notifications_for_service_after_pages_through_notifications_created_at_the_same_time(sample_template):
+    created_at = datetime(2016, 1, 1, 12, 0)
+    notifications = sorted(
+        (create_notification(sample_template, created_at=created_at) for _ in range(3)),
+        key=lambda notification: notification.id,
+        reverse=True,
+    )
+
+    first_page, after = get_notifications_for_service_after(sample_template.service_id, page_size=2)
+    assert first_page == notifications[:2]
+    assert after == (created_at, notifications[1].id)
+
+    second_page, after = get_notifications_for_service_after(sample_template.service_id, after=after, page_size=2)
+    assert second_page == notifications[2:]
+    assert after is None
+
+
+def test_get_notifications_for_service_after_older_than(sample_template):
+    older = create_notification(sample_template, created_at=datetime(2016, 1, 1))
+    newer = create_notification(sample_template, created_at=datetime(2016, 1, 2))
+    other_service_notification = create_notification(create_template(create_service(service_name='other')))
+
+    assert get_notifications_for_service_after(sample_template.service_id, older_than=newer.id) == ([older], None)
+    assert get_notifications_for_service_after(
+        sample_template.service_id, older_than=other_service_notification.id
+    ) == ([], None)
+
+
 def test_get_notifications_created_by_api_or_csv_are_returned_correctly_excluding_test_key_notifications(
         notify_db_session,
         sample_service,
@@ -1097,6 +1165,41 @@ def test_dao_get_notifications_by_recipient_matches_partial_emails(sample_email_
     assert notification_2.id not in notification_ids
 
 
+@pytest.mark.parametrize('exact_match_enabled, expected_recipients', [
+    (False, {'jack@gmail.com', 'ajack@gmail.com'}),
+    (True, {'jack@gmail.com'}),
+])
+def test_dao_get_notifications_by_recipient_only_matches_whole_email_addresses_exactly_when_enabled(
+    notify_api, sample_email_template, exact_match_enabled, expected_recipients
+):
+    for email_address in ('jack@gmail.com', 'ajack@gmail.com', 'jill@gmail.com'):
+        create_notification(template=sample_email_template, to_field=email_address, normalised_to=email_address)
+
+    with set_config(notify_api, 'NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED', exact_match_enabled):
+        results = dao_get_notifications_by_recipient_or_reference(
+            sample_email_template.service_id, 'Jack@gmail.com', notification_type='email'
+        )
+
+    assert {notification.normalised_to for notification in results.items} == expected_recipients
+
+
+def test_dao_get_notifications_by_recipient_exact_match_finds_phone_numbers_and_references(
+    notify_api, sample_template
+):
+    by_recipient = create_notification(sample_template, to_field='+447700900855', normalised_to='447700900855')
+    by_reference = create_notification(
+        sample_template, to_field='+447700900111', normalised_to='447700900111', client_reference='07700 900855'
+    )
+    create_notification(sample_template, to_field='+447700900112', normalised_to='447700900112')
+
+    with set_config(notify_api, 'NOTIFICATION_SEARCH_EXACT_MATCH_ENABLED', True):
+        results = dao_get_notifications_by_recipient_or_reference(
+            sample_template.service_id, '07700 900855', notification_type='sms'
+        )
+
+    assert {notification.id for notification in results.items} == {by_recipient.id, by_reference.id}
+
+
 @pytest.mark.parametrize('search_term, expected_result_count', [
     ('foobar', 1),
     ('foo', 2),
@@ -1587,6 +1690,49 @@ def test_dao_update_notifications_by_reference_updates_history_when_one_of_two_n
     assert NotificationHistory.query.get(notification1.id).status == 'returned-letter'
 
 
+def test_dao_update_notification_statuses_by_reference_updates_each_notification(sample_email_template):
+    delivered = create_notification(template=sample_email_template, reference='ref1', status='sending')
+    failed = create_notification(template=sample_email_template, reference='ref2', status='pending')
+    history = create_notification_history(template=sample_email_template, reference='ref3', status='sending')
+
+    updated, updated_history = dao_update_notification_statuses_by_reference(
+        {'ref1': 'delivered', 'ref2': 'permanent-failure', 'ref3': 'delivered'},
+        history_references=['ref3'],
+    )
+
+    assert sorted((row.reference, row.status, row.to) for row in updated) == [
+        ('ref1', 'delivered', delivered.to),
+        ('ref2', 'permanent-failure', failed.to),
+    ]
+    assert [(row.id, row.status) for row in updated_history] == [(history.id, 'delivered')]
+    assert Notification.query.get(delivered.id).status == 'delivered'
+    assert Notification.query.get(failed.id).status == 'permanent-failure'
+    assert Notification.query.get(failed.id).updated_at is not None
+    assert NotificationHistory.query.get(history.id).status == 'delivered'
+
+
+def test_dao_update_notification_statuses_by_reference_ignores_notifications_no_longer_sending(
+    sample_email_template
+):
+    notification = create_notification(template=sample_email_template, reference='ref1', status='delivered')
+
+    updated, updated_history = dao_update_notification_statuses_by_reference({'ref1': 'temporary-failure'})
+
+    assert updated == []
+    assert updated_history == []
+    assert Notification.query.get(notification.id).status == 'delivered'
+
+
+def test_dao_get_notifications_or_history_by_references(sample_email_template):
+    notification = create_notification(template=sample_email_template, reference='ref1')
+    history = create_notification_history(template=sample_email_template, reference='ref2')
+
+    notifications = dao_get_notifications_or_history_by_references(['ref1', 'ref2', 'ref3'])
+
+    assert notifications == {'ref1': notification, 'ref2': history}
+    assert isinstance(notifications['ref2'], NotificationHistory)
+
+
 def test_dao_get_notification_by_reference_with_one_match_returns_notification(sample_letter_template):
     create_notification(template=sample_letter_template, reference='REF1')
     notification = dao_get_notification_by_reference('REF1')
@@ -1765,3 +1911,80 @@ def test_get_service_ids_with_notifications_on_date_checks_ft_status(
 
     assert len(get_service_ids_with_notifications_on_date(SMS_TYPE, date(2022, 1, 1))) == 1
     assert len(get_service_ids_with_notifications_on_date(SMS_TYPE, date(2022, 1, 2))) == 1
+
+
+def test_get_service_ids_with_notifications_changed_since(notify_db_session):
+    changed_service = create_service(service_name='changed')
+    changed_history_service = create_service(service_name='changed history')
+    unchanged_service = create_service(service_name='unchanged')
+    other_type_service = create_service(service_name='other type')
+    created_at = datetime(2022, 1, 1, 12, 0)
+    changed_since = datetime(2022, 1, 3, 12, 0)
+
+    create_notification(
+        create_template(changed_service), created_at=created_at, updated_at=changed_since + timedelta(minutes=1)
+    )
+    create_notification_history(
+        create_template(changed_history_service), created_at=created_at, updated_at=changed_since
+    )
+    create_notification(
+        create_template(unchanged_service), created_at=created_at, updated_at=changed_since - timedelta(minutes=1)
+    )
+    create_notification(
+        create_template(other_type_service, template_type='email'),
+        created_at=created_at,
+        updated_at=changed_since + timedelta(minutes=1),
+    )
+
+    assert get_service_ids_with_notifications_changed_since(date(2022, 1, 1), changed_since, [SMS_TYPE]) == {
+        changed_service.id, changed_history_service.id
+    }
+    assert get_service_ids_with_notifications_changed_since(date(2022, 1, 2), changed_since, [SMS_TYPE]) == set()
+
+
+def test_get_notifications_by_ids(sample_template):
+    first = create_notification(template=sample_template)
+    second = create_notification(template=sample_template)
+    create_notification(template=sample_template)
+
+    notifications = get_notifications_by_ids([str(first.id), second.id, uuid.uuid4()])
+
+    assert {notification.id for notification in notifications} == {first.id, second.id}
+
+
+def test_get_notifications_by_ids_returns_nothing_for_no_ids(notify_db_session):
+    assert get_notifications_by_ids([]) == []
+
+
+def test_dao_update_notifications_to_sending_updates_each_notification(sample_template):
+    first = create_notification(template=sample_template, reference='existing')
+    second = create_notification(template=sample_template)
+    untouched = create_notification(template=sample_template)
+
+    updated = dao_update_notifications_to_sending([
+        {'id': first.id, 'status': 'sending', 'sent_by': 'sns', 'billable_units': 2},
+        {'id': second.id, 'status': 'sent', 'sent_by': 'sns', 'billable_units': 1, 'reference': 'ref'},
+    ])
+
+    assert updated == 2
+    first, second, untouched = (Notification.query.get(n.id) for n in (first, second, untouched))
+    assert (first.status, first.sent_by, first.billable_units, first.reference) == ('sending', 'sns', 2, 'existing')
+    assert (second.status, second.sent_by, second.billable_units, second.reference) == ('sent', 'sns', 1, 'ref')
+    assert first.sent_at is not None
+    assert untouched.status == 'created'
+    assert untouched.sent_at is None
+
+
+def test_dao_update_notifications_to_sending_does_not_undo_a_delivery_receipt(sample_template):
+    notification = create_notification(template=sample_template, status='delivered')
+
+    dao_update_notifications_to_sending([
+        {'id': notification.id, 'status': 'sending', 'sent_by': 'sns', 'billable_units': 1, 'reference': 'ref'},
+    ])
+
+    notification = Notification.query.get(notification.id)
+    assert (notification.status, notification.sent_by, notification.reference) == ('delivered', 'sns', 'ref')
+
+
+def test_dao_update_notifications_to_sending_does_nothing_for_no_updates(notify_db_session):
+    assert dao_update_notifications_to_sending([]) == 0
@@ -9,6 +9,7 @@ from moto import mock_s3
 
 from app.dao.notifications_dao import (
     insert_notification_history_delete_notifications,
+    move_notifications_past_retention_batch,
     move_notifications_to_notification_history,
 )
 from app.models import (
@@ -25,6 +26,8 @@ from tests.app.db import (
     create_template,
 )
 
+SWEEP_CUTOFF = datetime(2021, 3, 1)
+
 
 @mock_s3
 @freeze_time('2019-09-01 04:30')
@@ -380,3 +383,55 @@ def test_insert_notification_history_delete_notifications_insert_for_key_type(sa
     assert len(notifications) == 1
     assert with_test_key.id == notifications[0].id
     assert len(history_rows) == 2
+
+
+def test_move_notifications_past_retention_batch_uses_each_services_cutoff(notify_db_session):
+    default_service = create_service(service_name='default retention')
+    long_retention_service = create_service(service_name='long retention')
+    default_template = create_template(default_service)
+    long_retention_template = create_template(long_retention_service)
+
+    moved = create_notification(default_template, created_at=SWEEP_CUTOFF - timedelta(days=1))
+    create_notification(default_template, created_at=SWEEP_CUTOFF + timedelta(days=1))
+    create_notification(long_retention_template, created_at=SWEEP_CUTOFF - timedelta(days=1))
+    create_notification(default_template, created_at=SWEEP_CUTOFF - timedelta(days=1), key_type=KEY_TYPE_TEST)
+
+    count, last = move_notifications_past_retention_batch(
+        'sms', SWEEP_CUTOFF, {long_retention_service.id: SWEEP_CUTOFF - timedelta(days=30)}
+    )
+
+    assert count == 2
+    assert last is not None
+    assert Notification.query.count() == 2
+    assert [history.id for history in NotificationHistory.query.all()] == [moved.id]
+
+
+def test_move_notifications_past_retention_batch_carries_on_after_the_last_batch(sample_template):
+    notifications = [
+        create_notification(sample_template, created_at=SWEEP_CUTOFF - timedelta(days=3 - n)) for n in range(3)
+    ]
+
+    count, last = move_notifications_past_retention_batch('sms', SWEEP_CUTOFF, {}, batch_size=2)
+    assert count == 2
+    assert last == (notifications[1].created_at, notifications[1].id)
+
+    count, last = move_notifications_past_retention_batch('sms', SWEEP_CUTOFF, {}, after=last, batch_size=2)
+    assert count == 1
+    assert last == (notifications[2].created_at, notifications[2].id)
+
+    assert move_notifications_past_retention_batch('sms', SWEEP_CUTOFF, {}, after=last, batch_size=2) == (0, None)
+    assert NotificationHistory.query.count() == 3
+
+
+def test_move_notifications_past_retention_batch_keeps_letters_still_being_sent(sample_letter_template, mocker):
+    mock_delete_pdfs = mocker.patch('app.dao.notifications_dao._delete_letter_pdfs_from_s3')
+    delivered = create_notification(
+        sample_letter_template, status='delivered', created_at=SWEEP_CUTOFF - timedelta(days=1)
+    )
+    sending = create_notification(sample_letter_template, status='sending', created_at=SWEEP_CUTOFF - timedelta(days=1))
+
+    count, _ = move_notifications_past_retention_batch('letter', SWEEP_CUTOFF, {})
+
+    assert count == 1
+    assert Notification.query.all() == [sending]
+    mock_delete_pdfs.assert_called_once_with([delivered])
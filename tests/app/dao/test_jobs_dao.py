@@ -10,12 +10,17 @@ from app.dao.jobs_dao import (
     can_letter_job_be_cancelled,
     dao_cancel_letter_job,
     dao_create_job,
+    dao_create_job_shards,
+    dao_finish_job_shard,
     dao_get_future_scheduled_job_by_id_and_service_id,
     dao_get_job_by_service_id_and_job_id,
     dao_get_jobs_by_service_id,
     dao_get_jobs_older_than_data_retention,
     dao_get_notification_outcomes_for_job,
+    dao_get_unfinished_job_shards,
+    dao_job_has_shards,
     dao_set_scheduled_jobs_to_pending,
+    dao_start_job_shard,
     dao_update_job,
     find_jobs_with_missing_rows,
     find_missing_row_for_job,
@@ -23,6 +28,8 @@ from app.dao.jobs_dao import (
 from app.models import (
     EMAIL_TYPE,
     JOB_STATUS_FINISHED,
+    JOB_STATUS_IN_PROGRESS,
+    JOB_STATUS_PENDING,
     LETTER_TYPE,
     SMS_TYPE,
     Job,
@@ -559,6 +566,58 @@ def test_find_missing_row_for_job_return_none_when_row_isnt_missing(sample_email
     assert len(results) == 0
 
 
+def test_find_missing_row_for_job_only_looks_at_the_rows_asked_for(sample_email_template):
+    job = create_job(template=sample_email_template, notification_count=10)
+    create_notification(job=job, job_row_number=5)
+
+    results = find_missing_row_for_job(job.id, 3, first_row=4)
+    assert [result.missing_row for result in results] == [4, 6]
+
+
+def test_dao_create_job_shards_splits_the_rows_of_the_job(sample_email_template):
+    job = create_job(template=sample_email_template, notification_count=25)
+
+    shards = dao_create_job_shards(job, 10)
+
+    assert [(shard.shard_number, shard.first_row, shard.last_row) for shard in shards] == [
+        (0, 0, 9), (1, 10, 19), (2, 20, 24)
+    ]
+    assert {shard.status for shard in shards} == {JOB_STATUS_PENDING}
+    assert dao_job_has_shards(job.id)
+    assert not dao_job_has_shards(create_job(template=sample_email_template).id)
+
+
+def test_dao_finish_job_shard_returns_how_many_shards_are_left(sample_email_template):
+    job = create_job(template=sample_email_template, notification_count=20)
+    first_shard, second_shard = dao_create_job_shards(job, 10)
+
+    assert dao_finish_job_shard(second_shard) == 1
+    assert dao_get_unfinished_job_shards(job.id) == [first_shard]
+    assert dao_finish_job_shard(first_shard) == 0
+    assert dao_get_unfinished_job_shards(job.id) == []
+    assert first_shard.processing_finished
+
+
+def test_dao_start_job_shard_only_claims_a_shard_once_until_it_goes_stale(sample_email_template):
+    job = create_job(template=sample_email_template, notification_count=10)
+    shard, = dao_create_job_shards(job, 10)
+
+    with freeze_time('2021-06-05 12:00:00'):
+        assert dao_start_job_shard(shard, timedelta(minutes=30))
+        assert not dao_start_job_shard(shard, timedelta(minutes=30))
+    assert shard.status == JOB_STATUS_IN_PROGRESS
+    assert shard.processing_started == datetime(2021, 6, 5, 12, 0)
+
+    with freeze_time('2021-06-05 12:31:00'):
+        assert dao_start_job_shard(shard, timedelta(minutes=30))
+    assert shard.processing_started == datetime(2021, 6, 5, 12, 31)
+
+    dao_finish_job_shard(shard)
+    with freeze_time('2021-06-05 13:30:00'):
+        assert not dao_start_job_shard(shard, timedelta(minutes=30))
+
+
+@freeze_time('2021-06-05 12:00:00')
 def test_unique_key_on_job_id_and_job_row_number(sample_email_template):
     job = create_job(template=sample_email_template)
     create_notification(job=job, job_row_number=0)
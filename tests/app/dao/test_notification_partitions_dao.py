@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.dao.notification_partitions_dao import (
+    PARTITIONED_TABLES,
+    dao_archive_notification_partition,
+    dao_create_notification_partitions,
+    dao_get_notification_partition_days,
+    get_partition_name,
+)
+from app.models import Notification, NotificationHistory
+from tests.app.db import create_notification, create_service_data_retention
+
+PARTITION_DAY = date(2099, 1, 1)
+
+
+@pytest.fixture
+def partition_day(notify_db_session):
+    dao_create_notification_partitions(PARTITION_DAY, 1)
+    yield PARTITION_DAY
+    for table_name in PARTITIONED_TABLES:
+        if PARTITION_DAY in dao_get_notification_partition_days(table_name):
+            partition_name = get_partition_name(table_name, PARTITION_DAY)
+            db.session.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition_name}")
+            db.session.execute(f"DROP TABLE {partition_name}")
+    db.session.commit()
+
+
+def test_dao_create_notification_partitions_only_creates_missing_partitions(partition_day):
+    created = dao_create_notification_partitions(partition_day, 1)
+
+    assert created == []
+    for table_name in PARTITIONED_TABLES:
+        assert partition_day in dao_get_notification_partition_days(table_name)
+
+
+def test_notifications_are_stored_in_the_partition_for_their_day(sample_template, partition_day):
+    create_notification(sample_template, created_at=datetime(2099, 1, 1, 23, 59))
+
+    partition_name = get_partition_name('notifications', partition_day)
+    assert db.session.execute(f"SELECT count(*) FROM {partition_name}").scalar() == 1
+
+
+def test_dao_archive_notification_partition_moves_notifications_and_keeps_the_rest(
+    sample_template, sample_letter_template, partition_day
+):
+    created_at = datetime(2099, 1, 1, 12, 0)
+    moved = create_notification(sample_template, created_at=created_at)
+    create_notification(sample_template, created_at=created_at, key_type='test')
+    letter = create_notification(sample_letter_template, created_at=created_at)
+
+    assert dao_archive_notification_partition(partition_day) == (1, 1)
+
+    assert Notification.query.all() == [letter]
+    assert [history.id for history in NotificationHistory.query.all()] == [moved.id]
+    assert partition_day in dao_get_notification_partition_days()
+
+
+def test_dao_archive_notification_partition_keeps_notifications_for_services_with_their_own_retention(
+    sample_template, partition_day
+):
+    create_service_data_retention(sample_template.service, notification_type='sms', days_of_retention=30)
+    create_notification(sample_template, created_at=datetime(2099, 1, 1, 12, 0))
+
+    assert dao_archive_notification_partition(partition_day) == (0, 1)
+
+    assert Notification.query.count() == 1
+    assert NotificationHistory.query.count() == 0
+
+
+def test_dao_archive_notification_partition_drops_the_partition_if_nothing_is_kept(sample_template, partition_day):
+    create_notification(sample_template, created_at=datetime(2099, 1, 1, 12, 0))
+
+    assert dao_archive_notification_partition(partition_day) == (1, 0)
+
+    assert Notification.query.count() == 0
+    assert NotificationHistory.query.count() == 1
+    assert partition_day not in dao_get_notification_partition_days()
@@ -1,3 +1,4 @@
+import json
 import random
 import uuid
 from datetime import date, datetime, timedelta
@@ -871,6 +872,29 @@ def ses_complaint_callback():
     }
 
 
+def sns_delivery_status_event(reference, status='SUCCESS', provider_response=None, timestamp='2017-11-17 12:13:03.646'):
+    """
+    https://docs.aws.amazon.com/sns/latest/dg/sms_stats_cloudwatch.html
+    """
+    return json.dumps({
+        'notification': {'messageId': reference, 'timestamp': timestamp},
+        'delivery': {
+            'phoneCarrier': 'My Phone Carrier',
+            'mnc': 270,
+            'destination': '+12025550100',
+            'priceInUSD': 0.00645,
+            'smsType': 'Transactional',
+            'mcc': 310,
+            'providerResponse': provider_response or (
+                'Message has been accepted by phone carrier' if status == 'SUCCESS' else 'Unknown error'
+            ),
+            'dwellTimeMs': 599,
+            'dwellTimeMsUntilDeviceAck': 1344,
+        },
+        'status': status,
+    })
+
+
 def ses_notification_callback():
     return '{\n  "Type" : "Notification",\n  "MessageId" : "ref1",' \
            '\n  "TopicArn" : "arn:aws:sns:eu-west-1:123456789012:testing",' \
@@ -2,7 +2,7 @@ import json
 import uuid
 from collections import namedtuple
 from datetime import datetime, timedelta
-from unittest.mock import ANY
+from unittest.mock import ANY, call
 
 import pytest
 from flask import current_app
@@ -10,6 +10,9 @@ from notifications_utils.recipients import validate_and_format_phone_number
 from requests import HTTPError
 
 import app
+from app.clients.provider_sender import ProviderSenderBusyException
+from app.clients.send_rate_governor import SendRateExceededException
+from app.clients.sms import SmsClient
 # from app import firetext_client, mmg_client, notification_provider_clients
 from app.dao import notifications_dao
 from app.dao.provider_details_dao import get_provider_details_by_identifier
@@ -42,6 +45,8 @@ def setup_function(_function):
     # pytest will run this function before each test. It makes sure the
     # state of the cache is not shared between tests.
     send_to_providers.provider_cache.clear()
+    send_to_providers.template_cache.clear()
+    send_to_providers.email_branding_options_cache.clear()
 
 @pytest.mark.skip(reason="Needs updating for TTS: Update with new providers")
 def test_provider_to_use_should_return_random_provider(mocker, notify_db_session):
@@ -920,6 +925,47 @@ def test_get_html_email_options_return_email_branding_from_serialised_service(
                              }
 
 
+def test_get_html_email_options_caches_branding_for_serialised_service(sample_service, mocker):
+    sample_service.email_branding = create_email_branding()
+    service = SerialisedService.from_id(sample_service.id)
+    mock_get_branding = mocker.patch(
+        'app.delivery.send_to_providers.dao_get_email_branding_by_id',
+        wraps=send_to_providers.dao_get_email_branding_by_id,
+    )
+    mock_incr = mocker.patch('app.delivery.send_to_providers.statsd_client.incr')
+
+    assert get_html_email_options(service) == get_html_email_options(service)
+
+    mock_get_branding.assert_called_once_with(service.email_branding)
+    assert mock_incr.call_args_list == [call('email-branding-cache.miss'), call('email-branding-cache.hit')]
+
+
+def test_get_template_caches_each_template_version(sample_template, mocker):
+    mock_from_id = mocker.patch(
+        'app.delivery.send_to_providers.SerialisedTemplate.from_id_and_service_id',
+        wraps=send_to_providers.SerialisedTemplate.from_id_and_service_id,
+    )
+
+    first = send_to_providers.get_template(sample_template.id, sample_template.service_id, 1)
+    second = send_to_providers.get_template(sample_template.id, sample_template.service_id, 1)
+
+    assert first is second
+    assert first.content == sample_template.content
+    mock_from_id.assert_called_once_with(
+        template_id=sample_template.id, service_id=sample_template.service_id, version=1
+    )
+
+
+def test_get_template_does_not_cache_the_latest_version(sample_template, mocker):
+    mock_from_id = mocker.patch('app.delivery.send_to_providers.SerialisedTemplate.from_id_and_service_id')
+
+    send_to_providers.get_template(sample_template.id, sample_template.service_id, None)
+    send_to_providers.get_template(sample_template.id, sample_template.service_id, None)
+
+    assert mock_from_id.call_count == 2
+    assert len(send_to_providers.template_cache) == 0
+
+
 def test_get_html_email_options_add_email_branding_from_service(sample_service):
     branding = create_email_branding()
     sample_service.email_branding = branding
@@ -932,3 +978,234 @@ def test_get_html_email_options_add_email_branding_from_service(sample_service):
                              'brand_text': branding.text,
                              'brand_name': branding.name,
                              }
+
+
+def test_send_sms_batch_to_provider_marks_sent_notifications_as_sending_and_returns_failures(
+    sample_template,
+    mocker
+):
+    sent = create_notification(template=sample_template)
+    failed = create_notification(template=sample_template)
+    provider = mocker.Mock()
+    provider.name = 'sns'
+    provider.send_sms.side_effect = lambda reference, **kwargs: (
+        _raise(Exception('provider error')) if reference == str(failed.id) else 'reference'
+    )
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    mock_reduce_priority = mocker.patch('app.delivery.send_to_providers.dao_reduce_sms_provider_priority')
+
+    failed_ids, throttled = send_to_providers.send_sms_batch_to_provider([sent, failed])
+
+    assert failed_ids == [failed.id]
+    assert throttled == []
+    assert provider.send_sms.call_count == 2
+    mock_reduce_priority.assert_called_once_with('sns', time_threshold=timedelta(minutes=1))
+
+    sent = Notification.query.get(sent.id)
+    assert sent.status == 'sending'
+    assert sent.sent_by == 'sns'
+    assert sent.sent_at is not None
+    assert sent.billable_units == 1
+    assert sent.reference == 'reference'
+    assert Notification.query.get(failed.id).status == 'created'
+
+
+def test_send_email_batch_to_provider_stores_the_provider_reference(
+    sample_email_template,
+    mocker
+):
+    notification = create_notification(template=sample_email_template, to_field='jo.smith@example.com')
+    provider = mocker.Mock()
+    provider.name = 'ses'
+    provider.send_email.return_value = 'ses-reference'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+
+    assert send_to_providers.send_email_batch_to_provider([notification]) == ([], [])
+
+    assert provider.send_email.call_args[1]['to_addresses'] == notification.normalised_to
+    notification = Notification.query.get(notification.id)
+    assert notification.status == 'sending'
+    assert notification.sent_by == 'ses'
+    assert notification.reference == 'ses-reference'
+
+
+def test_send_sms_batch_to_provider_skips_notifications_that_have_already_been_sent(
+    sample_template,
+    mocker
+):
+    notification = create_notification(template=sample_template, status='sending')
+    provider = mocker.Mock()
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+
+    assert send_to_providers.send_sms_batch_to_provider([notification]) == ([], [])
+    assert not provider.send_sms.called
+
+
+def test_send_sms_batch_to_provider_picks_a_provider_for_international_notifications(
+    sample_template,
+    mocker
+):
+    domestic = create_notification(template=sample_template)
+    international = create_notification(template=sample_template, international=True)
+    providers = {False: mocker.Mock(), True: mocker.Mock()}
+    for international_provider, provider in providers.items():
+        provider.name = 'international' if international_provider else 'domestic'
+        provider.send_sms.return_value = 'reference'
+    mock_provider_to_use = mocker.patch(
+        'app.delivery.send_to_providers.provider_to_use',
+        side_effect=lambda notification_type, international: providers[international]
+    )
+
+    assert send_to_providers.send_sms_batch_to_provider([domestic, international]) == ([], [])
+
+    assert mock_provider_to_use.call_args_list == [call('sms', False), call('sms', True)]
+    assert Notification.query.get(domestic.id).sent_by == 'domestic'
+    assert Notification.query.get(international.id).sent_by == 'international'
+
+
+def test_send_sms_batch_to_provider_fails_notifications_no_provider_can_send(sample_template, mocker):
+    notification = create_notification(template=sample_template, international=True)
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=None)
+
+    assert send_to_providers.send_sms_batch_to_provider([notification]) == ([], [])
+
+    assert Notification.query.get(notification.id).status == 'technical-failure'
+
+
+def test_send_email_batch_to_provider_sends_research_mode_responses_after_marking_them_as_sending(
+    sample_email_template,
+    mocker
+):
+    sample_email_template.service.research_mode = True
+    notification = create_notification(template=sample_email_template)
+    provider = mocker.Mock()
+    provider.name = 'ses'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    statuses_when_responding = []
+    mocker.patch(
+        'app.delivery.send_to_providers.send_email_response',
+        side_effect=lambda reference, to: statuses_when_responding.append(
+            Notification.query.get(notification.id).status
+        )
+    )
+
+    send_to_providers.send_email_batch_to_provider([notification])
+
+    assert statuses_when_responding == ['sending']
+    assert not provider.send_email.called
+
+
+def test_send_sms_batch_to_provider_does_not_raise_if_marking_sent_notifications_as_sending_fails(
+    sample_template,
+    mocker
+):
+    notification = create_notification(template=sample_template)
+    provider = mocker.Mock()
+    provider.name = 'sns'
+    provider.send_sms.return_value = 'reference'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    mock_update = mocker.patch(
+        'app.delivery.send_to_providers.dao_update_notifications_to_sending', side_effect=Exception('db error')
+    )
+
+    assert send_to_providers.send_sms_batch_to_provider([notification]) == ([], [])
+
+    assert provider.send_sms.call_count == 1
+    # once for the batch, then once for each notification in it
+    assert mock_update.call_count == 2
+
+
+def test_send_sms_batch_to_provider_holds_back_throttled_notifications_without_blaming_the_provider(
+    sample_template,
+    mocker
+):
+    sent = create_notification(template=sample_template)
+    throttled = create_notification(template=sample_template)
+    provider = mocker.Mock()
+    provider.name = 'sns'
+    provider.send_sms.return_value = 'reference'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    mocker.patch(
+        'app.delivery.send_to_providers._wait_for_send_rate',
+        side_effect=[None, SendRateExceededException('sns:+15555550100', 2.5)]
+    )
+    mock_reduce_priority = mocker.patch('app.delivery.send_to_providers.dao_reduce_sms_provider_priority')
+
+    assert send_to_providers.send_sms_batch_to_provider([sent, throttled]) == ([], [(throttled.id, 2.5)])
+
+    assert provider.send_sms.call_count == 1
+    assert not mock_reduce_priority.called
+    assert Notification.query.get(sent.id).status == 'sending'
+    assert Notification.query.get(throttled.id).status == 'created'
+
+
+def test_wait_for_send_rate_gives_back_the_provider_token_if_the_origination_number_is_over_its_rate(mocker):
+    provider = mocker.Mock(spec=SmsClient)
+    provider.name = 'sns'
+    provider.get_origination_number.return_value = '+15555550100'
+    mock_governor = mocker.patch('app.delivery.send_to_providers.send_rate_governor')
+    mock_governor.acquire.side_effect = [None, SendRateExceededException('sns:+15555550100', 2.5)]
+
+    with pytest.raises(SendRateExceededException):
+        send_to_providers._wait_for_send_rate(provider, to='+15555550123', sender=None)
+
+    assert mock_governor.acquire.call_args_list == [call('sns'), call('sns:+15555550100')]
+    mock_governor.release.assert_called_once_with('sns')
+
+
+def test_send_sms_to_provider_gives_back_the_send_rate_without_blaming_the_provider_if_the_sender_is_busy(
+    sample_notification,
+    mocker
+):
+    provider = mocker.Mock()
+    provider.name = 'sns'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    mocker.patch('app.delivery.send_to_providers._wait_for_send_rate')
+    mocker.patch(
+        'app.delivery.send_to_providers.provider_sender.send', side_effect=ProviderSenderBusyException('busy')
+    )
+    mock_release = mocker.patch('app.delivery.send_to_providers._release_send_rate')
+    mock_reduce_priority = mocker.patch('app.delivery.send_to_providers.dao_reduce_sms_provider_priority')
+
+    with pytest.raises(ProviderSenderBusyException):
+        send_to_providers.send_sms_to_provider(sample_notification)
+
+    mock_release.assert_called_once_with(provider, to=sample_notification.normalised_to, sender=ANY)
+    assert not mock_reduce_priority.called
+    assert Notification.query.get(sample_notification.id).status == 'created'
+
+
+def test_send_sms_batch_to_provider_holds_back_notifications_the_busy_sender_could_not_take(
+    sample_template,
+    mocker
+):
+    notification = create_notification(template=sample_template)
+    provider = mocker.Mock()
+    provider.name = 'sns'
+    mocker.patch('app.delivery.send_to_providers.provider_to_use', return_value=provider)
+    mocker.patch('app.delivery.send_to_providers._wait_for_send_rate')
+    mocker.patch(
+        'app.delivery.send_to_providers.provider_sender.submit', side_effect=ProviderSenderBusyException('busy')
+    )
+    mock_release = mocker.patch('app.delivery.send_to_providers._release_send_rate')
+    mock_reduce_priority = mocker.patch('app.delivery.send_to_providers.dao_reduce_sms_provider_priority')
+
+    assert send_to_providers.send_sms_batch_to_provider([notification]) == ([], [(notification.id, 0)])
+
+    mock_release.assert_called_once_with(provider, to=notification.normalised_to, sender=ANY)
+    assert not mock_reduce_priority.called
+
+
+def test_release_send_rate_gives_back_the_provider_and_origination_number_tokens(mocker):
+    provider = mocker.Mock(spec=SmsClient)
+    provider.name = 'sns'
+    provider.get_origination_number.return_value = '+15555550100'
+    mock_governor = mocker.patch('app.delivery.send_to_providers.send_rate_governor')
+
+    send_to_providers._release_send_rate(provider, to='+15555550123', sender=None)
+
+    assert mock_governor.release.call_args_list == [call('sns'), call('sns:+15555550100')]
+
+
+def _raise(exception):
+    raise exception
@@ -10,6 +10,7 @@ from freezegun import freeze_time
 import app.celery.tasks
 from app.dao.templates_dao import dao_update_template
 from app.models import JOB_STATUS_PENDING, JOB_STATUS_TYPES
+from app.utils import encode_pagination_cursor
 from tests import create_admin_authorization_header
 from tests.app.db import (
     create_ft_notification_status,
@@ -563,6 +564,35 @@ def test_get_all_notifications_for_job_in_order_of_job_number(admin_request, sam
     assert resp['notifications'][2]['job_row_number'] == notification_3.job_row_number
 
 
+def test_get_all_notifications_for_job_with_keyset_pagination_pages_by_job_row_number(admin_request, sample_template):
+    job = create_job(sample_template)
+    for job_row_number in range(3):
+        create_notification(job=job, to_field=str(job_row_number), job_row_number=job_row_number)
+
+    with set_config(admin_request.app, 'KEYSET_PAGINATION_ENABLED', True):
+        resp = admin_request.get(
+            'job.get_all_notifications_for_service_job',
+            service_id=job.service_id,
+            job_id=job.id,
+            page_size=2
+        )
+
+    assert [n['job_row_number'] for n in resp['notifications']] == [0, 1]
+    assert 'total' not in resp
+    assert 'cursor=' in resp['links']['next']
+
+    resp = admin_request.get(
+        'job.get_all_notifications_for_service_job',
+        service_id=job.service_id,
+        job_id=job.id,
+        page_size=2,
+        cursor=encode_pagination_cursor((1,))
+    )
+
+    assert [n['job_row_number'] for n in resp['notifications']] == [2]
+    assert resp['links'] == {}
+
+
 @pytest.mark.parametrize(
     "expected_notification_count, status_args",
     [
@@ -16,6 +16,7 @@ from app.letters.utils import (
     get_bucket_name_and_prefix_for_notification,
     get_folder_name,
     get_letter_pdf_and_metadata,
+    get_letter_pdf_keys_and_sizes_in_s3,
     letter_print_day,
     move_failed_pdf,
     move_sanitised_letter_to_test_or_live_pdf_bucket,
@@ -77,6 +78,39 @@ def test_find_letter_pdf_in_s3_raises_if_not_found(sample_notification):
         find_letter_pdf_in_s3(sample_notification)
 
 
+@mock_s3
+def test_get_letter_pdf_keys_and_sizes_in_s3_lists_every_page_of_the_folder(notify_api):
+    bucket_name = current_app.config['LETTERS_PDF_BUCKET_NAME']
+    s3 = boto3.client('s3', region_name='eu-west-1')
+    s3.create_bucket(
+        Bucket=bucket_name,
+        CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+    )
+    for i in range(1001):
+        s3.put_object(Bucket=bucket_name, Key=f'2018-01-13/NOTIFY.REF{i:04}.D.2.C.20180113120000.PDF', Body=b'f')
+    s3.put_object(Bucket=bucket_name, Key='2018-01-13/NOTIFY.REF0000.D.2.C.20180113130000.PDF', Body=b'ff')
+    s3.put_object(Bucket=bucket_name, Key='2018-01-14/NOTIFY.OTHERDAY.D.2.C.20180114120000.PDF', Body=b'f')
+
+    keys_and_sizes = get_letter_pdf_keys_and_sizes_in_s3(bucket_name, '2018-01-13/')
+
+    assert len(keys_and_sizes) == 1001
+    assert keys_and_sizes['REF0000'] == ('2018-01-13/NOTIFY.REF0000.D.2.C.20180113120000.PDF', 1)
+    assert keys_and_sizes['REF1000'] == ('2018-01-13/NOTIFY.REF1000.D.2.C.20180113120000.PDF', 1)
+    assert 'OTHERDAY' not in keys_and_sizes
+
+
+@mock_s3
+def test_get_letter_pdf_keys_and_sizes_in_s3_returns_nothing_for_an_empty_folder(notify_api):
+    bucket_name = current_app.config['LETTERS_PDF_BUCKET_NAME']
+    s3 = boto3.client('s3', region_name='eu-west-1')
+    s3.create_bucket(
+        Bucket=bucket_name,
+        CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'}
+    )
+
+    assert get_letter_pdf_keys_and_sizes_in_s3(bucket_name, '2018-01-13/') == {}
+
+
 @pytest.mark.parametrize('created_at,folder', [
     (datetime(2017, 1, 1, 17, 29), '2017-01-01'),
     (datetime(2017, 1, 1, 17, 31), '2017-01-02'),
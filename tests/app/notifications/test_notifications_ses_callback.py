@@ -3,19 +3,23 @@ from flask import json
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.dao.notifications_dao import get_notification_by_id
-from app.models import Complaint
+from app.models import BATCHED_CALLBACKS, EMAIL_TYPE, Complaint
 from app.notifications.notifications_ses_callback import (
     check_and_queue_callback_task,
     handle_complaint,
+    queue_callback_tasks,
 )
 from tests.app.db import (
     create_notification,
     create_notification_history,
+    create_service,
     create_service_callback_api,
+    create_template,
     ses_complaint_callback,
     ses_complaint_callback_malformed_message_id,
     ses_complaint_callback_with_missing_complaint_type,
 )
+from tests.conftest import set_config
 
 
 def test_ses_callback_should_not_set_status_once_status_is_delivered(sample_email_template):
@@ -102,3 +106,24 @@ def test_check_and_queue_callback_task_no_callback_api(mocker, sample_notificati
 
     check_and_queue_callback_task(sample_notification)
     mock_send.assert_not_called()
+
+
+def test_queue_callback_tasks_batches_status_updates_for_services_that_opt_in(notify_api, notify_db_session, mocker):
+    mock_send = mocker.patch('app.celery.service_callback_tasks.send_delivery_status_to_service.apply_async')
+    mock_send_batch = mocker.patch('app.celery.service_callback_tasks.send_delivery_statuses_to_service.apply_async')
+    batched_service = create_service(
+        service_name='batched', service_permissions=[EMAIL_TYPE, BATCHED_CALLBACKS]
+    )
+    single_service = create_service(service_name='single', service_permissions=[EMAIL_TYPE])
+    for service in (batched_service, single_service):
+        create_service_callback_api(service=service)
+    batched = [create_notification(create_template(batched_service, template_type=EMAIL_TYPE)) for _ in range(3)]
+    single = create_notification(create_template(single_service, template_type=EMAIL_TYPE))
+
+    with set_config(notify_api, 'SERVICE_CALLBACK_BATCH_SIZE', 2):
+        queue_callback_tasks(batched + [single])
+
+    assert mock_send.call_count == 1
+    assert mock_send.call_args[0][0][0] == str(single.id)
+    assert [len(call[0][0][0]) for call in mock_send_batch.call_args_list] == [2, 1]
+    assert mock_send_batch.call_args[1] == {'queue': 'service-callbacks'}
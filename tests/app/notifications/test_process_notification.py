@@ -2,6 +2,7 @@ import datetime
 import uuid
 from collections import namedtuple
 
+import flask
 import pytest
 from boto3.exceptions import Boto3Error
 from freezegun import freeze_time
@@ -11,10 +12,16 @@ from notifications_utils.recipients import (
 )
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.celery import provider_tasks
 from app.models import LETTER_TYPE, Notification, NotificationHistory
 from app.notifications.process_notifications import (
+    build_notification,
     create_content_for_notification,
+    increment_daily_limit_cache,
     persist_notification,
+    persist_notifications_in_bulk,
+    record_daily_limit_reservation,
+    release_unused_daily_limit_reservation,
     send_notification_to_queue,
     simulated_recipient,
 )
@@ -245,6 +252,99 @@ def test_persist_notification_sets_daily_limit_cache_if_one_does_not_exists(
         mock_set.assert_called_once_with(str(service.id) + "-2016-01-01-count", 1, ex=86400)
 
 
+def test_persist_notification_uses_daily_limit_reservation_instead_of_incrementing_cache(
+        notify_api, notify_db_session, mocker
+):
+    service = create_service()
+    template = create_template(service=service)
+    api_key = create_api_key(service=service)
+    mock_get = mocker.patch('app.notifications.process_notifications.redis_store.get')
+    mock_incr = mocker.patch('app.notifications.process_notifications.redis_store.incr')
+    with set_config(notify_api, 'REDIS_ENABLED', True), notify_api.test_request_context():
+        record_daily_limit_reservation(service.id)
+        persist_notification(
+            template_id=template.id,
+            template_version=template.version,
+            recipient='+447111111122',
+            service=template.service,
+            personalisation={},
+            notification_type='sms',
+            api_key_id=api_key.id,
+            key_type=api_key.key_type,
+        )
+
+        assert 'daily_limit_reservation' not in flask.g
+    assert not mock_get.called
+    assert not mock_incr.called
+
+
+@freeze_time("2016-01-01 11:09:00.061258")
+def test_release_unused_daily_limit_reservation_gives_the_message_back(notify_api, sample_service, mocker):
+    mock_redis = mocker.patch('app.notifications.process_notifications.redis_store')
+    with set_config(notify_api, 'REDIS_ENABLED', True), notify_api.test_request_context():
+        record_daily_limit_reservation(sample_service.id)
+        release_unused_daily_limit_reservation()
+
+        assert 'daily_limit_reservation' not in flask.g
+    mock_redis.redis_store.decr.assert_called_once_with(str(sample_service.id) + "-2016-01-01-count")
+
+
+def test_persist_notifications_in_bulk_uses_daily_limit_reservation_and_releases_the_rest(
+        notify_api, notify_db_session, mocker
+):
+    service = create_service()
+    template = create_template(service=service)
+    api_key = create_api_key(service=service)
+    mock_redis = mocker.patch('app.notifications.process_notifications.redis_store')
+    notifications = [
+        build_notification(
+            template_id=template.id,
+            template_version=template.version,
+            recipient=recipient,
+            service=service,
+            personalisation={},
+            notification_type='sms',
+            api_key_id=api_key.id,
+            key_type=api_key.key_type,
+        )
+        for recipient in ['+447111111122', '+447111111123']
+    ]
+    with freeze_time("2016-01-01 11:09:00.061258"):
+        with set_config(notify_api, 'REDIS_ENABLED', True), notify_api.test_request_context():
+            record_daily_limit_reservation(service.id, count=3)
+            persist_notifications_in_bulk(notifications, service.id)
+
+            assert flask.g.daily_limit_reservation_count == 1
+            release_unused_daily_limit_reservation()
+
+    assert Notification.query.count() == 2
+    assert not mock_redis.set.called
+    assert not mock_redis.redis_store.incrby.called
+    mock_redis.redis_store.decr.assert_called_once_with(str(service.id) + "-2016-01-01-count")
+
+
+def test_release_unused_daily_limit_reservation_does_nothing_without_a_reservation(notify_api, mocker):
+    mock_redis = mocker.patch('app.notifications.process_notifications.redis_store')
+    with set_config(notify_api, 'REDIS_ENABLED', True), notify_api.test_request_context():
+        release_unused_daily_limit_reservation()
+
+    assert not mock_redis.redis_store.decr.called
+
+
+@freeze_time("2016-01-01 11:09:00.061258")
+def test_increment_daily_limit_cache_logs_rather_than_raises_if_redis_errors(notify_api, sample_service, mocker):
+    mock_redis = mocker.patch('app.notifications.process_notifications.redis_store')
+    mock_redis.get.return_value = b'10'
+    mock_redis.redis_store.incrby.side_effect = Exception('redis is down')
+    mock_logger = mocker.patch('app.notifications.process_notifications.current_app.logger.exception')
+
+    with set_config(notify_api, 'REDIS_ENABLED', True):
+        increment_daily_limit_cache(sample_service.id, count=3)
+
+    mock_redis.redis_store.incrby.assert_called_once_with(str(sample_service.id) + "-2016-01-01-count", 3)
+    assert mock_logger.called
+
+
 @pytest.mark.parametrize((
     'research_mode, requested_queue, notification_type, key_type, expected_queue, expected_task'
 ), [
@@ -296,6 +396,31 @@ def test_send_notification_to_queue_throws_exception_deletes_notification(sample
     assert NotificationHistory.query.count() == 0
 
 
+def test_send_notification_to_queue_publishes_straight_away_from_an_api_request(
+    notify_api, sample_notification, mocker
+):
+    mock_publisher = mocker.patch('app.notifications.process_notifications.task_publisher')
+    mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async', side_effect=Boto3Error("EXPECTED"))
+
+    with notify_api.test_request_context(), pytest.raises(Boto3Error):
+        send_notification_to_queue(sample_notification, False)
+
+    assert not mock_publisher.publish.called
+    assert Notification.query.count() == 0
+
+
+def test_send_notification_to_queue_uses_the_task_publisher_outside_an_api_request(sample_notification, mocker):
+    mock_publisher = mocker.patch('app.notifications.process_notifications.task_publisher')
+    mock_apply_async = mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+
+    send_notification_to_queue(sample_notification, False)
+
+    mock_publisher.publish.assert_called_once_with(
+        provider_tasks.deliver_sms, [str(sample_notification.id)], queue='send-sms-tasks'
+    )
+    assert not mock_apply_async.called
+
+
 @pytest.mark.parametrize("to_address, notification_type, expected", [
     ("+447700900000", "sms", True),
     ("+447700900111", "sms", True),
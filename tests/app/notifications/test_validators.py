@@ -1,5 +1,7 @@
+from collections import defaultdict, deque
 from datetime import datetime
 
+import flask
 import pytest
 from flask import current_app
 from freezegun import freeze_time
@@ -12,6 +14,7 @@ from app.notifications.process_notifications import (
     create_content_for_notification,
 )
 from app.notifications.validators import (
+    check_and_reserve_rate_limits,
     check_if_service_can_send_files_by_email,
     check_is_message_too_long,
     check_notification_content_is_not_empty,
@@ -45,7 +48,7 @@ from tests.app.db import (
     create_service_sms_sender,
     create_template,
 )
-from tests.conftest import set_config
+from tests.conftest import set_config, set_config_values
 
 
 # all of these tests should have redis enabled (except where we specifically disable it)
@@ -116,6 +119,15 @@ def test_check_service_message_limit_over_message_limit_fails(key_type, mocker,
     assert e.value.fields == []
 
 
+def test_check_service_message_limit_fails_if_the_notifications_would_go_over_the_limit(mocker, notify_db_session):
+    service = create_service(message_limit=4)
+    mocker.patch('app.redis_store.get', return_value="2")
+
+    assert check_service_over_daily_message_limit('normal', service, notification_count=2) == 2
+    with pytest.raises(TooManyRequestsError):
+        check_service_over_daily_message_limit('normal', service, notification_count=3)
+
+
 @pytest.mark.parametrize('template_type, notification_type',
                          [(EMAIL_TYPE, EMAIL_TYPE),
                           (SMS_TYPE, SMS_TYPE)])
@@ -470,8 +482,122 @@ def test_check_rate_limiting_validates_api_rate_limit_and_daily_limit(
 
     check_rate_limiting(service, api_key)
 
-    mock_rate_limit.assert_called_once_with(service, api_key)
-    mock_daily_limit.assert_called_once_with(api_key.key_type, service)
+    mock_rate_limit.assert_called_once_with(service, api_key, notification_count=1)
+    mock_daily_limit.assert_called_once_with(api_key.key_type, service, notification_count=1)
+
+
+def test_check_service_over_api_rate_limit_counts_every_message_of_a_bulk_request(
+    notify_api, sample_service, mocker
+):
+    mock_redis = mocker.patch('app.notifications.validators.redis_store')
+    pipeline = mock_redis.redis_store.pipeline.return_value
+    pipeline.execute.return_value = [3, 0, True, sample_service.rate_limit + 1]
+    serialised_service = SerialisedService.from_id(sample_service.id)
+    api_key = create_api_key(sample_service)
+
+    with set_config(notify_api, 'REDIS_ENABLED', True), pytest.raises(RateLimitError):
+        check_service_over_api_rate_limit(serialised_service, api_key, notification_count=3)
+
+    assert len(pipeline.zadd.call_args[0][1]) == 3
+    assert not mock_redis.exceeded_rate_limit.called
+
+
+def test_check_rate_limiting_uses_a_single_redis_call_when_atomic_rate_limiting_enabled(
+    notify_api, notify_db_session, mocker
+):
+    mock_check_and_reserve = mocker.patch('app.notifications.validators.check_and_reserve_rate_limits')
+    mock_rate_limit = mocker.patch('app.notifications.validators.check_service_over_api_rate_limit')
+    service = create_service()
+    api_key = create_api_key(service=service)
+
+    with set_config_values(notify_api, {'REDIS_ENABLED': True, 'ATOMIC_RATE_LIMITING_ENABLED': True}):
+        check_rate_limiting(service, api_key)
+
+    mock_check_and_reserve.assert_called_once_with(service, api_key, notification_count=1)
+    assert not mock_rate_limit.called
+
+
+@pytest.fixture
+def mock_rate_limit_script(mocker):
+    mocker.patch('app.notifications.validators.rate_and_daily_limit_script', None)
+    mock_redis = mocker.patch('app.notifications.validators.redis_store')
+    return mock_redis.redis_store.register_script.return_value
+
+
+@freeze_time("2016-01-01 12:00:00.000000")
+def test_check_and_reserve_rate_limits_reserves_a_message(notify_api, sample_service, mock_rate_limit_script):
+    mock_rate_limit_script.return_value = [0, 10]
+    api_key = create_api_key(sample_service)
+
+    with notify_api.test_request_context():
+        check_and_reserve_rate_limits(sample_service, api_key)
+
+        assert flask.g.daily_limit_reservation == str(sample_service.id)
+
+    assert mock_rate_limit_script.call_args[1]['keys'] == [
+        '{}-normal'.format(sample_service.id), '{}-2016-01-01-count'.format(sample_service.id)
+    ]
+    assert mock_rate_limit_script.call_args[1]['args'][1:] == [60, 3000, 1000, 1]
+
+
+def test_check_and_reserve_rate_limits_does_not_reserve_for_test_keys(
+    notify_api, sample_service, mock_rate_limit_script
+):
+    mock_rate_limit_script.return_value = [0, 0]
+    api_key = create_api_key(sample_service, key_type='test')
+
+    with notify_api.test_request_context():
+        check_and_reserve_rate_limits(sample_service, api_key)
+
+        assert 'daily_limit_reservation' not in flask.g
+
+    assert mock_rate_limit_script.call_args[1]['args'][3] == 0
+
+
+@pytest.mark.parametrize('outcome, expected_error', [
+    (1, RateLimitError),
+    (2, TooManyRequestsError),
+])
+def test_check_and_reserve_rate_limits_raises_if_over_a_limit(
+    notify_api, sample_service, mock_rate_limit_script, outcome, expected_error
+):
+    mock_rate_limit_script.return_value = [outcome, 1000]
+    api_key = create_api_key(sample_service)
+
+    with notify_api.test_request_context():
+        with pytest.raises(expected_error):
+            check_and_reserve_rate_limits(sample_service, api_key)
+
+        assert 'daily_limit_reservation' not in flask.g
+
+
+def test_check_and_reserve_rate_limits_falls_back_to_a_local_rate_limit_if_redis_fails(
+    notify_api, sample_service, mock_rate_limit_script, mocker
+):
+    mock_rate_limit_script.side_effect = Exception('redis is down')
+    mocker.patch('app.notifications.validators.local_rate_limits', defaultdict(deque))
+    sample_service.rate_limit = 2
+    api_key = create_api_key(sample_service)
+
+    with notify_api.test_request_context():
+        check_and_reserve_rate_limits(sample_service, api_key)
+        check_and_reserve_rate_limits(sample_service, api_key)
+        with pytest.raises(RateLimitError):
+            check_and_reserve_rate_limits(sample_service, api_key)
+
+
+def test_check_and_reserve_rate_limits_does_not_reserve_anything_if_redis_fails(
+    notify_api, sample_service, mock_rate_limit_script, mocker
+):
+    mock_rate_limit_script.side_effect = Exception('redis is down')
+    mocker.patch('app.notifications.validators.local_rate_limits', defaultdict(deque))
+    api_key = create_api_key(sample_service)
+
+    with notify_api.test_request_context():
+        check_and_reserve_rate_limits(sample_service, api_key)
+
+        # so persist_notification increments the daily limit cache itself
+        assert 'daily_limit_reservation' not in flask.g
 
 
 @pytest.mark.parametrize('key_type', ['test', 'normal'])
@@ -45,6 +45,7 @@ from app.models import (
     ServiceSmsSender,
     User,
 )
+from app.utils import encode_pagination_cursor
 from tests import create_admin_authorization_header
 from tests.app.db import (
     create_annual_billing,
@@ -70,6 +71,7 @@ from tests.app.db import (
     create_template_folder,
     create_user,
 )
+from tests.conftest import set_config
 
 
 def test_get_service_list(client, service_factory):
@@ -1968,6 +1970,55 @@ def test_get_notifications_for_service_pagination_links(
     assert 'next' not in resp['links']
 
 
+def test_get_notifications_for_service_with_keyset_pagination_links_to_the_next_page_with_a_cursor(
+    admin_request,
+    sample_template,
+):
+    notifications = [
+        create_notification(sample_template, created_at=datetime(2016, 1, 1, 12, minute))
+        for minute in range(3)
+    ]
+
+    with set_config(admin_request.app, 'KEYSET_PAGINATION_ENABLED', True):
+        resp = admin_request.get(
+            'service.get_all_notifications_for_service',
+            service_id=sample_template.service_id,
+            page_size=2
+        )
+
+        assert [n['id'] for n in resp['notifications']] == [str(notifications[2].id), str(notifications[1].id)]
+        assert 'prev' not in resp['links']
+        cursor = encode_pagination_cursor((notifications[1].created_at, notifications[1].id))
+        assert resp['links']['next'] == url_for(
+            'service.get_all_notifications_for_service',
+            service_id=sample_template.service_id,
+            page_size=2,
+            cursor=cursor
+        )
+
+    # the cursor is used whether or not keyset pagination is turned on
+    resp = admin_request.get(
+        'service.get_all_notifications_for_service',
+        service_id=sample_template.service_id,
+        page_size=2,
+        cursor=cursor
+    )
+
+    assert [n['id'] for n in resp['notifications']] == [str(notifications[0].id)]
+    assert resp['links'] == {}
+
+
+def test_get_notifications_for_service_with_an_invalid_cursor_returns_400(admin_request, sample_template):
+    resp = admin_request.get(
+        'service.get_all_notifications_for_service',
+        service_id=sample_template.service_id,
+        cursor='not-a-cursor',
+        _expected_status=400
+    )
+
+    assert resp['message'] == 'cursor is not valid'
+
+
 @pytest.mark.parametrize('should_prefix', [
     True,
     False,
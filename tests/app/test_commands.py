@@ -1,6 +1,8 @@
 import pytest
 
 from app.commands import (
+    benchmark_cap_ingestion,
+    benchmark_email_rendering,
     insert_inbound_numbers_from_file,
     local_dev_broadcast_permissions,
     populate_annual_billing_with_defaults,
@@ -80,3 +82,21 @@ def test_populate_annual_billing_with_defaults_sets_free_allowance_to_zero_if_pr
 
     assert len(results) == 1
     assert results[0].free_sms_fragment_limit == 0
+
+
+def test_benchmark_email_rendering(notify_api, sample_email_template_with_placeholders):
+    result = notify_api.test_cli_runner().invoke(
+        benchmark_email_rendering, ['-t', sample_email_template_with_placeholders.id, '-n', 2]
+    )
+
+    assert result.exit_code == 0
+    assert 'cold caches: ' in result.output
+    assert 'warm caches: ' in result.output
+
+
+def test_benchmark_cap_ingestion(notify_api):
+    result = notify_api.test_cli_runner().invoke(benchmark_cap_ingestion, ['-a', 3, '-p', 10, '-n', 2])
+
+    assert result.exit_code == 0
+    assert 'schema compiled every time: ' in result.output
+    assert 'schema cached: ' in result.output
@@ -0,0 +1,134 @@
+import json
+
+from app import cache_invalidation
+from app.dao.api_key_dao import expire_api_key
+from app.dao.service_callback_api_dao import (
+    delete_service_callback_api,
+    reset_service_callback_api,
+)
+from app.dao.services_dao import dao_update_service
+from app.dao.templates_dao import dao_update_template
+from app.serialised_models import (
+    SerialisedAPIKeyCollection,
+    SerialisedService,
+    SerialisedServiceCallbackApi,
+    SerialisedTemplate,
+    caches,
+    evict,
+)
+from tests.app.db import create_service_callback_api
+from tests.conftest import set_config
+
+
+def test_memory_cache_returns_the_cached_object(sample_service, mocker):
+    get_dict = mocker.patch.object(SerialisedService, 'get_dict', wraps=SerialisedService.get_dict)
+
+    first = SerialisedService.from_id(sample_service.id)
+    second = SerialisedService.from_id(sample_service.id)
+
+    assert first is second
+    get_dict.assert_called_once_with(sample_service.id)
+
+
+def test_evict_removes_entries_looked_up_by_id_or_string(sample_service):
+    SerialisedService.from_id(sample_service.id)
+    SerialisedService.from_id(str(sample_service.id))
+
+    evict('SerialisedService.from_id', str(sample_service.id))
+
+    assert not [key for key in caches['SerialisedService.from_id'] if str(sample_service.id) in map(str, key)]
+
+
+def test_dao_update_service_evicts_the_cached_service_on_commit(sample_service):
+    assert SerialisedService.from_id(sample_service.id).name == sample_service.name
+
+    sample_service.name = 'New name'
+    dao_update_service(sample_service)
+
+    assert SerialisedService.from_id(sample_service.id).name == 'New name'
+
+
+def test_dao_update_template_evicts_the_cached_template_on_commit(sample_template):
+    SerialisedTemplate.from_id_and_service_id(sample_template.id, sample_template.service_id)
+
+    sample_template.content = 'New content'
+    dao_update_template(sample_template)
+
+    assert SerialisedTemplate.from_id_and_service_id(
+        sample_template.id, sample_template.service_id
+    ).content == 'New content'
+
+
+def test_expire_api_key_evicts_the_cached_api_keys_on_commit(sample_api_key):
+    assert len(SerialisedAPIKeyCollection.from_service_id(sample_api_key.service_id)) == 1
+
+    expire_api_key(sample_api_key.service_id, sample_api_key.id)
+
+    assert len(SerialisedAPIKeyCollection.from_service_id(sample_api_key.service_id)) == 0
+
+
+def test_service_callback_api_changes_evict_the_cached_callback_api_on_commit(sample_service):
+    assert SerialisedServiceCallbackApi.from_service_id_and_type(sample_service.id, 'delivery_status') is None
+
+    callback_api = create_service_callback_api(sample_service, url='https://example.com/one')
+    assert SerialisedServiceCallbackApi.from_service_id_and_type(
+        sample_service.id, 'delivery_status'
+    ).url == 'https://example.com/one'
+
+    reset_service_callback_api(callback_api, sample_service.users[0].id, url='https://example.com/two')
+    assert SerialisedServiceCallbackApi.from_service_id_and_type(
+        sample_service.id, 'delivery_status'
+    ).url == 'https://example.com/two'
+
+    delete_service_callback_api(callback_api)
+    assert SerialisedServiceCallbackApi.from_service_id_and_type(sample_service.id, 'delivery_status') is None
+
+
+def test_service_callback_api_at_version_reloads_an_older_cached_callback_api(sample_service, mocker):
+    callback_api = create_service_callback_api(sample_service, url='https://example.com/one')
+    cached = SerialisedServiceCallbackApi.from_service_id_and_type(sample_service.id, 'delivery_status')
+    # as if the change was made by another process, and we haven't heard about it yet
+    mocker.patch('app.dao.service_callback_api_dao.invalidate_callback_apis')
+    reset_service_callback_api(callback_api, sample_service.users[0].id, url='https://example.com/two')
+
+    assert SerialisedServiceCallbackApi.from_service_id_and_type(sample_service.id, 'delivery_status') is cached
+    assert SerialisedServiceCallbackApi.from_service_id_and_type_at_version(
+        sample_service.id, 'delivery_status', cached.version
+    ) is cached
+    assert SerialisedServiceCallbackApi.from_service_id_and_type_at_version(
+        sample_service.id, 'delivery_status', cached.version + 1
+    ).url == 'https://example.com/two'
+
+
+def test_invalidations_are_published_after_commit(notify_api, sample_service, mocker):
+    mock_redis = mocker.patch('app.cache_invalidation.redis_store')
+
+    with set_config(notify_api, 'SERIALISED_MODEL_CACHE_INVALIDATION_ENABLED', True):
+        sample_service.name = 'New name'
+        dao_update_service(sample_service)
+
+    mock_redis.delete.assert_called_once_with(f'service-{sample_service.id}')
+    channel, message = mock_redis.redis_store.publish.call_args[0]
+    assert channel == 'serialised-model-invalidation'
+    assert json.loads(message) == {
+        'model': 'service',
+        'id': str(sample_service.id),
+        'redis_keys': [f'service-{sample_service.id}'],
+    }
+
+
+def test_invalidations_are_not_published_when_disabled(notify_api, sample_service, mocker):
+    mock_redis = mocker.patch('app.cache_invalidation.redis_store')
+
+    dao_update_service(sample_service)
+
+    mock_redis.delete.assert_called_once_with(f'service-{sample_service.id}')
+    assert not mock_redis.redis_store.publish.called
+
+
+def test_invalidations_from_other_processes_evict_cached_templates(sample_template):
+    template = SerialisedTemplate.from_id_and_service_id(sample_template.id, sample_template.service_id)
+
+    cache_invalidation._handle(cache_invalidation.TEMPLATE, str(sample_template.id))
+
+    assert SerialisedTemplate.from_id_and_service_id(sample_template.id, sample_template.service_id) is not template
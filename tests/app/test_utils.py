@@ -1,9 +1,13 @@
+import uuid
 from datetime import date, datetime
 
 import pytest
 from freezegun import freeze_time
 
 from app.utils import (
+    chunked,
+    decode_pagination_cursor,
+    encode_pagination_cursor,
     format_sequential_number,
     get_london_midnight_in_utc,
     get_midnight_for_day_before,
@@ -56,3 +60,33 @@ def test_midnight_n_days_ago(current_time, arg, expected_datetime):
 
 def test_format_sequential_number():
     assert format_sequential_number(123) == '0000007b'
+
+
+@pytest.mark.parametrize('iterable, size, expected_chunks', [
+    ([], 3, []),
+    ([1, 2, 3], 3, [[1, 2, 3]]),
+    ([1, 2, 3, 4, 5], 2, [[1, 2], [3, 4], [5]]),
+    ((x for x in range(4)), 3, [[0, 1, 2], [3]]),
+])
+def test_chunked(iterable, size, expected_chunks):
+    assert list(chunked(iterable, size)) == expected_chunks
+
+
+def test_decode_pagination_cursor_returns_the_encoded_values():
+    created_at = datetime(2016, 1, 15, 12, 30, 1, 123456)
+    notification_id = uuid.uuid4()
+
+    cursor = encode_pagination_cursor((created_at, notification_id))
+
+    assert decode_pagination_cursor(cursor, datetime.fromisoformat, uuid.UUID) == (created_at, notification_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    'bm90IGpzb24=',  # not json
+    encode_pagination_cursor(['2016-01-15 12:30:00']),
+    encode_pagination_cursor(['2016-01-15 12:30:00', 'not-a-uuid']),
+])
+def test_decode_pagination_cursor_raises_for_invalid_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_pagination_cursor(cursor, datetime.fromisoformat, uuid.UUID)
@@ -0,0 +1,37 @@
+import pytest
+
+from app import xml_schemas
+from app.xml_schemas import clear_schema_caches, parse_xml, validate_xml
+from tests.app.v2.broadcast.sample_cap_xml_documents import WAINFLEET
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    clear_schema_caches()
+    yield
+    clear_schema_caches()
+
+
+def test_parse_xml_returns_the_root_element_of_a_valid_document():
+    alert = parse_xml(WAINFLEET, 'CAP-v1.2.xsd')
+
+    assert alert.tag == '{urn:oasis:names:tc:emergency:cap:1.2}alert'
+
+
+@pytest.mark.parametrize('document', [
+    WAINFLEET.replace('<msgType>Alert</msgType>', ''),
+    WAINFLEET.replace('</alert>', ''),
+    'not xml',
+])
+def test_parse_xml_returns_none_for_an_invalid_document(document):
+    assert parse_xml(document, 'CAP-v1.2.xsd') is None
+    assert validate_xml(document, 'CAP-v1.2.xsd') is False
+
+
+def test_parse_xml_only_compiles_the_schema_once(mocker):
+    mock_xml_schema = mocker.patch('app.xml_schemas.etree.XMLSchema', wraps=xml_schemas.etree.XMLSchema)
+
+    for _ in range(3):
+        assert validate_xml(WAINFLEET, 'CAP-v1.2.xsd')
+
+    mock_xml_schema.assert_called_once()
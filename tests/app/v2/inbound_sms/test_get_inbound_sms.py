@@ -1,5 +1,8 @@
+from datetime import datetime
+
 from flask import json, url_for
 
+from app.utils import encode_pagination_cursor
 from tests import create_service_authorization_header
 from tests.app.db import (
     create_inbound_sms,
@@ -145,6 +148,40 @@ def test_get_next_inbound_sms_at_end_will_return_empty_inbound_sms_list(client,
     assert 'next' not in json_response['links'].keys()
 
 
+def test_get_inbound_sms_with_keyset_pagination_links_to_the_next_page_with_a_cursor(client, sample_service, mocker):
+    mocker.patch.dict(
+        "app.v2.inbound_sms.get_inbound_sms.current_app.config",
+        {"API_PAGE_SIZE": 2, "KEYSET_PAGINATION_ENABLED": True}
+    )
+    all_inbound_sms = [
+        create_inbound_sms(service=sample_service, content=str(i), created_at=datetime(2017, 1, 1, 12, i))
+        for i in range(3)
+    ]
+
+    auth_header = create_service_authorization_header(service_id=sample_service.id)
+    response = client.get(
+        path=url_for('v2_inbound_sms.get_inbound_sms'),
+        headers=[('Content-Type', 'application/json'), auth_header])
+
+    assert response.status_code == 200
+    json_response = json.loads(response.get_data(as_text=True))
+    assert json_response['received_text_messages'] == [all_inbound_sms[2].serialize(), all_inbound_sms[1].serialize()]
+    cursor = encode_pagination_cursor((all_inbound_sms[1].created_at, all_inbound_sms[1].id))
+    assert url_for(
+        'v2_inbound_sms.get_inbound_sms',
+        cursor=cursor,
+        _external=True) == json_response['links']['next']
+
+    response = client.get(
+        path=url_for('v2_inbound_sms.get_inbound_sms', cursor=cursor),
+        headers=[('Content-Type', 'application/json'), auth_header])
+
+    assert response.status_code == 200
+    json_response = json.loads(response.get_data(as_text=True))
+    assert json_response['received_text_messages'] == [all_inbound_sms[0].serialize()]
+    assert 'next' not in json_response['links'].keys()
+
+
 def test_get_inbound_sms_for_no_inbound_sms_returns_empty_list(
         client, sample_service
 ):
@@ -1,4 +1,5 @@
 import datetime
+from urllib.parse import parse_qs, urlsplit
 
 import pytest
 from flask import json, url_for
@@ -6,6 +7,7 @@ from flask import json, url_for
 from app.utils import DATETIME_FORMAT
 from tests import create_service_authorization_header
 from tests.app.db import create_notification, create_template
+from tests.conftest import set_config_values
 
 
 @pytest.mark.parametrize('billable_units, provider', [
@@ -721,3 +723,54 @@ def test_get_pdf_for_notification_fails_for_non_letters(client, sample_notificat
 
     assert response.status_code == 400
     assert response.json['errors'] == [{'error': 'BadRequestError', 'message': 'Notification is not a letter'}]
+
+
+def test_get_all_notifications_with_keyset_pagination_links_to_the_next_page_with_a_cursor(
+    client, notify_api, sample_template
+):
+    notifications = [
+        create_notification(template=sample_template, created_at=datetime.datetime(2016, 1, 1, 12, minute))
+        for minute in range(3)
+    ]
+    auth_header = create_service_authorization_header(service_id=sample_template.service_id)
+
+    with set_config_values(notify_api, {'KEYSET_PAGINATION_ENABLED': True, 'API_PAGE_SIZE': 2}):
+        response = client.get(path='/v2/notifications', headers=[auth_header])
+        json_response = json.loads(response.get_data(as_text=True))
+
+        assert response.status_code == 200
+        assert [n['id'] for n in json_response['notifications']] == [str(notifications[2].id), str(notifications[1].id)]
+        assert 'cursor=' in json_response['links']['next']
+
+        cursor = parse_qs(urlsplit(json_response['links']['next']).query)['cursor'][0]
+        response = client.get(path='/v2/notifications?cursor={}'.format(cursor), headers=[auth_header])
+        json_response = json.loads(response.get_data(as_text=True))
+
+    assert response.status_code == 200
+    assert [n['id'] for n in json_response['notifications']] == [str(notifications[0].id)]
+    assert 'next' not in json_response['links']
+
+
+def test_get_all_notifications_with_keyset_pagination_starts_after_older_than(client, notify_api, sample_template):
+    older_notification = create_notification(template=sample_template, created_at=datetime.datetime(2016, 1, 1))
+    newer_notification = create_notification(template=sample_template, created_at=datetime.datetime(2016, 1, 2))
+    auth_header = create_service_authorization_header(service_id=sample_template.service_id)
+
+    with set_config_values(notify_api, {'KEYSET_PAGINATION_ENABLED': True}):
+        response = client.get(
+            path='/v2/notifications?older_than={}'.format(newer_notification.id),
+            headers=[auth_header])
+
+    json_response = json.loads(response.get_data(as_text=True))
+    assert response.status_code == 200
+    assert [n['id'] for n in json_response['notifications']] == [str(older_notification.id)]
+    assert 'next' not in json_response['links']
+
+
+def test_get_all_notifications_with_an_invalid_cursor_returns_400(client, sample_notification):
+    auth_header = create_service_authorization_header(service_id=sample_notification.service_id)
+    response = client.get(path='/v2/notifications?cursor=not-a-cursor', headers=[auth_header])
+
+    json_response = json.loads(response.get_data(as_text=True))
+    assert response.status_code == 400
+    assert json_response['errors'][0]['message'] == "cursor is not valid"
@@ -1183,3 +1183,150 @@ def test_post_notification_does_not_use_save_queue_for_letters(client, sample_le
         json_resp = response.get_json()
         assert not mock_save.called
         mock_create_pdf_task.assert_called_once_with([str(json_resp['id'])], queue='create-letters-pdf-tasks')
+
+
+def test_post_bulk_notifications_returns_201_with_a_response_or_errors_per_recipient(
+    client, sample_template_with_placeholders, mocker
+):
+    mocked = mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    data = {
+        'template_id': str(sample_template_with_placeholders.id),
+        'recipients': [
+            {'phone_number': '+447700900855', 'personalisation': {' Name': 'Jo'}, 'reference': 'first'},
+            {'phone_number': 'not a number', 'personalisation': {' Name': 'Al'}},
+            {'phone_number': '+447700900856', 'personalisation': {}},
+            {'phone_number': '+447700900857', 'personalisation': {' Name': 'Sam'}},
+        ]
+    }
+    auth_header = create_service_authorization_header(service_id=sample_template_with_placeholders.service_id)
+
+    response = client.post(
+        path='/v2/notifications/bulk',
+        data=json.dumps(data),
+        headers=[('Content-Type', 'application/json'), auth_header])
+
+    assert response.status_code == 201
+    resp_json = response.get_json()
+    assert [notification['index'] for notification in resp_json['notifications']] == [0, 3]
+    assert resp_json['notifications'][0]['reference'] == 'first'
+    assert resp_json['notifications'][1]['content']['body'] == sample_template_with_placeholders.content.replace(
+        "(( Name))", "Sam"
+    )
+    assert [error['index'] for error in resp_json['errors']] == [1, 2]
+    assert resp_json['errors'][1]['errors'] == [
+        {'error': 'BadRequestError', 'message': 'Missing personalisation:  Name'}
+    ]
+
+    notifications = Notification.query.order_by(Notification.to).all()
+    assert [notification.id for notification in notifications] == [
+        uuid.UUID(notification['id']) for notification in resp_json['notifications']
+    ]
+    assert notifications[0].client_reference == 'first'
+    assert mocked.call_args_list == [
+        call([str(notification.id)], queue='send-sms-tasks') for notification in notifications
+    ]
+
+
+def test_post_bulk_notifications_counts_every_recipient_against_the_limits(client, sample_email_template, mocker):
+    mocker.patch('app.celery.provider_tasks.deliver_email.apply_async')
+    mock_check_rate_limiting = mocker.patch('app.v2.notifications.post_notifications.check_rate_limiting')
+    data = {
+        'template_id': str(sample_email_template.id),
+        'recipients': [{'email_address': 'one@example.com'}, {'email_address': 'two@example.com'}]
+    }
+
+    response = client.post(
+        path='/v2/notifications/bulk',
+        data=json.dumps(data),
+        headers=[('Content-Type', 'application/json'),
+                 create_service_authorization_header(service_id=sample_email_template.service_id)])
+
+    assert response.status_code == 201
+    assert mock_check_rate_limiting.call_args[1] == {'notification_count': 2}
+    assert len(Notification.query.all()) == 2
+
+
+def test_post_bulk_notifications_returns_an_error_for_notifications_that_could_not_be_queued(
+    client, sample_template, mocker
+):
+    mocker.patch(
+        'app.celery.provider_tasks.deliver_sms.apply_async', side_effect=[None, Exception('sqs is down'), None]
+    )
+    data = {
+        'template_id': str(sample_template.id),
+        'recipients': [
+            {'phone_number': '+447700900855'}, {'phone_number': '+447700900856'}, {'phone_number': '+447700900857'}
+        ]
+    }
+
+    response = client.post(
+        path='/v2/notifications/bulk',
+        data=json.dumps(data),
+        headers=[('Content-Type', 'application/json'),
+                 create_service_authorization_header(service_id=sample_template.service_id)])
+
+    assert response.status_code == 201
+    resp_json = response.get_json()
+    assert [notification['index'] for notification in resp_json['notifications']] == [0, 2]
+    assert resp_json['errors'] == [{'index': 1, 'errors': [
+        {'error': 'QueueError', 'message': 'Notification could not be queued for sending, try again'}
+    ]}]
+    assert {notification.to for notification in Notification.query.all()} == {'+447700900855', '+447700900857'}
+
+
+def test_post_bulk_notifications_returns_400_if_no_recipients_are_valid(client, sample_template, mocker):
+    mocked = mocker.patch('app.celery.provider_tasks.deliver_sms.apply_async')
+    data = {
+        'template_id': str(sample_template.id),
+        'recipients': [{'email_address': 'one@example.com'}]
+    }
+
+    response = client.post(
+        path='/v2/notifications/bulk',
+        data=json.dumps(data),
+        headers=[('Content-Type', 'application/json'),
+                 create_service_authorization_header(service_id=sample_template.service_id)])
+
+    assert response.status_code == 400
+    resp_json = response.get_json()
+    assert resp_json['notifications'] == []
+    assert resp_json['errors'][0]['index'] == 0
+    assert not mocked.called
+    assert not Notification.query.count()
+
+
+def test_post_bulk_notifications_returns_400_if_there_are_too_many_recipients(client, sample_template):
+    data = {
+        'template_id': str(sample_template.id),
+        'recipients': [{'phone_number': '+447700900855'}] * 3
+    }
+
+    with set_config_values(current_app, {'BULK_API_MAX_NOTIFICATIONS': 2}):
+        response = client.post(
+            path='/v2/notifications/bulk',
+            data=json.dumps(data),
+            headers=[('Content-Type', 'application/json'),
+                     create_service_authorization_header(service_id=sample_template.service_id)])
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [
+        {'error': 'BadRequestError', 'message': 'Cannot send more than 2 notifications in one request'}
+    ]
+
+
+def test_post_bulk_notifications_returns_400_for_letter_templates(client, sample_letter_template):
+    data = {
+        'template_id': str(sample_letter_template.id),
+        'recipients': [{'phone_number': '+447700900855'}]
+    }
+
+    response = client.post(
+        path='/v2/notifications/bulk',
+        data=json.dumps(data),
+        headers=[('Content-Type', 'application/json'),
+                 create_service_authorization_header(service_id=sample_letter_template.service_id)])
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [
+        {'error': 'BadRequestError', 'message': 'letter template is not suitable for bulk notifications'}
+    ]